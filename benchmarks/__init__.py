@@ -0,0 +1,5 @@
+"""性能基准包
+
+在合成用户池上测量匹配热点路径的吞吐、延迟分位数与内存峰值，
+通过 python -m benchmarks.suite 运行
+"""
@@ -0,0 +1,299 @@
+"""基准对比与回归门禁
+
+多轮运行基准套件，按轮间差异计算各指标均值的 95% 置信区间与标准误，与保存的基线对比；
+某个被跟踪的指标变差超过阈值、且两者之差经 Welch t 检验显著（差值的 95% 置信区间不含0）时判定为回归，
+打印对比表并以非零状态退出::
+
+    python -m benchmarks.compare --sizes 1000 10000 --rounds 3 --save-baseline baseline.json
+    python -m benchmarks.compare --sizes 1000 10000 --rounds 3 --baseline baseline.json --threshold 10
+
+只有一轮时，ops_per_sec 与 mean_ms 的标准误由该轮的逐次延迟估计，分位数指标的标准误由逐次延迟 bootstrap 估计；
+既不足两轮又没有逐次延迟的指标无法检验，变化超过阈值时记为 unverified，不判定为回归
+"""
+
+import argparse
+import json
+import math
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmarks.suite import BENCHMARKS, SIZES, BenchmarkSuite
+
+# 指标 -> 是否越大越好
+METRICS = {
+    'ops_per_sec': True,
+    'mean_ms': False,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'peak_memory_bytes': False,
+}
+
+# 缺省跟踪的指标（内存峰值受分配器影响较大，需要时显式指定）
+DEFAULT_METRICS = ('ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms')
+
+DEFAULT_THRESHOLD = 10.0
+
+# 分位数指标 -> 百分位
+PERCENTILES = {'p50_ms': 50, 'p95_ms': 95, 'p99_ms': 99}
+
+# 单轮分位数的 bootstrap 重采样次数
+BOOTSTRAP_ROUNDS = 1000
+
+# 双侧 95% t 分布临界值，下标为自由度
+_T_95 = (
+    float('inf'), 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+)
+
+def t_critical(df: int) -> float:
+    """双侧 95% t 临界值，自由度超过 30 时用正态近似"""
+    return _T_95[df] if df < len(_T_95) else 1.96
+
+def interval(values: Sequence[float]) -> Dict[str, Any]:
+    """均值及其 95% 置信区间
+
+    Returns:
+        Dict[str, Any]: mean、low、high、values、se（标准误）、df（自由度）；
+        少于两个值时区间退化为均值本身，se 与 df 为 None（无法检验）
+    """
+    values = [float(value) for value in values if value is not None]
+    if not values:
+        return {'mean': None, 'low': None, 'high': None, 'values': [], 'se': None, 'df': None}
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return {'mean': mean, 'low': mean, 'high': mean, 'values': values, 'se': None, 'df': None}
+    se = float(np.std(values, ddof=1)) / math.sqrt(len(values))
+    half = t_critical(len(values) - 1) * se
+    return {'mean': mean, 'low': mean - half, 'high': mean + half, 'values': values,
+            'se': se, 'df': len(values) - 1}
+
+def difference(base: Dict[str, Any], now: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """Welch t 检验: now 与 base 均值之差的 95% 置信区间
+
+    自由度按 Welch-Satterthwaite 公式取整（向下取整，偏保守）；两侧标准误都为0时差值是确定的。
+
+    Returns:
+        Optional[Dict[str, float]]: diff、low、high；任一侧没有标准误时为 None
+    """
+    if base.get('se') is None or now.get('se') is None:
+        return None
+    diff = now['mean'] - base['mean']
+    variances = [(side['se'] ** 2, side['df']) for side in (base, now)]
+    total = sum(variance for variance, _ in variances)
+    if total == 0:
+        return {'diff': diff, 'low': diff, 'high': diff}
+    df = total ** 2 / sum(variance ** 2 / df for variance, df in variances if variance > 0)
+    half = t_critical(max(int(df), 1)) * math.sqrt(total)
+    return {'diff': diff, 'low': diff - half, 'high': diff + half}
+
+def _key(result: Dict[str, Any]) -> str:
+    """结果的键: 基准名@规模"""
+    return f"{result['benchmark']}@{result['size'] if result['size'] is not None else '-'}"
+
+def _bootstrap(samples: np.ndarray, percentile: float, value: float) -> Dict[str, Any]:
+    """由逐次延迟 bootstrap 估计分位数的 95% 置信区间与标准误（固定随机种子，结果可复现）"""
+    rng = np.random.default_rng(0)
+    resampled = samples[rng.integers(len(samples), size=(BOOTSTRAP_ROUNDS, len(samples)))]
+    estimates = np.percentile(resampled, percentile, axis=1)
+    low, high = np.percentile(estimates, [2.5, 97.5])
+    return {'mean': value, 'low': float(low), 'high': float(high), 'values': [value],
+            'se': float(np.std(estimates, ddof=1)), 'df': len(samples) - 1}
+
+def _single_round(result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """只有一轮时由逐次延迟估计各时间指标的置信区间与标准误
+
+    mean_ms 用逐次延迟的标准误，ops_per_sec 由 mean_ms 换算（区间取倒数，标准误按一阶近似），
+    分位数指标 bootstrap；没有逐次延迟时这些指标无法检验。
+    """
+    metrics = {metric: interval([result.get(metric)]) for metric in METRICS}
+    samples = result.get('samples_ms') or []
+    if len(samples) >= 2:
+        mean_ms = interval(samples)
+        metrics['mean_ms'] = dict(mean_ms, mean=result['mean_ms'], values=[result['mean_ms']])
+        low, high = max(mean_ms['low'], 1e-12), max(mean_ms['high'], 1e-12)
+        ops = result['ops_per_sec']
+        se = ops * mean_ms['se'] / max(mean_ms['mean'], 1e-12)
+        metrics['ops_per_sec'] = dict(
+            metrics['ops_per_sec'], low=1000.0 / high, high=1000.0 / low, se=se, df=mean_ms['df'])
+        samples = np.asarray(samples, dtype=np.float64)
+        for metric, percentile in PERCENTILES.items():
+            if result.get(metric) is not None:
+                metrics[metric] = _bootstrap(samples, percentile, float(result[metric]))
+    return metrics
+
+def aggregate(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总多轮 BenchmarkSuite.run() 的结果
+
+    Args:
+        reports: 各轮的报告
+
+    Returns:
+        Dict[str, Any]: {'meta': 第一轮的运行环境, 'rounds': 轮数,
+        'benchmarks': {基准名@规模: {指标: interval()}}}
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for report in reports:
+        for result in report['results']:
+            grouped.setdefault(_key(result), []).append(result)
+    benchmarks = {}
+    for key, results in grouped.items():
+        if len(results) == 1:
+            benchmarks[key] = _single_round(results[0])
+        else:
+            benchmarks[key] = {
+                metric: interval([result.get(metric) for result in results]) for metric in METRICS
+            }
+    return {
+        'meta': reports[0]['meta'] if reports else {},
+        'rounds': len(reports),
+        'benchmarks': benchmarks
+    }
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    """读取基线文件，也接受 benchmarks.suite 直接输出的单轮结果"""
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    return aggregate([data]) if 'results' in data else data
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+    metrics: Sequence[str] = DEFAULT_METRICS
+) -> List[Dict[str, Any]]:
+    """逐个基准、逐个指标对比
+
+    状态: regressed（变差超过阈值且差值显著）、improved（变好超过阈值且差值显著）、
+    noise（变化超过阈值但差值不显著）、unverified（变化超过阈值但缺少标准误，无法检验）、
+    ok、new（基线中没有）、missing（本次没有）。差值是否显著见 difference()。
+
+    Args:
+        baseline: 基线（aggregate() 的结果）
+        current: 本次结果（aggregate() 的结果）
+        threshold: 阈值（百分比）
+        metrics: 跟踪的指标
+
+    Returns:
+        List[Dict[str, Any]]: 对比行，含 benchmark、metric、baseline、current、change_pct、status
+    """
+    rows = []
+    base_benchmarks = baseline['benchmarks']
+    current_benchmarks = current['benchmarks']
+    keys = list(current_benchmarks) + [key for key in base_benchmarks if key not in current_benchmarks]
+    for key in keys:
+        for metric in metrics:
+            base = base_benchmarks.get(key, {}).get(metric)
+            now = current_benchmarks.get(key, {}).get(metric)
+            row = {'benchmark': key, 'metric': metric,
+                   'baseline': base['mean'] if base else None,
+                   'current': now['mean'] if now else None,
+                   'change_pct': None}
+            if row['baseline'] is None:
+                row['status'] = 'new'
+            elif row['current'] is None:
+                row['status'] = 'missing'
+            else:
+                row['change_pct'] = (now['mean'] - base['mean']) / base['mean'] * 100.0 \
+                    if base['mean'] else 0.0
+                worse = -row['change_pct'] if METRICS[metric] else row['change_pct']
+                tested = difference(base, now)
+                if abs(worse) <= threshold:
+                    row['status'] = 'ok'
+                elif tested is None:
+                    row['status'] = 'unverified'
+                elif tested['low'] <= 0 <= tested['high']:
+                    row['status'] = 'noise'
+                else:
+                    row['status'] = 'regressed' if worse > 0 else 'improved'
+            rows.append(row)
+    return rows
+
+def _format_value(value: Optional[float], metric: str) -> str:
+    """格式化指标值"""
+    if value is None:
+        return '-'
+    if metric == 'peak_memory_bytes':
+        return f'{value / 2 ** 20:.2f}MB'
+    return f'{value:.4f}' if value < 100 else f'{value:.1f}'
+
+def format_diff(rows: List[Dict[str, Any]]) -> str:
+    """把对比行格式化为按基准分组的文本表"""
+    lines = [f"{'benchmark':<30}{'metric':<20}{'baseline':>14}{'current':>14}{'change':>10}  status"]
+    previous = None
+    for row in rows:
+        name = row['benchmark'] if row['benchmark'] != previous else ''
+        previous = row['benchmark']
+        change = f"{row['change_pct']:+.1f}%" if row['change_pct'] is not None else '-'
+        status = row['status'].upper() if row['status'] == 'regressed' else row['status']
+        lines.append(
+            f"{name:<30}{row['metric']:<20}{_format_value(row['baseline'], row['metric']):>14}"
+            f"{_format_value(row['current'], row['metric']):>14}{change:>10}  {status}"
+        )
+    return '\n'.join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口
+
+    Returns:
+        int: 0 表示没有回归，1 表示有指标回归，2 表示参数错误
+    """
+    parser = argparse.ArgumentParser(description="基准对比与回归门禁")
+    parser.add_argument('--baseline', help="基线 JSON 路径")
+    parser.add_argument('--save-baseline', help="把本次汇总结果保存为基线")
+    parser.add_argument('--current', nargs='+', help="直接使用已有的 benchmarks.suite 结果文件（每个文件一轮），不再运行")
+    parser.add_argument('--rounds', type=int, default=3, help="运行轮数")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="回归阈值（百分比）")
+    parser.add_argument('--metrics', nargs='+', choices=list(METRICS), default=list(DEFAULT_METRICS),
+                        help="跟踪的指标")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="用户池规模")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), help="要运行的基准")
+    parser.add_argument('--min-time', type=float, default=1.0, help="每个基准的最短累计耗时（秒）")
+    parser.add_argument('--max-ops', type=int, default=2000, help="每个基准最多执行次数")
+    args = parser.parse_args(argv)
+    if not args.baseline and not args.save_baseline:
+        parser.error("需要 --baseline 或 --save-baseline")
+
+    if args.current:
+        reports = []
+        for path in args.current:
+            with open(path, 'r', encoding='utf-8') as file:
+                reports.append(json.load(file))
+    else:
+        suite = BenchmarkSuite(
+            sizes=args.sizes,
+            benchmarks=args.benchmarks,
+            min_time=args.min_time,
+            max_ops=args.max_ops,
+            measure_memory='peak_memory_bytes' in args.metrics
+        )
+        reports = []
+        for round_index in range(args.rounds):
+            print(f"第 {round_index + 1}/{args.rounds} 轮", file=sys.stderr)
+            reports.append(suite.run())
+    current = aggregate(reports)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(current, file, ensure_ascii=False, indent=2)
+            file.write('\n')
+    if not args.baseline:
+        return 0
+
+    rows = compare(load_baseline(args.baseline), current, args.threshold, args.metrics)
+    print(format_diff(rows))
+    unverified = [row for row in rows if row['status'] == 'unverified']
+    if unverified:
+        print(f"\n{len(unverified)} 个指标变化超过 {args.threshold}% 但缺少轮间或逐次数据，无法检验"
+              "（需要至少两轮或 samples_ms）", file=sys.stderr)
+    regressed = [row for row in rows if row['status'] == 'regressed']
+    if regressed:
+        print(f"\n{len(regressed)} 个指标回归超过 {args.threshold}%", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""请求回放压测
+
+读取录制的匹配请求（JSON Lines，每行一个请求），回放到 MatchingSystem 或 MatchingService 上，
+报告吞吐、延迟分位数与错误 / 超时比例::
+
+    python -m benchmarks.replay requests.log.jsonl --synthesize 5000 --rate 200 --size 10000
+    python -m benchmarks.replay requests.log.jsonl --mode open --speed 2 --size 10000
+    python -m benchmarks.replay requests.log.jsonl --mode closed --concurrency 16 --target service
+
+请求字段: user_id（必填）、top_n（缺省10）、timestamp（秒数或 ISO 8601 时间，开环回放按其间隔发出）、
+lane（服务的准入通道，缺省 interactive）。
+
+开环模式按录制的时间间隔（除以 speed，或按固定 rate）发出请求，不等待前一个请求完成；
+延迟从计划发出时刻算起，因而包含目标过载时的排队时间。闭环模式由 N 个客户端各自串行发送，
+测量目标在固定并发下能达到的吞吐
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from models.user_profile import UserProfile
+from pool.generator import PoolGenerator
+from service.admission import AdmissionController, ServiceBusy
+from service.matching_service import MatchingService
+
+OPEN = 'open'
+CLOSED = 'closed'
+MODES = (OPEN, CLOSED)
+
+TARGETS = ('system', 'service')
+
+DEFAULT_TOP_N = 10
+
+# 目标: (请求, 截止时间或 None) -> 结果
+Target = Callable[[Dict[str, Any], Optional[float]], Any]
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    """时间戳 -> 秒数；接受数字与 ISO 8601 字符串"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    raise ValueError(f"无法解析的时间戳: {value!r}")
+
+def load_requests(path: str) -> List[Dict[str, Any]]:
+    """读取录制的请求
+
+    Args:
+        path: JSON Lines 文件路径，空行忽略
+
+    Returns:
+        List[Dict[str, Any]]: 请求，含 user_id、top_n、timestamp（秒数或 None）、lane
+
+    Raises:
+        ValueError: 某行不是 JSON 对象、缺少 user_id 或时间戳无法解析（信息中含行号）
+    """
+    requests = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or 'user_id' not in record:
+                    raise ValueError("须为含 user_id 的 JSON 对象")
+                requests.append({
+                    'user_id': str(record['user_id']),
+                    'top_n': int(record.get('top_n', DEFAULT_TOP_N)),
+                    'timestamp': _parse_timestamp(record.get('timestamp')),
+                    'lane': record.get('lane', 'interactive'),
+                })
+            except ValueError as e:
+                raise ValueError(f"{path} 第 {number} 行: {e}") from e
+    return requests
+
+def synthesize_requests(
+    user_ids: Sequence[str],
+    count: int,
+    rate: float,
+    seed: int = 0,
+    top_n: int = DEFAULT_TOP_N,
+    start: float = 0.0
+) -> List[Dict[str, Any]]:
+    """生成泊松到达的请求记录，用于没有线上录制时构造回放文件
+
+    Args:
+        user_ids: 可选的目标用户ID
+        count: 请求数
+        rate: 平均到达速率（每秒）
+        seed: 随机种子
+        top_n: 每个请求的 top_n
+        start: 第一个请求之前的起始时间戳
+
+    Returns:
+        List[Dict[str, Any]]: 请求记录
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = start + np.cumsum(rng.exponential(1.0 / rate, size=count))
+    targets = rng.integers(0, len(user_ids), size=count)
+    return [
+        {'user_id': user_ids[target], 'top_n': top_n, 'timestamp': round(float(timestamp), 6)}
+        for target, timestamp in zip(targets, timestamps)
+    ]
+
+def write_requests(path: str, requests: Iterable[Dict[str, Any]]) -> int:
+    """把请求记录写为 JSON Lines，返回写出的条数"""
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for request in requests:
+            file.write(json.dumps(request, ensure_ascii=False) + '\n')
+            written += 1
+    return written
+
+def system_target(matching_system: MatchingSystem, users: Sequence[UserProfile]) -> Target:
+    """直接调用 MatchingSystem.find_best_matches 的目标；有截止时间时按其限时返回"""
+    by_id = {user.user_id: user for user in users}
+
+    def run(request: Dict[str, Any], deadline: Optional[float]) -> Any:
+        target = by_id.get(request['user_id'])
+        if target is None:
+            raise KeyError(request['user_id'])
+        return matching_system.find_best_matches(target, users, request['top_n'], deadline=deadline)
+    return run
+
+def service_target(service: MatchingService) -> Target:
+    """调用 MatchingService.find_matches 的目标（服务不支持截止时间，超时只在完成后判定）"""
+    def run(request: Dict[str, Any], deadline: Optional[float]) -> Any:
+        return service.find_matches(request['user_id'], request['top_n'], request['lane'])
+    return run
+
+def _error_kind(error: BaseException) -> str:
+    """错误分类"""
+    if isinstance(error, KeyError):
+        return 'not_found'
+    if isinstance(error, ServiceBusy):
+        return f'busy_{error.reason}'
+    return type(error).__name__
+
+def _percentiles(values: Sequence[float]) -> Dict[str, float]:
+    """延迟（秒）的均值、分位数与最大值（毫秒）"""
+    if not len(values):
+        return {'mean': 0.0, 'p50': 0.0, 'p90': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    values = np.asarray(values, dtype=np.float64) * 1000.0
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {'mean': float(values.mean()), 'p50': float(p50), 'p90': float(p90),
+            'p95': float(p95), 'p99': float(p99), 'max': float(values.max())}
+
+class ReplayRunner:
+    """请求回放器"""
+
+    def __init__(
+        self,
+        target: Target,
+        mode: str = OPEN,
+        speed: float = 1.0,
+        rate: Optional[float] = None,
+        concurrency: int = 8,
+        timeout: Optional[float] = None,
+        max_workers: int = 64
+    ):
+        """初始化回放器
+
+        Args:
+            target: 目标，见 system_target() / service_target()
+            mode: OPEN 按时间间隔发出，CLOSED 由 concurrency 个客户端串行发送
+            speed: 开环回放的加速倍数（录制间隔除以 speed）
+            rate: 开环回放的固定速率（每秒），给出时忽略录制的时间戳
+            concurrency: 闭环客户端数
+            timeout: 超时（秒），延迟超过的请求计为超时；直接调用匹配系统时也作为其截止时间
+            max_workers: 开环模式执行请求的线程数上限
+
+        Raises:
+            ValueError: 未知的模式或参数不是正数
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的回放模式: {mode}，可选 {', '.join(MODES)}")
+        if speed <= 0 or (rate is not None and rate <= 0) or concurrency <= 0 or max_workers <= 0:
+            raise ValueError("speed、rate、concurrency、max_workers 须为正数")
+        self.target = target
+        self.mode = mode
+        self.speed = speed
+        self.rate = rate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+    def schedule(self, requests: Sequence[Dict[str, Any]]) -> List[float]:
+        """开环模式下各请求相对开始时刻的发出时间（秒）
+
+        Raises:
+            ValueError: 没有给出 rate 且有请求缺少时间戳
+        """
+        if self.rate is not None:
+            return [index / self.rate for index in range(len(requests))]
+        if any(request['timestamp'] is None for request in requests):
+            raise ValueError("开环回放需要每个请求都有 timestamp，或指定 rate")
+        first = min((request['timestamp'] for request in requests), default=0.0)
+        return [(request['timestamp'] - first) / self.speed for request in requests]
+
+    def run(self, requests: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """回放请求并汇总结果
+
+        Returns:
+            Dict[str, Any]: mode、requests、completed、errors（分类 -> 次数）、error_rate、
+            timeouts、timeout_rate、deadline_hits、duration_s、throughput（每秒完成的成功请求数）、
+            latency_ms（均值、p50/p90/p95/p99、最大值）；开环另有 offered_rate、service_time_ms
+            （不含排队）与 dispatch_lag_ms（发出时刻相对计划的滞后）
+        """
+        records: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        clock = time.monotonic
+        start = clock()
+        extra: Dict[str, Any] = {}
+        if self.mode == OPEN:
+            offsets = self.schedule(requests)
+            lags = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for index in sorted(range(len(requests)), key=offsets.__getitem__):
+                    scheduled = start + offsets[index]
+                    delay = scheduled - clock()
+                    if delay > 0:
+                        time.sleep(delay)
+                    lags.append(max(clock() - scheduled, 0.0))
+                    executor.submit(self._execute, requests[index], scheduled, records, index)
+            span = max(offsets, default=0.0)
+            extra = {
+                'offered_rate': len(requests) / span if span > 0 else None,
+                'service_time_ms': _percentiles([r['service_time'] for r in records if r]),
+                'dispatch_lag_ms': _percentiles(lags),
+            }
+        else:
+            position = iter(range(len(requests)))
+            lock = threading.Lock()
+
+            def client():
+                while True:
+                    with lock:
+                        index = next(position, None)
+                    if index is None:
+                        return
+                    self._execute(requests[index], clock(), records, index)
+
+            clients = [threading.Thread(target=client, name=f'replay-client-{n}') for n in range(self.concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            extra = {'concurrency': self.concurrency}
+        duration = clock() - start
+        return self._summarize(records, duration, extra)
+
+    def _execute(self, request: Dict[str, Any], scheduled: float, records: list, index: int) -> None:
+        """执行一个请求并记录结果"""
+        clock = time.monotonic
+        started = clock()
+        deadline = scheduled + self.timeout if self.timeout is not None else None
+        record = {'error': None, 'deadline_hit': False}
+        try:
+            result = self.target(request, deadline)
+            record['deadline_hit'] = bool(getattr(result, 'deadline_hit', False))
+        except Exception as e:
+            record['error'] = _error_kind(e)
+        finished = clock()
+        record['latency'] = finished - scheduled
+        record['service_time'] = finished - started
+        records[index] = record
+
+    def _summarize(self, records: List[Dict[str, Any]], duration: float, extra: Dict[str, Any]) -> Dict[str, Any]:
+        """汇总逐请求记录"""
+        total = len(records)
+        errors: Dict[str, int] = {}
+        for record in records:
+            if record['error'] is not None:
+                errors[record['error']] = errors.get(record['error'], 0) + 1
+        succeeded = [record for record in records if record['error'] is None]
+        timeouts = sum(1 for record in succeeded
+                       if self.timeout is not None and (record['latency'] > self.timeout or record['deadline_hit']))
+        report = {
+            'mode': self.mode,
+            'requests': total,
+            'completed': len(succeeded),
+            'errors': dict(sorted(errors.items())),
+            'error_rate': (total - len(succeeded)) / total if total else 0.0,
+            'timeouts': timeouts,
+            'timeout_rate': timeouts / total if total else 0.0,
+            'deadline_hits': sum(1 for record in succeeded if record['deadline_hit']),
+            'duration_s': duration,
+            'throughput': len(succeeded) / duration if duration > 0 else 0.0,
+            'latency_ms': _percentiles([record['latency'] for record in succeeded]),
+        }
+        report.update(extra)
+        return report
+
+def format_report(report: Dict[str, Any]) -> str:
+    """把回放结果格式化为文本"""
+    latency = report['latency_ms']
+    lines = [
+        f"模式 {report['mode']}，请求 {report['requests']}，成功 {report['completed']}，"
+        f"耗时 {report['duration_s']:.2f}s，吞吐 {report['throughput']:.1f}/s",
+        f"错误率 {report['error_rate']:.2%}"
+        + (f" {report['errors']}" if report['errors'] else '') + f"，超时率 {report['timeout_rate']:.2%}",
+        "延迟(ms) " + '  '.join(f'{name} {value:.2f}' for name, value in latency.items()),
+    ]
+    if report.get('service_time_ms'):
+        lines.append("服务时间(ms) " + '  '.join(
+            f'{name} {value:.2f}' for name, value in report['service_time_ms'].items()))
+    return '\n'.join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: 回放请求或生成请求记录"""
+    parser = argparse.ArgumentParser(description="匹配请求回放压测")
+    parser.add_argument('requests', help="请求记录 JSONL 路径")
+    parser.add_argument('--mode', choices=MODES, default=OPEN, help="开环（按时间间隔）或闭环（固定并发）")
+    parser.add_argument('--speed', type=float, default=1.0, help="开环回放的加速倍数")
+    parser.add_argument('--rate', type=float, help="开环回放的固定速率（每秒）；与 --synthesize 一起时为生成的平均速率")
+    parser.add_argument('--concurrency', type=int, default=8, help="闭环客户端数")
+    parser.add_argument('--timeout', type=float, help="超时（秒）")
+    parser.add_argument('--target', choices=TARGETS, default='system', help="回放目标")
+    parser.add_argument('--admission', type=int, help="服务目标的准入并发上限，缺省不限制")
+    parser.add_argument('--size', type=int, help="使用该规模的合成用户池，缺省使用 data/input 的用户池")
+    parser.add_argument('--seed', type=int, default=0, help="合成用户池与请求的随机种子")
+    parser.add_argument('--synthesize', type=int, metavar='COUNT', help="生成 COUNT 条请求写入 requests 后退出")
+    parser.add_argument('--output', help="结果 JSON 路径")
+    args = parser.parse_args(argv)
+
+    pools_loader = LoaderManager().pools_loader
+    games = pools_loader.load_game_pool()
+    users = list(PoolGenerator(seed=args.seed).users(args.size)) if args.size else pools_loader.load_user_pool()
+    if args.synthesize:
+        records = synthesize_requests([user.user_id for user in users], args.synthesize,
+                                      args.rate or 100.0, seed=args.seed)
+        print(json.dumps({'output': args.requests, 'requests': write_requests(args.requests, records)}))
+        return 0
+
+    system = MatchingSystem(games)
+    if args.target == 'system':
+        target = system_target(system, users)
+    else:
+        admission = AdmissionController(max_concurrency=args.admission) if args.admission else None
+        target = service_target(MatchingService(system, users, admission=admission))
+    runner = ReplayRunner(target, args.mode, speed=args.speed, rate=args.rate,
+                          concurrency=args.concurrency, timeout=args.timeout)
+    report = runner.run(load_requests(args.requests))
+    print(format_report(report), file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""匹配热点路径基准测试
+
+在 1k / 10k / 100k / 1M 合成用户池上测量 MatchingSystem 初始化、用户池加载、
+match_users、find_best_matches 以及各匹配器的吞吐（ops/s）、延迟分位数（p50/p95/p99）
+与内存峰值，结果写为 JSON 以便比较不同版本::
+
+    python -m benchmarks.suite --sizes 1000 10000 --output results.json
+
+计时与内存测量分开进行: 先不开启 tracemalloc 计时，再单独执行一次操作测量 Python 堆的峰值，
+避免 tracemalloc 的开销计入延迟
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils import profiling
+from loaders import LoaderManager
+from loaders.pools_loader import PoolsLoader
+from matching.matching_system import MatchingSystem
+from pool.generator import PoolGenerator
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+# 基准名 -> 是否与用户池规模相关（无关的只在第一个规模上运行一次）
+BENCHMARKS = {
+    'matching_system_init': False,
+    'load_pool': True,
+    'match_users': True,
+    'find_best_matches': True,
+    'match_type': True,
+    'match_preference': True,
+    'match_gender': True,
+    'mbti_lookup': True,
+    'zodiac_lookup': True,
+}
+
+# 逐对基准预先抽取的用户对数量（按操作序号循环使用）
+_PAIRS = 1024
+
+def summarize(latencies: Sequence[float]) -> Dict[str, float]:
+    """由逐次延迟（秒）计算吞吐与分位数
+
+    Returns:
+        Dict[str, float]: ops、ops_per_sec、mean_ms、p50_ms、p95_ms、p99_ms
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if not len(latencies):
+        return {'ops': 0, 'ops_per_sec': 0.0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000.0
+    total = float(latencies.sum())
+    return {
+        'ops': int(len(latencies)),
+        'ops_per_sec': len(latencies) / total if total > 0 else float('inf'),
+        'mean_ms': float(latencies.mean() * 1000.0),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+def time_operation(
+    operation: Callable[[int], Any],
+    min_time: float = 1.0,
+    max_ops: int = 2000,
+    min_ops: int = 3
+) -> List[float]:
+    """反复执行操作并记录每次的耗时
+
+    执行次数至少为 min_ops，累计耗时达到 min_time 或次数达到 max_ops 后停止。
+
+    Args:
+        operation: 以操作序号为参数的操作
+        min_time: 最短累计耗时（秒）
+        max_ops: 最多执行次数
+        min_ops: 最少执行次数
+
+    Returns:
+        List[float]: 每次的耗时（秒）
+    """
+    latencies = []
+    clock = time.perf_counter
+    elapsed = 0.0
+    while len(latencies) < max_ops and (len(latencies) < min_ops or elapsed < min_time):
+        start = clock()
+        operation(len(latencies))
+        latency = clock() - start
+        latencies.append(latency)
+        elapsed += latency
+    return latencies
+
+def peak_memory(operation: Callable[[int], Any]) -> int:
+    """执行一次操作期间 Python 堆（含 numpy 数组）相对执行前的峰值增量（字节）"""
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    operation(0)
+    peak = tracemalloc.get_traced_memory()[1]
+    if not was_tracing:
+        tracemalloc.stop()
+    return max(peak - baseline, 0)
+
+def _max_rss() -> Optional[int]:
+    """进程的最大常驻内存（字节），平台不支持时为 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class BenchmarkSuite:
+    """基准测试套件"""
+
+    def __init__(
+        self,
+        sizes: Sequence[int] = SIZES,
+        benchmarks: Optional[Sequence[str]] = None,
+        seed: int = 0,
+        min_time: float = 1.0,
+        max_ops: int = 2000,
+        min_ops: int = 3,
+        top_n: int = 10,
+        measure_memory: bool = True
+    ):
+        """初始化套件
+
+        Args:
+            sizes: 用户池规模
+            benchmarks: 要运行的基准，缺省为 BENCHMARKS 中的全部
+            seed: 合成用户池的随机种子
+            min_time: 每个基准的最短累计耗时（秒）
+            max_ops: 每个基准最多执行次数
+            min_ops: 每个基准最少执行次数
+            top_n: find_best_matches 的结果数量
+            measure_memory: 是否测量内存峰值
+
+        Raises:
+            ValueError: 未知的基准名
+        """
+        benchmarks = list(BENCHMARKS) if benchmarks is None else list(benchmarks)
+        unknown = [name for name in benchmarks if name not in BENCHMARKS]
+        if unknown:
+            raise ValueError(f"未知的基准: {', '.join(unknown)}")
+        self.sizes = list(sizes)
+        self.benchmarks = benchmarks
+        self.seed = seed
+        self.min_time = min_time
+        self.max_ops = max_ops
+        self.min_ops = min_ops
+        self.top_n = top_n
+        self.measure_memory = measure_memory
+        self.games = LoaderManager().pools_loader.load_game_pool()
+        self.system = MatchingSystem(self.games)
+
+    def operations(self, size: int, users: List, workdir: str) -> Dict[str, Callable[[int], Any]]:
+        """构造某个规模下各基准的操作
+
+        Args:
+            size: 用户池规模
+            users: 合成用户池
+            workdir: 存放用户池文件的临时目录
+
+        Returns:
+            Dict[str, Callable[[int], Any]]: 基准名 -> 以操作序号为参数的操作
+        """
+        system = self.system
+        rng = np.random.default_rng(self.seed)
+        pairs = [(users[i], users[j]) for i, j in rng.integers(0, len(users), size=(_PAIRS, 2))]
+        targets = [users[i] for i in rng.integers(0, len(users), size=_PAIRS)]
+
+        def pair(function):
+            def operation(index: int):
+                user1, user2 = pairs[index % _PAIRS]
+                return function(user1, user2)
+            return operation
+
+        operations = {
+            'matching_system_init': lambda index: MatchingSystem(self.games),
+            'match_users': pair(system.match_users),
+            'find_best_matches': lambda index: system.find_best_matches(
+                targets[index % _PAIRS], users, self.top_n),
+            'match_type': pair(system.game_matcher.match_type),
+            'match_preference': pair(system.game_matcher.match_preference),
+            'match_gender': pair(system.ordered_matcher.match_gender),
+            'mbti_lookup': pair(lambda user1, user2: system.mbti_matcher.get_weighted_score(
+                user1.mbti, user2.mbti)),
+            'zodiac_lookup': pair(lambda user1, user2: system.zodiac_matcher.get_weighted_score(
+                user1.zodiac, user2.zodiac)),
+        }
+        if 'load_pool' in self.benchmarks:
+            operations['load_pool'] = self._pool_loader(size, workdir)
+        return operations
+
+    def _pool_loader(self, size: int, workdir: str) -> Callable[[int], Any]:
+        """写出 size 个用户的 data/input 目录副本，返回加载它的操作"""
+        source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'input')
+        base = os.path.join(workdir, f'input_{size}')
+        pools = os.path.join(base, 'pools')
+        os.makedirs(pools, exist_ok=True)
+        for name in os.listdir(os.path.join(source, 'pools')):
+            if name != 'user_pool.json':
+                shutil.copy(os.path.join(source, 'pools', name), pools)
+        PoolGenerator(seed=self.seed).write(os.path.join(pools, 'user_pool.json'), size, 'json')
+        return lambda index: PoolsLoader(base).load_user_pool()
+
+    def run(self, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """运行全部基准
+
+        Args:
+            progress: 每得到一条结果时的回调
+
+        Returns:
+            Dict[str, Any]: {'meta': 运行环境, 'results': 结果列表}；每条结果含 benchmark、size、
+            ops、ops_per_sec、mean_ms、p50_ms、p95_ms、p99_ms、peak_memory_bytes 与逐次延迟 samples_ms
+        """
+        results = []
+        done = set()
+        with tempfile.TemporaryDirectory(prefix='gresy-bench-') as workdir:
+            for size in self.sizes:
+                users = list(PoolGenerator(seed=self.seed).users(size))
+                operations = self.operations(size, users, workdir)
+                for name in self.benchmarks:
+                    scaled = BENCHMARKS[name]
+                    if not scaled and name in done:
+                        continue
+                    done.add(name)
+                    result = self.measure(name, operations[name])
+                    result['size'] = size if scaled else None
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+                del users, operations
+        return {'meta': self.metadata(), 'results': results}
+
+    def measure(self, name: str, operation: Callable[[int], Any]) -> Dict[str, Any]:
+        """计时并测量单个基准"""
+        operation(0)  # 预热: 编码器、缓存等首次使用的开销不计入延迟
+        latencies = time_operation(operation, self.min_time, self.max_ops, self.min_ops)
+        result = {'benchmark': name}
+        result.update(summarize(latencies))
+        result['peak_memory_bytes'] = peak_memory(operation) if self.measure_memory else None
+        result['samples_ms'] = [round(latency * 1000.0, 6) for latency in latencies]
+        return result
+
+    def metadata(self) -> Dict[str, Any]:
+        """运行环境与参数"""
+        return {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'seed': self.seed,
+            'sizes': self.sizes,
+            'min_time': self.min_time,
+            'max_ops': self.max_ops,
+            'top_n': self.top_n,
+            'max_rss_bytes': _max_rss(),
+        }
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    """把结果格式化为文本表格"""
+    lines = [f"{'benchmark':<22}{'size':>9}{'ops/s':>13}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'peak MB':>10}"]
+    for result in results:
+        peak = result.get('peak_memory_bytes')
+        lines.append(
+            f"{result['benchmark']:<22}{result['size'] if result['size'] is not None else '-':>9}"
+            f"{result['ops_per_sec']:>13.1f}{result['p50_ms']:>11.4f}{result['p95_ms']:>11.4f}"
+            f"{result['p99_ms']:>11.4f}{peak / 2 ** 20 if peak is not None else float('nan'):>10.2f}"
+        )
+    return '\n'.join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: 运行基准并输出 JSON"""
+    parser = argparse.ArgumentParser(description="匹配热点路径基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="用户池规模")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), help="要运行的基准")
+    parser.add_argument('--seed', type=int, default=0, help="合成用户池的随机种子")
+    parser.add_argument('--min-time', type=float, default=1.0, help="每个基准的最短累计耗时（秒）")
+    parser.add_argument('--max-ops', type=int, default=2000, help="每个基准最多执行次数")
+    parser.add_argument('--min-ops', type=int, default=3, help="每个基准最少执行次数")
+    parser.add_argument('--no-memory', action='store_true', help="不测量内存峰值")
+    parser.add_argument('--output', help="结果 JSON 路径，缺省输出到标准输出")
+    profiling.add_arguments(parser, scopes=False)
+    args = parser.parse_args(argv)
+    profiler = profiling.ProfileSession.from_args(args)
+
+    suite = BenchmarkSuite(
+        sizes=args.sizes,
+        benchmarks=args.benchmarks,
+        seed=args.seed,
+        min_time=args.min_time,
+        max_ops=args.max_ops,
+        min_ops=args.min_ops,
+        measure_memory=not args.no_memory
+    )
+    with profiler.session('suite') if profiler is not None else nullcontext():
+        report = suite.run(progress=lambda result: print(format_table([result]).splitlines()[1], file=sys.stderr))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,6 +12,55 @@ from models.game_profile import GameProfile
 
 logger = logging.getLogger(__name__)
 
+def user_from_dict(user_data: Dict[str, Any]) -> UserProfile:
+    """由 user_pool.json 格式的字典创建用户档案
+
+    Args:
+        user_data: 用户数据
+
+    Returns:
+        UserProfile: 用户档案
+
+    Raises:
+        KeyError: 缺少字段
+    """
+    return UserProfile(
+        user_id=user_data['id'],
+        games=user_data['游戏'],
+        gender=user_data['性别'],
+        gender_preference=user_data['性别倾向'],
+        play_region=user_data['游玩服务器'],
+        play_time=user_data['游玩固定时间'],
+        mbti=user_data['MBTI'],
+        zodiac=user_data['星座'],
+        game_experience=user_data['游戏经验'],
+        online_status=user_data['在线状态'],
+        game_style=user_data['游戏风格']
+    )
+
+def user_to_dict(user: UserProfile) -> Dict[str, Any]:
+    """把用户档案转为 user_pool.json 格式的字典，是 user_from_dict 的逆操作
+
+    Args:
+        user: 用户档案
+
+    Returns:
+        Dict[str, Any]: 用户数据
+    """
+    return {
+        'id': user.user_id,
+        '游戏': list(user.games),
+        '性别': user.gender,
+        '性别倾向': list(user.gender_preference or []),
+        '游玩服务器': user.play_region,
+        '游玩固定时间': user.play_time,
+        'MBTI': user.mbti,
+        '星座': user.zodiac,
+        '游戏经验': user.game_experience,
+        '在线状态': user.online_status,
+        '游戏风格': user.game_style
+    }
+
 class PoolsLoader:
     """数据池加载器类"""
     
@@ -74,23 +123,7 @@ class PoolsLoader:
         if not data:
             return []
             
-        users = []
-        for user_data in data.get('users', []):
-            user = UserProfile(
-                user_id=user_data['id'],
-                games=user_data['游戏'],
-                gender=user_data['性别'],
-                gender_preference=user_data['性别倾向'],
-                play_region=user_data['游玩服务器'],
-                play_time=user_data['游玩固定时间'],
-                mbti=user_data['MBTI'],
-                zodiac=user_data['星座'],
-                game_experience=user_data['游戏经验'],
-                online_status=user_data['在线状态'],
-                game_style=user_data['游戏风格']
-            )
-            users.append(user)
-        return users
+        return [user_from_dict(user_data) for user_data in data.get('users', [])]
         
     def load_game_pool(self) -> List[GameProfile]:
         """加载游戏池数据
@@ -3,13 +3,21 @@
 基于matcher模块实现的游戏玩家匹配系统主程序，提供命令行交互界面。
 """
 
+import argparse
 import os
 import sys
-from typing import List, Tuple, Dict
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List, Optional, Tuple, Dict
 from matching.matching_system import MatchingSystem
 from loaders import LoaderManager
 from models.user_profile import UserProfile
 from models.game_profile import GameProfile
+from pool import VersionedPool, PoolSnapshot
+from matching.instrumentation import Instrumentation
+from matching.tracing import QueryTracer
+from utils import profiling
+from service.metrics import MetricsRegistry, instrumentation_collector
 import pandas as pd
 from datetime import datetime
 
@@ -40,16 +48,78 @@ MATCHING_CONFIG = {
 class MatchingApp:
     """匹配系统应用类，封装主要的匹配功能和交互逻辑"""
     
-    def __init__(self, debug_mode: bool = SYSTEM_CONFIG['debug_mode']):
+    def __init__(
+        self,
+        debug_mode: bool = SYSTEM_CONFIG['debug_mode'],
+        metrics: Optional[MetricsRegistry] = None,
+        profiler: Optional[profiling.ProfileSession] = None,
+        tracer: Optional[QueryTracer] = None
+    ):
         """初始化匹配系统
         
         Args:
             debug_mode: 是否启用调试模式
+            metrics: 指标注册表，记录查询、加载耗时、用户池大小与重新加载次数，None 表示不记录
+            profiler: 剖析会话，范围为 query 时每次查询单独剖析，None 表示不剖析
+            tracer: 查询追踪器，每次查询输出一条 JSON 追踪记录，None 表示不追踪
         """
-        self.users: List[UserProfile] = []
-        self.games: List[GameProfile] = []
+        # 多版本用户池：查询固定一个快照，更新发布新版本，两者互不阻塞
+        self.pool = VersionedPool()
         self.debug_mode = debug_mode
+        self.metrics = metrics
+        self.profiler = profiler
+        self.tracer = tracer
+        self._query_count = 0
         self.matcher = None  # 延迟初始化匹配器，等待游戏数据加载完成
+        if metrics is not None:
+            metrics.register_collector(self._collect_metrics)
+        
+    @property
+    def users(self) -> PoolSnapshot:
+        """当前版本的用户池快照"""
+        return self.pool.snapshot()
+        
+    @property
+    def games(self) -> Tuple[GameProfile, ...]:
+        """当前版本的游戏档案"""
+        return self.pool.snapshot().games
+        
+    def _collect_metrics(self):
+        """导出时采集用户池大小、版本与匹配计时"""
+        snapshot = self.pool.snapshot()
+        families = [
+            ('gresy_pool_size', 'gauge', "当前用户池大小", [('', {}, len(snapshot))]),
+            ('gresy_pool_version', 'gauge', "当前用户池版本号", [('', {}, snapshot.version)]),
+        ]
+        if self.matcher is not None and self.matcher.instrumentation is not None:
+            families.extend(instrumentation_collector(self.matcher.instrumentation)())
+        return families
+        
+    def _timed_load(self, loader: str):
+        """记录一个加载步骤的耗时，未配置指标时不记录"""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.histogram(
+            'gresy_loader_duration_seconds', "数据加载耗时（秒）", ('loader',)
+        ).time(loader=loader)
+        
+    @contextmanager
+    def _timed_query(self) -> Iterator[None]:
+        """记录一次交互查询的次数、结果与耗时，未配置指标时不记录"""
+        if self.metrics is None:
+            yield
+            return
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.metrics.counter('gresy_queries_total', "匹配查询数", ('lane', 'outcome')).inc(
+                lane='interactive', outcome=outcome)
+            self.metrics.histogram(
+                'gresy_query_duration_seconds', "匹配查询延迟（秒），含排队与合并等待", ('lane',)
+            ).observe(time.perf_counter() - start, lane='interactive')
         
     def load_data(self) -> None:
         """加载用户和游戏数据"""
@@ -60,15 +130,27 @@ class MatchingApp:
                                   SYSTEM_CONFIG['data_dir'])
             
             # 初始化加载器管理器
-            loader = LoaderManager()
+            with self._timed_load('loader_manager'):
+                loader = LoaderManager()
             pools_loader = loader.pools_loader
             
             # 加载用户和游戏数据
-            self.users = pools_loader.load_user_pool()
-            self.games = pools_loader.load_game_pool()
+            with self._timed_load('user_pool'):
+                users = pools_loader.load_user_pool()
+            with self._timed_load('game_pool'):
+                games = pools_loader.load_game_pool()
+            # 版本号为0表示尚未加载过，首次加载不计为替换
+            replacing = self.pool.version > 0
+            self.pool.replace(users, games)
             
             # 初始化匹配器
-            self.matcher = MatchingSystem(self.games)
+            with self._timed_load('matching_system'):
+                self.matcher = MatchingSystem(self.games)
+            self.matcher.tracer = self.tracer
+            if self.metrics is not None:
+                self.matcher.instrumentation = Instrumentation()
+                # 首次加载只注册计数器（导出0），替换已有用户池时才计数
+                self.metrics.counter('gresy_pool_reloads_total', "用户池替换次数").inc(1 if replacing else 0)
                 
             print(f"成功加载 {len(self.users)} 个用户和 {len(self.games)} 个游戏")
             
@@ -288,8 +370,11 @@ class MatchingApp:
         
         while True:
             try:
+                # 本次查询固定使用同一个快照
+                users = self.users
+                
                 # 显示用户选择提示
-                print(f"\n请输入要查看的用户编号 (1-{len(self.users)})，输入0退出：")
+                print(f"\n请输入要查看的用户编号 (1-{len(users)})，输入0退出：")
                 user_index = int(input().strip())
                 
                 # 检查是否退出
@@ -298,18 +383,22 @@ class MatchingApp:
                     break
                     
                 # 验证输入范围
-                if user_index < 1 or user_index > len(self.users):
-                    print(f"请输入1到{len(self.users)}之间的数字！")
+                if user_index < 1 or user_index > len(users):
+                    print(f"请输入1到{len(users)}之间的数字！")
                     continue
                     
                 # 获取目标用户并执行匹配
-                target_user = self.users[user_index - 1]
+                target_user = users[user_index - 1]
                 print("\n正在执行匹配...")
-                matches = self.matcher.find_best_matches(
-                    target_user, 
-                    self.users,
-                    top_n=MATCHING_CONFIG['default_top_n']
-                )
+                self._query_count += 1
+                profile = self.profiler.query(f'query-{self._query_count:04d}-{target_user.user_id}') \
+                    if self.profiler is not None else nullcontext()
+                with profile, self._timed_query():
+                    matches = self.matcher.find_best_matches(
+                        target_user, 
+                        users,
+                        top_n=MATCHING_CONFIG['default_top_n']
+                    )
                 
                 if not matches:
                     print("\n未找到匹配的用户。")
@@ -344,16 +433,37 @@ class MatchingApp:
                 if self.debug_mode:
                     raise
                     
-def main():
+def main(argv: Optional[List[str]] = None):
     """主函数"""
+    parser = argparse.ArgumentParser(description="游戏玩家匹配系统")
+    parser.add_argument('--metrics-port', type=int, help="在本机该端口的 /metrics 导出 Prometheus 指标")
+    parser.add_argument('--metrics-file', help="退出时把 Prometheus 指标写入该文件")
+    parser.add_argument('--trace-file', help="把每次查询的追踪记录写入该 JSONL 文件（按大小轮转）")
+    parser.add_argument('--trace-slow-ms', type=float, help="只追踪耗时不低于该值（毫秒）的查询")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    profiler = profiling.ProfileSession.from_args(args)
+    metrics = MetricsRegistry() if args.metrics_port is not None or args.metrics_file else None
+    server = metrics.serve(args.metrics_port) if args.metrics_port is not None else None
+    tracer = QueryTracer(args.trace_file, slow_ms=args.trace_slow_ms) if args.trace_file else None
     try:
         # 创建并运行匹配系统
-        system = MatchingApp(debug_mode=SYSTEM_CONFIG['debug_mode'])
-        system.run()
+        system = MatchingApp(debug_mode=SYSTEM_CONFIG['debug_mode'], metrics=metrics, profiler=profiler,
+                             tracer=tracer)
+        with profiler.session() if profiler is not None else nullcontext():
+            system.run()
     except KeyboardInterrupt:
         print("\n程序被用户中断")
     except Exception as e:
         print(f"程序运行失败: {str(e)}")
+    finally:
+        if tracer is not None:
+            tracer.close()
+        if server is not None:
+            server.close()
+        if args.metrics_file:
+            metrics.write(args.metrics_file)
         
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -8,7 +8,18 @@ from .numeric_matcher import NumericMatcher
 from .preference_matcher import PreferenceMatcher, MBTIMatcher, ZodiacMatcher
 from .ordered_matcher import OrderedMatcher
 from .game_matcher import GameMatcher
-from .matching_system import MatchingSystem
+from .instrumentation import Instrumentation
+from .memory import memory_report, format_memory_report
+from .tracing import QueryTracer
+from .matching_system import MatchingSystem, MatchResults
+from .encoded_pool import PoolEncoder, EncodedPool, EncodedQuery, DIMENSIONS
+from .shared_pool import SharedPoolDescriptor, SharedEncodedPool
+from .prefilter import HardConstraints, prefilter
+from .inverted_index import GameIndex
+from .minhash import MinHashLSH
+from .ann import FeatureEmbedding, IVFIndex
+from .clusters import ClusterIndex
+from .candidates import CandidateIndex, TwoStageMatcher
 
 __all__ = [
     'BaseMatcher',
@@ -18,5 +29,25 @@ __all__ = [
     'ZodiacMatcher',
     'OrderedMatcher',
     'GameMatcher',
-    'MatchingSystem'
+    'Instrumentation',
+    'memory_report',
+    'format_memory_report',
+    'QueryTracer',
+    'MatchingSystem',
+    'MatchResults',
+    'PoolEncoder',
+    'EncodedPool',
+    'EncodedQuery',
+    'DIMENSIONS',
+    'SharedPoolDescriptor',
+    'SharedEncodedPool',
+    'HardConstraints',
+    'prefilter',
+    'GameIndex',
+    'MinHashLSH',
+    'FeatureEmbedding',
+    'IVFIndex',
+    'ClusterIndex',
+    'CandidateIndex',
+    'TwoStageMatcher'
 ] 
\ No newline at end of file
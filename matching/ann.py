@@ -0,0 +1,475 @@
+"""近似最近邻索引模块
+
+由编码器展开的相似度表导出用户嵌入向量，使两个用户嵌入的内积近似加权总分；
+在嵌入上构建 IVF 索引（numpy 实现的 k-means 粗量化），查询只探查与目标最接近的
+nprobe 个簇，再用 find_best_matches 对簇内用户精确重排
+"""
+
+import heapq
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from loaders.pools_loader import user_from_dict, user_to_dict
+from matching.encoded_pool import DIMENSIONS, EncodedPool, PoolEncoder
+from models.user_profile import UserProfile
+
+DEFAULT_NPROBE = 8
+
+# k-means 每次处理的向量数，限制距离矩阵的内存
+_KMEANS_BATCH = 65536
+
+# 相似度表维度: 维度名 -> (分类列, 相似度表)
+_TABLE_DIMENSIONS = {
+    'server': ('server', 'server'),
+    'time': ('time', 'time'),
+    'experience': ('experience', 'experience'),
+    'style': ('style', 'style'),
+    'mbti': ('mbti', 'mbti'),
+    'zodiac': ('zodiac', 'zodiac'),
+    'gender': ('gender', 'gender'),
+}
+
+def _factor(table: np.ndarray, weight: float) -> np.ndarray:
+    """把相似度表分解为行向量，使行向量的内积近似 weight * 表项
+
+    表先对称化，再只保留正特征值对应的分量（半正定部分的最佳近似）。
+    """
+    table = np.nan_to_num(np.asarray(table, dtype=np.float64))
+    if table.size == 0:
+        return np.zeros((0, 0))
+    values, vectors = np.linalg.eigh((table + table.T) / 2)
+    keep = values > 1e-9
+    return vectors[:, keep] * np.sqrt(values[keep] * weight)
+
+def _value_key(value: Any) -> str:
+    """分类取值的可序列化键（性别列的取值为元组）"""
+    return json.dumps(value, ensure_ascii=False)
+
+class FeatureEmbedding:
+    """用户嵌入
+
+    每个维度对应嵌入中的一段，段内向量的内积近似该维度分数乘以权重:
+    相似度表维度取相似度表的特征分解，在线状态与风格取独热编码，
+    游戏类型取类型相关矩阵的分解按类型数平均，游戏偏好取按 sqrt(游戏数) 归一化的多热向量
+    （余弦相似度，近似 Jaccard）。社交维度拆入在线、风格与社交经验三段。
+    嵌入按取值（而不是编码）保存，构建后出现的新取值嵌入为零向量，
+    精确重排不受影响，但召回率会下降，此时应重建索引。
+    """
+
+    def __init__(self, blocks: Dict[str, Dict[str, Any]], encoder: Optional[PoolEncoder] = None):
+        """初始化嵌入
+
+        Args:
+            blocks: 段名 -> {'column': 分类列或 'games' / 'types', 'values': 取值键列表, 'matrix': 行向量}
+            encoder: embed() 缺省使用的编码器
+        """
+        self.blocks = blocks
+        self.encoder = encoder
+        self._rows = {
+            name: {key: row for row, key in enumerate(block['values'])}
+            for name, block in blocks.items()
+        }
+        self._game_types: Dict[str, List[str]] = blocks.get('game_type', {}).get('game_types', {})
+        self.dim = sum(block['matrix'].shape[1] for block in blocks.values())
+
+    @classmethod
+    def build(cls, matching_system, users: Iterable[UserProfile]) -> 'FeatureEmbedding':
+        """由匹配系统的相似度表构建嵌入
+
+        Args:
+            matching_system: 匹配系统
+            users: 用于确定取值表的用户
+        """
+        encoder = matching_system.encoder
+        encoded = encoder.encode(users)
+        tables = encoded.tables
+        vocabularies = encoded.vocabularies
+        weights = dict(zip(DIMENSIONS, np.asarray(encoded.weights, dtype=np.float64) / encoded.weight_total))
+        social = np.asarray(encoded.social_weights, dtype=np.float64) * weights['game_social']
+
+        def keys(column: str) -> List[str]:
+            return [_value_key(value) for value in vocabularies[column]]
+
+        def one_hot(column: str, weight: float) -> Dict[str, Any]:
+            size = len(vocabularies[column])
+            return {'column': column, 'values': keys(column), 'matrix': np.eye(size) * np.sqrt(weight)}
+
+        # 社交维度: (0.5 + 0.5 * 相等) * 权重，常数部分对排序无影响
+        blocks = {
+            'online_status': one_hot('online', weights['online_status'] + social[0] * 0.5),
+            'style_equal': one_hot('style', social[1] * 0.5),
+            'social_experience': {
+                'column': 'experience', 'values': keys('experience'),
+                'matrix': _factor(tables['social_experience'], social[2])
+            },
+        }
+        for dimension, (column, table) in _TABLE_DIMENSIONS.items():
+            blocks[dimension] = {
+                'column': column, 'values': keys(column),
+                'matrix': _factor(tables[table], weights[dimension])
+            }
+
+        types = list(vocabularies['types'])
+        game_types = {}
+        for game in vocabularies['games']:
+            codes = np.flatnonzero(encoder.game_types[encoder.code('games', game)][:len(types)])
+            game_types[game] = [types[code] for code in codes]
+        blocks['game_type'] = {
+            'column': 'types', 'values': [_value_key(value) for value in types],
+            'matrix': _factor(tables['type_correlation'][:len(types), :len(types)], weights['game_type']),
+            'game_types': game_types
+        }
+        games = list(vocabularies['games'])
+        blocks['game_preference'] = {
+            'column': 'games', 'values': [_value_key(value) for value in games],
+            'matrix': np.eye(len(games)) * np.sqrt(weights['game_preference'])
+        }
+        return cls(blocks, encoder)
+
+    def embed(self, users: Iterable[UserProfile], encoder: Optional[PoolEncoder] = None) -> np.ndarray:
+        """计算用户嵌入
+
+        Args:
+            users: 用户档案
+            encoder: 编码器，缺省使用构建嵌入时匹配系统的编码器
+
+        Returns:
+            np.ndarray: (用户数, dim) 的 float32 矩阵
+
+        Raises:
+            ValueError: 嵌入由 from_state() 重建且未给出编码器
+        """
+        encoder = self.encoder if encoder is None else encoder
+        if encoder is None:
+            raise ValueError("从序列化状态重建的嵌入需要给出编码器")
+        return self.embed_encoded(encoder.encode(users))
+
+    def embed_encoded(self, pool: EncodedPool) -> np.ndarray:
+        """由编码池的分类列和游戏多热矩阵计算嵌入
+
+        每段先把段内行向量按编码池的编码重排成查找表，分类列按编码取行，
+        游戏与游戏类型段用多热矩阵乘查找表，全程没有逐用户的循环。
+
+        Args:
+            pool: 编码池
+
+        Returns:
+            np.ndarray: (用户数, dim) 的 float32 矩阵
+        """
+        vocabularies = pool.vocabularies
+        vectors = np.zeros((len(pool), self.dim), dtype=np.float32)
+        start = 0
+        for name, block in self.blocks.items():
+            width = block['matrix'].shape[1]
+            column = block['column']
+            if column == 'games':
+                part = pool.games @ self._by_code(name, vocabularies['games'])
+                part /= np.sqrt(np.maximum(pool.game_counts, 1))[:, np.newaxis]
+            elif column == 'types':
+                # 游戏类型按嵌入构建时的 游戏 -> 类型 对应关系从游戏推出
+                rows = self._rows[name]
+                membership = np.zeros((len(vocabularies['games']), len(rows)), dtype=np.int32)
+                for code, game in enumerate(vocabularies['games']):
+                    for game_type in self._game_types.get(game, ()):
+                        membership[code, rows[_value_key(game_type)]] = 1
+                types = (pool.games.astype(np.int32) @ membership > 0).astype(np.float64)
+                part = types @ block['matrix']
+                part /= np.maximum(types.sum(axis=1), 1)[:, np.newaxis]
+            else:
+                part = self._by_code(name, vocabularies[column])[pool.columns[column]]
+            vectors[:, start:start + width] = part
+            start += width
+        return vectors
+
+    def _by_code(self, name: str, vocabulary: List[Any]) -> np.ndarray:
+        """把一段的行向量按编码重排: 第 c 行为编码 c 的取值的行向量，嵌入中没有的取值为零向量"""
+        matrix = self.blocks[name]['matrix']
+        rows = self._rows[name]
+        table = np.zeros((len(vocabulary), matrix.shape[1]))
+        for code, value in enumerate(vocabulary):
+            row = rows.get(_value_key(value))
+            if row is not None:
+                table[code] = matrix[row]
+        return table
+
+    def state(self):
+        """序列化为 (元数据, 数组)"""
+        metadata = {
+            name: {key: value for key, value in block.items() if key != 'matrix'}
+            for name, block in self.blocks.items()
+        }
+        arrays = {f'embedding.{name}': block['matrix'] for name, block in self.blocks.items()}
+        return metadata, arrays
+
+    @classmethod
+    def from_state(cls, metadata: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'FeatureEmbedding':
+        """由 state() 的结果重建嵌入"""
+        blocks = {}
+        for name, block in metadata.items():
+            blocks[name] = dict(block, matrix=np.asarray(arrays[f'embedding.{name}']))
+        return cls(blocks)
+
+def kmeans(
+    vectors: np.ndarray,
+    k: int,
+    iterations: int = 20,
+    seed: int = 0
+) -> np.ndarray:
+    """numpy 实现的 k-means（Lloyd 迭代，分批计算距离）
+
+    requirements.txt 固定了 scikit-learn，但只有 0_Heap of debris 下的旧脚本使用它，
+    matching 包运行时只依赖 numpy；为几十行的 Lloyd 迭代不值得让索引依赖 scikit-learn。
+
+    Args:
+        vectors: (n, d) 向量
+        k: 簇数
+        iterations: 迭代次数上限
+        seed: 随机种子
+
+    Returns:
+        np.ndarray: (k, d) 簇中心
+    """
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float64)
+    assignment = None
+    for _ in range(iterations):
+        labels = _nearest(vectors, centroids)
+        if assignment is not None and np.array_equal(labels, assignment):
+            break
+        assignment = labels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        if empty.any():
+            # 空簇重新取随机向量作为中心
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """每个向量最近的簇中心（欧氏距离）"""
+    squared = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _KMEANS_BATCH):
+        batch = vectors[start:start + _KMEANS_BATCH]
+        labels[start:start + _KMEANS_BATCH] = np.argmin(squared - 2.0 * (batch @ centroids.T), axis=1)
+    return labels
+
+class IVFIndex:
+    """倒排文件（IVF）近似最近邻索引
+
+    用户按嵌入分到最近的簇中；查询按与目标嵌入的内积选出 nprobe 个簇，
+    只对这些簇中的用户精确打分。增删用户不重新聚类，簇中心固定，
+    数据分布明显变化后应重建。
+    删除用户的文档号（嵌入行）放入空闲堆，新用户优先取最小的空闲号，
+    嵌入矩阵的行数因此只随同时存在的用户数的峰值增长，反复增删不会无限变长。
+    """
+
+    def __init__(
+        self,
+        matching_system,
+        users: Iterable[UserProfile],
+        n_lists: Optional[int] = None,
+        nprobe: int = DEFAULT_NPROBE,
+        seed: int = 0,
+        embedding: Optional[FeatureEmbedding] = None,
+        centroids: Optional[np.ndarray] = None
+    ):
+        """构建索引
+
+        Args:
+            matching_system: 匹配系统，用于精确重排
+            users: 用户池
+            n_lists: 簇数，缺省为 sqrt(用户数)
+            nprobe: 每次查询探查的簇数
+            seed: k-means 随机种子
+            embedding: 已有的嵌入（从磁盘加载时使用），缺省由 users 构建
+            centroids: 已有的簇中心，缺省对 users 聚类
+        """
+        users = list(users)
+        self.system = matching_system
+        self.nprobe = nprobe
+        self.embedding = FeatureEmbedding.build(matching_system, users) if embedding is None else embedding
+        self._users: List[Optional[UserProfile]] = []
+        self._docs: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._vectors = np.zeros((0, self.embedding.dim), dtype=np.float32)
+        self._labels = np.zeros(0, dtype=np.int64)
+
+        vectors = self.embedding.embed(users, matching_system.encoder)
+        if centroids is None:
+            n_lists = n_lists or max(1, int(np.sqrt(len(users))))
+            centroids = kmeans(vectors, n_lists, seed=seed) if len(users) else np.zeros((1, self.embedding.dim))
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self._lists: List[set] = [set() for _ in range(len(self.centroids))]
+        self._insert(users, vectors)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def n_lists(self) -> int:
+        """簇数"""
+        return len(self.centroids)
+
+    @property
+    def users(self) -> List[UserProfile]:
+        """索引中的用户（按文档号顺序，只新增时即加入顺序）"""
+        return [user for user in self._users if user is not None]
+
+    @property
+    def doc_bound(self) -> int:
+        """已分配的文档号数量（含已删除用户留下、尚未复用的空号）"""
+        return len(self._users)
+
+    def _insert(self, users: List[UserProfile], vectors: np.ndarray) -> None:
+        """加入用户及其嵌入，优先复用空闲的文档号"""
+        if not users:
+            return
+        reused = [heapq.heappop(self._free) for _ in range(min(len(users), len(self._free)))]
+        start = len(self._users)
+        end = start + len(users) - len(reused)
+        if end > len(self._vectors):
+            capacity = max(end, 2 * len(self._vectors), 64)
+            grown = np.zeros((capacity, self.embedding.dim), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+            labels = np.zeros(capacity, dtype=np.int64)
+            labels[:start] = self._labels[:start]
+            self._labels = labels
+        labels = _nearest(vectors, self.centroids)
+        docs = reused + list(range(start, end))
+        self._vectors[docs] = vectors
+        self._labels[docs] = labels
+        self._users.extend([None] * (end - start))
+        for doc, user, label in zip(docs, users, labels.tolist()):
+            self._users[doc] = user
+            self._docs[user.user_id] = doc
+            self._lists[label].add(doc)
+
+    def add(self, user: UserProfile) -> None:
+        """新增或更新用户"""
+        self.remove(user.user_id)
+        self._insert([user], self.embedding.embed([user], self.system.encoder))
+
+    def apply(self, upserted: Iterable[UserProfile], removed: Iterable[str]) -> None:
+        """应用一次用户池提交，可由 VersionedPool.attach() 挂接
+
+        Args:
+            upserted: 新增或变化的用户档案
+            removed: 被删除的用户ID
+        """
+        for user_id in removed:
+            self.remove(user_id)
+        upserted = list(upserted)
+        for user in upserted:
+            self.remove(user.user_id)
+        if upserted:
+            self._insert(upserted, self.embedding.embed(upserted, self.system.encoder))
+
+    def remove(self, user_id: str) -> bool:
+        """删除用户
+
+        Returns:
+            bool: 用户是否存在
+        """
+        doc = self._docs.pop(user_id, None)
+        if doc is None:
+            return False
+        self._lists[self._labels[doc]].discard(doc)
+        self._users[doc] = None
+        heapq.heappush(self._free, doc)
+        return True
+
+    def candidates(self, target_user: UserProfile, nprobe: Optional[int] = None) -> List[UserProfile]:
+        """探查与目标最接近的 nprobe 个簇，返回其中的用户（按文档号顺序）"""
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.n_lists)
+        query = self.embedding.embed([target_user], self.system.encoder)[0].astype(np.float64)
+        closeness = self.centroids @ query
+        probed = np.argpartition(-closeness, nprobe - 1)[:nprobe] if nprobe < self.n_lists else range(self.n_lists)
+        docs = sorted(doc for label in probed for doc in self._lists[label])
+        return [self._users[doc] for doc in docs]
+
+    def find_best_matches(self, target_user: UserProfile, top_n: int = 10, nprobe: Optional[int] = None):
+        """近似查找: 探查 nprobe 个簇后精确重排
+
+        Args:
+            target_user: 目标用户
+            top_n: 返回的最佳匹配数量
+            nprobe: 探查的簇数，缺省使用索引的 nprobe
+
+        Returns:
+            MatchResults: 结果的 pool_size 为候选数
+        """
+        return self.system.find_best_matches(target_user, self.candidates(target_user, nprobe), top_n)
+
+    def measure_recall(
+        self,
+        targets: Iterable[UserProfile],
+        top_n: int = 10,
+        nprobe: Optional[int] = None
+    ) -> Dict[str, float]:
+        """与完整扫描的 find_best_matches 对比 recall@top_n
+
+        总分不低于完整扫描第 top_n 名总分的结果计为命中，与 TwoStageMatcher.measure_recall 一致。
+
+        Returns:
+            Dict[str, float]: recall、min_recall、candidates（平均候选数）、pool_fraction
+        """
+        users = self.users
+        recalls = []
+        candidates = []
+        for target in targets:
+            exact = self.system.find_best_matches(target, users, top_n)
+            if not exact:
+                continue
+            threshold = exact[-1][1]['total_score'] - 1e-12
+            results = self.find_best_matches(target, top_n, nprobe)
+            hits = sum(1 for _, scores in results if scores['total_score'] >= threshold)
+            recalls.append(hits / len(exact))
+            candidates.append(results.pool_size)
+        if not recalls:
+            return {'recall': 1.0, 'min_recall': 1.0, 'candidates': 0.0, 'pool_fraction': 0.0}
+        mean_candidates = sum(candidates) / len(candidates)
+        return {
+            'recall': sum(recalls) / len(recalls),
+            'min_recall': min(recalls),
+            'candidates': mean_candidates,
+            'pool_fraction': mean_candidates / max(len(users) - 1, 1)
+        }
+
+    def save(self, path: str) -> None:
+        """保存索引（簇中心、嵌入、用户档案）到 .npz 文件
+
+        已删除用户不写入；用户嵌入在加载时重新计算。
+        """
+        metadata, arrays = self.embedding.state()
+        state = {
+            'nprobe': self.nprobe,
+            'embedding': metadata,
+            'users': [user_to_dict(user) for user in self.users]
+        }
+        arrays['centroids'] = self.centroids
+        arrays['state'] = np.array(json.dumps(state, ensure_ascii=False))
+        with open(path, 'wb') as file:
+            np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, path: str, matching_system) -> 'IVFIndex':
+        """从 save() 写出的文件加载索引
+
+        Args:
+            path: 文件路径
+            matching_system: 匹配系统，用于精确重排
+        """
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        state = json.loads(str(arrays.pop('state')))
+        embedding = FeatureEmbedding.from_state(state['embedding'], arrays)
+        users = [user_from_dict(user_data) for user_data in state['users']]
+        return cls(matching_system, users, nprobe=state['nprobe'],
+                   embedding=embedding, centroids=arrays['centroids'])
@@ -0,0 +1,458 @@
+"""两阶段匹配模块
+
+第一阶段从服务器组、游戏时间、共同游戏、游戏类型四个倒排索引中
+廉价地召回候选用户（每个来源的召回数量可配置），
+第二阶段用 MatchingSystem 的精确打分对候选重排
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from matching.inverted_index import GameIndex, Postings
+from models.user_profile import UserProfile
+
+# 召回来源及默认的每来源召回数量
+DEFAULT_FAN_OUT = {
+    'server_group': 1000,
+    'play_time': 1000,
+    'shared_games': 2000,
+    'type_overlap': 1000
+}
+
+# 召回来源 -> 综合分中对应的维度权重
+_SOURCE_DIMENSIONS = {
+    'server_group': 'server',
+    'play_time': 'time',
+    'shared_games': 'game_preference',
+    'type_overlap': 'game_type'
+}
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+# 涉及的位置数达到用户池的 1/DENSE_RATIO 时改用按位置索引的数组
+DENSE_RATIO = 8
+
+def _add(postings: Dict[str, Postings], value: str, doc: int) -> None:
+    """把文档号加入取值的倒排表"""
+    posting = postings.get(value)
+    if posting is None:
+        posting = postings[value] = Postings()
+    posting.add(doc)
+
+def _discard(postings: Dict[str, Postings], value: str, doc: int) -> None:
+    """从取值的倒排表中移除文档号，空表随之删除"""
+    posting = postings.get(value)
+    if posting is not None:
+        posting.discard(doc)
+        if not posting:
+            del postings[value]
+
+def _docs(postings: Dict[str, Postings], value: str) -> np.ndarray:
+    """取值的倒排表（有序文档号）"""
+    posting = postings.get(value)
+    return _EMPTY if posting is None else posting.to_array()
+
+def _count(postings: List[np.ndarray], size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """统计每个位置在多少个倒排表中出现，返回 (有序位置, 次数)
+
+    倒排表总长不足用户池的 1/DENSE_RATIO 时排序计数，否则用计数数组，
+    两种做法的代价都与倒排表总长成正比。
+    """
+    postings = [posting for posting in postings if len(posting)]
+    if not postings:
+        return _EMPTY, np.zeros(0)
+    merged = np.concatenate(postings)
+    if len(merged) * DENSE_RATIO < size:
+        positions, counts = np.unique(merged, return_counts=True)
+        return positions, counts.astype(np.float64)
+    counts = np.bincount(merged)
+    positions = np.flatnonzero(counts)
+    return positions, counts[positions].astype(np.float64)
+
+def _lookup(sparse: Tuple[np.ndarray, np.ndarray], size: int):
+    """返回在按位置升序的 (位置, 召回键) 中查找召回键的函数，未召回的位置为0
+
+    召回结果较多时展开为按位置索引的数组直接查表，否则二分查找。
+    """
+    recalled, keys = sparse
+    if len(recalled) * DENSE_RATIO >= size:
+        table = np.zeros(size)
+        table[recalled] = keys
+        return lambda positions: table[positions]
+    if not len(recalled):
+        return lambda positions: np.zeros(len(positions))
+
+    def lookup(positions: np.ndarray) -> np.ndarray:
+        rows = np.minimum(np.searchsorted(recalled, positions), len(recalled) - 1)
+        return np.where(recalled[rows] == positions, keys[rows], 0.0)
+    return lookup
+
+def _weighted(postings: Iterable[Tuple[np.ndarray, float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """把互不相交的 (倒排表, 分值) 合并为 (位置, 召回键)，分值为0的倒排表不召回"""
+    postings = [(posting, score) for posting, score in postings if score > 0 and len(posting)]
+    if not postings:
+        return _EMPTY, np.zeros(0)
+    return (np.concatenate([posting for posting, _ in postings]),
+            np.concatenate([np.full(len(posting), float(score)) for posting, score in postings]))
+
+def _union(arrays: Iterable[np.ndarray]) -> np.ndarray:
+    """多个有序位置数组的并集（有序、去重）"""
+    arrays = [array for array in arrays if len(array)]
+    if not arrays:
+        return _EMPTY
+    return np.unique(np.concatenate(arrays))
+
+class CandidateIndex:
+    """候选召回索引
+
+    维护四组倒排表: 服务器、游戏时间、游戏、游戏类型 -> 用户位置。
+    位置即游戏倒排表 GameIndex（以 user_id 为用户键）分配的文档号，四组倒排表共用；
+    只新增时位置与加入顺序一致，删除用户留下的位置由之后的新用户复用。
+    apply() 按变化的用户增量更新，可由 VersionedPool.attach() 挂接到用户池，随提交保持同步。
+    重复的用户ID以最后一个为准。
+    """
+
+    def __init__(self, matching_system, users: Iterable[UserProfile]):
+        """构建索引
+
+        Args:
+            matching_system: 匹配系统，提供服务器组、时间相似度和游戏类型
+            users: 用户池
+        """
+        self.system = matching_system
+
+        types_of_game: Dict[str, set] = {}
+        for game in matching_system.game_matcher.games:
+            types_of_game.setdefault(game.name, set()).update(game.types)
+        self._types_of_game = types_of_game
+
+        self.games = GameIndex()
+        self.by_server: Dict[str, Postings] = {}
+        self.by_time: Dict[str, Postings] = {}
+        self.by_type: Dict[str, Postings] = {}
+        # 位置 -> 用户档案，空出的位置为 None
+        self._users: List[Optional[UserProfile]] = []
+        # 每个位置的服务器、游戏时间编码，供只对少量位置计算综合分时按编码查表；
+        # 编码只增不减，不再出现的取值在查表时分值为0
+        self._servers: List[str] = []
+        self._times: List[str] = []
+        self._server_index: Dict[str, int] = {}
+        self._time_index: Dict[str, int] = {}
+        self._server_codes = np.zeros(0, dtype=np.int64)
+        self._time_codes = np.zeros(0, dtype=np.int64)
+        self.apply(users, ())
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    @property
+    def users(self) -> List[UserProfile]:
+        """索引中的用户（按位置顺序）"""
+        return [user for user in self._users if user is not None]
+
+    @property
+    def size(self) -> int:
+        """位置上界（含空出的位置），各来源的召回键数组按此长度展开"""
+        return self.games.doc_bound
+
+    def users_at(self, positions: Iterable[int]) -> List[UserProfile]:
+        """位置对应的用户档案"""
+        users = self._users
+        return [users[position] for position in positions]
+
+    def apply(self, upserted: Iterable[UserProfile], removed: Iterable[str]) -> None:
+        """增量应用用户的新增、修改与删除，可由 VersionedPool.attach() 挂接
+
+        Args:
+            upserted: 新增或变化的用户档案
+            removed: 被删除的用户ID
+        """
+        for user_id in removed:
+            self.remove(user_id)
+        for user in upserted:
+            self.put(user)
+
+    def put(self, user: UserProfile) -> None:
+        """新增或更新用户，已有用户保留原位置"""
+        position = self.games.doc_of(user.user_id)
+        if position is not None:
+            self._discard(position)
+        self.games.add_user(user)
+        position = self.games.doc_of(user.user_id)
+        if position == len(self._users):
+            self._users.append(user)
+        else:
+            self._users[position] = user
+        if position >= len(self._server_codes):
+            capacity = max(position + 1, 2 * len(self._server_codes), 64)
+            self._server_codes = np.resize(self._server_codes, capacity)
+            self._time_codes = np.resize(self._time_codes, capacity)
+        _add(self.by_server, user.play_region, position)
+        _add(self.by_time, user.play_time, position)
+        for game_type in self._types_of(user.games):
+            _add(self.by_type, game_type, position)
+        self._server_codes[position] = self._code(self._servers, self._server_index, user.play_region)
+        self._time_codes[position] = self._code(self._times, self._time_index, user.play_time)
+
+    def remove(self, user_id: str) -> bool:
+        """删除用户
+
+        Returns:
+            bool: 用户是否存在
+        """
+        position = self.games.doc_of(user_id)
+        if position is None:
+            return False
+        self._discard(position)
+        self.games.remove(user_id)
+        self._users[position] = None
+        return True
+
+    def _discard(self, position: int) -> None:
+        """把位置从服务器、游戏时间、游戏类型倒排表中移除（游戏倒排表由 GameIndex 维护）"""
+        user = self._users[position]
+        _discard(self.by_server, user.play_region, position)
+        _discard(self.by_time, user.play_time, position)
+        for game_type in self._types_of(user.games):
+            _discard(self.by_type, game_type, position)
+
+    @staticmethod
+    def _code(values: List[str], index: Dict[str, int], value: str) -> int:
+        """取值的编码，未见过的取值追加编码"""
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+
+    def _types_of(self, games: Iterable[str]) -> set:
+        """用户所玩游戏的类型集合"""
+        types = set()
+        for game in games:
+            types.update(self._types_of_game.get(game, ()))
+        return types
+
+    def _server_scores(self, target_user: UserProfile) -> Dict[str, float]:
+        """服务器 -> 召回键: 同服务器 1.0，同服务器组 0.7"""
+        region = target_user.play_region
+        scores = {}
+        for group in self.system.base_matcher.server_groups.values():
+            if region in group:
+                scores.update((other, 0.7) for other in group)
+        scores[region] = 1.0
+        return scores
+
+    def _server_group(self, target_user: UserProfile) -> Tuple[np.ndarray, np.ndarray]:
+        """服务器来源: 同服务器 1.0，同服务器组 0.7"""
+        return _weighted(
+            (_docs(self.by_server, server), score)
+            for server, score in self._server_scores(target_user).items())
+
+    def _play_time(self, target_user: UserProfile) -> Tuple[np.ndarray, np.ndarray]:
+        """游戏时间来源: 时间相似度"""
+        similarity = self.system.numeric_matcher.time_similarity.get(target_user.play_time, {})
+        return _weighted(
+            (_docs(self.by_time, play_time), score) for play_time, score in similarity.items())
+
+    def _shared_games(self, target_user: UserProfile) -> Tuple[np.ndarray, np.ndarray]:
+        """共同游戏来源: 游戏偏好的 Jaccard 相似度，与 GameMatcher.match_preference 一致"""
+        return self.games.preference_scores(target_user.games)
+
+    def _type_overlap(self, target_user: UserProfile) -> Tuple[np.ndarray, np.ndarray]:
+        """游戏类型来源: 共同游戏类型数"""
+        return _count(
+            [_docs(self.by_type, game_type) for game_type in self._types_of(target_user.games)],
+            self.size)
+
+    def _dense(self, sparse: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """把 (位置, 召回键) 展开为按位置索引的召回键，未召回的位置为0
+
+        只供下面按来源查看召回键的公开方法使用，retrieve() 不展开。
+        """
+        positions, keys = sparse
+        dense = np.zeros(self.size)
+        dense[positions] = keys
+        return dense
+
+    def server_group(self, target_user: UserProfile) -> np.ndarray:
+        """服务器来源的召回键: 同服务器 1.0，同服务器组 0.7，其余 0"""
+        return self._dense(self._server_group(target_user))
+
+    def play_time(self, target_user: UserProfile) -> np.ndarray:
+        """游戏时间来源的召回键: 时间相似度"""
+        return self._dense(self._play_time(target_user))
+
+    def shared_games(self, target_user: UserProfile) -> np.ndarray:
+        """共同游戏来源的召回键: 游戏偏好的 Jaccard 相似度"""
+        return self._dense(self._shared_games(target_user))
+
+    def type_overlap(self, target_user: UserProfile) -> np.ndarray:
+        """游戏类型来源的召回键: 共同游戏类型数"""
+        return self._dense(self._type_overlap(target_user))
+
+    def retrieve(
+        self,
+        target_user: UserProfile,
+        fan_out: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        """从各来源召回候选并合并
+
+        每个来源按自己的召回键取前 fan_out 个（键为0的用户不召回）。
+        同键的用户很多，同键时按各来源键按维度权重归一化求和的廉价综合分排序，
+        使同时被多个来源看好的用户优先入选。
+        全程只处理目标用户各取值的倒排表，综合分只对卡在名额边界上的同键位置计算，
+        代价与这些倒排表的总长度成正比，不为每个来源展开用户池大小的键数组。
+
+        Args:
+            target_user: 目标用户
+            fan_out: 来源 -> 召回数量，缺省使用 DEFAULT_FAN_OUT；数量为0的来源不参与
+
+        Returns:
+            np.ndarray: 候选用户在索引中的位置，升序、去重，不含目标用户
+
+        Raises:
+            ValueError: 未知的召回来源
+        """
+        fan_out = DEFAULT_FAN_OUT if fan_out is None else fan_out
+        for source in fan_out:
+            if source not in DEFAULT_FAN_OUT:
+                raise ValueError(f"未知的召回来源: {source}")
+
+        sparse = {source: getattr(self, '_' + source)(target_user) for source in DEFAULT_FAN_OUT}
+        own = self.games.doc_of(target_user.user_id)
+        combined = None
+        parts = []
+        for source, limit in fan_out.items():
+            if limit <= 0:
+                continue
+            positions, key = sparse[source]
+            if own is not None:
+                keep = positions != own
+                positions, key = positions[keep], key[keep]
+            if not len(positions):
+                continue
+            if limit >= len(positions):
+                parts.append(positions)
+                continue
+            # 召回键为主序: 高于第 limit 大键值的全部入选，等于它的按综合分取剩余名额
+            threshold = np.partition(key, len(key) - limit)[len(key) - limit]
+            above = positions[key > threshold]
+            tied = positions[key == threshold]
+            if combined is None:
+                combined = self._combined(target_user, sparse)
+            scores = combined(tied)
+            remaining = limit - len(above)
+            if remaining < len(tied):
+                tied = tied[np.argpartition(-scores, remaining - 1)[:remaining]]
+            parts.extend((above, tied))
+        return _union(parts)
+
+    def _combined(self, target_user: UserProfile, sparse: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        """返回计算给定位置综合分的函数: 各来源召回键按维度权重归一化求和
+
+        服务器和游戏时间按位置编码查表，共同游戏和游戏类型在有序的召回结果中二分查找，
+        代价只与待计算的位置数有关。
+        """
+        weights = self.system.dimension_weights
+        server_scores = self._server_scores(target_user)
+        similarity = self.system.numeric_matcher.time_similarity.get(target_user.play_time, {})
+        tables = {
+            'server_group': np.array([server_scores.get(server, 0.0) for server in self._servers]),
+            'play_time': np.array([similarity.get(play_time, 0.0) for play_time in self._times])
+        }
+        codes = {'server_group': self._server_codes, 'play_time': self._time_codes}
+        terms = []
+        for source, dimension in _SOURCE_DIMENSIONS.items():
+            key = sparse[source][1]
+            peak = key.max() if len(key) else 0.0
+            if peak > 0:
+                if source in tables:
+                    table, code = tables[source], codes[source]
+                    lookup = lambda positions, table=table, code=code: table[code[positions]]
+                else:
+                    lookup = _lookup(sparse[source], self.size)
+                terms.append((lookup, weights.get(dimension, 1.0) / peak))
+
+        def combined(positions: np.ndarray) -> np.ndarray:
+            scores = np.zeros(len(positions))
+            for lookup, scale in terms:
+                scores += scale * lookup(positions)
+            return scores
+        return combined
+
+class TwoStageMatcher:
+    """两阶段匹配器: 索引召回 + 精确重排"""
+
+    def __init__(
+        self,
+        matching_system,
+        users: Iterable[UserProfile],
+        fan_out: Optional[Dict[str, int]] = None
+    ):
+        """初始化两阶段匹配器
+
+        Args:
+            matching_system: 匹配系统
+            users: 用户池
+            fan_out: 各召回来源的召回数量，缺省使用 DEFAULT_FAN_OUT
+        """
+        self.system = matching_system
+        self.index = CandidateIndex(matching_system, users)
+        self.fan_out = dict(DEFAULT_FAN_OUT if fan_out is None else fan_out)
+
+    @property
+    def users(self) -> List[UserProfile]:
+        """用户池（按索引中的位置顺序）"""
+        return self.index.users
+
+    def find_best_matches(self, target_user: UserProfile, top_n: int = 10):
+        """召回候选后精确重排
+
+        候选保持在索引中的位置顺序，同分时的先后与对 users 的完整扫描一致。
+
+        Args:
+            target_user: 目标用户
+            top_n: 返回的最佳匹配数量
+
+        Returns:
+            MatchResults: 结果的 pool_size 为候选数
+        """
+        positions = self.index.retrieve(target_user, self.fan_out)
+        return self.system.find_best_matches(target_user, self.index.users_at(positions), top_n)
+
+    def measure_recall(self, targets: Iterable[UserProfile], top_n: int = 10) -> Dict[str, float]:
+        """与完整扫描对比召回率，用于判断候选预算是否足够
+
+        两阶段结果中总分不低于完整扫描第 top_n 名总分的用户计为命中，
+        因此与第 top_n 名同分的用户无论是否入选都算正确。
+
+        Args:
+            targets: 目标用户
+            top_n: 结果数量
+
+        Returns:
+            Dict[str, float]: recall 为平均召回率，min_recall 为最差查询的召回率，
+            candidates 为平均候选数，pool_fraction 为候选数占用户池的平均比例
+        """
+        users = self.users
+        recalls = []
+        candidates = []
+        for target in targets:
+            exact = self.system.find_best_matches(target, users, top_n)
+            if not exact:
+                continue
+            threshold = exact[-1][1]['total_score'] - 1e-12
+            results = self.find_best_matches(target, top_n)
+            hits = sum(1 for _, scores in results if scores['total_score'] >= threshold)
+            recalls.append(hits / len(exact))
+            candidates.append(results.pool_size)
+        if not recalls:
+            return {'recall': 1.0, 'min_recall': 1.0, 'candidates': 0.0, 'pool_fraction': 0.0}
+        mean_candidates = sum(candidates) / len(candidates)
+        return {
+            'recall': sum(recalls) / len(recalls),
+            'min_recall': min(recalls),
+            'candidates': mean_candidates,
+            'pool_fraction': mean_candidates / max(len(users) - 1, 1)
+        }
@@ -0,0 +1,415 @@
+"""聚类剪枝匹配模块
+
+离线按 match_users 的总分把用户池划分为 k 个簇（CLARA: 对多个样本做 k-medoids，
+取在全池上代价最小的中心点），每个簇记录各分类列出现过的取值及游戏、游戏类型的并集，
+据此给出目标用户与簇内任意用户总分的上界。
+
+k-medoids 簇内几乎包含各分类列的所有取值（PoolGenerator 的各属性独立均匀分布），
+按簇求的上界很松，因此精确模式把每个簇再按上界损失最大的几列分类列的取值细分为子簇，
+子簇在这些列上取值唯一，对应维度的上界即为精确值。
+
+查询时精确模式按子簇上界从高到低分批扫描，上界低于当前第 top_n 名时停止，结果与完整扫描一致；
+快速模式只扫描与目标对中心点打分最高的 c 个簇
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from matching.encoded_pool import CATEGORICAL_COLUMNS, DIMENSIONS, EncodedQuery
+from models.user_profile import UserProfile
+
+EXACT = 'exact'
+FAST = 'fast'
+
+# 分类列 -> 依赖该列取值的相似度表维度
+_TABLE_DIMENSIONS = {
+    'server': 'server',
+    'time': 'time',
+    'experience': 'experience',
+    'style': 'style',
+    'mbti': 'mbti',
+    'zodiac': 'zodiac',
+    'gender': 'gender',
+}
+
+# 子簇的平均用户数下限，限制细分列数
+MIN_CELL_SIZE = 2.0
+
+# 精确模式首批精确打分的用户数，之后每批翻倍
+_SCAN_BATCH = 256
+
+# 上界比较的浮点余量，保证与第 top_n 名同分的用户不会被剪掉
+_EPSILON = 1e-9
+
+class ClusterIndex:
+    """k-medoids 聚类索引
+
+    Attributes:
+        medoids: 各簇中心点在用户池中的位置
+        members: 各簇成员在用户池中的位置（升序）
+        cells: 子簇成员在用户池中的位置（升序），每个子簇属于一个簇
+        split_columns: 细分子簇所用的分类列
+        cost: 全池到最近中心点的距离（1 - 总分）之和
+    """
+
+    def __init__(
+        self,
+        matching_system,
+        users: Iterable[UserProfile],
+        k: int,
+        samples: int = 5,
+        sample_size: Optional[int] = None,
+        iterations: int = 10,
+        seed: int = 0,
+        min_cell_size: float = MIN_CELL_SIZE
+    ):
+        """离线聚类并计算各簇的取值集合
+
+        Args:
+            matching_system: 匹配系统
+            users: 用户池
+            k: 簇数
+            samples: CLARA 样本数
+            sample_size: 每个样本的用户数，缺省为 40 + 2k
+            iterations: 每个样本上 k-medoids 的迭代次数上限
+            seed: 随机种子
+            min_cell_size: 子簇平均用户数下限，按上界损失从大到小加入细分列，
+                加入后平均用户数低于该值的列跳过
+
+        Raises:
+            ValueError: k 不是正数
+        """
+        if k <= 0:
+            raise ValueError(f"簇数须为正数: {k}")
+        self.system = matching_system
+        self.users: List[UserProfile] = list(users)
+        self.encoder = matching_system.encoder
+        self.encoded = self.encoder.encode(self.users)
+        size = len(self.users)
+        k = min(k, size)
+        rng = np.random.default_rng(seed)
+        sample_size = min(size, sample_size or 40 + 2 * k)
+
+        best = None
+        for _ in range(samples if size else 0):
+            sample = np.sort(rng.choice(size, sample_size, replace=False))
+            medoids = sample[self._k_medoids(sample, k, iterations)]
+            labels, scores = self._assign(medoids)
+            cost = float((1.0 - scores).sum())
+            if best is None or cost < best[0]:
+                best = (cost, medoids, labels)
+
+        if best is None:
+            self.cost, self.medoids, labels = 0.0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        else:
+            self.cost, self.medoids, labels = best
+        self.members: List[np.ndarray] = [np.flatnonzero(labels == c) for c in range(len(self.medoids))]
+        self._clusters = self._summarize(labels, len(self.medoids))
+
+        self.split_columns: List[str] = []
+        cell_labels = labels
+        for column in self._split_order():
+            width = len(self.encoded.vocabularies[column])
+            _, candidate = np.unique(cell_labels * width + self.encoded.columns[column], return_inverse=True)
+            count = int(candidate.max()) + 1 if size else 0
+            if count and size / count >= min_cell_size:
+                self.split_columns.append(column)
+                cell_labels = candidate
+        _, cell_labels = np.unique(cell_labels, return_inverse=True)
+        count = int(cell_labels.max()) + 1 if size else 0
+        self._cell_order = np.argsort(cell_labels, kind='stable')
+        self._cell_ends = np.cumsum(np.bincount(cell_labels, minlength=count))
+        self.cells: List[np.ndarray] = np.split(self._cell_order, self._cell_ends[:-1]) if count else []
+        self._cells = self._summarize(cell_labels, count)
+
+    def __len__(self) -> int:
+        return len(self.medoids)
+
+    def _assign(self, medoids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """把全池用户分给总分最高的中心点
+
+        逐个中心点打分，只保留每个用户当前的最高分及其中心点（同分取靠前的中心点），
+        内存为 O(用户数) 而不是 O(中心点数 × 用户数)。
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (每个用户所属中心点的序号, 与该中心点的总分)
+        """
+        encoded = self.encoded
+        size = len(self.users)
+        labels = np.zeros(size, dtype=np.int64)
+        best = np.full(size, -np.inf)
+        for label, medoid in enumerate(medoids):
+            scores = encoded.score(encoded.query(int(medoid)))['total_score']
+            better = scores > best
+            labels[better] = label
+            best[better] = scores[better]
+        return labels, best
+
+    def _k_medoids(self, sample: np.ndarray, k: int, iterations: int) -> np.ndarray:
+        """在样本上做交替式 k-medoids，返回中心点在样本中的下标
+
+        初始中心点依次取离已有中心点最远的用户。
+        """
+        encoded = self.encoded
+        distance = np.stack([
+            1.0 - encoded.score(encoded.query(int(row)), sample)['total_score'] for row in sample
+        ])
+        medoids = [int(np.argmin(distance.sum(axis=1)))]
+        while len(medoids) < k:
+            nearest = distance[medoids].min(axis=0)
+            nearest[medoids] = -1.0
+            medoids.append(int(np.argmax(nearest)))
+        medoids = np.asarray(medoids)
+        for _ in range(iterations):
+            labels = distance[medoids].argmin(axis=0)
+            updated = medoids.copy()
+            for c in range(k):
+                group = np.flatnonzero(labels == c)
+                if len(group):
+                    updated[c] = group[np.argmin(distance[np.ix_(group, group)].sum(axis=1))]
+            if np.array_equal(updated, medoids):
+                break
+            medoids = updated
+        return medoids
+
+    def _split_order(self) -> List[str]:
+        """分类列按上界损失从大到小排序
+
+        损失为该列取值不唯一时相关维度上界与实际得分之差的估计:
+        相似度表维度取表中各行 (最大值 - 最小值) 的均值乘以权重，在线状态和社交维度按各自的权重计入。
+        """
+        encoded = self.encoded
+        weights = dict(zip(DIMENSIONS, encoded.weights))
+        social = weights['game_social'] * encoded.social_weights
+
+        def spread(table: np.ndarray, column: str) -> float:
+            width = len(encoded.vocabularies[column])
+            values = np.nan_to_num(table[:width, :width])
+            return float((values.max(axis=1) - values.min(axis=1)).mean()) if width else 0.0
+
+        loss = {column: weights[dimension] * spread(encoded.tables[dimension], column)
+                for column, dimension in _TABLE_DIMENSIONS.items()}
+        loss['online'] = weights['online_status'] + 0.5 * social[0]
+        loss['style'] += 0.5 * social[1]
+        loss['experience'] += social[2] * spread(encoded.tables['social_experience'], 'experience')
+        return sorted((column for column in CATEGORICAL_COLUMNS if loss.get(column, 0.0) > 0),
+                      key=lambda column: -loss[column])
+
+    def _summarize(self, labels: np.ndarray, count: int) -> Dict[str, np.ndarray]:
+        """记录各组出现过的分类取值，以及游戏、游戏类型的并集
+
+        Args:
+            labels: 每个用户所属组的编号
+            count: 组数
+        """
+        encoded = self.encoded
+        summary = {}
+        for column, values in encoded.columns.items():
+            present = np.zeros((count, len(encoded.vocabularies[column])), dtype=bool)
+            present[labels, values] = True
+            summary[column] = present
+            if count and (present.sum(axis=1) == 1).all():
+                # 每组只有一个取值时直接记录取值编码，求上界时按编码取表项
+                summary['code:' + column] = present.argmax(axis=1)
+        order = np.argsort(labels, kind='stable')
+        sizes = np.bincount(labels, minlength=count)
+        # reduceat 不支持空组，只对非空组归约，空组保持全 False
+        filled = np.flatnonzero(sizes)
+        starts = (np.cumsum(sizes) - sizes)[filled]
+        for name in ('games', 'types'):
+            matrix = getattr(encoded, name)
+            union = np.zeros((count, matrix.shape[1]), dtype=bool)
+            if len(filled) and matrix.shape[1]:
+                union[filled] = np.logical_or.reduceat(matrix[order], starts, axis=0)
+            summary[name] = union
+        return summary
+
+    def bounds(self, query: EncodedQuery) -> np.ndarray:
+        """目标用户与各簇内任意用户总分的上界
+
+        Args:
+            query: 由同一编码器 encode_query() 得到的查询
+
+        Returns:
+            np.ndarray: 各簇的总分上界
+        """
+        return self._bounds(query, self._clusters)
+
+    def cell_bounds(self, query: EncodedQuery) -> np.ndarray:
+        """目标用户与各子簇内任意用户总分的上界
+
+        Args:
+            query: 由同一编码器 encode_query() 得到的查询
+
+        Returns:
+            np.ndarray: 各子簇的总分上界
+        """
+        return self._bounds(query, self._cells)
+
+    def _bounds(self, query: EncodedQuery, summary: Dict[str, np.ndarray]) -> np.ndarray:
+        """目标用户与各组内任意用户总分的上界
+
+        各维度分别取上界: 相似度表维度取簇内出现过的取值中的最大值，
+        游戏类型取两侧类型间相关性的最大值，游戏偏好取 |共同游戏| / |目标游戏|，
+        社交维度由在线、风格、社交经验三项的上界合成。
+
+        Args:
+            query: 由同一编码器 encode_query() 得到的查询
+            summary: _summarize() 得到的各组取值集合
+
+        Returns:
+            np.ndarray: 各组的总分上界
+        """
+        tables = query.tables
+        codes = query.codes
+        k = len(summary['games'])
+        upper = {}
+
+        def table_max(table: np.ndarray, column: str, fill: float = 0.0) -> np.ndarray:
+            present = summary[column]
+            row = np.nan_to_num(table[codes[column], :present.shape[1]], nan=fill)
+            if 'code:' + column in summary:
+                return row[summary['code:' + column]]
+            return np.where(present, row, -np.inf).max(axis=1)
+
+        for column, dimension in _TABLE_DIMENSIONS.items():
+            upper[dimension] = table_max(tables[dimension], column)
+        online = summary['online'][:, codes['online']] \
+            if codes['online'] < summary['online'].shape[1] else np.zeros(k, dtype=bool)
+        style = summary['style'][:, codes['style']] \
+            if codes['style'] < summary['style'].shape[1] else np.zeros(k, dtype=bool)
+        upper['online_status'] = online.astype(np.float64)
+        social_weights = self.encoded.social_weights
+        # 未知经验等级在逐对打分时会报错，这里按最大值1计，保证仍是上界
+        upper['game_social'] = (
+            np.where(online, 1.0, 0.5) * social_weights[0] +
+            np.where(style, 1.0, 0.5) * social_weights[1] +
+            table_max(tables['social_experience'], 'experience', fill=1.0) * social_weights[2]
+        )
+
+        type_width = summary['types'].shape[1]
+        target_types = np.flatnonzero(query.types[:type_width])
+        if len(target_types):
+            correlation = tables['type_correlation'][target_types, :type_width].max(axis=0)
+            upper['game_type'] = np.where(summary['types'], correlation, -np.inf).max(axis=1)
+        else:
+            upper['game_type'] = np.zeros(k)
+
+        game_width = summary['games'].shape[1]
+        query_count = int(query.games.sum())
+        if query_count:
+            common = summary['games'].astype(np.int32) @ query.games[:game_width].astype(np.int32)
+            upper['game_preference'] = common / query_count
+        else:
+            upper['game_preference'] = np.zeros(k)
+
+        total = np.zeros(k)
+        for dimension, weight in zip(DIMENSIONS, self.encoded.weights):
+            total += np.maximum(upper[dimension], 0.0) * weight
+        return total / self.encoded.weight_total + _EPSILON
+
+    def find_best_matches(
+        self,
+        target_user: UserProfile,
+        top_n: int = 10,
+        mode: str = EXACT,
+        clusters: int = 1
+    ):
+        """聚类剪枝查找
+
+        Args:
+            target_user: 目标用户
+            top_n: 返回的最佳匹配数量
+            mode: EXACT 按上界剪枝，结果与完整扫描一致；FAST 只扫描中心点得分最高的 clusters 个簇
+            clusters: 快速模式扫描的簇数
+
+        Returns:
+            MatchResults: 结果的 pool_size 为扫描的用户数
+
+        Raises:
+            ValueError: 未知的模式
+        """
+        if mode not in (EXACT, FAST):
+            raise ValueError(f"未知的模式: {mode}")
+        query = self.encoder.encode_query(target_user)
+        scanned = self._scan_exact(query, top_n) if mode == EXACT else self._scan_fast(query, clusters)
+        users = self.users
+        return self.system.find_best_matches(target_user, [users[p] for p in scanned], top_n)
+
+    def _scan_exact(self, query: EncodedQuery, top_n: int) -> np.ndarray:
+        """按上界从高到低分批扫描子簇，返回需要精确打分的用户位置（升序）
+
+        首批 _SCAN_BATCH 个用户、之后每批翻倍一起打分，维护当前最高的 top_n 个总分，
+        下一个子簇的上界低于其中最低者时停止。
+        """
+        bounds = self.cell_bounds(query)
+        user_ids = self.encoded.user_ids
+        order, ends = self._cell_order, self._cell_ends
+        cells = np.argsort(-bounds, kind='stable')
+        ranked_bounds = bounds[cells]
+        scanned_rows = np.cumsum(np.diff(np.concatenate([[0], ends]))[cells])
+        best = np.zeros(0)
+        parts = []
+        i = 0
+        batch = _SCAN_BATCH
+        while i < len(cells):
+            before = scanned_rows[i - 1] if i else 0
+            stop = int(np.searchsorted(scanned_rows, before + batch)) + 1
+            if len(best) >= top_n > 0:
+                # ranked_bounds 降序，取上界不低于阈值的前缀
+                stop = min(stop, i + int(np.searchsorted(-ranked_bounds[i:stop], _EPSILON - best[0], side='right')))
+                if stop <= i:
+                    break
+            rows = np.concatenate([order[(ends[c - 1] if c else 0):ends[c]] for c in cells[i:stop]])
+            rows = rows[user_ids[rows] != query.user_id]
+            i = stop
+            batch *= 2
+            if not len(rows):
+                continue
+            parts.append(rows)
+            totals = np.concatenate([best, self.encoded.score(query, rows)['total_score']])
+            best = np.sort(totals)[-top_n:] if top_n > 0 else totals[:0]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def _scan_fast(self, query: EncodedQuery, clusters: int) -> np.ndarray:
+        """扫描与目标对中心点打分最高的若干簇（同分时上界高者优先）"""
+        if not len(self.medoids):
+            return np.zeros(0, dtype=np.int64)
+        scores = self.encoded.score(query, self.medoids)['total_score']
+        order = np.lexsort((-self.bounds(query), -scores))[:max(clusters, 0)]
+        parts = [self.members[c] for c in order]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def measure(
+        self,
+        targets: Iterable[UserProfile],
+        top_n: int = 10,
+        mode: str = EXACT,
+        clusters: int = 1
+    ) -> Dict[str, float]:
+        """与完整扫描对比召回率与扫描比例
+
+        总分不低于完整扫描第 top_n 名总分的结果计为命中。
+
+        Returns:
+            Dict[str, float]: recall、min_recall、scanned（平均扫描用户数）、pool_fraction
+        """
+        recalls = []
+        scanned = []
+        for target in targets:
+            exact = self.system.find_best_matches(target, self.users, top_n)
+            results = self.find_best_matches(target, top_n, mode, clusters)
+            scanned.append(results.pool_size)
+            if not exact:
+                continue
+            threshold = exact[-1][1]['total_score'] - 1e-12
+            hits = sum(1 for _, scores in results if scores['total_score'] >= threshold)
+            recalls.append(hits / len(exact))
+        mean_scanned = sum(scanned) / len(scanned) if scanned else 0.0
+        return {
+            'recall': sum(recalls) / len(recalls) if recalls else 1.0,
+            'min_recall': min(recalls) if recalls else 1.0,
+            'scanned': mean_scanned,
+            'pool_fraction': mean_scanned / max(len(self.users) - 1, 1)
+        }
@@ -0,0 +1,390 @@
+"""差分等价测试模块
+
+随机生成对抗性的小用户池，以 MatchingSystem.match_users 为参照，比较各快速实现的
+逐维度分数、总分与 top-k 排序；发现不一致时把用例收缩为仍能复现的最小用例::
+
+    python -m matching.differential --runs 500 --seed 0 --output failures.json
+
+生成的取值有意覆盖参照实现的边界: 时间段表之外的 play_time（时间分为0）、
+相似度表之外的服务器 / MBTI / 星座 / 在线状态 / 风格、不在性别倾向列表中的性别
+（OrderedMatcher 的 0.7 上限与缺省分）、游戏池之外或重复的游戏（GameMatcher 缺省相关性 0.1）、
+空游戏列表、完全相同的用户（并列总分）以及 top_n 为0或超过池大小。
+经验等级只取 experience_levels.json 中的等级，参照实现对未知等级会抛出 KeyError。
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from loaders.pools_loader import user_from_dict
+from matching.clusters import ClusterIndex
+from matching.encoded_pool import DIMENSIONS
+from matching.instrumentation import Instrumentation
+from models.user_profile import UserProfile
+from pool.generator import FIELDS, load_vocabularies
+
+DEFAULT_TOLERANCE = 1e-9
+
+# 各字段在取值表之外的取值
+_UNKNOWN_VALUES = {
+    '性别': '未知性别',
+    '游玩服务器': '未知服务器',
+    '游玩固定时间': '未知时段',
+    'MBTI': 'XXXX',
+    '星座': '未知星座',
+    '在线状态': '未知状态',
+    '游戏风格': '未知风格',
+}
+
+_UNKNOWN_GAME = '未知游戏'
+
+# 分数的键: 各维度与总分
+_SCORE_KEYS = tuple(DIMENSIONS) + ('total_score',)
+
+# 用例: {'users': [user_pool.json 格式的用户], 'target': 目标下标, 'top_n': 结果数}
+Case = Dict[str, Any]
+
+def _pairs_staged(system, target: UserProfile, users: List[UserProfile]) -> Dict[str, Dict[str, float]]:
+    """按代价顺序逐维打分（剪枝与计时路径使用的打分阶段）"""
+    instrumentation = Instrumentation()
+    return {user.user_id: system._match_users_instrumented(target, user, instrumentation)
+            for user in users if user != target}
+
+def _pairs_encoded(system, target: UserProfile, users: List[UserProfile]) -> Dict[str, Dict[str, float]]:
+    """编码池向量化打分"""
+    encoded = system.encoder.encode(users)
+    scores = encoded.score(system.encoder.encode_query(target))
+    return {
+        user.user_id: {key: float(scores[key][row]) for key in _SCORE_KEYS}
+        for row, user in enumerate(users) if user != target
+    }
+
+def _ranked(results) -> List[Any]:
+    """find_best_matches 结果 -> [(用户ID, 总分)]"""
+    return [(user.user_id, scores['total_score']) for user, scores in results]
+
+def _topk_cached(system, target: UserProfile, users: List[UserProfile], top_n: int) -> List[Any]:
+    """剪枝路径的第二次查询（打分阶段缓存命中）"""
+    system.find_best_matches(target, users, top_n)
+    return _ranked(system.find_best_matches(target, users, top_n))
+
+def _topk_encoded(system, target: UserProfile, users: List[UserProfile], top_n: int) -> List[Any]:
+    """编码池 top_k"""
+    encoded = system.encoder.encode(users)
+    ranked = encoded.top_k(system.encoder.encode_query(target), top_n)
+    return [(users[row].user_id, float(total)) for row, total in ranked]
+
+def _topk_clusters(system, target: UserProfile, users: List[UserProfile], top_n: int) -> List[Any]:
+    """聚类剪枝的精确模式"""
+    index = ClusterIndex(system, users, k=max(1, min(3, len(users))), samples=2, seed=0)
+    return _ranked(index.find_best_matches(target, top_n))
+
+# 逐对打分的实现: (匹配系统, 目标, 用户池) -> {用户ID: 分数字典}
+PAIR_ENGINES: Dict[str, Callable] = {
+    'staged': _pairs_staged,
+    'encoded': _pairs_encoded,
+}
+
+# top-k 实现: (匹配系统, 目标, 用户池, top_n) -> [(用户ID, 总分)]
+RANKING_ENGINES: Dict[str, Callable] = {
+    'full_scan': lambda system, target, users, top_n: _ranked(
+        system.find_best_matches(target, users, top_n, prune=False)),
+    'pruned': lambda system, target, users, top_n: _ranked(
+        system.find_best_matches(target, users, top_n)),
+    'pruned_cached': _topk_cached,
+    'deadline': lambda system, target, users, top_n: _ranked(
+        system.find_best_matches(target, users, top_n, deadline=time.monotonic() + 3600, chunk_size=3)),
+    'encoded_topk': _topk_encoded,
+    'cluster_exact': _topk_clusters,
+}
+
+ENGINES = tuple(PAIR_ENGINES) + tuple(RANKING_ENGINES)
+
+class CaseGenerator:
+    """对抗性用例生成器"""
+
+    def __init__(
+        self,
+        seed: int = 0,
+        vocabularies: Optional[Dict[str, List[str]]] = None,
+        max_size: int = 30,
+        unknown_rate: float = 0.2,
+        duplicate_rate: float = 0.25
+    ):
+        """初始化生成器
+
+        Args:
+            seed: 随机种子
+            vocabularies: 取值表，缺省由 pool.generator.load_vocabularies() 读取
+            max_size: 用户池大小上限
+            unknown_rate: 各字段取表外值的概率
+            duplicate_rate: 复制已有用户（只换ID）的概率，用于制造并列总分
+        """
+        self.rng = np.random.default_rng(seed)
+        self.vocabularies = vocabularies or load_vocabularies()
+        self.max_size = max_size
+        self.unknown_rate = unknown_rate
+        self.duplicate_rate = duplicate_rate
+
+    def _choice(self, values: Sequence[Any]) -> Any:
+        return values[int(self.rng.integers(len(values)))]
+
+    def user(self, user_id: str) -> Dict[str, Any]:
+        """生成一个用户（user_pool.json 格式）"""
+        rng = self.rng
+        user = {'id': user_id}
+        for attribute, field in FIELDS.items():
+            if field in _UNKNOWN_VALUES and rng.random() < self.unknown_rate:
+                user[field] = _UNKNOWN_VALUES[field]
+            else:
+                user[field] = self._choice(self.vocabularies[attribute])
+        games = self.vocabularies['games']
+        library = [self._choice(games) for _ in range(int(rng.integers(0, 5)))]
+        if rng.random() < self.unknown_rate:
+            library.append(_UNKNOWN_GAME)
+        user['游戏'] = library
+        genders = list(self.vocabularies['gender'])
+        if rng.random() < self.unknown_rate:
+            genders.append(_UNKNOWN_VALUES['性别'])
+        order = rng.permutation(len(genders))
+        user['性别倾向'] = [genders[i] for i in order[:int(rng.integers(0, len(genders) + 1))]]
+        return user
+
+    def case(self) -> Case:
+        """生成一个用例"""
+        rng = self.rng
+        size = int(rng.integers(1, self.max_size + 1))
+        users = []
+        for index in range(size):
+            if users and rng.random() < self.duplicate_rate:
+                user = copy.deepcopy(self._choice(users))
+                user['id'] = f'u{index}'
+            else:
+                user = self.user(f'u{index}')
+            users.append(user)
+        return {'users': users, 'target': int(rng.integers(size)), 'top_n': int(rng.integers(0, size + 3))}
+
+def _profiles(case: Case) -> List[UserProfile]:
+    return [user_from_dict(user) for user in case['users']]
+
+def _differs(expected: float, actual: float, tolerance: float) -> bool:
+    """两个分数是否超出容差（两侧都是 NaN 视为相同）"""
+    if np.isnan(expected) or np.isnan(actual):
+        return not (np.isnan(expected) and np.isnan(actual))
+    return abs(expected - actual) > tolerance
+
+def compare(
+    system,
+    case: Case,
+    engines: Sequence[str] = ENGINES,
+    tolerance: float = DEFAULT_TOLERANCE
+) -> Optional[List[Dict[str, Any]]]:
+    """对一个用例比较各实现与参照实现
+
+    逐对实现比较每个候选的各维度分数与总分；top-k 实现比较结果数与逐名次总分，
+    名次上的用户不同时，只要该用户的参照总分与参照结果同名次的总分在容差内（并列）即视为一致。
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: 不一致列表（engine、kind、detail），
+        参照实现对该用例抛出异常时返回 None
+    """
+    users = _profiles(case)
+    target = users[case['target']]
+    top_n = case['top_n']
+    try:
+        reference = {user.user_id: system.match_users(target, user) for user in users if user != target}
+    except Exception:
+        return None
+    ranking = sorted(reference.items(), key=lambda item: item[1]['total_score'], reverse=True)[:max(top_n, 0)]
+
+    mismatches = []
+    for engine in engines:
+        try:
+            if engine in PAIR_ENGINES:
+                actual = PAIR_ENGINES[engine](system, target, users)
+                if set(actual) != set(reference):
+                    mismatches.append({'engine': engine, 'kind': 'candidates',
+                                       'detail': {'expected': sorted(reference), 'actual': sorted(actual)}})
+                    continue
+                for user_id, expected_scores in reference.items():
+                    for key in _SCORE_KEYS:
+                        if _differs(expected_scores[key], actual[user_id][key], tolerance):
+                            mismatches.append({'engine': engine, 'kind': 'score', 'detail': {
+                                'candidate': user_id, 'dimension': key,
+                                'expected': expected_scores[key], 'actual': actual[user_id][key]}})
+                            break
+            else:
+                actual = RANKING_ENGINES[engine](system, target, users, top_n)
+                expected = [(user_id, scores['total_score']) for user_id, scores in ranking]
+                if len(actual) != len(expected):
+                    mismatches.append({'engine': engine, 'kind': 'ranking', 'detail': {
+                        'expected': expected, 'actual': actual}})
+                    continue
+                for rank, ((expected_id, expected_total), (actual_id, actual_total)) in \
+                        enumerate(zip(expected, actual)):
+                    tied = actual_id in reference and not _differs(
+                        reference[actual_id]['total_score'], expected_total, tolerance)
+                    if _differs(expected_total, actual_total, tolerance) or (actual_id != expected_id and not tied):
+                        mismatches.append({'engine': engine, 'kind': 'ranking', 'detail': {
+                            'rank': rank, 'expected': expected, 'actual': actual}})
+                        break
+        except Exception as e:
+            mismatches.append({'engine': engine, 'kind': 'error', 'detail': repr(e)})
+    return mismatches
+
+def shrink(
+    system,
+    case: Case,
+    engine: str,
+    tolerance: float = DEFAULT_TOLERANCE,
+    simple_values: Optional[Dict[str, Any]] = None,
+    max_rounds: int = 20
+) -> Case:
+    """把 engine 不一致的用例收缩为仍不一致的最小用例
+
+    依次尝试: 成批删除目标以外的用户、减小 top_n、删除游戏与性别倾向列表中的元素、
+    把标量字段替换为简单取值；每一步保留仍能复现不一致的改动，直到一轮下来没有改动。
+
+    Args:
+        system: 匹配系统
+        case: 不一致的用例
+        engine: 不一致的实现
+        tolerance: 容差
+        simple_values: 字段 -> 简单取值，缺省取第一个用户的取值
+        max_rounds: 最多轮数
+
+    Returns:
+        Case: 收缩后的用例
+    """
+    def fails(candidate: Case) -> bool:
+        mismatches = compare(system, candidate, (engine,), tolerance)
+        return bool(mismatches)
+
+    case = copy.deepcopy(case)
+    simple_values = simple_values or {field: case['users'][0][field] for field in _UNKNOWN_VALUES}
+    for _ in range(max_rounds):
+        changed = False
+
+        # 成批删除用户（块大小逐次减半）
+        chunk = max(len(case['users']) // 2, 1)
+        while chunk >= 1:
+            start = 0
+            while start < len(case['users']):
+                keep = [i for i in range(len(case['users']))
+                        if not start <= i < start + chunk or i == case['target']]
+                if len(keep) < len(case['users']):
+                    candidate = dict(case, users=[case['users'][i] for i in keep],
+                                     target=keep.index(case['target']))
+                    if fails(candidate):
+                        case, changed = candidate, True
+                        continue
+                start += chunk
+            chunk //= 2
+
+        # 减小 top_n
+        for top_n in range(0, case['top_n']):
+            candidate = dict(case, top_n=top_n)
+            if fails(candidate):
+                case, changed = candidate, True
+                break
+
+        # 简化各用户的字段
+        for index in range(len(case['users'])):
+            for field in ('游戏', '性别倾向'):
+                position = 0
+                while position < len(case['users'][index][field]):
+                    candidate = copy.deepcopy(case)
+                    del candidate['users'][index][field][position]
+                    if fails(candidate):
+                        case, changed = candidate, True
+                    else:
+                        position += 1
+            for field, value in simple_values.items():
+                if case['users'][index][field] != value:
+                    candidate = copy.deepcopy(case)
+                    candidate['users'][index][field] = value
+                    if fails(candidate):
+                        case, changed = candidate, True
+        if not changed:
+            break
+    return case
+
+def run(
+    system,
+    runs: int = 200,
+    seed: int = 0,
+    max_size: int = 30,
+    engines: Sequence[str] = ENGINES,
+    tolerance: float = DEFAULT_TOLERANCE,
+    minimize: bool = True,
+    generator: Optional[CaseGenerator] = None
+) -> Dict[str, Any]:
+    """随机差分测试
+
+    每个实现只保留并收缩第一个不一致的用例，之后不再测试该实现。
+
+    Returns:
+        Dict[str, Any]: cases（比较的用例数）、skipped（参照实现抛出异常的用例数）、
+        failures（engine、kind、detail、case、shrunk）
+    """
+    generator = generator or CaseGenerator(seed, max_size=max_size)
+    remaining = list(engines)
+    failures = []
+    cases = skipped = 0
+    for _ in range(runs):
+        if not remaining:
+            break
+        case = generator.case()
+        mismatches = compare(system, case, remaining, tolerance)
+        if mismatches is None:
+            skipped += 1
+            continue
+        cases += 1
+        for mismatch in mismatches:
+            if mismatch['engine'] not in remaining:
+                continue
+            remaining.remove(mismatch['engine'])
+            shrunk = shrink(system, case, mismatch['engine'], tolerance) if minimize else case
+            detail = compare(system, shrunk, (mismatch['engine'],), tolerance)
+            failures.append(dict(mismatch, case=case, shrunk=shrunk,
+                                 shrunk_detail=detail[0]['detail'] if detail else None))
+    return {'cases': cases, 'skipped': skipped, 'failures': failures}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口
+
+    Returns:
+        int: 0 表示全部一致，1 表示发现不一致
+    """
+    from loaders import LoaderManager
+    from matching.matching_system import MatchingSystem
+
+    parser = argparse.ArgumentParser(description="快速实现与参照打分的差分等价测试")
+    parser.add_argument('--runs', type=int, default=200, help="用例数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--max-size', type=int, default=30, help="用户池大小上限")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help="参与比较的实现")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="分数容差")
+    parser.add_argument('--no-shrink', action='store_true', help="不收缩不一致的用例")
+    parser.add_argument('--output', help="把不一致的用例写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    system = MatchingSystem(LoaderManager().pools_loader.load_game_pool())
+    report = run(system, args.runs, args.seed, args.max_size, args.engines, args.tolerance, not args.no_shrink)
+    print(f"用例 {report['cases']}，跳过 {report['skipped']}，不一致 {len(report['failures'])}", file=sys.stderr)
+    for failure in report['failures']:
+        print(f"  {failure['engine']} ({failure['kind']}): 收缩到 {len(failure['shrunk']['users'])} 个用户，"
+              f"top_n={failure['shrunk']['top_n']}", file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+            file.write('\n')
+    return 1 if report['failures'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,598 @@
+"""编码用户池模块
+
+将用户档案编码为列式数组，并把各匹配器的逐对打分逻辑预先展开为相似度表，
+供向量化打分和多进程共享使用
+"""
+
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.user_profile import UserProfile
+
+# 与 MatchingSystem.match_users 返回字典一致的维度顺序
+DIMENSIONS = (
+    'online_status', 'server', 'time', 'experience', 'style',
+    'mbti', 'zodiac', 'gender', 'game_type', 'game_preference', 'game_social'
+)
+
+# 分类列: 列名 -> 从用户档案取值的函数
+CATEGORICAL_COLUMNS = {
+    'online': lambda user: user.online_status,
+    'server': lambda user: user.play_region,
+    'time': lambda user: user.play_time,
+    'experience': lambda user: user.game_experience,
+    'style': lambda user: user.game_style,
+    'mbti': lambda user: user.mbti,
+    'zodiac': lambda user: user.zodiac,
+    'gender': lambda user: (user.gender, tuple(user.gender_preference or ())),
+}
+
+# 相似度表: 表名 -> 所依赖的分类列
+TABLE_COLUMNS = {
+    'server': 'server',
+    'time': 'time',
+    'experience': 'experience',
+    'social_experience': 'experience',
+    'style': 'style',
+    'mbti': 'mbti',
+    'zodiac': 'zodiac',
+    'gender': 'gender',
+}
+
+def _probe(**attrs) -> SimpleNamespace:
+    """构造只带部分属性的探针用户，用于调用匹配器的逐对方法"""
+    return SimpleNamespace(**attrs)
+
+class PoolEncoder:
+    """用户池编码器
+
+    维护各分类列的词表以及由匹配器展开得到的相似度表。词表只增不减，
+    已分配的编码永远有效；表在词表增长时整体替换而不原地修改，
+    因此旧的编码池可以安全地继续引用旧表。
+    """
+
+    def __init__(self, matching_system):
+        """初始化编码器
+
+        Args:
+            matching_system: 提供各匹配器和维度权重的匹配系统
+        """
+        self.system = matching_system
+        self.vocabularies: Dict[str, List[Any]] = {name: [] for name in CATEGORICAL_COLUMNS}
+        self.vocabularies['games'] = []
+        self.vocabularies['types'] = []
+        self._codes: Dict[str, Dict[Any, int]] = {name: {} for name in self.vocabularies}
+        self._lock = threading.RLock()
+
+        # 游戏名称 -> 类型列表（与 GameMatcher.match_type 一样取第一个同名游戏）
+        self._game_type_lookup: Dict[str, List[str]] = {}
+        for game in matching_system.game_matcher.games:
+            self._game_type_lookup.setdefault(game.name, list(game.types))
+
+        self.tables: Dict[str, np.ndarray] = {
+            name: np.zeros((0, 0), dtype=np.float64) for name in TABLE_COLUMNS
+        }
+        self.tables['type_correlation'] = np.zeros((0, 0), dtype=np.float64)
+        self.game_types = np.zeros((0, 0), dtype=np.uint8)
+
+        dimension_weights = matching_system.dimension_weights
+        self.weights = np.array(
+            [dimension_weights.get(dimension, 1.0) for dimension in DIMENSIONS],
+            dtype=np.float64
+        )
+        self.weight_total = float(sum(dimension_weights.values()))
+        social_weights = matching_system.game_matcher.social_weights
+        self.social_weights = np.array(
+            [social_weights['online_status'], social_weights['game_style'], social_weights['experience']],
+            dtype=np.float64
+        )
+
+    def _pair_functions(self) -> Dict[str, Any]:
+        """各相似度表的逐对打分函数，直接复用匹配器的实现"""
+        system = self.system
+        return {
+            'server': lambda a, b: system.base_matcher.match_server(
+                _probe(play_region=a), _probe(play_region=b)),
+            'time': lambda a, b: system.numeric_matcher.match_time(
+                _probe(play_time=a), _probe(play_time=b)),
+            'experience': lambda a, b: system.numeric_matcher.match_experience(
+                _probe(game_experience=a), _probe(game_experience=b)),
+            'social_experience': self._social_experience,
+            'style': lambda a, b: system.numeric_matcher.match_style(
+                _probe(game_style=a), _probe(game_style=b)),
+            'mbti': system.mbti_matcher.get_weighted_score,
+            'zodiac': system.zodiac_matcher.get_weighted_score,
+            'gender': lambda a, b: system.ordered_matcher.match_gender(
+                _probe(gender=a[0], gender_preference=list(a[1])),
+                _probe(gender=b[0], gender_preference=list(b[1]))),
+        }
+
+    def _social_experience(self, level1: str, level2: str) -> float:
+        """社交维度中的经验匹配度
+
+        GameMatcher.match_social 对未知经验等级会抛出 KeyError，
+        这里用 NaN 标记该情况，而不是悄悄给出一个分数。
+        """
+        levels = self.system.game_matcher.experience_levels
+        similarity = self.system.game_matcher.level_similarity
+        try:
+            return float(similarity[str(abs(levels[level1] - levels[level2]))])
+        except KeyError:
+            return float('nan')
+
+    def _type_correlation(self, type1: str, type2: str) -> float:
+        """游戏类型相关性，与 GameMatcher.match_type 的取值规则一致"""
+        correlations = self.system.game_matcher.game_type_correlations
+        if type1 in correlations and type2 in correlations[type1]:
+            return correlations[type1][type2]
+        return 1.0 if type1 == type2 else 0.1
+
+    def code(self, column: str, value: Any) -> int:
+        """获取取值的编码，未见过的取值会追加到词表
+
+        Args:
+            column: 列名
+            value: 原始取值
+
+        Returns:
+            int: 编码
+        """
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            with self._lock:
+                code = codes.get(value)
+                if code is None:
+                    code = len(self.vocabularies[column])
+                    self.vocabularies[column].append(value)
+                    codes[value] = code
+                    if column == 'games':
+                        for game_type in self._game_type_lookup.get(value, []):
+                            self.code('types', game_type)
+        return code
+
+    def _sync_tables(self) -> None:
+        """把相似度表扩展到当前词表大小"""
+        with self._lock:
+            functions = self._pair_functions()
+            for table_name, column in TABLE_COLUMNS.items():
+                self.tables[table_name] = self._extend_table(
+                    self.tables[table_name], self.vocabularies[column], functions[table_name])
+            self.tables['type_correlation'] = self._extend_table(
+                self.tables['type_correlation'], self.vocabularies['types'], self._type_correlation)
+
+            games = self.vocabularies['games']
+            types = self.vocabularies['types']
+            if self.game_types.shape != (len(games), len(types)):
+                game_types = np.zeros((len(games), len(types)), dtype=np.uint8)
+                old_games, old_types = self.game_types.shape
+                game_types[:old_games, :old_types] = self.game_types
+                for game_code in range(old_games, len(games)):
+                    for game_type in self._game_type_lookup.get(games[game_code], []):
+                        game_types[game_code, self._codes['types'][game_type]] = 1
+                self.game_types = game_types
+
+    @staticmethod
+    def _extend_table(table: np.ndarray, values: List[Any], function) -> np.ndarray:
+        """只计算新增取值对应的行和列，返回新表"""
+        old_size = table.shape[0]
+        size = len(values)
+        if size == old_size:
+            return table
+        extended = np.empty((size, size), dtype=np.float64)
+        extended[:old_size, :old_size] = table
+        for i in range(size):
+            for j in range(old_size if i < old_size else 0, size):
+                extended[i, j] = function(values[i], values[j])
+        return extended
+
+    def _encode_user(self, user: UserProfile) -> Tuple[Dict[str, int], List[int]]:
+        """编码单个用户的分类列和游戏列表"""
+        codes = {column: self.code(column, getter(user)) for column, getter in CATEGORICAL_COLUMNS.items()}
+        game_codes = sorted({self.code('games', game) for game in user.games})
+        return codes, game_codes
+
+    def encode(self, users: Iterable[UserProfile]) -> 'EncodedPool':
+        """将用户列表编码为编码池
+
+        Args:
+            users: 用户档案列表
+
+        Returns:
+            EncodedPool: 编码池
+        """
+        users = list(users)
+        size = len(users)
+        columns = {column: np.empty(size, dtype=np.int32) for column in CATEGORICAL_COLUMNS}
+        game_rows: List[int] = []
+        game_cols: List[int] = []
+        with self._lock:
+            for row, user in enumerate(users):
+                codes, game_codes = self._encode_user(user)
+                for column, code in codes.items():
+                    columns[column][row] = code
+                game_rows.extend([row] * len(game_codes))
+                game_cols.extend(game_codes)
+            self._sync_tables()
+            games = np.zeros((size, len(self.vocabularies['games'])), dtype=np.uint8)
+            games[game_rows, game_cols] = 1
+            return EncodedPool(
+                user_ids=[user.user_id for user in users],
+                columns=columns,
+                games=games,
+                types=self._types_of(games),
+                tables=dict(self.tables),
+                weights=self.weights,
+                weight_total=self.weight_total,
+                social_weights=self.social_weights,
+                vocabularies={name: list(values) for name, values in self.vocabularies.items()},
+                encoder=self
+            )
+
+    def encode_query(self, user: UserProfile) -> 'EncodedQuery':
+        """编码单个查询用户，返回可与任意同源编码池打分的查询
+
+        Args:
+            user: 查询用户
+
+        Returns:
+            EncodedQuery: 编码后的查询
+        """
+        with self._lock:
+            codes, game_codes = self._encode_user(user)
+            self._sync_tables()
+            games = np.zeros(len(self.vocabularies['games']), dtype=np.uint8)
+            games[game_codes] = 1
+            types = self._types_of(games[np.newaxis, :])[0]
+            return EncodedQuery(user.user_id, codes, games, types, dict(self.tables))
+
+    def _types_of(self, games: np.ndarray) -> np.ndarray:
+        """由游戏多热矩阵推导游戏类型多热矩阵"""
+        game_types = self.game_types[:games.shape[1]]
+        return (games.astype(np.int32) @ game_types.astype(np.int32) > 0).astype(np.uint8)
+
+class EncodedQuery:
+    """编码后的查询用户
+
+    持有编码时刻的相似度表；由于词表只增不减，这些表对同一编码器
+    之前产生的所有编码池都有效。
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        codes: Dict[str, int],
+        games: np.ndarray,
+        types: np.ndarray,
+        tables: Dict[str, np.ndarray]
+    ):
+        """初始化查询
+
+        Args:
+            user_id: 用户ID
+            codes: 各分类列的编码
+            games: 游戏多热向量
+            types: 游戏类型多热向量
+            tables: 相似度表
+        """
+        self.user_id = user_id
+        self.codes = codes
+        self.games = games
+        self.types = types
+        self.tables = tables
+
+class EncodedPool:
+    """编码用户池
+
+    以列式数组保存用户的分类编码、游戏/类型多热矩阵和相似度表，
+    打分结果与 MatchingSystem.match_users 逐维一致（浮点求和顺序除外）。
+    所有数组都可以放入共享内存，参见 matching.shared_pool。
+    """
+
+    def __init__(
+        self,
+        user_ids: Sequence[str],
+        columns: Dict[str, np.ndarray],
+        games: np.ndarray,
+        types: np.ndarray,
+        tables: Dict[str, np.ndarray],
+        weights: np.ndarray,
+        weight_total: float,
+        social_weights: np.ndarray,
+        vocabularies: Dict[str, List[Any]],
+        encoder: Optional[PoolEncoder] = None,
+        id_order: Optional[np.ndarray] = None,
+        game_counts: Optional[np.ndarray] = None,
+        type_counts: Optional[np.ndarray] = None
+    ):
+        """初始化编码池
+
+        Args:
+            user_ids: 用户ID序列
+            columns: 分类列编码数组
+            games: 游戏多热矩阵 (用户数 x 游戏数)
+            types: 游戏类型多热矩阵 (用户数 x 类型数)
+            tables: 相似度表
+            weights: 按 DIMENSIONS 顺序排列的维度权重
+            weight_total: 维度权重之和
+            social_weights: 社交维度的(在线状态, 游戏风格, 经验)权重
+            vocabularies: 各列词表
+            encoder: 产生该编码池的编码器，共享内存中附加的编码池为 None
+            id_order: 按用户ID排序的行号，缺省时自动计算
+            game_counts: 每个用户的游戏数，缺省时自动计算
+            type_counts: 每个用户的游戏类型数，缺省时自动计算
+        """
+        self.user_ids = np.asarray(user_ids, dtype=str) if not isinstance(user_ids, np.ndarray) else user_ids
+        self.columns = columns
+        self.games = games
+        self.types = types
+        self.game_counts = games.sum(axis=1, dtype=np.int32) if game_counts is None else game_counts
+        self.type_counts = types.sum(axis=1, dtype=np.int32) if type_counts is None else type_counts
+        self.tables = tables
+        self.weights = weights
+        self.weight_total = weight_total
+        self.social_weights = social_weights
+        self.vocabularies = vocabularies
+        self.encoder = encoder
+        self.id_order = np.argsort(self.user_ids, kind='stable') if id_order is None else id_order
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def row_of(self, user_id: str) -> int:
+        """按用户ID查找行号（二分查找，不额外占用内存）
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            int: 行号
+
+        Raises:
+            KeyError: 用户不在编码池中
+        """
+        position = int(np.searchsorted(self.user_ids, user_id, sorter=self.id_order))
+        if position < len(self.id_order):
+            row = int(self.id_order[position])
+            if self.user_ids[row] == user_id:
+                return row
+        raise KeyError(user_id)
+
+    def query(self, row: int) -> EncodedQuery:
+        """把编码池中的一行作为查询
+
+        Args:
+            row: 行号
+
+        Returns:
+            EncodedQuery: 查询
+        """
+        codes = {column: int(values[row]) for column, values in self.columns.items()}
+        return EncodedQuery(str(self.user_ids[row]), codes, self.games[row], self.types[row], self.tables)
+
+    def score(
+        self,
+        query: EncodedQuery,
+        rows: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """向量化计算查询与各行的匹配分数
+
+        查询须由同一编码器在编码池之后产生（或取自编码池本身），
+        以保证其相似度表覆盖编码池中出现的所有编码。
+
+        Args:
+            query: 查询用户
+            rows: 参与打分的行号，缺省为全部行
+
+        Returns:
+            Dict[str, np.ndarray]: 各维度分数数组及 total_score
+        """
+        if rows is None:
+            rows = np.arange(len(self.user_ids))
+        tables = query.tables
+        codes = query.codes
+        columns = {column: values[rows] for column, values in self.columns.items()}
+
+        online_equal = columns['online'] == codes['online']
+        style_equal = columns['style'] == codes['style']
+        scores = {
+            'online_status': online_equal.astype(np.float64),
+            'server': tables['server'][codes['server'], columns['server']],
+            'time': tables['time'][codes['time'], columns['time']],
+            'experience': tables['experience'][codes['experience'], columns['experience']],
+            'style': tables['style'][codes['style'], columns['style']],
+            'mbti': tables['mbti'][codes['mbti'], columns['mbti']],
+            'zodiac': tables['zodiac'][codes['zodiac'], columns['zodiac']],
+            'gender': tables['gender'][codes['gender'], columns['gender']],
+        }
+
+        # 游戏类型: sum(C[a, b]) / (|T1| * |T2|)，即双线性形式 x1^T C x2
+        type_width = self.types.shape[1]
+        type_vector = query.types.astype(np.float64) @ tables['type_correlation'][:len(query.types)]
+        if len(type_vector) < type_width:
+            raise ValueError("查询的相似度表早于编码池，请重新编码查询")
+        type_sums = self.types[rows] @ type_vector[:type_width]
+        type_pairs = int(query.types.sum()) * self.type_counts[rows]
+        scores['game_type'] = np.where(type_pairs > 0, type_sums / np.maximum(type_pairs, 1), 0.0)
+
+        # 游戏偏好: 游戏集合的 Jaccard 相似度
+        game_width = self.games.shape[1]
+        query_count = int(query.games.sum())
+        query_games = np.zeros(game_width, dtype=np.int32)
+        query_games[:min(game_width, len(query.games))] = query.games[:game_width]
+        common = self.games[rows].astype(np.int32) @ query_games
+        union = query_count + self.game_counts[rows] - common
+        has_games = (self.game_counts[rows] > 0) & (query_count > 0)
+        scores['game_preference'] = np.where(has_games, common / np.maximum(union, 1), 0.0)
+
+        social_weights = self.social_weights
+        scores['game_social'] = (
+            np.where(online_equal, 1.0, 0.5) * social_weights[0] +
+            np.where(style_equal, 1.0, 0.5) * social_weights[1] +
+            tables['social_experience'][codes['experience'], columns['experience']] * social_weights[2]
+        )
+
+        total = np.zeros(len(rows), dtype=np.float64)
+        for dimension, weight in zip(DIMENSIONS, self.weights):
+            total = total + scores[dimension] * weight
+        scores['total_score'] = total / self.weight_total
+        return scores
+
+    def top_k(
+        self,
+        query: EncodedQuery,
+        k: int,
+        rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """返回总分最高的 k 行，排除查询用户本身
+
+        同分时按行号升序，与 find_best_matches 的稳定排序一致。
+
+        Args:
+            query: 查询用户
+            k: 返回数量
+            rows: 候选行号，缺省为全部行
+
+        Returns:
+            List[Tuple[int, float]]: (行号, 总分)列表，按总分降序排序
+        """
+        if rows is None:
+            rows = np.arange(len(self.user_ids))
+        rows = rows[self.user_ids[rows] != query.user_id]
+        if k <= 0 or len(rows) == 0:
+            return []
+        total = self.score(query, rows)['total_score']
+        if len(rows) > k:
+            # 先按第 k 大的分数截断，保留所有并列项以维持稳定排序语义
+            threshold = np.partition(total, len(total) - k)[len(total) - k]
+            keep = np.nonzero(total >= threshold)[0]
+            rows, total = rows[keep], total[keep]
+        order = np.argsort(-total, kind='stable')[:k]
+        return [(int(rows[i]), float(total[i])) for i in order]
+
+    def updated(self, changes: Dict[int, UserProfile], size: Optional[int] = None) -> 'EncodedPool':
+        """返回只重新编码了指定行的新编码池，原编码池保持不变
+
+        只有变化的行需要编码，其余行按数组整体复制，
+        代价与编码池行数成正比而与变化行之外的用户无关。
+
+        Args:
+            changes: 行号 -> 新的用户档案，行号可以超出当前行数以追加新行
+            size: 新编码池的行数，缺省为容纳所有变化行的最小行数
+
+        Returns:
+            EncodedPool: 新编码池
+
+        Raises:
+            ValueError: 编码池没有关联的编码器（例如附加自共享内存）
+        """
+        encoder = self.encoder
+        if encoder is None:
+            raise ValueError("编码池没有关联的编码器，无法增量更新")
+        old_size = len(self.user_ids)
+        if size is None:
+            size = max([old_size] + [row + 1 for row in changes])
+
+        with encoder._lock:
+            encoded = {row: encoder._encode_user(user) for row, user in changes.items()}
+            encoder._sync_tables()
+            game_width = len(encoder.vocabularies['games'])
+            type_width = len(encoder.vocabularies['types'])
+
+            kept = min(old_size, size)
+            columns = {}
+            for column, values in self.columns.items():
+                columns[column] = np.zeros(size, dtype=values.dtype)
+                columns[column][:kept] = values[:kept]
+            games = np.zeros((size, game_width), dtype=np.uint8)
+            games[:kept, :self.games.shape[1]] = self.games[:kept]
+            types = np.zeros((size, type_width), dtype=np.uint8)
+            types[:kept, :self.types.shape[1]] = self.types[:kept]
+            user_ids = self.user_ids[:kept].tolist() + [''] * (size - kept)
+
+            rows = sorted(encoded)
+            for row in rows:
+                codes, game_codes = encoded[row]
+                for column, code in codes.items():
+                    columns[column][row] = code
+                games[row] = 0
+                games[row, game_codes] = 1
+                user_ids[row] = changes[row].user_id
+            if rows:
+                types[rows] = encoder._types_of(games[rows])
+
+            return EncodedPool(
+                user_ids=user_ids,
+                columns=columns,
+                games=games,
+                types=types,
+                tables=dict(encoder.tables),
+                weights=self.weights,
+                weight_total=self.weight_total,
+                social_weights=self.social_weights,
+                vocabularies={name: list(values) for name, values in encoder.vocabularies.items()},
+                encoder=encoder
+            )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """列出全部数组，键名用于共享内存布局
+
+        Returns:
+            Dict[str, np.ndarray]: 数组名 -> 数组
+        """
+        arrays = {
+            'user_ids': self.user_ids,
+            'id_order': self.id_order,
+            'games': self.games,
+            'types': self.types,
+            'game_counts': self.game_counts,
+            'type_counts': self.type_counts,
+            'weights': self.weights,
+            'social_weights': self.social_weights,
+        }
+        for column, values in self.columns.items():
+            arrays[f'column.{column}'] = values
+        for name, table in self.tables.items():
+            arrays[f'table.{name}'] = table
+        return arrays
+
+    def metadata(self) -> Dict[str, Any]:
+        """列出数组之外的元数据（可JSON序列化）
+
+        Returns:
+            Dict[str, Any]: 元数据
+        """
+        vocabularies = dict(self.vocabularies)
+        vocabularies['gender'] = [[gender, list(preference)] for gender, preference in self.vocabularies['gender']]
+        return {'weight_total': self.weight_total, 'vocabularies': vocabularies}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> 'EncodedPool':
+        """由 arrays() 与 metadata() 的结果重建编码池（不复制数组）
+
+        Args:
+            arrays: 数组名 -> 数组
+            metadata: 元数据
+
+        Returns:
+            EncodedPool: 编码池
+        """
+        vocabularies = dict(metadata['vocabularies'])
+        vocabularies['gender'] = [(gender, tuple(preference)) for gender, preference in vocabularies['gender']]
+        return cls(
+            user_ids=arrays['user_ids'],
+            columns={name[len('column.'):]: array for name, array in arrays.items() if name.startswith('column.')},
+            games=arrays['games'],
+            types=arrays['types'],
+            tables={name[len('table.'):]: array for name, array in arrays.items() if name.startswith('table.')},
+            weights=arrays['weights'],
+            weight_total=metadata['weight_total'],
+            social_weights=arrays['social_weights'],
+            vocabularies=vocabularies,
+            id_order=arrays['id_order'],
+            game_counts=arrays['game_counts'],
+            type_counts=arrays['type_counts']
+        )
@@ -24,7 +24,8 @@ class GameMatcher:
         Args:
             games: 游戏档案列表
         """
-        self.games = games
+        # 复制为不可变元组，调用方之后修改自己的列表不会影响匹配器
+        self.games = tuple(games)
         self._load_configs()
         
     def _load_configs(self):
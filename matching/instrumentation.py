@@ -0,0 +1,136 @@
+"""匹配计时与计数模块
+
+记录各维度打分函数的累计耗时与调用次数，以及扫描、剪枝、缓存命中等计数。
+每个线程写自己的累加表，写入时不加锁；线程结束时其累加表并入共享的合计表，
+snapshot() 汇总合计表与存活线程的累加表
+"""
+
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List
+
+def _new_table() -> Dict[str, Any]:
+    """空累加表: {'timings': {名称: [次数, 秒]}, 'counters': {名称: 计数}}"""
+    return {'timings': {}, 'counters': {}}
+
+def _merge(total: Dict[str, Any], table: Dict[str, Any]) -> None:
+    """把累加表 table 并入 total"""
+    timings = total['timings']
+    for name, (calls, seconds) in list(table['timings'].items()):
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+    counters = total['counters']
+    for name, amount in list(table['counters'].items()):
+        counters[name] = counters.get(name, 0) + amount
+
+class _Slot:
+    """线程局部变量中持有累加表的对象，线程结束时随线程局部变量释放，触发 _retire()"""
+
+    __slots__ = ('table', '__weakref__')
+
+    def __init__(self, table: Dict[str, Any]):
+        self.table = table
+
+def _retire(owner: 'weakref.ref', key: int) -> None:
+    """线程结束: 把它的累加表并入合计表"""
+    instrumentation = owner()
+    if instrumentation is not None:
+        with instrumentation._lock:
+            table = instrumentation._tables.pop(key, None)
+            if table is not None:
+                _merge(instrumentation._retired, table)
+
+def timed(add_time: Callable[[str, float], None], name: str, function: Callable) -> Callable:
+    """包装函数，每次调用后以 add_time(name, 秒) 记录其耗时
+
+    Instrumentation.timed() 与 QueryTrace.timed() 共用。
+    """
+    clock = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            add_time(name, clock() - start)
+    return wrapper
+
+class Instrumentation:
+    """计时与计数器
+
+    挂接到 MatchingSystem.instrumentation 后启用；未挂接（None）时匹配路径只多一次判断。
+    """
+
+    def __init__(self):
+        """初始化计数器"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # 存活线程的累加表（键为线程的 _Slot 编号）与已结束线程的合计表
+        self._tables: Dict[int, Dict[str, Any]] = {}
+        self._retired: Dict[str, Any] = _new_table()
+        self._next_key = 0
+
+    def _table(self) -> Dict[str, Any]:
+        """当前线程的累加表: {'timings': {名称: [次数, 秒]}, 'counters': {名称: 计数}}"""
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            slot = _Slot(_new_table())
+            with self._lock:
+                key = self._next_key
+                self._next_key += 1
+                self._tables[key] = slot.table
+            weakref.finalize(slot, _retire, weakref.ref(self), key)
+            self._local.slot = slot
+        return slot.table
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        """累加一项耗时"""
+        timings = self._table()['timings']
+        entry = timings.get(name)
+        if entry is None:
+            timings[name] = [calls, seconds]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """累加一个计数"""
+        counters = self._table()['counters']
+        counters[name] = counters.get(name, 0) + amount
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        """包装函数，每次调用累加其耗时"""
+        return timed(self.add_time, name, function)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """汇总所有线程的计时与计数
+
+        Returns:
+            Dict[str, Dict[str, Any]]: {'timings': {名称: {'calls', 'seconds', 'mean_us'}},
+            'counters': {名称: 计数}}，计时按累计耗时降序排列
+        """
+        total = _new_table()
+        with self._lock:
+            _merge(total, self._retired)
+            tables = list(self._tables.values())
+        for table in tables:
+            _merge(total, table)
+        timings: Dict[str, List[float]] = total['timings']
+        counters: Dict[str, int] = total['counters']
+        ordered = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'timings': {
+                name: {'calls': calls, 'seconds': seconds, 'mean_us': seconds / calls * 1e6 if calls else 0.0}
+                for name, (calls, seconds) in ordered
+            },
+            'counters': dict(sorted(counters.items()))
+        }
+
+    def reset(self) -> None:
+        """清零所有线程的计时与计数"""
+        with self._lock:
+            for table in list(self._tables.values()) + [self._retired]:
+                table['timings'].clear()
+                table['counters'].clear()
@@ -0,0 +1,339 @@
+"""游戏倒排索引模块
+
+维护 游戏 -> 玩家 的倒排表，可随用户档案变化增量更新。
+每个用户分配一个整数文档号，删除用户留下的文档号由之后的新用户复用，倒排表按文档号有序；
+稀疏的倒排表存为有序数组，热门游戏（如王者荣耀）的倒排表自动转为位图压缩存储
+"""
+
+import bisect
+import heapq
+from array import array
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# 位图每个文档占 1 位，有序数组每个文档占 32 位；
+# 倒排表长度超过文档号上界的 1/32 时位图更省空间，低于 1/64 时转回数组（留出回差避免反复转换）
+_DENSE_RATIO = 32
+_SPARSE_RATIO = 64
+
+# 倒排表长度低于该值时始终使用数组
+_MIN_DENSE_COUNT = 64
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+class Postings:
+    """单个游戏的倒排表
+
+    两种存储形式: 有序的 uint32 数组，或按文档号索引的位图（bytearray）。
+    """
+
+    __slots__ = ('ids', 'bits', 'count')
+
+    def __init__(self):
+        """初始化空倒排表（数组形式）"""
+        self.ids: Optional[array] = array('I')
+        self.bits: Optional[bytearray] = None
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def compressed(self) -> bool:
+        """是否为位图形式"""
+        return self.bits is not None
+
+    def add(self, doc: int) -> None:
+        """加入文档号（已存在时不变）"""
+        if self.bits is not None:
+            byte, bit = doc >> 3, 1 << (doc & 7)
+            if byte >= len(self.bits):
+                self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                self.count += 1
+            return
+        ids = self.ids
+        if not ids or doc > ids[-1]:
+            # 新用户的文档号最大，常见情况为追加
+            ids.append(doc)
+            self.count += 1
+            return
+        position = bisect.bisect_left(ids, doc)
+        if ids[position] != doc:
+            ids.insert(position, doc)
+            self.count += 1
+
+    def discard(self, doc: int) -> None:
+        """移除文档号（不存在时不变）"""
+        if self.bits is not None:
+            byte, bit = doc >> 3, 1 << (doc & 7)
+            if byte < len(self.bits) and self.bits[byte] & bit:
+                self.bits[byte] &= ~bit & 0xFF
+                self.count -= 1
+            return
+        ids = self.ids
+        position = bisect.bisect_left(ids, doc)
+        if position < len(ids) and ids[position] == doc:
+            del ids[position]
+            self.count -= 1
+
+    def contains(self, docs: np.ndarray) -> np.ndarray:
+        """向量化判断一组文档号是否在倒排表中"""
+        if self.bits is not None:
+            bits = np.frombuffer(self.bits, dtype=np.uint8)
+            inside = (docs >> 3) < len(bits)
+            result = np.zeros(len(docs), dtype=bool)
+            present = docs[inside]
+            result[inside] = (bits[present >> 3] >> (present & 7)) & 1 == 1
+            return result
+        return np.isin(docs, self.to_array(), assume_unique=True)
+
+    def to_array(self) -> np.ndarray:
+        """以有序 int64 数组返回全部文档号"""
+        if self.bits is not None:
+            return np.flatnonzero(np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8), bitorder='little'))
+        if not self.ids:
+            return _EMPTY
+        return np.frombuffer(self.ids, dtype=np.uint32).astype(np.int64)
+
+    def rebalance(self, doc_bound: int) -> None:
+        """按当前密度选择存储形式
+
+        Args:
+            doc_bound: 文档号上界（已分配的文档数）
+        """
+        if self.bits is None:
+            if self.count >= _MIN_DENSE_COUNT and self.count * _DENSE_RATIO > doc_bound:
+                docs = self.to_array()
+                bits = np.zeros((doc_bound + 7) // 8 * 8, dtype=np.uint8)
+                bits[docs] = 1
+                self.bits = bytearray(np.packbits(bits, bitorder='little').tobytes())
+                self.ids = None
+        elif self.count < _MIN_DENSE_COUNT or self.count * _SPARSE_RATIO < doc_bound:
+            docs = self.to_array()
+            self.ids = array('I', docs.astype(np.uint32).tobytes())
+            self.bits = None
+
+    def nbytes(self) -> int:
+        """存储占用的字节数"""
+        if self.bits is not None:
+            return len(self.bits)
+        return self.ids.itemsize * len(self.ids)
+
+class GameIndex:
+    """游戏倒排索引
+
+    用户键可以是用户ID或任意可哈希值（例如用户在某个列表中的位置）。
+    put() / remove() 增量维护，只改动新旧游戏集合之差对应的倒排表。
+    删除用户的文档号放入空闲堆，新用户优先取最小的空闲号，
+    文档号上界因此只随同时存在的用户数的峰值增长，反复增删不会让位图和各数组无限变长。
+    倒排表的存储形式在修改时不做调整，读取前才按当前文档号上界统一调整被修改过的倒排表。
+    只以 put() 新增、从不删除时文档号依次递增，与加入顺序一致。
+    """
+
+    def __init__(self, users: Iterable = ()):
+        """初始化索引
+
+        Args:
+            users: 初始用户档案，按 user_id 建索引
+        """
+        self._docs: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Hashable]] = []
+        self._games: List[Optional[frozenset]] = []
+        self._game_counts = array('I')
+        self._postings: Dict[str, Postings] = {}
+        self._free: List[int] = []
+        self._unbalanced: Set[str] = set()
+        for user in users:
+            self.put(user.user_id, user.games)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._docs
+
+    @property
+    def doc_bound(self) -> int:
+        """已分配的文档号数量（含已删除用户留下、尚未复用的空号）"""
+        return len(self._keys)
+
+    def doc_of(self, key: Hashable) -> Optional[int]:
+        """用户键对应的文档号"""
+        return self._docs.get(key)
+
+    def keys_of(self, docs: Iterable[int]) -> List[Hashable]:
+        """文档号对应的用户键"""
+        keys = self._keys
+        return [keys[doc] for doc in docs]
+
+    def put(self, key: Hashable, games: Iterable[str]) -> None:
+        """新增或更新用户的游戏列表
+
+        Args:
+            key: 用户键
+            games: 游戏名列表
+        """
+        games = frozenset(games)
+        doc = self._docs.get(key)
+        if doc is None:
+            if self._free:
+                doc = heapq.heappop(self._free)
+                self._keys[doc] = key
+                self._games[doc] = frozenset()
+            else:
+                doc = len(self._keys)
+                self._keys.append(key)
+                self._games.append(frozenset())
+                self._game_counts.append(0)
+            self._docs[key] = doc
+        old = self._games[doc]
+        for game in old - games:
+            self._discard(game, doc)
+        for game in games - old:
+            postings = self._postings.get(game)
+            if postings is None:
+                postings = self._postings[game] = Postings()
+            postings.add(doc)
+            self._unbalanced.add(game)
+        self._games[doc] = games
+        self._game_counts[doc] = len(games)
+
+    def add_user(self, user) -> None:
+        """按 user_id 新增或更新用户档案"""
+        self.put(user.user_id, user.games)
+
+    def apply(self, upserted: Iterable, removed: Iterable[Hashable]) -> None:
+        """按 user_id 应用一次用户池提交，可由 VersionedPool.attach() 挂接
+
+        Args:
+            upserted: 新增或变化的用户档案
+            removed: 被删除的用户ID
+        """
+        for key in removed:
+            self.remove(key)
+        for user in upserted:
+            self.add_user(user)
+
+    def remove(self, key: Hashable) -> bool:
+        """删除用户
+
+        Returns:
+            bool: 用户是否存在
+        """
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return False
+        for game in self._games[doc]:
+            self._discard(game, doc)
+        self._keys[doc] = None
+        self._games[doc] = None
+        self._game_counts[doc] = 0
+        heapq.heappush(self._free, doc)
+        return True
+
+    def _discard(self, game: str, doc: int) -> None:
+        """从游戏的倒排表中移除文档号，空表随之删除"""
+        postings = self._postings[game]
+        postings.discard(doc)
+        if not postings:
+            del self._postings[game]
+            self._unbalanced.discard(game)
+        else:
+            self._unbalanced.add(game)
+
+    def _balance(self) -> None:
+        """按当前文档号上界调整修改过的倒排表的存储形式，读取倒排表前调用"""
+        if self._unbalanced:
+            doc_bound = self.doc_bound
+            for game in self._unbalanced:
+                self._postings[game].rebalance(doc_bound)
+            self._unbalanced.clear()
+
+    def games_of(self, key: Hashable) -> frozenset:
+        """用户的游戏集合（不存在时为空集）"""
+        doc = self._docs.get(key)
+        return frozenset() if doc is None else self._games[doc]
+
+    def postings(self, game: str) -> np.ndarray:
+        """游戏的倒排表（有序文档号）"""
+        self._balance()
+        postings = self._postings.get(game)
+        return _EMPTY if postings is None else postings.to_array()
+
+    def count(self, game: str) -> int:
+        """玩该游戏的用户数"""
+        postings = self._postings.get(game)
+        return 0 if postings is None else len(postings)
+
+    def counts(self) -> Dict[str, int]:
+        """各游戏的玩家数"""
+        return {game: len(postings) for game, postings in self._postings.items()}
+
+    def compressed_games(self) -> List[str]:
+        """以位图形式存储的游戏"""
+        self._balance()
+        return [game for game, postings in self._postings.items() if postings.compressed]
+
+    def union(self, games: Iterable[str]) -> np.ndarray:
+        """玩任一指定游戏的用户（有序文档号）"""
+        arrays = [self.postings(game) for game in set(games)]
+        arrays = [docs for docs in arrays if len(docs)]
+        return np.unique(np.concatenate(arrays)) if arrays else _EMPTY
+
+    def intersection(self, games: Iterable[str]) -> np.ndarray:
+        """同时玩全部指定游戏的用户（有序文档号）
+
+        从最短的倒排表出发，逐个与其余倒排表求交；位图形式的倒排表按位直接判断。
+        """
+        self._balance()
+        postings = [self._postings.get(game) for game in set(games)]
+        if not postings or any(p is None for p in postings):
+            return _EMPTY
+        postings.sort(key=len)
+        docs = postings[0].to_array()
+        for other in postings[1:]:
+            if not len(docs):
+                break
+            docs = docs[other.contains(docs)]
+        return docs
+
+    def shared_counts(self, games: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """与给定游戏集合至少有一个共同游戏的用户及共同游戏数
+
+        Args:
+            games: 游戏名
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (有序文档号, 共同游戏数)，即 Jaccard 的分子
+        """
+        arrays = [self.postings(game) for game in set(games)]
+        arrays = [docs for docs in arrays if len(docs)]
+        if not arrays:
+            return _EMPTY, _EMPTY
+        return np.unique(np.concatenate(arrays), return_counts=True)
+
+    def preference_scores(self, games: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """批量计算 GameMatcher.match_preference 的 Jaccard 相似度
+
+        没有共同游戏的用户相似度为0，不在返回结果中。
+
+        Args:
+            games: 目标用户的游戏列表
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (有序文档号, 相似度)
+        """
+        games = set(games)
+        docs, shared = self.shared_counts(games)
+        if not len(docs):
+            return docs, np.zeros(0)
+        counts = np.frombuffer(self._game_counts, dtype=np.uint32)[docs].astype(np.int64)
+        return docs, shared / (len(games) + counts - shared)
+
+    def nbytes(self) -> int:
+        """全部倒排表占用的字节数"""
+        self._balance()
+        return sum(postings.nbytes() for postings in self._postings.values())
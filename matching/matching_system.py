@@ -3,8 +3,12 @@
 整合所有匹配器，提供完整的匹配功能
 """
 
+import copy
+import heapq
+import operator
 import os
-from typing import Dict, List, Tuple
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from models.user_profile import UserProfile
 from models.game_profile import GameProfile
 from matching.base_matcher import BaseMatcher
@@ -12,8 +16,65 @@ from matching.numeric_matcher import NumericMatcher
 from matching.preference_matcher import PreferenceMatcher, MBTIMatcher, ZodiacMatcher
 from matching.ordered_matcher import OrderedMatcher
 from matching.game_matcher import GameMatcher
+from matching.encoded_pool import DIMENSIONS, PoolEncoder, EncodedPool
+from matching.prefilter import HardConstraints, prefilter
+from matching.instrumentation import Instrumentation
+from matching.tracing import QueryTrace, QueryTracer
+from pool.presence import ONLINE, PresenceIndex
 from loaders import WeightsLoader
 
+def _same_games(games: Tuple[GameProfile, ...], other: Tuple[GameProfile, ...]) -> bool:
+    """两组游戏档案是否逐个为同一对象（GameProfile 只按名称判等，不能发现类型的变化）"""
+    return games is other or (len(games) == len(other) and all(a is b for a, b in zip(games, other)))
+
+class MatchResults(list):
+    """匹配结果列表
+    
+    与普通列表用法相同，额外记录本次查询扫描了多少用户池，
+    以便在截止时间到达时区分完整结果和部分结果
+    """
+    
+    def __init__(
+        self,
+        matches: Iterable[Tuple[UserProfile, Dict[str, float]]],
+        scanned: int,
+        pool_size: int,
+        deadline_hit: bool = False,
+        prefiltered: int = 0,
+        pruned: int = 0
+    ):
+        """初始化匹配结果
+        
+        Args:
+            matches: (匹配用户, 匹配分数)列表
+            scanned: 已打分的候选用户数
+            pool_size: 候选用户总数（不含目标用户）
+            deadline_hit: 是否因截止时间提前返回
+            prefiltered: 打分前被硬约束排除的用户数（不计入 pool_size）
+            pruned: 已扫描的用户中因分数上界不足而提前放弃的用户数
+        """
+        super().__init__(matches)
+        self.scanned = scanned
+        self.pool_size = pool_size
+        self.deadline_hit = deadline_hit
+        self.prefiltered = prefiltered
+        self.pruned = pruned
+        
+    @property
+    def complete(self) -> bool:
+        """是否扫描了全部候选用户"""
+        return self.scanned >= self.pool_size
+        
+    @property
+    def coverage(self) -> float:
+        """已扫描的候选用户比例 [0,1]"""
+        return self.scanned / self.pool_size if self.pool_size else 1.0
+        
+    @property
+    def pruned_fraction(self) -> float:
+        """已扫描的候选用户中被剪枝的比例 [0,1]"""
+        return self.pruned / self.scanned if self.scanned else 0.0
+
 class MatchingSystem:
     """综合匹配系统
     
@@ -40,6 +101,98 @@ class MatchingSystem:
         self.ordered_matcher = OrderedMatcher()
         self.game_matcher = GameMatcher(games)
         
+        # 编码器延迟创建，只有使用编码池时才需要
+        self._encoder = None
+        
+        # 在线状态索引，由调用方挂接；None 时按档案中的 online_status 判断在线
+        self.presence: Optional[PresenceIndex] = None
+        
+        # 计时与计数器，由调用方挂接；None 时不记录
+        self.instrumentation: Optional[Instrumentation] = None
+        
+        # 查询追踪器，由调用方挂接；None 时不输出追踪记录
+        self.tracer: Optional[QueryTracer] = None
+        
+        # _score_stages() 的缓存: (配置键, 各维度打分阶段)
+        self._stages_cache = None
+        
+        # encode_pool() 的缓存: (用户池, 编码池, 用户ID -> 位置)，用户池逐个是同一对象时复用编码池
+        self._pool_cache = None
+        
+        # for_games() 的缓存: (游戏档案, 绑定到这些游戏档案的匹配系统)；
+        # 绑定的系统记录其来源，再次绑定时从来源出发，不会层层嵌套
+        self._bound_games = None
+        self._origin = None
+        
+    @property
+    def encoder(self) -> PoolEncoder:
+        """用户池编码器（首次访问时创建）"""
+        if self._encoder is None:
+            self._encoder = PoolEncoder(self)
+        return self._encoder
+        
+    def for_games(self, games: Iterable[GameProfile]) -> 'MatchingSystem':
+        """绑定到另一组游戏档案的匹配系统
+        
+        只替换游戏匹配器的游戏档案（配置与其余匹配器共享），编码器与打分阶段缓存各自独立；
+        在线状态索引、计时与追踪器跟随本系统。最近一次绑定的结果会被缓存，
+        游戏档案逐个是同一对象时直接返回缓存或本系统。
+        
+        Args:
+            games: 游戏档案
+            
+        Returns:
+            MatchingSystem: 使用这些游戏档案打分的匹配系统
+        """
+        if self._origin is not None:
+            return self._origin.for_games(games)
+        games = tuple(games)
+        if _same_games(games, self.game_matcher.games):
+            return self
+        cached = self._bound_games
+        if cached is not None and _same_games(games, cached[0]):
+            bound = cached[1]
+        else:
+            bound = copy.copy(self)
+            bound.game_matcher = copy.copy(self.game_matcher)
+            bound.game_matcher.games = games
+            bound._encoder = None
+            bound._stages_cache = None
+            bound._pool_cache = None
+            bound._bound_games = None
+            bound._origin = self
+            self._bound_games = (games, bound)
+        bound.presence = self.presence
+        bound.instrumentation = self.instrumentation
+        bound.tracer = self.tracer
+        return bound
+        
+    def encode_pool(self, user_pool: List[UserProfile]) -> EncodedPool:
+        """将用户池编码为列式编码池
+        
+        缓存最近一次编码的用户池：再次传入逐个是同一对象的用户池时直接返回缓存，
+        只需一次按身份比较，不再逐个用户编码。就地修改过的用户档案不会被发现，
+        修改档案时应替换为新的 UserProfile（多版本用户池的写入即如此）。
+        
+        Args:
+            user_pool: 用户池
+            
+        Returns:
+            EncodedPool: 编码池，可用于向量化打分或放入共享内存
+        """
+        return self._encoded_pool(user_pool)[0]
+        
+    def _encoded_pool(self, user_pool: List[UserProfile]) -> Tuple[EncodedPool, Dict[str, int]]:
+        """encode_pool() 的实现，另返回用户ID -> 位置的索引（与编码池一同缓存）"""
+        users = tuple(user_pool)
+        cached = self._pool_cache
+        if cached is not None and len(cached[0]) == len(users) and all(map(operator.is_, cached[0], users)):
+            return cached[1], cached[2]
+        encoded = self.encoder.encode(users)
+        index = {user.user_id: position for position, user in enumerate(users)}
+        self._pool_cache = (users, encoded, index)
+        return encoded, index
+        
     def match_users(self, user1: UserProfile, user2: UserProfile) -> Dict[str, float]:
         """匹配两个用户
         
@@ -50,6 +203,9 @@ class MatchingSystem:
         Returns:
             Dict[str, float]: 包含各维度匹配分数和总分的字典
         """
+        if self.instrumentation is not None:
+            return self._match_users_instrumented(user1, user2, self.instrumentation)
+            
         # 获取各个维度的匹配结果
         base_results = self.base_matcher.get_match_result(user1, user2)
         numeric_results = self.numeric_matcher.get_match_result(user1, user2)
@@ -91,34 +247,456 @@ class MatchingSystem:
         
         return match_scores
         
+    def _match_users_instrumented(
+        self,
+        user1: UserProfile,
+        user2: UserProfile,
+        instrumentation: Instrumentation
+    ) -> Dict[str, float]:
+        """逐维度计时的 match_users，结果与 match_users 相同
+        
+        各维度打分函数的耗时按维度名累加，合并字典与求总分的耗时记为 aggregate，
+        整次调用记为 match_users。
+        """
+        clock = time.perf_counter
+        add_time = instrumentation.add_time
+        start = clock()
+        scores = {}
+        for dimension, function, _, _ in self._score_stages():
+            began = clock()
+            scores[dimension] = function(user1, user2)
+            add_time(dimension, clock() - began)
+            
+        began = clock()
+        match_scores = {dimension: scores[dimension] for dimension in DIMENSIONS}
+        match_scores['total_score'] = sum(
+            score * self.dimension_weights.get(dimension, 1.0)
+            for dimension, score in match_scores.items()
+        ) / sum(self.dimension_weights.values())
+        finished = clock()
+        add_time('aggregate', finished - began)
+        add_time('match_users', finished - start)
+        return match_scores
+        
     def find_best_matches(
         self,
         target_user: UserProfile,
         user_pool: List[UserProfile],
-        top_n: int = 10
-    ) -> List[Tuple[UserProfile, Dict[str, float]]]:
+        top_n: int = 10,
+        deadline: Optional[float] = None,
+        chunk_size: int = 256,
+        online_only: bool = False,
+        constraints: Optional[HardConstraints] = None,
+        prune: bool = True
+    ) -> MatchResults:
         """为目标用户找到最佳匹配
         
         Args:
             target_user: 目标用户
             user_pool: 用户池
             top_n: 返回的最佳匹配数量
+            deadline: 截止时间（time.monotonic() 的绝对时间），None 表示不限时。
+                设置后按优先级分块打分：同服务器、同服务器组、其他；
+                每块结束后检查截止时间，到达时返回已扫描部分中的最佳结果。
+                第一块总会被打分，以保证有结果可返回
+            chunk_size: 限时模式下每块的用户数
+            online_only: 只匹配在线用户，见 online_subset()
+            constraints: 硬约束，打分前按位图排除不满足的用户
+            prune: 是否分支限界剪枝，见 _bounded_scores()；结果与不剪枝时完全相同
             
         Returns:
-            List[Tuple[UserProfile, Dict[str, float]]]: 
-            (匹配用户, 匹配分数)列表，按总分降序排序
+            MatchResults: 
+            (匹配用户, 匹配分数)列表，按总分降序排序；
+            coverage / complete 属性说明扫描了多少用户池。
+            用户池是带游戏档案的 PoolSnapshot 时，按快照中的游戏档案打分，见 for_games()
         """
+        games = getattr(user_pool, 'games', None)
+        if isinstance(games, tuple) and not _same_games(games, self.game_matcher.games):
+            return self.for_games(games).find_best_matches(
+                target_user, user_pool, top_n, deadline, chunk_size, online_only, constraints, prune)
+        instrumentation = self.instrumentation
+        tracer = self.tracer
+        trace = tracer.begin(instrumentation) if tracer is not None else None
+        if instrumentation is None and trace is None:
+            return self._find_best_matches(
+                target_user, user_pool, top_n, deadline, chunk_size, online_only, constraints, prune)
+        start = time.perf_counter()
+        results = self._find_best_matches(
+            target_user, user_pool, top_n, deadline, chunk_size, online_only, constraints, prune, trace)
+        elapsed = time.perf_counter() - start
+        if instrumentation is not None:
+            instrumentation.add_time('find_best_matches', elapsed)
+            instrumentation.count('queries')
+            instrumentation.count('candidates_scanned', results.scanned)
+            instrumentation.count('candidates_pruned', results.pruned)
+            instrumentation.count('candidates_prefiltered', results.prefiltered)
+            if results.deadline_hit:
+                instrumentation.count('deadline_hits')
+        if trace is not None:
+            tracer.finish(trace, target_user.user_id, len(user_pool), top_n, deadline, results, elapsed)
+        return results
+        
+    def _find_best_matches(
+        self,
+        target_user: UserProfile,
+        user_pool: List[UserProfile],
+        top_n: int,
+        deadline: Optional[float],
+        chunk_size: int,
+        online_only: bool,
+        constraints: Optional[HardConstraints],
+        prune: bool,
+        trace: Optional[QueryTrace] = None
+    ) -> MatchResults:
+        """find_best_matches 的实现（不计时）；trace 不为 None 时按阶段记录耗时"""
+        if online_only:
+            user_pool = self.online_subset(user_pool)
+        prefiltered = 0
+        if constraints:
+            size = len(user_pool)
+            user_pool = prefilter(self, target_user, user_pool, constraints)
+            prefiltered = size - len(user_pool)
+        if deadline is not None:
+            results = self._find_best_matches_until(
+                target_user, user_pool, top_n, deadline, chunk_size, prune, trace)
+            results.prefiltered = prefiltered
+            return results
+        if prune:
+            candidates = [
+                (position, user) for position, user in enumerate(user_pool) if user != target_user
+            ]
+            if trace is not None:
+                trace.lap('filter')
+            heap, pruned = self._scan_top(target_user, candidates, top_n, [], True, trace)
+            if trace is not None:
+                trace.lap('score')
+            heap.sort(key=lambda entry: entry[:2], reverse=True)
+            results = MatchResults(
+                [(user, match_scores) for _, _, user, match_scores in heap],
+                len(candidates),
+                len(candidates),
+                prefiltered=prefiltered,
+                pruned=pruned
+            )
+            if trace is not None:
+                trace.lap('topk')
+            return results
+            
+        if trace is not None:
+            trace.lap('filter')
+            
         # 计算目标用户与用户池中所有用户的匹配分数
         matches = []
         for user in user_pool:
             if user != target_user:
-                match_scores = self.match_users(target_user, user)
+                if trace is None:
+                    match_scores = self.match_users(target_user, user)
+                else:
+                    match_scores = self._match_users_instrumented(target_user, user, trace)
                 matches.append((user, match_scores))
+        if trace is not None:
+            trace.lap('score')
                 
         # 按总分降序排序
         matches.sort(key=lambda x: x[1]['total_score'], reverse=True)
         
-        return matches[:top_n]
+        results = MatchResults(matches[:top_n], len(matches), len(matches), prefiltered=prefiltered)
+        if trace is not None:
+            trace.lap('topk')
+        return results
+        
+    def online_subset(self, user_pool: Iterable[UserProfile]) -> List[UserProfile]:
+        """取出用户池中的在线用户，保持用户池中的顺序
+        
+        挂接了在线状态索引且用户池是 PoolSnapshot 时，
+        直接由在线位图取得在线用户，位图槽位随会话结束回收，
+        代价与同时在线人数的峰值成正比，与池大小无关；
+        用户池是普通列表时逐个查询索引；未挂接索引时按档案中的 online_status 判断。
+        
+        Args:
+            user_pool: 用户池
+            
+        Returns:
+            List[UserProfile]: 在线用户
+        """
+        presence = self.presence
+        if presence is None:
+            return [user for user in user_pool if user.online_status == ONLINE]
+        if hasattr(user_pool, 'slot'):
+            # PoolSnapshot: 按ID索引查到槽位（此处不能导入 pool.snapshot，否则循环导入）
+            positions = []
+            for user_id in presence.online_ids():
+                position = user_pool.index.get(user_id)
+                if position is not None:
+                    positions.append(position)
+            positions.sort()
+            return [user_pool.slot(position) for position in positions]
+        now = presence.clock()
+        return [user for user in user_pool if presence.is_online(user.user_id, now)]
+        
+    def _priority_order(
+        self,
+        target_user: UserProfile,
+        user_pool: List[UserProfile]
+    ) -> List[Tuple[int, UserProfile]]:
+        """按服务器亲近程度对候选用户分桶排序
+        
+        Returns:
+            List[Tuple[int, UserProfile]]: (原始位置, 用户)列表，
+            同服务器在前，同服务器组其次，其余在后；桶内保持原始顺序
+        """
+        region = target_user.play_region
+        group_regions = set()
+        for group in self.base_matcher.server_groups.values():
+            if region in group:
+                group_regions.update(group)
+                
+        same_server, same_group, others = [], [], []
+        for position, user in enumerate(user_pool):
+            if user == target_user:
+                continue
+            if user.play_region == region:
+                same_server.append((position, user))
+            elif user.play_region in group_regions:
+                same_group.append((position, user))
+            else:
+                others.append((position, user))
+        return same_server + same_group + others
+        
+    def _find_best_matches_until(
+        self,
+        target_user: UserProfile,
+        user_pool: List[UserProfile],
+        top_n: int,
+        deadline: float,
+        chunk_size: int,
+        prune: bool = True,
+        trace: Optional[QueryTrace] = None
+    ) -> MatchResults:
+        """限时分块查找最佳匹配，见 find_best_matches"""
+        candidates = self._priority_order(target_user, user_pool)
+        chunk_size = max(chunk_size, 1)
+        if trace is not None:
+            trace.lap('filter')
+        
+        heap: List[Tuple[float, int, UserProfile, Dict[str, float]]] = []
+        scanned = 0
+        pruned = 0
+        deadline_hit = False
+        for start in range(0, len(candidates), chunk_size):
+            if start > 0 and time.monotonic() >= deadline:
+                deadline_hit = True
+                break
+            heap, chunk_pruned = self._scan_top(
+                target_user, candidates[start:start + chunk_size], top_n, heap, prune, trace)
+            pruned += chunk_pruned
+            scanned = min(start + chunk_size, len(candidates))
+        if trace is not None:
+            trace.lap('score')
+            
+        heap.sort(key=lambda entry: entry[:2], reverse=True)
+        results = MatchResults(
+            [(user, match_scores) for _, _, user, match_scores in heap],
+            scanned,
+            len(candidates),
+            deadline_hit,
+            pruned=pruned
+        )
+        if trace is not None:
+            trace.lap('topk')
+        return results
+        
+    def _scan_top(
+        self,
+        target_user: UserProfile,
+        candidates: List[Tuple[int, UserProfile]],
+        top_n: int,
+        heap: List[Tuple[float, int, UserProfile, Dict[str, float]]],
+        prune: bool,
+        trace: Optional[QueryTrace] = None
+    ) -> Tuple[List[Tuple[float, int, UserProfile, Dict[str, float]]], int]:
+        """对候选用户打分并维护当前最佳的 top_n 个
+        
+        小顶堆保存当前最佳的 top_n 个，堆顶为最差者；同分时原始位置靠前者更优，
+        与完整扫描的稳定排序一致。堆满后堆顶总分即为剪枝门槛。
+        
+        追踪时各维度耗时记入 trace（并由它转发给挂接的 Instrumentation）。
+        
+        Returns:
+            Tuple[List, int]: (更新后的堆, 被剪枝的候选数)
+        """
+        stages = self._score_stages(trace) if prune else None
+        # QueryTrace 与 Instrumentation 的计时接口相同
+        timer = trace if trace is not None else self.instrumentation
+        if stages is not None and timer is not None:
+            stages = [
+                (dimension, timer.timed(dimension, function), weight, remaining)
+                for dimension, function, weight, remaining in stages
+            ]
+        pruned = 0
+        for position, user in candidates:
+            if top_n <= 0:
+                break
+            if stages is None:
+                match_scores = self.match_users(target_user, user) if trace is None \
+                    else self._match_users_instrumented(target_user, user, trace)
+            else:
+                threshold = heap[0][0] if len(heap) >= top_n else None
+                match_scores = self._bounded_scores(target_user, user, stages, threshold)
+                if match_scores is None:
+                    pruned += 1
+                    continue
+            entry = (match_scores['total_score'], -position, user, match_scores)
+            if len(heap) < top_n:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        return heap, pruned
+        
+    def _score_stages(
+        self,
+        trace: Optional[QueryTrace] = None
+    ) -> List[Tuple[str, Callable[[UserProfile, UserProfile], float], float, float]]:
+        """按计算代价从低到高排列的维度打分函数
+        
+        Returns:
+            List[Tuple]: (维度, 打分函数, 维度权重, 本维度及其后各维度加权分数的上界之和)。
+            各维度分数的取值范围见 _score_ranges()，由已加载的配置表推出。
+            结果按匹配器与权重配置缓存，配置不变时直接复用
+        """
+        base, numeric, game = self.base_matcher, self.numeric_matcher, self.game_matcher
+        mbti, zodiac, ordered = self.mbti_matcher, self.zodiac_matcher, self.ordered_matcher
+        key = (
+            tuple(id(matcher) for matcher in (base, numeric, game, mbti, zodiac, ordered)),
+            tuple(self.dimension_weights.items()),
+            tuple(game.social_weights.values()),
+            mbti.preference_weight,
+            zodiac.preference_weight
+        )
+        cached = self._stages_cache
+        instrumentation = self.instrumentation
+        hit = cached is not None and cached[0] == key
+        if trace is not None and trace.cache is None:
+            trace.cache = 'hit' if hit else 'miss'
+        if hit:
+            if instrumentation is not None:
+                instrumentation.count('stages_cache_hits')
+            return cached[1]
+        if instrumentation is not None:
+            instrumentation.count('stages_cache_misses')
+        functions = [
+            ('style', numeric.match_style),
+            ('online_status', lambda u1, u2: 1.0 if base.match_online_status(u1, u2) else 0.0),
+            ('time', numeric.match_time),
+            ('server', base.match_server),
+            ('experience', numeric.match_experience),
+            ('game_social', game.match_social),
+            ('gender', ordered.match_gender),
+            ('game_preference', game.match_preference),
+            ('zodiac', lambda u1, u2: zodiac.get_weighted_score(u1.zodiac, u2.zodiac)),
+            ('mbti', lambda u1, u2: mbti.get_weighted_score(u1.mbti, u2.mbti)),
+            ('game_type', game.match_type),
+        ]
+        ranges = self._score_ranges()
+        stages = []
+        remaining = 0.0
+        for dimension, function in reversed(functions):
+            weight = self.dimension_weights.get(dimension, 1.0)
+            low, high = ranges[dimension]
+            remaining += max(weight * low, weight * high)
+            stages.append((dimension, function, weight, remaining))
+        stages.reverse()
+        self._stages_cache = (key, stages)
+        return stages
+        
+    def _score_ranges(self) -> Dict[str, Tuple[float, float]]:
+        """由已加载的配置表推出各维度打分函数的取值范围 (下界, 上界)
+        
+        配置表中的取值（时间、经验等级相似度、游戏类型相关性、MBTI / 星座偏好分）可以超出 [0,1]，
+        剪枝的上界必须覆盖配置允许的任何分数，不能假设为 1.0；
+        无法推出有限上界的维度（性别偏好衰减系数大于 1 时）记为无穷大，该维度之前不会剪枝。
+        """
+        base, numeric, game = self.base_matcher, self.numeric_matcher, self.game_matcher
+        mbti, zodiac, ordered = self.mbti_matcher, self.zodiac_matcher, self.ordered_matcher
+        
+        def span(values: Iterable[float], *defaults: float) -> Tuple[float, float]:
+            values = [float(value) for value in values] + list(defaults)
+            return min(values), max(values)
+        
+        def preference(matcher: PreferenceMatcher, pool: str, field: str) -> Tuple[float, float]:
+            # 非正的偏好分记为 0，查不到时为 0
+            scores = [
+                max(float(score), 0.0) / 10.0
+                for item in matcher.preference_data.get(pool, [])
+                for score in item.get(field, {}).values()
+            ]
+            low, high = span(scores, 0.0)
+            weight = matcher.preference_weight
+            return min(low * weight, high * weight), max(low * weight, high * weight)
+        
+        level = span(numeric.level_similarity.values(), 0.0)
+        social = game.social_weights
+        social_range = [
+            sorted((social['online_status'] * 0.5, social['online_status'] * 1.0)),
+            sorted((social['game_style'] * 0.5, social['game_style'] * 1.0)),
+            sorted((social['experience'] * level[0], social['experience'] * level[1])),
+        ]
+        scale = ordered.preference_scale
+        return {
+            'style': (0.3, 1.0),
+            'online_status': (0.0, 1.0),
+            'time': span((value for row in numeric.time_similarity.values() for value in row.values()), 0.0),
+            'server': (0.3, 1.0),
+            'experience': level,
+            'game_social': (sum(low for low, _ in social_range), sum(high for _, high in social_range)),
+            'gender': (0.0, 1.0) if 0.0 <= scale <= 1.0 else (float('-inf'), float('inf')),
+            'game_preference': (0.0, 1.0),
+            'zodiac': preference(zodiac, 'constellation_types', '偏好星座'),
+            'mbti': preference(mbti, 'mbti_types', '偏好mbti'),
+            'game_type': span(
+                (value for row in game.game_type_correlations.values() for value in row.values()), 0.0, 0.1, 1.0),
+        }
+        
+    def _bounded_scores(
+        self,
+        target_user: UserProfile,
+        user: UserProfile,
+        stages: List[Tuple[str, Callable[[UserProfile, UserProfile], float], float, float]],
+        threshold: Optional[float]
+    ) -> Optional[Dict[str, float]]:
+        """按代价顺序逐维打分，乐观上界达不到门槛时放弃
+        
+        已算维度的加权分数加上其余维度的上界即为总分的乐观上界。
+        同分时先扫描者优先，上界不超过门槛的候选不可能进入结果；
+        比较时留出浮点误差余量，保证结果与完整扫描完全相同。
+        
+        Args:
+            target_user: 目标用户
+            user: 候选用户
+            stages: _score_stages() 的结果
+            threshold: 当前第 top_n 名的总分，None 表示尚无门槛
+            
+        Returns:
+            Optional[Dict[str, float]]: 与 match_users 相同的分数字典，剪枝时返回 None
+        """
+        total_weight = sum(self.dimension_weights.values())
+        limit = None if threshold is None else (threshold - 1e-9) * total_weight
+        partial = 0.0
+        scores = {}
+        for dimension, function, weight, remaining in stages:
+            if limit is not None and partial + remaining < limit:
+                return None
+            score = function(target_user, user)
+            scores[dimension] = score
+            partial += score * weight
+            
+        # 按 match_users 的维度顺序求和，保证总分逐位相同
+        match_scores = {dimension: scores[dimension] for dimension in DIMENSIONS}
+        match_scores['total_score'] = sum(
+            score * self.dimension_weights.get(dimension, 1.0)
+            for dimension, score in match_scores.items()
+        ) / total_weight
+        return match_scores
         
     def get_match_explanation(
         self,
@@ -0,0 +1,186 @@
+"""内存统计模块
+
+按组件统计匹配进程的内存占用: 游戏档案、用户池、相似度表（各匹配器的 JSON 字典与编码器的
+NumPy 表）、缓存与索引。结构统计沿对象引用递归累加 sys.getsizeof 与 NumPy 缓冲区大小，
+多个组件共享的对象只计入最先统计的组件；tracemalloc 正在跟踪时另附按包汇总的分配量，
+可用于核对结构统计遗漏的部分。
+"""
+
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Dict, Optional, Set
+
+import numpy as np
+
+# 不沿引用展开的类型: 类、模块、函数等属于代码而不是数据
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+           types.MethodType, types.CodeType, types.FrameType, threading.local)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def deep_sizeof(obj: Any, seen: Optional[Set[int]] = None) -> int:
+    """对象及其引用的全部对象占用的字节数
+
+    NumPy 数组按数据缓冲区计（视图计其基数组一次），对象数组另计各元素。
+
+    Args:
+        obj: 对象
+        seen: 已计入的对象 id，传入同一个集合可避免多次统计共享对象
+
+    Returns:
+        int: 字节数
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    pending = deque([obj])
+    while pending:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, _OPAQUE):
+            continue
+        seen.add(id(current))
+        if isinstance(current, np.ndarray):
+            total += sys.getsizeof(current)
+            if current.base is not None:
+                pending.append(current.base)
+            if current.dtype == object:
+                pending.extend(current.ravel().tolist())
+            continue
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            pending.extend(current)
+        elif isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        else:
+            attributes = getattr(current, '__dict__', None)
+            if attributes is not None:
+                pending.append(attributes)
+            for cls in type(current).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(current, name) and name not in ('__dict__', '__weakref__'):
+                        pending.append(getattr(current, name))
+    return total
+
+def _traced_by_package(snapshot: tracemalloc.Snapshot) -> Dict[str, int]:
+    """按包汇总 tracemalloc 快照: 项目内按顶层包，项目外按第三方包名，其余记为 other"""
+    packages: Dict[str, int] = {}
+    for statistic in snapshot.statistics('filename'):
+        filename = statistic.traceback[0].filename
+        if filename.startswith(_PROJECT_ROOT + os.sep):
+            relative = os.path.relpath(filename, _PROJECT_ROOT).split(os.sep)
+            package = relative[0] if len(relative) > 1 else os.path.splitext(relative[0])[0]
+        elif 'site-packages' + os.sep in filename:
+            package = filename.split('site-packages' + os.sep, 1)[1].split(os.sep, 1)[0]
+        else:
+            package = 'other'
+        packages[package] = packages.get(package, 0) + statistic.size
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+def memory_report(
+    matching_system,
+    users: Any = None,
+    indexes: Optional[Dict[str, Any]] = None,
+    caches: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """统计匹配进程各组件的内存占用
+
+    依次统计 games（游戏档案）、pool（用户池）、similarity_tables（各匹配器与编码器）、
+    caches（打分阶段缓存、计时表与调用方给出的缓存）、indexes（在线状态索引与调用方给出的索引），
+    共享对象只计入最先统计的组件，因此索引只计自身的结构而不重复计入用户档案。
+
+    Args:
+        matching_system: 匹配系统
+        users: 用户列表、PoolSnapshot 或 VersionedPool
+        indexes: 名称 -> 索引对象（GameIndex、CandidateIndex、IVFIndex、ClusterIndex 等）
+        caches: 名称 -> 缓存对象
+
+    Returns:
+        Dict[str, Any]: users（用户数）、components（组件 -> {'bytes', 'parts': {部分: 字节数}}）、
+        total_bytes、bytes_per_user（pool 与 total）、traced（tracemalloc 未跟踪时为 None，
+        否则为 current_bytes、peak_bytes 与按包汇总的 by_package）
+    """
+    seen: Set[int] = {id(matching_system)}
+    system = matching_system
+
+    if users is None:
+        user_count = 0
+    elif hasattr(users, 'snapshot'):
+        user_count = len(users.snapshot())
+    else:
+        user_count = len(users)
+
+    def measure(parts: Dict[str, Any]) -> Dict[str, Any]:
+        sizes = {name: deep_sizeof(part, seen) for name, part in parts.items() if part is not None}
+        return {'bytes': sum(sizes.values()), 'parts': sizes}
+
+    components = {}
+    components['games'] = measure({'game_profiles': system.game_matcher.games})
+    components['pool'] = measure({'users': users})
+    components['similarity_tables'] = measure({
+        'dimension_weights': system.dimension_weights,
+        'base_matcher': system.base_matcher,
+        'numeric_matcher': system.numeric_matcher,
+        'mbti_matcher': system.mbti_matcher,
+        'zodiac_matcher': system.zodiac_matcher,
+        'ordered_matcher': system.ordered_matcher,
+        'game_matcher': system.game_matcher,
+        'encoder': system._encoder,
+    })
+    components['caches'] = measure(dict({
+        'stages_cache': system._stages_cache,
+        'instrumentation': system.instrumentation,
+    }, **(caches or {})))
+    components['indexes'] = measure(dict({'presence': system.presence}, **(indexes or {})))
+
+    total = sum(component['bytes'] for component in components.values())
+    traced = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        traced = {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'by_package': _traced_by_package(tracemalloc.take_snapshot())
+        }
+    return {
+        'users': user_count,
+        'components': components,
+        'total_bytes': total,
+        'bytes_per_user': {
+            'pool': components['pool']['bytes'] / user_count if user_count else 0.0,
+            'total': total / user_count if user_count else 0.0
+        },
+        'traced': traced
+    }
+
+def _format_bytes(size: float) -> str:
+    """格式化字节数"""
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.2f}GB'
+
+def format_memory_report(report: Dict[str, Any]) -> str:
+    """把 memory_report() 的结果格式化为文本"""
+    lines = [f"{'component':<30}{'bytes':>12}{'share':>8}"]
+    total = report['total_bytes'] or 1
+    for name, component in report['components'].items():
+        lines.append(f"{name:<30}{_format_bytes(component['bytes']):>12}{component['bytes'] / total:>8.1%}")
+        for part, size in sorted(component['parts'].items(), key=lambda item: item[1], reverse=True):
+            if size:
+                lines.append(f"  {part:<28}{_format_bytes(size):>12}")
+    lines.append(f"{'total':<30}{_format_bytes(report['total_bytes']):>12}")
+    per_user = report['bytes_per_user']
+    lines.append(f"用户数 {report['users']}，每用户 {per_user['pool']:.0f}B（用户池）/ {per_user['total']:.0f}B（合计）")
+    traced = report['traced']
+    if traced is not None:
+        lines.append(f"tracemalloc: 当前 {_format_bytes(traced['current_bytes'])}，峰值 {_format_bytes(traced['peak_bytes'])}")
+        for package, size in list(traced['by_package'].items())[:10]:
+            lines.append(f"  {package:<28}{_format_bytes(size):>12}")
+    return '\n'.join(lines)
@@ -0,0 +1,258 @@
+"""MinHash / LSH 近似游戏相似度模块
+
+为每个用户的游戏集合预计算 MinHash 签名，签名按 band 分段后放入 LSH 桶。
+查询时只比较与目标用户至少有一个 band 完全相同的用户，用签名估计 Jaccard 相似度，
+代价与桶的大小有关而与用户池大小无关
+"""
+
+import heapq
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+
+# 空游戏集合的签名取值（大于任何哈希值）
+_EMPTY_HASH = np.uint32(0xFFFFFFFF)
+
+class MinHashLSH:
+    """MinHash 签名与 LSH 分桶索引
+
+    签名长度 num_perm 被分成 bands 段，每段 rows = num_perm / bands 个哈希值；
+    两个 Jaccard 为 s 的集合至少有一段相同的概率为 1 - (1 - s^rows)^bands，
+    约在 threshold = (1 / bands) ^ (1 / rows) 处陡升。
+    删除（以及更新时先删除）的用户留下的签名行放入空闲堆，由之后放入的用户复用，
+    签名矩阵的行数只随同时存在的用户数的峰值增长。
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, bands: int = DEFAULT_BANDS, seed: int = 1):
+        """初始化索引
+
+        Args:
+            num_perm: 签名长度（哈希函数个数）
+            bands: LSH 分段数，须整除 num_perm
+            seed: 哈希函数的随机种子，签名只能在同种子的索引之间比较
+
+        Raises:
+            ValueError: 参数不合法
+        """
+        if num_perm <= 0 or bands <= 0 or num_perm % bands:
+            raise ValueError(f"签名长度 {num_perm} 须为分段数 {bands} 的正整数倍")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # 乘移位哈希: h(x) = ((a * x + b) mod 2^64) >> 32，a 为奇数
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._game_hashes: Dict[str, np.ndarray] = {}
+
+        self._docs: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Hashable]] = []
+        self._free: List[int] = []
+        self._signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self._buckets: List[Dict[bytes, Set[int]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def doc_bound(self) -> int:
+        """已分配的签名行数（含已删除用户留下、尚未复用的空行）"""
+        return len(self._keys)
+
+    @property
+    def threshold(self) -> float:
+        """LSH 召回概率陡升处的近似 Jaccard 阈值"""
+        return (1.0 / self.bands) ** (1.0 / self.rows)
+
+    def _hashes_of(self, game: str) -> np.ndarray:
+        """单个游戏在全部哈希函数下的取值（按游戏名缓存）"""
+        hashes = self._game_hashes.get(game)
+        if hashes is None:
+            x = np.uint64(zlib.crc32(game.encode('utf-8')))
+            with np.errstate(over='ignore'):
+                hashes = ((self._a * x + self._b) >> np.uint64(32)).astype(np.uint32)
+            self._game_hashes[game] = hashes
+        return hashes
+
+    def signature(self, games: Iterable[str]) -> np.ndarray:
+        """游戏集合的 MinHash 签名
+
+        Args:
+            games: 游戏名
+
+        Returns:
+            np.ndarray: 长度为 num_perm 的 uint32 数组；空集合的签名全为最大值
+        """
+        games = set(games)
+        if not games:
+            return np.full(self.num_perm, _EMPTY_HASH, dtype=np.uint32)
+        return np.min([self._hashes_of(game) for game in games], axis=0)
+
+    @staticmethod
+    def estimate(first: np.ndarray, second: np.ndarray) -> float:
+        """由两个签名估计 Jaccard 相似度（任一方为空集合时为0）"""
+        if first[0] == _EMPTY_HASH and (first == _EMPTY_HASH).all():
+            return 0.0
+        return float(np.mean(first == second))
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """签名各段的桶键"""
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def put(self, key: Hashable, games: Iterable[str]) -> None:
+        """新增或更新用户，游戏集合为空的用户不进入任何桶
+
+        Args:
+            key: 用户键
+            games: 游戏名列表
+        """
+        self.remove(key)
+        signature = self.signature(games)
+        if self._free:
+            doc = heapq.heappop(self._free)
+            self._keys[doc] = key
+        else:
+            doc = len(self._keys)
+            if doc == len(self._signatures):
+                grown = np.zeros((max(2 * doc, 64), self.num_perm), dtype=np.uint32)
+                grown[:doc] = self._signatures
+                self._signatures = grown
+            self._keys.append(key)
+        self._signatures[doc] = signature
+        self._docs[key] = doc
+        if signature[0] == _EMPTY_HASH and (signature == _EMPTY_HASH).all():
+            return
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band_key, set()).add(doc)
+
+    def add_user(self, user) -> None:
+        """按 user_id 新增或更新用户档案"""
+        self.put(user.user_id, user.games)
+
+    def apply(self, upserted: Iterable, removed: Iterable[Hashable]) -> None:
+        """按 user_id 应用一次用户池提交，可由 VersionedPool.attach() 挂接
+
+        Args:
+            upserted: 新增或变化的用户档案
+            removed: 被删除的用户ID
+        """
+        for key in removed:
+            self.remove(key)
+        for user in upserted:
+            self.add_user(user)
+
+    def remove(self, key: Hashable) -> bool:
+        """删除用户
+
+        Returns:
+            bool: 用户是否存在
+        """
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return False
+        for buckets, band_key in zip(self._buckets, self._band_keys(self._signatures[doc])):
+            bucket = buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(doc)
+                if not bucket:
+                    del buckets[band_key]
+        self._keys[doc] = None
+        heapq.heappush(self._free, doc)
+        return True
+
+    def candidates(self, games: Iterable[str]) -> np.ndarray:
+        """与给定游戏集合至少有一个 band 相同的用户（文档号）"""
+        signature = self.signature(games)
+        docs: Set[int] = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(band_key)
+            if bucket:
+                docs.update(bucket)
+        return np.fromiter(docs, dtype=np.int64, count=len(docs))
+
+    def query(
+        self,
+        games: Iterable[str],
+        threshold: Optional[float] = None
+    ) -> List[Tuple[Hashable, float]]:
+        """查找估计 Jaccard 相似度不低于阈值的用户
+
+        Args:
+            games: 目标用户的游戏列表
+            threshold: 相似度阈值，缺省使用 LSH 阈值
+
+        Returns:
+            List[Tuple[Hashable, float]]: (用户键, 估计相似度)，按相似度从高到低排列
+        """
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.signature(games)
+        docs = self.candidates(games)
+        if not len(docs):
+            return []
+        estimates = np.mean(self._signatures[docs] == signature, axis=1)
+        keep = estimates >= threshold
+        docs, estimates = docs[keep], estimates[keep]
+        order = np.lexsort((docs, -estimates))
+        keys = self._keys
+        return [(keys[doc], float(estimates[i])) for i, doc in zip(order, docs[order])]
+
+    def measure_recall(
+        self,
+        users: Iterable,
+        threshold: Optional[float] = None,
+        targets: Optional[Iterable] = None
+    ) -> Dict[str, float]:
+        """与精确 Jaccard 计算对比召回率
+
+        精确相似度不低于阈值的 (目标, 用户) 对中，被 query() 返回的比例为召回率，
+        落入同一 LSH 桶的比例为候选召回率（估计值在阈值附近波动造成的漏检不计入后者）；
+        query() 返回的用户中精确相似度达到阈值的比例为精确率。
+
+        Args:
+            users: 已放入索引的用户档案（按 user_id 为键）
+            threshold: 相似度阈值，缺省使用 LSH 阈值
+            targets: 目标用户，缺省为全部用户
+
+        Returns:
+            Dict[str, float]: recall、candidate_recall、precision、candidates（每次查询的平均候选数）、
+            pool_fraction（候选数占用户池的比例）
+        """
+        threshold = self.threshold if threshold is None else threshold
+        users = list(users)
+        targets = users if targets is None else list(targets)
+        games = {user.user_id: set(user.games) for user in users}
+
+        def jaccard(first: set, second: set) -> float:
+            if not first or not second:
+                return 0.0
+            return len(first & second) / len(first | second)
+
+        keys = self._keys
+        relevant = found = bucketed = returned = correct = candidates = 0
+        for target in targets:
+            target_games = set(target.games)
+            expected = {
+                user_id for user_id, user_games in games.items()
+                if user_id != target.user_id and jaccard(target_games, user_games) >= threshold
+            }
+            results = {key for key, _ in self.query(target_games, threshold) if key != target.user_id}
+            docs = self.candidates(target_games)
+            candidates += len(docs)
+            bucketed += len(expected.intersection(keys[doc] for doc in docs))
+            relevant += len(expected)
+            found += len(expected & results)
+            returned += len(results)
+            correct += sum(1 for key in results if jaccard(target_games, games.get(key, set())) >= threshold)
+        queries = max(len(targets), 1)
+        return {
+            'recall': found / relevant if relevant else 1.0,
+            'candidate_recall': bucketed / relevant if relevant else 1.0,
+            'precision': correct / returned if returned else 1.0,
+            'candidates': candidates / queries,
+            'pool_fraction': candidates / queries / max(len(users), 1)
+        }
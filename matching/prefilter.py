@@ -0,0 +1,211 @@
+"""硬约束预过滤模块
+
+在打分之前按硬约束排除不可能展示的候选用户。每个约束先在分类取值表上
+求出允许的取值，再按编码列映射为逐行的布尔位图，所有位图按位与后
+只对剩下的候选用户打分
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from matching.encoded_pool import EncodedPool, EncodedQuery
+from pool.presence import ONLINE
+
+# 分类列 -> 对应的约束名
+_CONSTRAINT_OF = {
+    'server': 'server_group',
+    'online': 'online',
+    'gender': 'gender',
+    'experience': 'experience_gap'
+}
+
+class HardConstraints:
+    """声明式硬约束
+
+    Attributes:
+        server_group: 只保留与目标用户同服务器或同服务器组的用户
+        online: 只保留在线用户（挂接了在线状态索引时以索引为准）
+        gender: 只保留与目标用户性别偏好双向兼容的用户，
+            即双方的性别都在对方的偏好列表中（match_gender 不会落到 0.2 的兜底分）
+        experience_gap: 只保留经验等级差不超过该值的用户，None 表示不限；
+            经验等级未知的用户被排除
+    """
+
+    def __init__(
+        self,
+        server_group: bool = False,
+        online: bool = False,
+        gender: bool = False,
+        experience_gap: Optional[int] = None
+    ):
+        """初始化硬约束
+
+        Args:
+            server_group: 是否要求同服务器组
+            online: 是否要求在线
+            gender: 是否要求性别偏好双向兼容
+            experience_gap: 经验等级差上限
+        """
+        self.server_group = server_group
+        self.online = online
+        self.gender = gender
+        self.experience_gap = experience_gap
+
+    def __bool__(self) -> bool:
+        return self.server_group or self.online or self.gender or self.experience_gap is not None
+
+    def allowed_values(
+        self,
+        matching_system,
+        query: EncodedQuery,
+        vocabularies: Dict[str, List]
+    ) -> Dict[str, np.ndarray]:
+        """求出各约束在分类列上允许的取值（每次查询只算一次）
+
+        Args:
+            matching_system: 匹配系统，提供服务器组和经验等级配置
+            query: 目标用户的编码查询
+            vocabularies: 编码器的取值表（只增不减，覆盖查询和编码池中出现的所有编码）
+
+        Returns:
+            Dict[str, np.ndarray]: 分类列名 -> 按编码索引的布尔向量
+        """
+        codes = query.codes
+        allowed: Dict[str, np.ndarray] = {}
+
+        if self.server_group:
+            servers = vocabularies['server']
+            region = servers[codes['server']]
+            regions = {region}
+            for group in matching_system.base_matcher.server_groups.values():
+                if region in group:
+                    regions.update(group)
+            allowed['server'] = np.array([server in regions for server in servers], dtype=bool)
+
+        if self.online and matching_system.presence is None:
+            allowed['online'] = np.array(
+                [status == ONLINE for status in vocabularies['online']], dtype=bool)
+
+        if self.gender:
+            genders = vocabularies['gender']
+            target_gender, target_preference = genders[codes['gender']]
+            allowed['gender'] = np.array([
+                gender in target_preference and target_gender in preference
+                for gender, preference in genders
+            ], dtype=bool)
+
+        if self.experience_gap is not None:
+            levels = matching_system.numeric_matcher.experience_levels
+            experiences = vocabularies['experience']
+            target_level = levels.get(experiences[codes['experience']])
+            allowed['experience'] = np.array([
+                target_level is not None and experience in levels and
+                abs(levels[experience] - target_level) <= self.experience_gap
+                for experience in experiences
+            ], dtype=bool)
+        return allowed
+
+    @staticmethod
+    def bitmaps(
+        allowed: Dict[str, np.ndarray],
+        pool: EncodedPool,
+        online_rows: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """逐个约束计算编码池各行是否满足
+
+        Args:
+            allowed: allowed_values() 的结果
+            pool: 编码池
+            online_rows: 与编码池行对应的在线位图（来自在线状态索引），None 表示不按索引过滤
+
+        Returns:
+            Dict[str, np.ndarray]: 约束名 -> 与编码池行对应的布尔位图
+        """
+        bitmaps = {
+            _CONSTRAINT_OF[column]: values[pool.columns[column]]
+            for column, values in allowed.items()
+        }
+        if online_rows is not None:
+            bitmaps['online'] = online_rows
+        return bitmaps
+
+    @classmethod
+    def mask(
+        cls,
+        allowed: Dict[str, np.ndarray],
+        pool: EncodedPool,
+        online_rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """所有约束位图按位与的结果
+
+        Returns:
+            np.ndarray: 与编码池行对应的布尔数组，True 表示保留
+        """
+        mask = np.ones(len(pool), dtype=bool)
+        for bitmap in cls.bitmaps(allowed, pool, online_rows).values():
+            mask &= bitmap
+        return mask
+
+def _online_positions(online_ids: List[str], index, size: int) -> np.ndarray:
+    """在线用户ID经用户池的ID索引映射为位置位图，代价与在线人数成正比"""
+    online = np.zeros(size, dtype=bool)
+    positions = [position for position in map(index.get, online_ids) if position is not None]
+    online[positions] = True
+    return online
+
+def prefilter(matching_system, target_user, user_pool, constraints: HardConstraints) -> List:
+    """按硬约束过滤用户池，保持用户池中的顺序
+
+    用户池为 PoolSnapshot 时直接使用各块的编码列：快照带编码器时用已有的编码池，
+    否则用匹配系统的编码器编码一次并缓存在快照上，同一版本的后续查询不再编码，
+    每次查询只按目标用户求允许取值、查表得到位图。
+    普通列表经 matching_system.encode_pool() 编码，反复查询同一列表时复用缓存的编码池与ID索引。
+    挂接了在线状态索引时，在线用户ID按用户池的ID索引一次映射为位置，不逐块匹配ID。
+
+    Args:
+        matching_system: 匹配系统
+        target_user: 目标用户
+        user_pool: 用户池
+        constraints: 硬约束
+
+    Returns:
+        List[UserProfile]: 满足全部约束的用户
+    """
+    online_ids = None
+    if constraints.online and matching_system.presence is not None:
+        online_ids = matching_system.presence.online_ids()
+
+    if hasattr(user_pool, 'encoded_chunks'):
+        # PoolSnapshot: 按块使用与槽位对应的编码列
+        if user_pool.encoder is None:
+            user_pool = user_pool.encoded_with(matching_system.encoder)
+        encoder = user_pool.encoder
+        query = encoder.encode_query(target_user)
+        allowed = constraints.allowed_values(matching_system, query, encoder.vocabularies)
+        online = None
+        if online_ids is not None:
+            online = _online_positions(online_ids, user_pool.index, user_pool.slot_count)
+        users = []
+        for base, encoded, live_rows in user_pool.encoded_chunks():
+            online_rows = online[base:base + len(encoded)] if online is not None else None
+            mask = constraints.mask(allowed, encoded, online_rows)
+            rows = live_rows[mask[live_rows]]
+            users.extend(user_pool.slot(base + int(row)) for row in rows)
+        return users
+
+    user_pool = list(user_pool)
+    encoder = matching_system.encoder
+    encoded, index = matching_system._encoded_pool(user_pool)
+    query = encoder.encode_query(target_user)
+    allowed = constraints.allowed_values(matching_system, query, encoder.vocabularies)
+    online = None
+    if online_ids is not None:
+        if len(index) == len(user_pool):
+            online = _online_positions(online_ids, index, len(user_pool))
+        else:
+            # 列表中有重复ID，位置索引只记了其中一个
+            online_set = set(online_ids)
+            online = np.array([user.user_id in online_set for user in user_pool], dtype=bool)
+    mask = constraints.mask(allowed, encoded, online)
+    return [user_pool[row] for row in np.flatnonzero(mask)]
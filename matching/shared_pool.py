@@ -0,0 +1,240 @@
+"""共享内存编码池模块
+
+把编码池的全部数组打包进一个 multiprocessing.shared_memory 段，
+工作进程凭描述符零拷贝附加，避免每个进程各自重建用户列表和匹配器字典
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from matching.encoded_pool import EncodedPool
+
+# 数组在共享内存段中的对齐字节数
+_ALIGNMENT = 64
+
+# 串行化本进程内的附加与注销，避免同名段的登记/注销消息交错
+_ATTACH_LOCK = threading.Lock()
+
+class SharedPoolDescriptor:
+    """共享编码池描述符
+
+    只包含共享内存段名称、数组布局和少量元数据，可以 pickle 或 JSON 序列化后
+    传给任意工作进程。
+    """
+
+    def __init__(
+        self,
+        segment_name: str,
+        size: int,
+        layout: Dict[str, Tuple[int, str, Tuple[int, ...]]],
+        metadata: Dict[str, Any],
+        owner_pid: Optional[int] = None
+    ):
+        """初始化描述符
+
+        Args:
+            segment_name: 共享内存段名称
+            size: 共享内存段字节数
+            layout: 数组名 -> (偏移量, dtype字符串, 形状)
+            metadata: 编码池元数据
+            owner_pid: 创建者进程ID
+        """
+        self.segment_name = segment_name
+        self.size = size
+        self.layout = layout
+        self.metadata = metadata
+        self.owner_pid = owner_pid
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的字典"""
+        return {
+            'segment_name': self.segment_name,
+            'size': self.size,
+            'layout': {
+                name: [offset, dtype, list(shape)]
+                for name, (offset, dtype, shape) in self.layout.items()
+            },
+            'metadata': self.metadata,
+            'owner_pid': self.owner_pid
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SharedPoolDescriptor':
+        """由 to_dict 的结果重建描述符"""
+        return cls(
+            segment_name=data['segment_name'],
+            size=data['size'],
+            layout={
+                name: (offset, dtype, tuple(shape))
+                for name, (offset, dtype, shape) in data['layout'].items()
+            },
+            metadata=data['metadata'],
+            owner_pid=data.get('owner_pid')
+        )
+
+def _shares_tracker(owner_pid: Optional[int]) -> bool:
+    """当前进程是否与创建者共用同一个 resource_tracker
+
+    创建者本身及其 multiprocessing 子进程共用创建者的 resource_tracker。
+    """
+    if owner_pid is None:
+        return False
+    parent = multiprocessing.parent_process()
+    return os.getpid() == owner_pid or (parent is not None and parent.pid == owner_pid)
+
+def _open_untracked(name: str, shares_tracker: bool = False) -> shared_memory.SharedMemory:
+    """附加到已有的共享内存段，且不由 resource_tracker 跟踪
+
+    被跟踪的段会在附加进程的 resource_tracker 退出时被删除，
+    而段的生命周期应当只由创建者管理。Python 3.13 起直接关闭跟踪；
+    更早的版本在附加后注销登记。resource_tracker 按集合记录登记，
+    与创建者共用 resource_tracker 时附加产生的登记本就是重复的，
+    注销反而会删掉创建者的登记，因此不注销。
+
+    Args:
+        name: 共享内存段名称
+        shares_tracker: 是否与创建者共用 resource_tracker
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    if shares_tracker:
+        return shared_memory.SharedMemory(name=name)
+    with _ATTACH_LOCK:
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+class SharedEncodedPool:
+    """共享内存中的编码池
+
+    生命周期:
+    - 创建: 主进程调用 create()，拥有该段并负责 unlink()
+    - 附加: 工作进程调用 attach(descriptor)，只读访问，退出前 close()
+    - 销毁: 所有进程 close() 后，创建者 unlink()；unlink 后不能再附加
+
+    十六个工作进程附加同一个段时，编码列与相似度表在物理内存中只有一份。
+    """
+
+    def __init__(
+        self,
+        segment: shared_memory.SharedMemory,
+        descriptor: SharedPoolDescriptor,
+        owner: bool
+    ):
+        """初始化共享编码池，请使用 create() 或 attach()
+
+        Args:
+            segment: 共享内存段
+            descriptor: 描述符
+            owner: 是否为创建者
+        """
+        self._segment = segment
+        self.descriptor = descriptor
+        self.owner = owner
+        self._pool: Optional[EncodedPool] = self._map_pool()
+
+    @classmethod
+    def create(cls, pool: EncodedPool, name: Optional[str] = None) -> 'SharedEncodedPool':
+        """把编码池复制进新建的共享内存段
+
+        Args:
+            pool: 编码池
+            name: 共享内存段名称，缺省时随机生成
+
+        Returns:
+            SharedEncodedPool: 由当前进程拥有的共享编码池
+        """
+        arrays = pool.arrays()
+        layout = {}
+        offset = 0
+        for array_name, array in arrays.items():
+            offset = (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+            layout[array_name] = (offset, array.dtype.str, tuple(array.shape))
+            offset += array.nbytes
+        size = max(offset, 1)
+
+        segment = shared_memory.SharedMemory(
+            name=name or f'gresy_{uuid.uuid4().hex[:16]}', create=True, size=size)
+        for array_name, array in arrays.items():
+            array_offset, dtype, shape = layout[array_name]
+            target = np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=array_offset)
+            target[...] = array
+            del target
+
+        descriptor = SharedPoolDescriptor(segment.name, size, layout, pool.metadata(), os.getpid())
+        return cls(segment, descriptor, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor: SharedPoolDescriptor) -> 'SharedEncodedPool':
+        """按描述符零拷贝附加到已有的共享编码池
+
+        Args:
+            descriptor: 描述符（也可以是 to_dict 的结果）
+
+        Returns:
+            SharedEncodedPool: 只读的共享编码池
+
+        Raises:
+            FileNotFoundError: 共享内存段不存在或已被 unlink
+        """
+        if isinstance(descriptor, dict):
+            descriptor = SharedPoolDescriptor.from_dict(descriptor)
+        segment = _open_untracked(descriptor.segment_name, _shares_tracker(descriptor.owner_pid))
+        return cls(segment, descriptor, owner=False)
+
+    def _map_pool(self) -> EncodedPool:
+        """在共享内存上建立数组视图并组装编码池"""
+        arrays = {}
+        for array_name, (offset, dtype, shape) in self.descriptor.layout.items():
+            array = np.ndarray(shape, dtype=dtype, buffer=self._segment.buf, offset=offset)
+            if not self.owner:
+                array.flags.writeable = False
+            arrays[array_name] = array
+        return EncodedPool.from_arrays(arrays, self.descriptor.metadata)
+
+    @property
+    def pool(self) -> EncodedPool:
+        """共享内存上的编码池视图"""
+        if self._pool is None:
+            raise ValueError("共享编码池已关闭")
+        return self._pool
+
+    def close(self) -> None:
+        """释放本进程的映射
+
+        调用前应丢弃从 pool 取得的所有数组引用，否则映射无法释放。
+        """
+        if self._segment is None:
+            return
+        self._pool = None
+        self._segment.close()
+        self._segment = None
+
+    def unlink(self) -> None:
+        """删除共享内存段，只有创建者可以调用"""
+        if not self.owner:
+            raise PermissionError("只有创建者可以删除共享编码池")
+        if self._segment is None:
+            self._segment = shared_memory.SharedMemory(name=self.descriptor.segment_name)
+        elif sys.version_info < (3, 13):
+            # 经多级进程附加时创建者的登记可能已被注销，重新登记使 unlink() 的注销成对
+            resource_tracker.register(self._segment._name, 'shared_memory')
+        self._pool = None
+        self._segment.unlink()
+        self.close()
+
+    def __enter__(self) -> 'SharedEncodedPool':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
@@ -0,0 +1,230 @@
+"""查询追踪模块
+
+为 find_best_matches 的每次调用（可抽样、可只记慢查询）输出一条结构化 JSON 记录:
+目标ID、用户池大小、过滤后的候选数、实际打分数、各阶段耗时（filter / score / topk，
+以及按维度的 breakdown）、打分阶段缓存是否命中与截止时间状态。
+
+记录经 QueueHandler 放入有界队列，由 QueueListener 线程序列化并写入按大小轮转的 JSONL 文件；
+查询线程只构造一个字典并入队，队列满时丢弃该记录并计数，不会阻塞查询
+"""
+
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Dict, Optional
+
+from matching.encoded_pool import DIMENSIONS
+from matching.instrumentation import Instrumentation, timed
+
+# 计入 breakdown 的名称: 各维度与合并求总分
+_BREAKDOWN = frozenset(DIMENSIONS) | {'aggregate'}
+
+class QueryTrace:
+    """一次查询的追踪状态，只在发起查询的线程内使用
+
+    lap() 把上次标记以来的耗时记入某个阶段；add_time() / timed() 与 Instrumentation
+    接口相同，记录按维度的耗时并转发给挂接的 Instrumentation。
+    """
+
+    __slots__ = ('stages', 'breakdown', 'cache', 'instrumentation', '_mark')
+
+    def __init__(self, instrumentation: Optional[Instrumentation] = None):
+        """开始追踪"""
+        self.stages = {'filter': 0.0, 'score': 0.0, 'topk': 0.0}
+        self.breakdown: Dict[str, float] = {}
+        self.cache: Optional[str] = None
+        self.instrumentation = instrumentation
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """上次标记以来的耗时记入 stage"""
+        now = time.perf_counter()
+        self.stages[stage] += now - self._mark
+        self._mark = now
+
+    def add_time(self, name: str, seconds: float, calls: int = 1) -> None:
+        """累加一项耗时"""
+        if name in _BREAKDOWN:
+            self.breakdown[name] = self.breakdown.get(name, 0.0) + seconds
+        if self.instrumentation is not None:
+            self.instrumentation.add_time(name, seconds, calls)
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        """包装函数，每次调用累加其耗时"""
+        return timed(self.add_time, name, function)
+
+class _DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃记录的 QueueHandler；记录原样入队，序列化留给写出线程"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _BlockingQueueListener(QueueListener):
+    """停止时阻塞放入结束标记的 QueueListener
+
+    默认实现用 put_nowait 放入结束标记，队列满时抛出 queue.Full；
+    写出线程仍在消费队列，阻塞放入总会在已入队的记录写出后完成。
+    """
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+class _JsonFormatter(logging.Formatter):
+    """把记录的消息字典序列化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, separators=(',', ':'))
+
+class QueryTracer:
+    """查询追踪器
+
+    挂接到 MatchingSystem.tracer 后启用；未挂接（None）时匹配路径只多一次判断。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 50 * 2 ** 20,
+        backup_count: int = 5,
+        sample_rate: float = 1.0,
+        slow_ms: Optional[float] = None,
+        queue_size: int = 10000
+    ):
+        """打开追踪文件并启动写出线程
+
+        Args:
+            path: JSONL 文件路径
+            max_bytes: 单个文件的大小上限，超过后轮转
+            backup_count: 保留的轮转文件数
+            sample_rate: 追踪的查询比例 [0,1]
+            slow_ms: 只记录耗时不低于该值（毫秒）的查询，None 表示全部记录
+            queue_size: 待写记录的队列长度上限，队列满时丢弃新记录
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self._random = random.Random()
+        self._file_handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self._file_handler.setFormatter(_JsonFormatter())
+        self._handler = _DroppingQueueHandler(queue.Queue(queue_size))
+        self._listener = _BlockingQueueListener(self._handler.queue, self._file_handler)
+        self._listener.start()
+        # 私有的 Logger 实例，不经 getLogger() 注册到全局管理器: 追踪器关闭后随之回收，
+        # 也不会因 id() 复用而取回别的追踪器的 Logger
+        self._logger = logging.Logger(f'{__name__}.QueryTracer', logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(self._handler)
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        """因队列满而丢弃的记录数"""
+        return self._handler.dropped
+
+    def begin(self, instrumentation: Optional[Instrumentation] = None) -> Optional[QueryTrace]:
+        """按抽样比例开始追踪一次查询，未抽中时返回 None"""
+        if self._closed or (self.sample_rate < 1.0 and self._random.random() >= self.sample_rate):
+            return None
+        return QueryTrace(instrumentation)
+
+    def finish(
+        self,
+        trace: QueryTrace,
+        target_id: str,
+        pool_size: int,
+        top_n: int,
+        deadline: Optional[float],
+        results,
+        seconds: float
+    ) -> None:
+        """把一次查询的追踪记录放入写出队列
+
+        Args:
+            trace: begin() 返回的追踪状态
+            target_id: 目标用户ID
+            pool_size: 过滤前的用户池大小
+            top_n: 请求的结果数
+            deadline: 截止时间（time.monotonic() 的绝对时间）
+            results: find_best_matches 返回的 MatchResults
+            seconds: 总耗时
+        """
+        duration_ms = seconds * 1000.0
+        if self.slow_ms is not None and duration_ms < self.slow_ms:
+            return
+        stages = {stage: value * 1000.0 for stage, value in trace.stages.items()}
+        stages['breakdown'] = {name: value * 1000.0 for name, value in trace.breakdown.items()}
+        self._logger.info({
+            'ts': time.time(),
+            'target_id': target_id,
+            'top_n': top_n,
+            'pool_size': pool_size,
+            'candidates': results.pool_size,
+            'prefiltered': results.prefiltered,
+            'scanned': results.scanned,
+            'pruned': results.pruned,
+            'scored': results.scanned - results.pruned,
+            'results': len(results),
+            'duration_ms': duration_ms,
+            'stages_ms': stages,
+            'cache': trace.cache,
+            'deadline': {
+                'set': deadline is not None,
+                'hit': results.deadline_hit,
+                'remaining_ms': (deadline - time.monotonic()) * 1000.0 if deadline is not None else None
+            },
+            'thread': threading.current_thread().name,
+        })
+
+    def flush(self) -> None:
+        """等待已入队的记录全部写出
+
+        只等待队列中的记录处理完（Queue.join），不停止写出线程，可与 close() 并发调用。
+        """
+        if self._closed:
+            return
+        self._handler.queue.join()
+        self._file_handler.flush()
+
+    def close(self) -> None:
+        """写出剩余记录并关闭文件
+
+        先摘下 QueueHandler 不再接收新记录，再等写出线程处理完结束标记之前的全部记录；
+        停止后仍在途入队的记录计为丢弃。
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._logger.removeHandler(self._handler)
+            self._listener.stop()
+            log_queue = self._handler.queue
+            while True:
+                try:
+                    log_queue.get_nowait()
+                except queue.Empty:
+                    break
+                log_queue.task_done()
+                self._handler.dropped += 1
+            self._file_handler.close()
+
+    def __enter__(self) -> 'QueryTracer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
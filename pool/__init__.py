@@ -0,0 +1,21 @@
+"""用户池包
+
+提供支持并发读写的多版本用户池
+"""
+
+from .snapshot import ShardedIndex, PoolChunk, PoolSnapshot
+from .versioned_pool import VersionedPool, PoolWriter
+from .event_stream import EventConsumer
+from .presence import PresenceIndex
+from .generator import PoolGenerator
+
+__all__ = [
+    'ShardedIndex',
+    'PoolChunk',
+    'PoolSnapshot',
+    'VersionedPool',
+    'PoolWriter',
+    'EventConsumer',
+    'PresenceIndex',
+    'PoolGenerator'
+]
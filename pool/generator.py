@@ -0,0 +1,307 @@
+"""合成用户池生成模块
+
+按 data/input 中的真实取值表生成任意规模的用户池，用于基准测试:
+服务器取自 server_pool.json，MBTI / 星座取自偏好池，游戏取自 game_pool.json，
+游戏时间段取自 time_similarity.json，经验等级取自 experience_levels.json；
+性别、游戏风格、在线状态只出现在 user_pool.json 中，取其中出现过的取值。
+
+生成结果只由种子决定，与分批方式和输出格式无关。按固定大小的批次生成并写出，
+内存占用与用户数无关::
+
+    python -m pool.generator 1000000 users.jsonl --seed 7
+"""
+
+import argparse
+import json
+import os
+import sys
+from contextlib import nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from utils import profiling
+from loaders import LoaderManager
+from loaders.pools_loader import user_from_dict
+from models.user_profile import UserProfile
+
+# 每批生成的用户数；每批使用由 (种子, 批号) 派生的独立随机数发生器
+BATCH_SIZE = 10000
+
+# 输出格式
+FORMATS = ('json', 'jsonl', 'parquet')
+
+# 可配置分布的属性 -> user_pool.json 字段名
+FIELDS = {
+    'gender': '性别',
+    'play_region': '游玩服务器',
+    'play_time': '游玩固定时间',
+    'mbti': 'MBTI',
+    'zodiac': '星座',
+    'game_experience': '游戏经验',
+    'online_status': '在线状态',
+    'game_style': '游戏风格',
+}
+
+# 用户池中没有出现时使用的取值
+_DEFAULT_VALUES = {
+    'gender': ['男', '女', '赛博人'],
+    'online_status': ['在线', '离线'],
+    'game_style': ['强硬', '保守'],
+}
+
+def load_vocabularies(loader_manager: Optional[LoaderManager] = None) -> Dict[str, List[str]]:
+    """从 data/input 读取各属性的取值表
+
+    Args:
+        loader_manager: 加载器管理器，缺省新建
+
+    Returns:
+        Dict[str, List[str]]: 属性名 -> 取值列表，另含 games（按 game_pool.json 中的顺序）
+    """
+    manager = loader_manager or LoaderManager()
+    pools = manager.pools_loader.pools
+    servers = []
+    for group in pools.get('server_pool', {}).get('server_groups', {}).values():
+        servers.extend(server for server in group if server not in servers)
+    users = pools.get('user_pool', {}).get('users', [])
+
+    def observed(field: str, attribute: str) -> List[str]:
+        values = []
+        for user in users:
+            if user.get(field) not in values and user.get(field) is not None:
+                values.append(user[field])
+        return values or list(_DEFAULT_VALUES[attribute])
+
+    games = []
+    for game in pools.get('game_pool', {}).get('game_types', []):
+        if game['游戏名字'] not in games:
+            games.append(game['游戏名字'])
+    return {
+        'gender': observed('性别', 'gender'),
+        'play_region': servers,
+        'play_time': list(manager.get_weights('time_similarity').get('time_periods', [])),
+        'mbti': [item['自身mbti'] for item in pools.get('mbti_pool', {}).get('mbti_types', [])],
+        'zodiac': [item['自身星座'] for item in pools.get('constellation_pool', {}).get('constellation_types', [])],
+        'game_experience': list(manager.get_config('experience_levels').get('experience_levels', {})),
+        'online_status': observed('在线状态', 'online_status'),
+        'game_style': observed('游戏风格', 'game_style'),
+        'games': games,
+    }
+
+class PoolGenerator:
+    """可复现的合成用户池生成器
+
+    Attributes:
+        vocabularies: 属性名 -> 取值列表
+        distributions: 属性名 -> 各取值的概率（与取值表对齐）
+        library_sizes: 游戏库大小 -> 概率
+        game_weights: 各游戏被选中的相对权重（与 vocabularies['games'] 对齐）
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        vocabularies: Optional[Dict[str, List[str]]] = None,
+        distributions: Optional[Dict[str, Dict[str, float]]] = None,
+        library_sizes: Optional[Dict[int, float]] = None,
+        game_skew: float = 1.0,
+        id_prefix: str = 'u'
+    ):
+        """初始化生成器
+
+        Args:
+            seed: 随机种子
+            vocabularies: 取值表，缺省由 load_vocabularies() 读取
+            distributions: 属性名 -> {取值: 权重}，未给出的属性按取值均匀分布，
+                未列出的取值权重为0
+            library_sizes: 游戏库大小 -> 权重，缺省 1~5 个游戏均匀分布；超过游戏总数的按游戏总数计
+            game_skew: 游戏热度的 Zipf 指数，按 game_pool.json 中的顺序第 r 个游戏的权重为 1/r^skew，
+                0 表示均匀
+            id_prefix: 用户ID前缀，ID 为前缀加序号
+
+        Raises:
+            ValueError: 分布中出现取值表之外的属性或取值，或权重全为0
+        """
+        self.seed = seed
+        self.vocabularies = vocabularies or load_vocabularies()
+        self.id_prefix = id_prefix
+        self.distributions: Dict[str, np.ndarray] = {}
+        distributions = distributions or {}
+        for attribute in distributions:
+            if attribute not in FIELDS:
+                raise ValueError(f"未知的属性: {attribute}")
+        for attribute in FIELDS:
+            values = self.vocabularies[attribute]
+            weights = distributions.get(attribute)
+            if weights is None:
+                self.distributions[attribute] = np.full(len(values), 1.0 / len(values))
+                continue
+            unknown = set(weights) - set(values)
+            if unknown:
+                raise ValueError(f"属性 {attribute} 的取值不在取值表中: {sorted(unknown)}")
+            self.distributions[attribute] = self._normalize(
+                [weights.get(value, 0.0) for value in values], attribute)
+
+        games = self.vocabularies['games']
+        sizes = library_sizes or {size: 1.0 for size in range(1, 6)}
+        self._sizes = np.asarray([min(int(size), len(games)) for size in sizes], dtype=np.int64)
+        self.library_sizes = dict(zip(sizes, self._normalize(list(sizes.values()), 'library_sizes')))
+        self._size_probabilities = np.asarray(list(self.library_sizes.values()))
+        self.game_weights = 1.0 / np.arange(1, len(games) + 1, dtype=np.float64) ** game_skew
+        self._log_game_weights = np.log(self.game_weights)
+
+    @staticmethod
+    def _normalize(weights: List[float], name: str) -> np.ndarray:
+        """把权重归一化为概率"""
+        weights = np.asarray(weights, dtype=np.float64)
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f"{name} 的权重须非负且不全为0")
+        return weights / weights.sum()
+
+    def _batch(self, index: int) -> List[Dict[str, Any]]:
+        """生成第 index 批用户（user_pool.json 格式）"""
+        rng = np.random.default_rng([self.seed, index])
+        size = BATCH_SIZE
+        columns = {
+            attribute: rng.choice(len(probabilities), size=size, p=probabilities)
+            for attribute, probabilities in self.distributions.items()
+        }
+        genders = self.vocabularies['gender']
+        preference_orders = np.argsort(rng.random((size, len(genders))), axis=1)
+
+        # 加权无放回抽样: 对 log(权重) 加 Gumbel 噪声后取最大的若干个
+        games = self.vocabularies['games']
+        library = self._sizes[rng.choice(len(self._sizes), size=size, p=self._size_probabilities)]
+        keys = self._log_game_weights + rng.gumbel(size=(size, len(games)))
+        ranked = np.argsort(-keys, axis=1)
+
+        users = []
+        start = index * size
+        for row in range(size):
+            user = {'id': f'{self.id_prefix}{start + row}'}
+            user['游戏'] = [games[code] for code in ranked[row, :library[row]]]
+            for attribute, field in FIELDS.items():
+                user[field] = self.vocabularies[attribute][columns[attribute][row]]
+            user['性别倾向'] = [genders[code] for code in preference_orders[row]]
+            users.append(user)
+        return users
+
+    def records(self, count: int, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """按序号依次生成用户字典（user_pool.json 格式）
+
+        Args:
+            count: 用户数
+            start: 起始序号，可用于分段生成同一个池
+
+        Yields:
+            Dict[str, Any]: 用户数据
+        """
+        end = start + count
+        index = start // BATCH_SIZE
+        while index * BATCH_SIZE < end:
+            batch = self._batch(index)
+            first = max(start - index * BATCH_SIZE, 0)
+            last = min(end - index * BATCH_SIZE, BATCH_SIZE)
+            yield from batch[first:last]
+            index += 1
+
+    def users(self, count: int, start: int = 0) -> Iterator[UserProfile]:
+        """按序号依次生成用户档案"""
+        for record in self.records(count, start):
+            yield user_from_dict(record)
+
+    def write(self, path: str, count: int, output_format: Optional[str] = None) -> int:
+        """把 count 个用户流式写入文件
+
+        Args:
+            path: 输出路径
+            count: 用户数
+            output_format: 'json'（与 user_pool.json 相同的结构）、'jsonl'（每行一个用户）
+                或 'parquet'（需要 pyarrow），缺省按扩展名推断
+
+        Returns:
+            int: 写出的用户数
+
+        Raises:
+            ValueError: 无法确定输出格式
+            ImportError: 写 Parquet 时缺少 pyarrow
+        """
+        output_format = output_format or os.path.splitext(path)[1].lstrip('.').lower()
+        if output_format not in FORMATS:
+            raise ValueError(f"未知的输出格式: {output_format}，可选 {', '.join(FORMATS)}")
+        if output_format == 'parquet':
+            return self._write_parquet(path, count)
+        written = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            if output_format == 'json':
+                file.write('{"users": [\n')
+            for record in self.records(count):
+                line = json.dumps(record, ensure_ascii=False)
+                if output_format == 'json':
+                    file.write(',\n' + line if written else line)
+                else:
+                    file.write(line + '\n')
+                written += 1
+            if output_format == 'json':
+                file.write('\n]}\n')
+        return written
+
+    def _write_parquet(self, path: str, count: int) -> int:
+        """按批写 Parquet 文件，每批一个 row group"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("写 Parquet 文件需要安装 pyarrow") from e
+
+        schema = pa.schema(
+            [('id', pa.string()), ('游戏', pa.list_(pa.string()))] +
+            [(field, pa.string()) for field in FIELDS.values()] +
+            [('性别倾向', pa.list_(pa.string()))]
+        )
+        written = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            batch: List[Dict[str, Any]] = []
+            for record in self.records(count):
+                batch.append(record)
+                if len(batch) == BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    written += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+        return written
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口: 生成合成用户池文件"""
+    parser = argparse.ArgumentParser(description="按 data/input 的取值表生成合成用户池")
+    parser.add_argument('count', type=int, help="用户数")
+    parser.add_argument('output', help="输出路径（.json / .jsonl / .parquet）")
+    parser.add_argument('--format', choices=FORMATS, help="输出格式，缺省按扩展名推断")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--game-skew', type=float, default=1.0, help="游戏热度的 Zipf 指数")
+    parser.add_argument('--config', help="JSON 配置文件: {\"distributions\": {...}, \"library_sizes\": {...}}")
+    profiling.add_arguments(parser, scopes=False)
+    args = parser.parse_args(argv)
+    profiler = profiling.ProfileSession.from_args(args)
+
+    config: Dict[str, Any] = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as file:
+            config = json.load(file)
+    library_sizes = config.get('library_sizes')
+    generator = PoolGenerator(
+        seed=args.seed,
+        distributions=config.get('distributions'),
+        library_sizes={int(size): weight for size, weight in library_sizes.items()} if library_sizes else None,
+        game_skew=args.game_skew
+    )
+    with profiler.session('generator') if profiler is not None else nullcontext():
+        written = generator.write(args.output, args.count, args.format)
+    print(json.dumps({'output': args.output, 'users': written}, ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
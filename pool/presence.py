@@ -0,0 +1,215 @@
+"""在线状态索引模块
+
+以心跳维护用户在线状态：每次心跳把用户的过期时间顺延 ttl 秒，
+超过 ttl 没有心跳的用户视为离线。同时维护一个在线位图，
+供只匹配在线用户的查询直接取得在线子集
+"""
+
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 静态档案中表示在线的 online_status 取值
+ONLINE = '在线'
+
+# 默认心跳有效期（秒）
+DEFAULT_TTL = 60.0
+
+class PresenceIndex:
+    """在线状态索引
+
+    每个用户的过期时间精确为其最后一次心跳时间加 ttl（同一用户乱序到达的旧心跳不会缩短会话）。
+    事件流中的心跳时间可能乱序，过期顺序用 (过期时间, 用户ID) 的小顶堆维护：
+    心跳 O(log n) 入堆，被后续心跳或下线作废的旧条目留在堆中，弹出时与当前过期时间不符即跳过；
+    作废条目超过登记会话数时整体重建堆，堆长度不超过会话数的两倍。
+    过期的用户在位图中批量清零；全部会话都已过期时直接清空，不逐个弹出。
+
+    位图只为仍登记的会话保留槽位：会话过期或下线后槽位归还空闲列表，
+    供之后新上线的用户复用，因此位图长度只随同时在线人数的峰值增长，
+    而不是随见过的全部用户增长。
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.monotonic):
+        """初始化在线状态索引
+
+        Args:
+            ttl: 心跳有效期（秒）
+            clock: 时钟函数，默认 time.monotonic
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._expiry: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        # 不小于全部登记会话过期时间的上界，用于判断能否一次清空
+        self._latest = float('-inf')
+        self._bits: Dict[str, int] = {}
+        self._user_ids: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._bitmap = np.zeros(1024, dtype=bool)
+
+    def _bit_for(self, user_id: str) -> int:
+        """取得用户在位图中的位置，会话开始时分配，优先复用空闲槽位"""
+        bit = self._bits.get(user_id)
+        if bit is None:
+            if self._free:
+                bit = self._free.pop()
+                self._user_ids[bit] = user_id
+            else:
+                bit = len(self._user_ids)
+                if bit == len(self._bitmap):
+                    bitmap = np.zeros(len(self._bitmap) * 2, dtype=bool)
+                    bitmap[:bit] = self._bitmap
+                    self._bitmap = bitmap
+                self._user_ids.append(user_id)
+            self._bits[user_id] = bit
+        return bit
+
+    def _release(self, user_id: str) -> int:
+        """会话结束时归还用户的槽位"""
+        bit = self._bits.pop(user_id)
+        self._user_ids[bit] = None
+        self._free.append(bit)
+        return bit
+
+    def heartbeat(self, user_id: str, now: Optional[float] = None) -> None:
+        """记录一次心跳，用户在 now + ttl 之前视为在线
+
+        Args:
+            user_id: 用户ID
+            now: 心跳时间，缺省取 clock()；可以乱序，同一用户取最晚的一次
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            expiry = self._expiry
+            deadline = now + self.ttl
+            current = expiry.get(user_id)
+            if current is not None:
+                if deadline <= current:
+                    return
+            elif not self._free:
+                # 新会话需要槽位而没有空闲的: 先清理过期会话，避免位图无谓增长
+                self._expire_locked(now)
+            expiry[user_id] = deadline
+            if deadline > self._latest:
+                self._latest = deadline
+            heap = self._heap
+            heapq.heappush(heap, (deadline, user_id))
+            if len(heap) > 2 * len(expiry) + 64:
+                self._heap = [(value, key) for key, value in expiry.items()]
+                heapq.heapify(self._heap)
+            bit = self._bit_for(user_id)
+            self._bitmap[bit] = True
+
+    def leave(self, user_id: str) -> bool:
+        """用户主动下线
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            bool: 用户此前是否在线
+        """
+        with self._lock:
+            if self._expiry.pop(user_id, None) is None:
+                return False
+            self._bitmap[self._release(user_id)] = False
+            return True
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """清理所有已过期的会话
+
+        Args:
+            now: 当前时间，缺省取 clock()
+
+        Returns:
+            int: 本次清理的会话数
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            return self._expire_locked(now)
+
+    def _expire_locked(self, now: float) -> int:
+        """在已持有锁时清理过期会话"""
+        expiry = self._expiry
+        if expiry and self._latest <= now:
+            # 全部会话都已过期: 一次清空（位图为真当且仅当会话仍登记）
+            count = len(expiry)
+            expiry.clear()
+            self._heap.clear()
+            self._latest = float('-inf')
+            self._bits.clear()
+            self._user_ids.clear()
+            self._free.clear()
+            self._bitmap[:] = False
+            return count
+        heap = self._heap
+        expired = []
+        release = self._release
+        while heap and heap[0][0] <= now:
+            deadline, user_id = heapq.heappop(heap)
+            if expiry.get(user_id) != deadline:
+                # 已被更晚的心跳或下线作废
+                continue
+            del expiry[user_id]
+            expired.append(release(user_id))
+        if expired:
+            self._bitmap[expired] = False
+        return len(expired)
+
+    def is_online(self, user_id: str, now: Optional[float] = None) -> bool:
+        """用户当前是否在线
+
+        Args:
+            user_id: 用户ID
+            now: 当前时间，缺省取 clock()
+        """
+        deadline = self._expiry.get(user_id)
+        if deadline is None:
+            return False
+        return deadline > (self.clock() if now is None else now)
+
+    def online_ids(self, now: Optional[float] = None) -> List[str]:
+        """清理过期会话后返回全部在线用户ID（按位图槽位顺序）
+
+        扫描的位图长度是同时在线人数的峰值。
+
+        Args:
+            now: 当前时间，缺省取 clock()
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            self._expire_locked(now)
+            user_ids = self._user_ids
+            return [user_ids[bit] for bit in np.flatnonzero(self._bitmap[:len(user_ids)])]
+
+    def bitmap(self, now: Optional[float] = None) -> np.ndarray:
+        """清理过期会话后返回在线位图的只读副本
+
+        第 i 位对应 user_id_of(i)；槽位会在会话结束后复用，
+        对应关系只在下一次心跳、下线或清理之前有效。
+
+        Args:
+            now: 当前时间，缺省取 clock()
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            self._expire_locked(now)
+            bitmap = self._bitmap[:len(self._user_ids)].copy()
+        bitmap.flags.writeable = False
+        return bitmap
+
+    def user_id_of(self, bit: int) -> Optional[str]:
+        """位图中第 bit 位对应的用户ID，空闲槽位为 None"""
+        return self._user_ids[bit]
+
+    def __len__(self) -> int:
+        """当前登记的会话数（包括已过期但尚未清理的）"""
+        return len(self._expiry)
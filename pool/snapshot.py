@@ -0,0 +1,505 @@
+"""用户池快照模块
+
+定义不可变的用户池版本。用户按固定大小分块存储，ID索引按哈希分片存储，
+块表与分片表都是 32 叉的持久化向量，新版本只复制发生变化的块、分片及其到根的路径，
+未变化的部分在版本之间共享
+"""
+
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.user_profile import UserProfile
+from models.game_profile import GameProfile
+from matching.encoded_pool import CATEGORICAL_COLUMNS, EncodedPool, PoolEncoder
+
+# 每块的用户槽位数
+CHUNK_SIZE = 1024
+
+# 索引分片的平均条目数上限，超过后分片数翻倍
+MAX_SHARD_SIZE = 1024
+
+_MISSING = object()
+
+# 持久化向量每个节点的分支数（2 ** _BITS）
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+
+def _assoc(node: tuple, shift: int, items: List[Tuple[int, Any]]) -> tuple:
+    """复制 node 并写入 items（按下标升序），只复制被写入的子树"""
+    node = list(node)
+    if shift == 0:
+        for index, value in items:
+            offset = index & _MASK
+            if offset >= len(node):
+                node.extend([None] * (offset + 1 - len(node)))
+            node[offset] = value
+        return tuple(node)
+    for slot, group in groupby(items, key=lambda item: (item[0] >> shift) & _MASK):
+        if slot >= len(node):
+            node.extend([()] * (slot + 1 - len(node)))
+        node[slot] = _assoc(node[slot], shift - _BITS, list(group))
+    return tuple(node)
+
+def _entries(node: tuple, shift: int, base: int) -> Iterator[Tuple[int, Any]]:
+    """按下标顺序遍历子树中已写入的 (下标, 值)"""
+    if shift == 0:
+        for offset, value in enumerate(node):
+            yield base + offset, value
+        return
+    for slot, child in enumerate(node):
+        yield from _entries(child, shift - _BITS, base + (slot << shift))
+
+class PersistentVector:
+    """持久化向量（32 叉树）
+
+    实例不可变；updated() 返回新向量，只复制被修改的叶子及其到根的路径
+    （每个修改 O(log32 n) 个节点，每个节点至多 32 个引用），其余节点与旧向量共享。
+    超出末尾写入时中间未写入的位置为 None。
+    """
+
+    __slots__ = ('_root', '_shift', '_size')
+
+    def __init__(self, items: Iterable[Any] = ()):
+        """由元素序列构建向量
+
+        Args:
+            items: 初始元素
+        """
+        items = tuple(items)
+        level = [items[start:start + _WIDTH] for start in range(0, len(items), _WIDTH)] or [()]
+        self._size = len(items)
+        shift = 0
+        while len(level) > 1:
+            level = [tuple(level[start:start + _WIDTH]) for start in range(0, len(level), _WIDTH)]
+            shift += _BITS
+        self._root = level[0]
+        self._shift = shift
+
+    @classmethod
+    def _make(cls, root: tuple, shift: int, size: int) -> 'PersistentVector':
+        vector = cls.__new__(cls)
+        vector._root = root
+        vector._shift = shift
+        vector._size = size
+        return vector
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        node = self._root
+        shift = self._shift
+        try:
+            while shift:
+                node = node[(index >> shift) & _MASK]
+                shift -= _BITS
+            return node[index & _MASK]
+        except IndexError:
+            # 超出末尾写入时跳过的位置
+            return None
+
+    def __iter__(self) -> Iterator[Any]:
+        expected = 0
+        for index, value in _entries(self._root, self._shift, 0):
+            while expected < index:
+                yield None
+                expected += 1
+            yield value
+            expected += 1
+        for _ in range(expected, self._size):
+            yield None
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        """按下标顺序遍历值不为 None 的 (下标, 值)，跳过整棵未写入的子树"""
+        for index, value in _entries(self._root, self._shift, 0):
+            if value is not None:
+                yield index, value
+
+    def updated(self, changes: Dict[int, Any]) -> 'PersistentVector':
+        """返回写入了修改的新向量
+
+        Args:
+            changes: 下标 -> 新值，下标可以超出末尾以追加
+
+        Returns:
+            PersistentVector: 新向量
+        """
+        if not changes:
+            return self
+        if min(changes) < 0:
+            raise IndexError(min(changes))
+        size = max(self._size, max(changes) + 1)
+        root, shift = self._root, self._shift
+        while size > 1 << (shift + _BITS):
+            root = (root,)
+            shift += _BITS
+        return PersistentVector._make(_assoc(root, shift, sorted(changes.items())), shift, size)
+
+class ShardedIndex:
+    """持久化分片哈希索引
+
+    实例不可变；updated() 返回新索引，只复制被修改的分片，
+    未修改的分片与旧索引共享。分片表本身是持久化向量，复制的只是到被修改分片的路径。
+    """
+
+    __slots__ = ('shards', 'size', 'mask')
+
+    def __init__(self, shards: Sequence[Dict[Any, Any]] = ({},), size: int = 0):
+        """初始化索引
+
+        Args:
+            shards: 分片序列，长度必须是2的幂
+            size: 条目总数
+        """
+        if not isinstance(shards, PersistentVector):
+            shards = PersistentVector(shards)
+        self.shards = shards
+        self.size = size
+        self.mask = len(shards) - 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """查找键对应的值"""
+        return self.shards[hash(key) & self.mask].get(key, default)
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        """遍历全部条目"""
+        for shard in self.shards:
+            yield from shard.items()
+
+    def updated(self, changes: Dict[Any, Any]) -> 'ShardedIndex':
+        """返回应用了修改的新索引
+
+        Args:
+            changes: 键 -> 新值，值为 None 表示删除该键
+
+        Returns:
+            ShardedIndex: 新索引
+        """
+        if not changes:
+            return self
+        mask = self.mask
+        copied: Dict[int, Dict[Any, Any]] = {}
+        size = self.size
+        for key, value in changes.items():
+            position = hash(key) & mask
+            shard = copied.get(position)
+            if shard is None:
+                shard = copied[position] = dict(self.shards[position])
+            if value is None:
+                if shard.pop(key, _MISSING) is not _MISSING:
+                    size -= 1
+            else:
+                if key not in shard:
+                    size += 1
+                shard[key] = value
+        index = ShardedIndex(self.shards.updated(copied), size)
+        if size > len(self.shards) * MAX_SHARD_SIZE:
+            index = index._resized(len(self.shards) * 2)
+        return index
+
+    def _resized(self, shard_count: int) -> 'ShardedIndex':
+        """按新的分片数重建索引（均摊O(1)）"""
+        shards: List[Dict[Any, Any]] = [{} for _ in range(shard_count)]
+        for key, value in self.items():
+            shards[hash(key) & (shard_count - 1)][key] = value
+        return ShardedIndex(shards, self.size)
+
+class PoolChunk:
+    """用户池中的一块
+
+    槽位中的 None 是已删除用户留下的墓碑，等待压缩时回收。
+    块一经创建不再修改；配置了编码器时，块同时持有与槽位逐行对应的编码池，
+    墓碑行的编码保留原值，通过 live_rows 排除。
+    """
+
+    __slots__ = ('users', 'live', 'encoded', 'live_rows')
+
+    def __init__(
+        self,
+        users: Tuple[Optional[UserProfile], ...],
+        encoded: Optional[EncodedPool] = None,
+        live_rows: Optional[np.ndarray] = None
+    ):
+        """初始化块
+
+        Args:
+            users: 槽位元组
+            encoded: 与槽位逐行对应的编码池
+            live_rows: 存活槽位的偏移，缺省时由 users 计算
+        """
+        self.users = users
+        self.encoded = encoded
+        if live_rows is None:
+            live_rows = np.array(
+                [offset for offset, user in enumerate(users) if user is not None], dtype=np.int64)
+        self.live_rows = live_rows
+        self.live = len(self.live_rows)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+def chunk_value_rows(chunk: PoolChunk) -> Dict[Tuple[str, Any], np.ndarray]:
+    """块中每个 (分类列, 取值) 的存活槽位偏移（升序）
+
+    块带编码池时按编码列分组，否则逐个用户取值。
+    """
+    encoded = chunk.encoded
+    if encoded is not None:
+        grouped: Dict[Tuple[str, Any], np.ndarray] = {}
+        live_rows = chunk.live_rows
+        for column in CATEGORICAL_COLUMNS:
+            codes = encoded.columns[column][live_rows]
+            order = np.argsort(codes, kind='stable')
+            codes, offsets = codes[order], live_rows[order]
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else []
+            vocabulary = encoded.vocabularies[column]
+            for start, end in zip(list(starts), list(starts[1:]) + [len(codes)]):
+                grouped[(column, vocabulary[codes[start]])] = offsets[start:end]
+        return grouped
+    rows: Dict[Tuple[str, Any], List[int]] = {}
+    users = chunk.users
+    for offset in chunk.live_rows.tolist():
+        user = users[offset]
+        for column, getter in CATEGORICAL_COLUMNS.items():
+            rows.setdefault((column, getter(user)), []).append(offset)
+    return {key: np.array(offsets, dtype=np.int64) for key, offsets in rows.items()}
+
+def build_slot_index(chunks: Iterable[PoolChunk]) -> Dict[Tuple[str, Any], PersistentVector]:
+    """由各块构建二级索引: (分类列, 取值) -> 按块号索引的存活槽位偏移，不含该取值的块为 None"""
+    by_key: Dict[Tuple[str, Any], Dict[int, np.ndarray]] = {}
+    for chunk_number, chunk in enumerate(chunks):
+        for key, rows in chunk_value_rows(chunk).items():
+            by_key.setdefault(key, {})[chunk_number] = rows
+    return {key: PersistentVector().updated(rows) for key, rows in by_key.items()}
+
+class PoolSnapshot:
+    """不可变的用户池版本
+
+    读者持有快照期间看到的内容不会变化，写者发布新版本也不会阻塞读者。
+    快照可以直接作为 find_best_matches 的 user_pool 使用；快照携带游戏档案时，
+    find_best_matches 按快照中的游戏档案打分，游戏池的替换与用户池一样按版本生效。
+    """
+
+    def __init__(
+        self,
+        version: int,
+        chunks: Sequence[PoolChunk],
+        index: ShardedIndex,
+        games: Optional[Tuple[GameProfile, ...]],
+        chunk_size: int = CHUNK_SIZE,
+        encoder: Optional[PoolEncoder] = None,
+        size: Optional[int] = None,
+        slot_index: Optional[Dict[Tuple[str, Any], PersistentVector]] = None
+    ):
+        """初始化快照，通常由 build() 或 PoolWriter 创建
+
+        Args:
+            version: 版本号
+            chunks: 用户块
+            index: 用户ID -> 槽位号
+            games: 游戏档案，None 表示快照不携带游戏档案
+            chunk_size: 每块的槽位数
+            encoder: 编码器，None 表示块不带编码池
+            size: 存活用户数，None 表示由各块统计
+            slot_index: 二级索引（见 build_slot_index），None 表示由各块构建
+        """
+        if not isinstance(chunks, PersistentVector):
+            chunks = PersistentVector(chunks)
+        self.version = version
+        self.chunks = chunks
+        self.index = index
+        self.games = games
+        self.chunk_size = chunk_size
+        self.encoder = encoder
+        self.size = sum(chunk.live for chunk in chunks) if size is None else size
+        self.slot_index = build_slot_index(chunks) if slot_index is None else slot_index
+        self._encoded_view: Optional[Tuple[PoolEncoder, 'PoolSnapshot']] = None
+
+    @classmethod
+    def build(
+        cls,
+        version: int,
+        users: Iterable[UserProfile],
+        games: Optional[Iterable[GameProfile]] = None,
+        chunk_size: int = CHUNK_SIZE,
+        encoder: Optional[PoolEncoder] = None
+    ) -> 'PoolSnapshot':
+        """由用户列表构建快照
+
+        Args:
+            version: 版本号
+            users: 用户档案，重复的用户ID以最后一个为准
+            games: 游戏档案，None 表示快照不携带游戏档案
+            chunk_size: 每块的槽位数
+            encoder: 编码器，提供时为每块编码
+
+        Returns:
+            PoolSnapshot: 快照
+        """
+        slots: List[UserProfile] = []
+        positions: Dict[str, int] = {}
+        for user in users:
+            position = positions.get(user.user_id)
+            if position is None:
+                positions[user.user_id] = len(slots)
+                slots.append(user)
+            else:
+                slots[position] = user
+        chunks = []
+        for start in range(0, len(slots), chunk_size):
+            users_in_chunk = slots[start:start + chunk_size]
+            encoded = encoder.encode(users_in_chunk) if encoder is not None else None
+            chunks.append(PoolChunk(tuple(users_in_chunk), encoded))
+        if games is not None:
+            games = tuple(games)
+        return cls(version, chunks, ShardedIndex().updated(positions), games, chunk_size, encoder)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[UserProfile]:
+        for chunk in self.chunks:
+            for user in chunk.users:
+                if user is not None:
+                    yield user
+
+    def __getitem__(self, position: int) -> UserProfile:
+        """按存活用户的顺序取第 position 个用户"""
+        if position < 0:
+            position += self.size
+        if not 0 <= position < self.size:
+            raise IndexError(position)
+        for chunk in self.chunks:
+            if position >= chunk.live:
+                position -= chunk.live
+                continue
+            for user in chunk.users:
+                if user is not None:
+                    if position == 0:
+                        return user
+                    position -= 1
+        raise IndexError(position)
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    @property
+    def slot_count(self) -> int:
+        """槽位总数（含已删除的槽位）"""
+        if not self.chunks:
+            return 0
+        return (len(self.chunks) - 1) * self.chunk_size + len(self.chunks[-1])
+
+    def slot(self, position: int) -> Optional[UserProfile]:
+        """按槽位号取用户，已删除时返回 None"""
+        return self.chunks[position // self.chunk_size].users[position % self.chunk_size]
+
+    def get(self, user_id: str) -> Optional[UserProfile]:
+        """按用户ID查找用户
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            Optional[UserProfile]: 用户档案，不存在时返回 None
+        """
+        position = self.index.get(user_id)
+        return None if position is None else self.slot(position)
+
+    @property
+    def tombstones(self) -> int:
+        """已删除但尚未回收的槽位数"""
+        return self.slot_count - self.size
+
+    def encoded_chunks(self) -> Iterator[Tuple[int, EncodedPool, np.ndarray]]:
+        """遍历各块的编码池
+
+        各块编码于不同时刻，跨块打分的查询应由 encoder.encode_query() 生成，
+        其相似度表覆盖所有块中出现的编码。
+
+        Returns:
+            Iterator[Tuple[int, EncodedPool, np.ndarray]]:
+            (块首槽位号, 编码池, 存活行号)，行号加块首槽位号即为槽位号
+
+        Raises:
+            ValueError: 快照没有编码器
+        """
+        if self.encoder is None:
+            raise ValueError("快照没有编码器，块中不含编码池")
+        for chunk_number, chunk in enumerate(self.chunks):
+            yield chunk_number * self.chunk_size, chunk.encoded, chunk.live_rows
+
+    def encoded_with(self, encoder: PoolEncoder) -> 'PoolSnapshot':
+        """取得用 encoder 编码各块的同版本快照
+
+        快照不可变，编码结果缓存在快照上，同一版本只编码一次；
+        已用该编码器编码的快照直接返回自身。墓碑行以块中任一存活用户的编码占位，
+        由 live_rows 排除。
+
+        Args:
+            encoder: 编码器
+
+        Returns:
+            PoolSnapshot: 与本快照内容相同、块中带编码池的快照
+        """
+        if self.encoder is encoder:
+            return self
+        cached = self._encoded_view
+        if cached is not None and cached[0] is encoder:
+            return cached[1]
+        chunks = []
+        for chunk in self.chunks:
+            filler = next((user for user in chunk.users if user is not None), None)
+            if filler is None:
+                # 全是墓碑的块没有存活行
+                encoded = encoder.encode([])
+            else:
+                encoded = encoder.encode([filler if user is None else user for user in chunk.users])
+            chunks.append(PoolChunk(chunk.users, encoded, chunk.live_rows))
+        view = PoolSnapshot(
+            self.version, chunks, self.index, self.games, self.chunk_size, encoder, self.size, self.slot_index)
+        self._encoded_view = (encoder, view)
+        return view
+
+    def slots_where(self, column: str, value: Any) -> np.ndarray:
+        """二级索引查询: 某个分类列取指定值的全部存活槽位
+
+        二级索引随提交增量维护，查询只拼接含该取值的块的槽位，不逐行过滤编码列。
+
+        Args:
+            column: 分类列名，见 matching.encoded_pool.CATEGORICAL_COLUMNS
+            value: 原始取值
+
+        Returns:
+            np.ndarray: 槽位号数组，升序
+
+        Raises:
+            KeyError: 未知的分类列
+        """
+        if column not in CATEGORICAL_COLUMNS:
+            raise KeyError(column)
+        chunks = self.slot_index.get((column, value))
+        parts = [] if chunks is None else [
+            rows + chunk_number * self.chunk_size for chunk_number, rows in chunks.items()]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def users(self) -> List[UserProfile]:
+        """以列表形式返回全部存活用户"""
+        return list(self)
+
+    def shares_chunks_with(self, other: 'PoolSnapshot') -> Sequence[bool]:
+        """逐块判断是否与另一个快照共享同一块对象（用于观察写时复制）"""
+        return [
+            position < len(other.chunks) and chunk is other.chunks[position]
+            for position, chunk in enumerate(self.chunks)
+        ]
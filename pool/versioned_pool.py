@@ -0,0 +1,519 @@
+"""多版本用户池模块
+
+读者通过 snapshot() 固定一个不可变版本，写者通过 writer() 在私有副本上修改，
+提交时以一次引用赋值原子地发布新版本。读者从不加锁，写者之间串行
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from models.user_profile import UserProfile
+from models.game_profile import GameProfile
+from matching.encoded_pool import CATEGORICAL_COLUMNS, PoolEncoder
+from pool.snapshot import CHUNK_SIZE, PersistentVector, PoolChunk, PoolSnapshot
+
+# 墓碑占槽位总数的比例超过该值时，提交后自动压缩
+COMPACT_RATIO = 0.25
+
+_UNCHANGED = object()
+
+# 二级索引维护中表示“该槽位无用户”的取值
+_ABSENT = object()
+
+def _diff(old: PoolSnapshot, new: PoolSnapshot) -> Tuple[List[UserProfile], List[str]]:
+    """两个快照之间新增或变化的用户，以及被删除的用户ID（O(n)）"""
+    upserted = [user for user in new if old.get(user.user_id) is not user]
+    removed = [user_id for user_id, _ in old.index.items() if user_id not in new]
+    return upserted, removed
+
+def _encoder_for(
+    encoder: Optional[PoolEncoder],
+    games: Optional[Tuple[GameProfile, ...]]
+) -> Optional[PoolEncoder]:
+    """与游戏档案一致的编码器: 编码器所属匹配系统绑定到这些游戏档案后的编码器"""
+    if encoder is None or games is None:
+        return encoder
+    return encoder.system.for_games(games).encoder
+
+class VersionedPool:
+    """多版本用户池
+
+    长时间运行的批量扫描持有旧快照时，写者照常发布新版本；
+    写者提交期间，读者照常读取当前版本，两者互不阻塞。
+
+    单个用户的增删改只重新编码一行、复制一个块（chunk_size 个槽位）和一个索引分片
+    （平均不超过 MAX_SHARD_SIZE 个条目），块表与分片表是持久化向量，只复制到这两处的路径
+    （O(log32 n) 个节点，每个节点至多 32 个引用）；二级索引只重算该块中取值变化的列，
+    另复制一次 (分类列, 取值) 数量大小的字典。池大小只以对数项计入，存活用户数随提交增量维护。
+    删除留下墓碑，墓碑比例超过 compact_ratio 时整体压缩，压缩的 O(n) 代价由之前的 Θ(n) 次删除均摊。
+
+    attach() 挂接的索引（GameIndex、MinHashLSH、IVFIndex、CandidateIndex 等实现了
+    apply(upserted, removed) 的对象）在每次提交时按变化的用户增量更新。
+    """
+
+    def __init__(
+        self,
+        users: Iterable[UserProfile] = (),
+        games: Optional[Iterable[GameProfile]] = None,
+        chunk_size: int = CHUNK_SIZE,
+        encoder: Optional[PoolEncoder] = None,
+        compact_ratio: float = COMPACT_RATIO
+    ):
+        """初始化多版本用户池
+
+        Args:
+            users: 初始用户
+            games: 游戏档案，随版本发布；find_best_matches 按快照中的游戏档案打分，
+                None 表示不携带游戏档案，按匹配系统自身的游戏档案打分
+            chunk_size: 每块的槽位数
+            encoder: 编码器，提供时每块维护与槽位对应的编码列；
+                游戏档案与编码器所属匹配系统的不同时，换用绑定到这些游戏档案的编码器
+            compact_ratio: 触发自动压缩的墓碑比例
+        """
+        self._write_lock = threading.Lock()
+        if games is not None:
+            games = tuple(games)
+        self.encoder = _encoder_for(encoder, games)
+        self.compact_ratio = compact_ratio
+        self._current = PoolSnapshot.build(0, users, games, chunk_size, self.encoder)
+        self._indexes: List[Any] = []
+
+    def snapshot(self) -> PoolSnapshot:
+        """获取当前版本的快照（无锁）"""
+        return self._current
+
+    @property
+    def version(self) -> int:
+        """当前版本号"""
+        return self._current.version
+
+    def attach(self, index: Any, snapshot: Optional[PoolSnapshot] = None) -> None:
+        """挂接随提交增量更新的索引
+
+        索引不分版本，始终反映最新提交的版本：提交在写锁内发布新快照后调用
+        index.apply(upserted, removed)。与写者并发查询挂接的索引时，调用方需自行同步。
+
+        Args:
+            index: 实现 apply(upserted, removed) 的索引
+            snapshot: 构建索引所用的快照；不是当前版本时先补上两者之差（O(n)），
+                None 表示索引已与当前版本一致
+        """
+        with self._write_lock:
+            if snapshot is not None and snapshot is not self._current:
+                index.apply(*_diff(snapshot, self._current))
+            self._indexes.append(index)
+
+    def detach(self, index: Any) -> None:
+        """取消挂接索引
+
+        Raises:
+            ValueError: 索引未挂接
+        """
+        with self._write_lock:
+            self._indexes.remove(index)
+
+    def _notify(self, upserted: List[UserProfile], removed: List[str]) -> None:
+        """在已持有写锁时把变化的用户通知挂接的索引"""
+        if upserted or removed:
+            for index in self._indexes:
+                index.apply(upserted, removed)
+
+    def writer(self) -> 'PoolWriter':
+        """开始一次写事务，写者之间串行
+
+        Returns:
+            PoolWriter: 写事务，可作为上下文管理器使用，正常退出时提交
+        """
+        return PoolWriter(self)
+
+    def replace(
+        self,
+        users: Iterable[UserProfile],
+        games: Optional[Iterable[GameProfile]] = None
+    ) -> PoolSnapshot:
+        """整体替换用户池并发布新版本
+
+        Args:
+            users: 新的用户
+            games: 新的游戏档案，None 表示沿用当前游戏档案
+
+        Returns:
+            PoolSnapshot: 新发布的快照
+        """
+        with self._write_lock:
+            current = self._current
+            if games is None:
+                games = current.games
+            else:
+                games = tuple(games)
+                self.encoder = _encoder_for(self.encoder, games)
+            snapshot = PoolSnapshot.build(
+                current.version + 1, users, games, current.chunk_size, self.encoder)
+            self._current = snapshot
+            if self._indexes:
+                self._notify(*_diff(current, snapshot))
+            return snapshot
+
+    def compact(self) -> PoolSnapshot:
+        """回收全部墓碑，按原有顺序重新排布存活用户并发布新版本
+
+        Returns:
+            PoolSnapshot: 新发布的快照
+        """
+        with self._write_lock:
+            return self._compact_locked(self._current)
+
+    def _compact_locked(self, current: PoolSnapshot) -> PoolSnapshot:
+        """在已持有写锁时压缩"""
+        snapshot = PoolSnapshot.build(
+            current.version + 1, current, current.games, current.chunk_size, self.encoder)
+        self._current = snapshot
+        return snapshot
+
+    def _needs_compaction(self, snapshot: PoolSnapshot) -> bool:
+        """墓碑是否已多到需要压缩"""
+        return (snapshot.tombstones >= snapshot.chunk_size and
+                snapshot.tombstones > self.compact_ratio * snapshot.slot_count)
+
+    def add_user(self, user: UserProfile) -> PoolSnapshot:
+        """新增一个用户并发布新版本
+
+        Raises:
+            ValueError: 用户ID已存在
+        """
+        with self.writer() as writer:
+            writer.add_user(user)
+        return self.snapshot()
+
+    def update_user(self, user: UserProfile) -> PoolSnapshot:
+        """更新一个已有用户并发布新版本
+
+        Raises:
+            KeyError: 用户不存在
+        """
+        with self.writer() as writer:
+            writer.update_user(user)
+        return self.snapshot()
+
+    def remove_user(self, user_id: str) -> PoolSnapshot:
+        """删除一个用户并发布新版本
+
+        Raises:
+            KeyError: 用户不存在
+        """
+        with self.writer() as writer:
+            writer.remove_user(user_id)
+        return self.snapshot()
+
+class PoolWriter:
+    """写事务
+
+    在基础版本上累积修改；提交时只复制被修改的块和索引分片及其在块表、分片表中的路径，
+    其余部分与基础版本共享。
+    """
+
+    def __init__(self, pool: VersionedPool):
+        """开始写事务
+
+        Args:
+            pool: 多版本用户池
+        """
+        pool._write_lock.acquire()
+        self._pool = pool
+        self.base = pool.snapshot()
+        self._chunk_size = self.base.chunk_size
+        self._dirty: Dict[int, List[Optional[UserProfile]]] = {}
+        self._changed_rows: Dict[int, Set[int]] = {}
+        # 本事务中变为墓碑的槽位，提交时据此由旧块的存活槽位推出新块的
+        self._removed: Dict[int, List[int]] = {}
+        self._index_changes: Dict[str, Optional[int]] = {}
+        self._slot_count = self.base.slot_count
+        self._games = self.base.games
+        self._closed = False
+
+    def _position_of(self, user_id: str) -> Optional[int]:
+        """查找用户ID在本事务视角下的槽位号"""
+        position = self._index_changes.get(user_id, _UNCHANGED)
+        if position is _UNCHANGED:
+            return self.base.index.get(user_id)
+        return position
+
+    def _dirty_chunk(self, chunk_number: int) -> List[Optional[UserProfile]]:
+        """取得可修改的块副本（写时复制）"""
+        chunk = self._dirty.get(chunk_number)
+        if chunk is None:
+            if chunk_number < len(self.base.chunks):
+                chunk = list(self.base.chunks[chunk_number].users)
+            else:
+                chunk = []
+            self._dirty[chunk_number] = chunk
+            self._changed_rows[chunk_number] = set()
+        return chunk
+
+    def _live_rows(
+        self,
+        old: Optional[PoolChunk],
+        users: List[Optional[UserProfile]],
+        chunk_number: int
+    ) -> Optional[np.ndarray]:
+        """由旧块的存活槽位推出修改后的存活槽位，避免逐个检查全部槽位
+
+        旧块之后追加的槽位都存活，除非在本事务中又被删除。
+        新块返回 None，由 PoolChunk 自行计算。
+        """
+        if old is None:
+            return None
+        removed = self._removed.get(chunk_number)
+        if removed is None and len(users) == len(old.users):
+            return old.live_rows
+        alive = np.zeros(len(users), dtype=bool)
+        alive[old.live_rows] = True
+        alive[len(old.users):] = True
+        if removed is not None:
+            alive[removed] = False
+        return np.flatnonzero(alive)
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise RuntimeError("写事务已结束")
+
+    def get(self, user_id: str) -> Optional[UserProfile]:
+        """按本事务视角查找用户"""
+        position = self._position_of(user_id)
+        if position is None:
+            return None
+        chunk_number, offset = divmod(position, self._chunk_size)
+        chunk = self._dirty.get(chunk_number)
+        if chunk is not None:
+            return chunk[offset]
+        return self.base.chunks[chunk_number].users[offset]
+
+    def put(self, user: UserProfile) -> None:
+        """新增或替换用户
+
+        Args:
+            user: 用户档案，按 user_id 判断是否已存在
+        """
+        self._check_open()
+        position = self._position_of(user.user_id)
+        if position is None:
+            position = self._slot_count
+            self._slot_count += 1
+            self._index_changes[user.user_id] = position
+            chunk_number, offset = divmod(position, self._chunk_size)
+            self._dirty_chunk(chunk_number).append(user)
+        else:
+            chunk_number, offset = divmod(position, self._chunk_size)
+            self._dirty_chunk(chunk_number)[offset] = user
+        self._changed_rows[chunk_number].add(offset)
+
+    def patch(self, user_id: str, **fields: Any) -> bool:
+        """修改已有用户的部分字段，原用户档案不变
+
+        Args:
+            user_id: 用户ID
+            **fields: 要修改的字段，如 online_status='离线'
+
+        Returns:
+            bool: 用户是否存在
+        """
+        if self._closed:
+            raise RuntimeError("写事务已结束")
+        # 内联 _position_of()（事件流回放的热路径）
+        position = self._index_changes.get(user_id, _UNCHANGED)
+        if position is _UNCHANGED:
+            index = self.base.index
+            position = index.shards[hash(user_id) & index.mask].get(user_id)
+        if position is None:
+            return False
+        chunk_number, offset = divmod(position, self._chunk_size)
+        chunk = self._dirty.get(chunk_number)
+        if chunk is None:
+            chunk = self._dirty_chunk(chunk_number)
+        # 复制属性字典构造新档案，比经 __init__ 逐个传参快
+        user = object.__new__(UserProfile)
+        attributes = user.__dict__
+        attributes.update(chunk[offset].__dict__)
+        attributes.update(fields)
+        chunk[offset] = user
+        self._changed_rows[chunk_number].add(offset)
+        return True
+
+    def add_user(self, user: UserProfile) -> None:
+        """新增用户
+
+        Raises:
+            ValueError: 用户ID已存在
+        """
+        if self._position_of(user.user_id) is not None:
+            raise ValueError(f"用户已存在: {user.user_id}")
+        self.put(user)
+
+    def update_user(self, user: UserProfile) -> None:
+        """更新已有用户
+
+        Raises:
+            KeyError: 用户不存在
+        """
+        if self._position_of(user.user_id) is None:
+            raise KeyError(user.user_id)
+        self.put(user)
+
+    def remove_user(self, user_id: str) -> None:
+        """删除已有用户
+
+        Raises:
+            KeyError: 用户不存在
+        """
+        if not self.remove(user_id):
+            raise KeyError(user_id)
+
+    def remove(self, user_id: str) -> bool:
+        """删除用户，槽位留空
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            bool: 用户是否存在
+        """
+        self._check_open()
+        position = self._position_of(user_id)
+        if position is None:
+            return False
+        chunk_number, offset = divmod(position, self._chunk_size)
+        self._dirty_chunk(chunk_number)[offset] = None
+        self._changed_rows[chunk_number].discard(offset)
+        self._removed.setdefault(chunk_number, []).append(offset)
+        self._index_changes[user_id] = None
+        return True
+
+    def set_games(self, games: Iterable[GameProfile]) -> None:
+        """替换游戏档案，提交后的查询按新的游戏档案打分
+
+        带编码器的用户池提交时全部重新编码（游戏类型列随游戏档案变化），代价为 O(n)。
+        """
+        self._check_open()
+        self._games = tuple(games)
+
+    def commit(self) -> PoolSnapshot:
+        """提交修改并原子地发布新版本
+
+        Returns:
+            PoolSnapshot: 新发布的快照
+        """
+        self._check_open()
+        try:
+            encoder = self._pool.encoder
+            regames = encoder is not None and self._games is not self.base.games
+            if regames:
+                # 游戏档案变化时游戏类型列全部失效: 先不编码，发布前换用新的编码器整体重新编码
+                encoder = None
+            base_chunks = self.base.chunks
+            chunks: Dict[int, PoolChunk] = {}
+            size = self.base.size
+            for chunk_number, users in self._dirty.items():
+                encoded = None
+                old = base_chunks[chunk_number] if chunk_number < len(base_chunks) else None
+                if encoder is not None:
+                    changes = {offset: users[offset] for offset in self._changed_rows[chunk_number]}
+                    if old is not None and old.encoded is not None:
+                        encoded = old.encoded.updated(changes, len(users))
+                    else:
+                        encoded = encoder.encode([]).updated(changes, len(users))
+                chunk = chunks[chunk_number] = PoolChunk(
+                    tuple(users), encoded, self._live_rows(old, users, chunk_number))
+                size += chunk.live - (old.live if old is not None else 0)
+            snapshot = PoolSnapshot(
+                self.base.version + 1,
+                base_chunks.updated(chunks),
+                self.base.index.updated(self._index_changes),
+                self._games,
+                self._chunk_size,
+                encoder,
+                size,
+                self._slot_index(chunks)
+            )
+            if regames:
+                self._pool.encoder = _encoder_for(self._pool.encoder, self._games)
+                snapshot = PoolSnapshot.build(
+                    snapshot.version, snapshot, self._games, self._chunk_size, self._pool.encoder)
+            self._pool._current = snapshot
+            if self._pool._indexes:
+                upserted = [
+                    users[offset]
+                    for chunk_number, users in self._dirty.items()
+                    for offset in sorted(self._changed_rows[chunk_number])
+                    if users[offset] is not None
+                ]
+                removed = [user_id for user_id, position in self._index_changes.items() if position is None]
+                self._pool._notify(upserted, removed)
+            if self._pool._needs_compaction(snapshot):
+                snapshot = self._pool._compact_locked(snapshot)
+            return snapshot
+        finally:
+            self._close()
+
+    def _slot_index(self, chunks: Dict[int, PoolChunk]) -> Dict[Tuple[str, Any], PersistentVector]:
+        """增量维护二级索引: 只重算脏块中有槽位进出的 (分类列, 取值)
+
+        代价与变化的槽位数及受影响取值在这些块中的槽位数成正比，另复制一次顶层字典。
+        """
+        base = self.base.slot_index
+        base_chunks = self.base.chunks
+        changes: Dict[Tuple[str, Any], Dict[int, Optional[np.ndarray]]] = {}
+        for chunk_number, chunk in chunks.items():
+            old = base_chunks[chunk_number] if chunk_number < len(base_chunks) else None
+            added: Dict[Tuple[str, Any], List[int]] = {}
+            dropped: Dict[Tuple[str, Any], List[int]] = {}
+            for offset in self._changed_rows[chunk_number].union(self._removed.get(chunk_number, ())):
+                before = old.users[offset] if old is not None and offset < len(old.users) else None
+                after = chunk.users[offset]
+                for column, getter in CATEGORICAL_COLUMNS.items():
+                    old_value = _ABSENT if before is None else getter(before)
+                    new_value = _ABSENT if after is None else getter(after)
+                    if old_value == new_value:
+                        continue
+                    if old_value is not _ABSENT:
+                        dropped.setdefault((column, old_value), []).append(offset)
+                    if new_value is not _ABSENT:
+                        added.setdefault((column, new_value), []).append(offset)
+            for key in added.keys() | dropped.keys():
+                vector = base.get(key)
+                rows = vector[chunk_number] if vector is not None and chunk_number < len(vector) else None
+                if rows is None:
+                    rows = np.zeros(0, dtype=np.int64)
+                # 取值不同，离开的槽位必在旧行中、加入的槽位必不在，有序插删即可
+                if key in dropped:
+                    rows = np.delete(rows, np.searchsorted(rows, dropped[key]))
+                if key in added:
+                    offsets = np.sort(np.array(added[key], dtype=np.int64))
+                    rows = np.insert(rows, np.searchsorted(rows, offsets), offsets)
+                changes.setdefault(key, {})[chunk_number] = rows if len(rows) else None
+        if not changes:
+            return base
+        slot_index = dict(base)
+        for key, rows in changes.items():
+            vector = slot_index.get(key)
+            slot_index[key] = (PersistentVector() if vector is None else vector).updated(rows)
+        return slot_index
+
+    def abort(self) -> None:
+        """放弃修改"""
+        if not self._closed:
+            self._close()
+
+    def _close(self) -> None:
+        self._closed = True
+        self._pool._write_lock.release()
+
+    def __enter__(self) -> 'PoolWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None and not self._closed:
+            self.commit()
+        else:
+            self.abort()
@@ -0,0 +1,22 @@
+"""服务包
+
+在匹配系统之外提供面向请求的服务层
+"""
+
+from .singleflight import SingleFlight
+from .admission import AdmissionController, ServiceBusy, LANES
+from .matching_service import MatchingService
+from .metrics import MetricsRegistry, MetricsServer, Counter, Gauge, Histogram
+
+__all__ = [
+    'SingleFlight',
+    'AdmissionController',
+    'ServiceBusy',
+    'LANES',
+    'MatchingService',
+    'MetricsRegistry',
+    'MetricsServer',
+    'Counter',
+    'Gauge',
+    'Histogram'
+]
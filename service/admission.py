@@ -0,0 +1,183 @@
+"""准入控制模块
+
+为服务层提供并发上限、按优先级分道的有界等待队列和负载削减。
+过载时请求会被明确拒绝（ServiceBusy），而不是无限排队拖慢所有人
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+# 优先级从高到低的请求通道
+LANES = ('interactive', 'bulk')
+
+class ServiceBusy(Exception):
+    """服务繁忙，请求未被受理"""
+
+    def __init__(self, lane: str, reason: str):
+        """初始化异常
+
+        Args:
+            lane: 请求通道
+            reason: 拒绝原因，queue_full 为队列已满，queue_timeout 为排队超时
+        """
+        super().__init__(f"服务繁忙: {lane} 通道 {reason}")
+        self.lane = lane
+        self.reason = reason
+
+class AdmissionController:
+    """准入控制器
+
+    - 全局并发上限 max_concurrency，每个通道另有自己的并发上限，
+      批量通道的上限低于全局上限，为交互通道保留余量
+    - 每个通道一个有界 FIFO 队列；队列满时立即拒绝
+    - 排队超过通道的最长等待时间时放弃并拒绝，从而约束尾延迟
+    - 空出的执行槽优先分配给交互通道
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        lane_concurrency: Optional[Dict[str, int]] = None,
+        queue_limits: Optional[Dict[str, int]] = None,
+        max_queue_wait: Optional[Dict[str, float]] = None
+    ):
+        """初始化准入控制器
+
+        Args:
+            max_concurrency: 全局并发上限
+            lane_concurrency: 各通道并发上限，缺省时批量通道为全局上限的一半
+            queue_limits: 各通道队列长度上限
+            max_queue_wait: 各通道最长排队时间（秒）
+        """
+        self.max_concurrency = max_concurrency
+        self.lane_concurrency = {
+            'interactive': max_concurrency,
+            'bulk': max(1, max_concurrency // 2)
+        }
+        self.lane_concurrency.update(lane_concurrency or {})
+        self.queue_limits = {'interactive': 64, 'bulk': 16}
+        self.queue_limits.update(queue_limits or {})
+        self.max_queue_wait = {'interactive': 0.05, 'bulk': 1.0}
+        self.max_queue_wait.update(max_queue_wait or {})
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._queues: Dict[str, Deque[object]] = {lane: deque() for lane in LANES}
+        self._lane_in_flight = {lane: 0 for lane in LANES}
+        self._counters = {
+            lane: {
+                'admitted': 0,
+                'completed': 0,
+                'shed_queue_full': 0,
+                'shed_queue_timeout': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0
+            }
+            for lane in LANES
+        }
+
+    def _can_run(self, lane: str) -> bool:
+        """通道当前是否有空闲执行槽"""
+        return (self._in_flight < self.max_concurrency and
+                self._lane_in_flight[lane] < self.lane_concurrency[lane])
+
+    def _next_ticket(self) -> Optional[object]:
+        """下一个应当获得执行槽的排队请求"""
+        for lane in LANES:
+            if self._queues[lane] and self._can_run(lane):
+                return self._queues[lane][0]
+        return None
+
+    def _grant(self, lane: str, waited: float) -> None:
+        """分配执行槽并记录等待时间"""
+        self._in_flight += 1
+        self._lane_in_flight[lane] += 1
+        counters = self._counters[lane]
+        counters['admitted'] += 1
+        counters['wait_seconds_total'] += waited
+        counters['wait_seconds_max'] = max(counters['wait_seconds_max'], waited)
+
+    def acquire(self, lane: str = 'interactive') -> None:
+        """申请执行槽，必要时排队等待
+
+        Args:
+            lane: 请求通道
+
+        Raises:
+            ValueError: 未知通道
+            ServiceBusy: 队列已满或排队超时
+        """
+        if lane not in self._queues:
+            raise ValueError(f"未知的请求通道: {lane}")
+        with self._condition:
+            queue = self._queues[lane]
+            if not queue and self._can_run(lane) and self._next_ticket() is None:
+                self._grant(lane, 0.0)
+                return
+            if len(queue) >= self.queue_limits[lane]:
+                self._counters[lane]['shed_queue_full'] += 1
+                raise ServiceBusy(lane, 'queue_full')
+
+            ticket = object()
+            queue.append(ticket)
+            enqueued = time.monotonic()
+            deadline = enqueued + self.max_queue_wait[lane]
+            while True:
+                if self._next_ticket() is ticket:
+                    queue.popleft()
+                    self._grant(lane, time.monotonic() - enqueued)
+                    # 可能还有其他排队请求能够运行
+                    self._condition.notify_all()
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    self._counters[lane]['shed_queue_timeout'] += 1
+                    self._condition.notify_all()
+                    raise ServiceBusy(lane, 'queue_timeout')
+                self._condition.wait(remaining)
+
+    def release(self, lane: str = 'interactive') -> None:
+        """归还执行槽
+
+        Args:
+            lane: 请求通道
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._lane_in_flight[lane] -= 1
+            self._counters[lane]['completed'] += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = 'interactive') -> Iterator[None]:
+        """以上下文管理器形式占用执行槽
+
+        Args:
+            lane: 请求通道
+        """
+        self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release(lane)
+
+    def metrics(self) -> Dict[str, Any]:
+        """获取准入控制指标
+
+        Returns:
+            Dict[str, Any]: in_flight 为执行中的请求数；lanes 下按通道给出
+            队列深度、受理数、完成数、两类削减数和排队时间
+        """
+        with self._condition:
+            lanes = {}
+            for lane in LANES:
+                counters = dict(self._counters[lane])
+                counters['queue_depth'] = len(self._queues[lane])
+                counters['in_flight'] = self._lane_in_flight[lane]
+                counters['shed'] = counters['shed_queue_full'] + counters['shed_queue_timeout']
+                lanes[lane] = counters
+            return {'in_flight': self._in_flight, 'lanes': lanes}
@@ -0,0 +1,200 @@
+"""匹配服务模块
+
+按用户ID提供匹配查询，并对并发的相同查询做请求合并
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from models.user_profile import UserProfile
+from matching.matching_system import MatchingSystem
+from service.singleflight import SingleFlight
+from service.admission import AdmissionController, ServiceBusy
+from service.metrics import MetricsRegistry, instrumentation_collector
+from pool.snapshot import PoolSnapshot
+from pool.versioned_pool import VersionedPool
+
+class MatchingService:
+    """匹配服务
+
+    查询固定多版本用户池的一个快照。相同的 (user_id, top_n, 池版本, 通道) 查询并发到达时
+    只执行一次全池扫描，其余调用者共享结果；合并不跨通道，交互查询不会等待排在批量通道里的同一查询。
+    配置准入控制器后，实际执行的扫描需要先取得执行槽，过载时抛出 ServiceBusy。
+    配置指标注册表后，记录查询数、查询延迟与池替换次数，并在导出时采集池大小、
+    请求合并、准入控制与匹配计时（若匹配系统挂接了 Instrumentation）的统计。
+    """
+
+    def __init__(
+        self,
+        matching_system: MatchingSystem,
+        users: Union[VersionedPool, List[UserProfile]],
+        admission: Optional[AdmissionController] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        """初始化匹配服务
+
+        Args:
+            matching_system: 匹配系统
+            users: 多版本用户池，或用于创建多版本用户池的初始用户列表
+            admission: 准入控制器，None 表示不限制
+            metrics: 指标注册表，None 表示不记录指标
+        """
+        self.system = matching_system
+        self.admission = admission
+        self.metrics = metrics
+        self._singleflight = SingleFlight()
+        if isinstance(users, VersionedPool):
+            self.pool = users
+        else:
+            self.pool = VersionedPool(
+                users, matching_system.game_matcher.games, encoder=matching_system.encoder)
+        if metrics is not None:
+            self._queries = metrics.counter(
+                'gresy_queries_total', "匹配查询数", ('lane', 'outcome'))
+            self._latency = metrics.histogram(
+                'gresy_query_duration_seconds', "匹配查询延迟（秒），含排队与合并等待", ('lane',))
+            self._reloads = metrics.counter('gresy_pool_reloads_total', "用户池替换次数")
+            metrics.register_collector(self._collect_metrics)
+
+    @property
+    def pool_version(self) -> int:
+        """当前池版本号"""
+        return self.pool.version
+
+    def replace_pool(self, users: List[UserProfile]) -> int:
+        """替换用户池，池版本号加一
+
+        Args:
+            users: 新的用户池
+
+        Returns:
+            int: 新的池版本号
+        """
+        version = self.pool.replace(users).version
+        if self.metrics is not None:
+            self._reloads.inc()
+        return version
+
+    def find_matches(
+        self,
+        user_id: str,
+        top_n: int = 10,
+        lane: str = 'interactive'
+    ) -> List[Tuple[UserProfile, Dict[str, float]]]:
+        """为指定用户查找最佳匹配
+
+        Args:
+            user_id: 目标用户ID
+            top_n: 返回的最佳匹配数量
+            lane: 准入控制通道，interactive 为交互查询，bulk 为批量查询
+
+        Returns:
+            List[Tuple[UserProfile, Dict[str, float]]]:
+            (匹配用户, 匹配分数)列表，按总分降序排序。
+            合并的调用者共享分数字典，调用方不应修改它们。
+
+        Raises:
+            KeyError: 用户不在用户池中
+            ServiceBusy: 准入控制拒绝了该请求（同一通道内合并的调用者一并收到）
+        """
+        if self.metrics is None:
+            return self._find_matches(user_id, top_n, lane)
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = self._find_matches(user_id, top_n, lane)
+            outcome = 'ok'
+            return result
+        except KeyError:
+            outcome = 'not_found'
+            raise
+        except ServiceBusy:
+            outcome = 'busy'
+            raise
+        finally:
+            self._queries.inc(lane=lane, outcome=outcome)
+            self._latency.observe(time.perf_counter() - start, lane=lane)
+
+    def _find_matches(
+        self,
+        user_id: str,
+        top_n: int,
+        lane: str
+    ) -> List[Tuple[UserProfile, Dict[str, float]]]:
+        """查找最佳匹配（不记录指标）"""
+        snapshot = self.pool.snapshot()
+        target = snapshot.get(user_id)
+        if target is None:
+            raise KeyError(user_id)
+        result, _ = self._singleflight.do(
+            (user_id, top_n, snapshot.version, lane),
+            self._scan,
+            lane,
+            target,
+            snapshot,
+            top_n
+        )
+        return list(result)
+
+    def _scan(
+        self,
+        lane: str,
+        target: UserProfile,
+        users: PoolSnapshot,
+        top_n: int
+    ) -> List[Tuple[UserProfile, Dict[str, float]]]:
+        """在准入控制下执行一次全池扫描"""
+        if self.admission is None:
+            return self.system.find_best_matches(target, users, top_n)
+        with self.admission.slot(lane):
+            return self.system.find_best_matches(target, users, top_n)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取服务统计
+
+        Returns:
+            Dict[str, Any]: 池版本、池大小与请求合并计数
+        """
+        snapshot = self.pool.snapshot()
+        stats: Dict[str, Any] = {
+            'pool_version': snapshot.version,
+            'pool_size': len(snapshot),
+            'in_flight': self._singleflight.in_flight()
+        }
+        stats.update({
+            f'singleflight_{name}': value
+            for name, value in self._singleflight.counters().items()
+        })
+        if self.admission is not None:
+            stats['admission'] = self.admission.metrics()
+        return stats
+
+    def _collect_metrics(self) -> List[Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]]:
+        """导出时采集池、请求合并、准入控制与匹配计时的统计"""
+        stats = self.stats()
+        calls = stats['singleflight_calls']
+        families = [
+            ('gresy_pool_size', 'gauge', "当前用户池大小", [('', {}, stats['pool_size'])]),
+            ('gresy_pool_version', 'gauge', "当前用户池版本号", [('', {}, stats['pool_version'])]),
+            ('gresy_in_flight_queries', 'gauge', "执行中的去重查询数", [('', {}, stats['in_flight'])]),
+            ('gresy_singleflight_calls_total', 'counter', "请求合并的调用数，按执行或共享结果区分", [
+                ('', {'result': 'executed'}, stats['singleflight_executions']),
+                ('', {'result': 'shared'}, stats['singleflight_shared'])
+            ]),
+        ]
+        if calls:
+            families.append(('gresy_cache_hit_ratio', 'gauge', "缓存命中率",
+                             [('', {'cache': 'singleflight'}, stats['singleflight_shared'] / calls)]))
+        admission = stats.get('admission')
+        if admission is not None:
+            lanes = admission['lanes']
+            families.append(('gresy_admission_queue_depth', 'gauge', "准入控制各通道的排队数",
+                             [('', {'lane': lane}, counters['queue_depth']) for lane, counters in lanes.items()]))
+            families.append(('gresy_admission_requests_total', 'counter', "准入控制各通道的受理、完成与削减数", [
+                ('', {'lane': lane, 'result': result}, counters[result])
+                for lane, counters in lanes.items()
+                for result in ('admitted', 'completed', 'shed_queue_full', 'shed_queue_timeout')
+            ]))
+        if self.system.instrumentation is not None:
+            families.extend(instrumentation_collector(self.system.instrumentation)())
+        return families
@@ -0,0 +1,370 @@
+"""指标模块
+
+进程内的指标注册表，按 Prometheus 文本格式（0.0.4）导出，只依赖标准库。
+导出方式有两种: 本地 HTTP 端点（GET /metrics），或写成文件供批处理任务与
+node_exporter 的 textfile 收集器读取::
+
+    registry = MetricsRegistry()
+    server = registry.serve(port=9464)
+    ...
+    registry.write('/var/lib/node_exporter/gresy.prom')
+"""
+
+import math
+import os
+from abc import ABC, abstractmethod
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 缺省的延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_LABEL_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# 采集结果: (指标名, 类型, 说明, [(名称后缀, 标签, 值)])
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+def _format_value(value: float) -> str:
+    """格式化样本值"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+def _escape(value: str, quote: bool = True) -> str:
+    """转义说明文本与标签值中的反斜杠、换行（标签值另转义双引号）"""
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+class _Metric(ABC):
+    """指标基类: 按标签取值分别保存状态"""
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        """初始化指标
+
+        Args:
+            name: 指标名
+            documentation: 说明
+            labels: 标签名
+
+        Raises:
+            ValueError: 指标名或标签名不合法
+        """
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"指标名不合法: {name}")
+        for label in labels:
+            if not _LABEL_PATTERN.match(label) or label.startswith('__') or label == 'le':
+                raise ValueError(f"标签名不合法: {label}")
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """标签取值 -> 状态键"""
+        if set(labels) != set(self.labels):
+            raise ValueError(f"指标 {self.name} 的标签须为 {list(self.labels)}，实际为 {sorted(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """当前所有样本"""
+        pass
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """计数增加 amount
+
+        Raises:
+            ValueError: amount 为负
+        """
+        if amount < 0:
+            raise ValueError(f"计数器只能增加: {amount}")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """当前计数"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [('', dict(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    """可增可减、可直接设置的量"""
+
+    type = 'gauge'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """分桶直方图，另记总和与次数"""
+
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        """初始化直方图
+
+        Args:
+            buckets: 各桶上界（升序），+Inf 桶自动追加
+
+        Raises:
+            ValueError: 分桶为空或不是严格升序
+        """
+        super().__init__(name, documentation, labels)
+        bounds = [float(bound) for bound in buckets if not math.isinf(bound)]
+        if not bounds or any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError(f"分桶须非空且严格升序: {list(buckets)}")
+        self.buckets = tuple(bounds)
+
+    def observe(self, value: float, **labels) -> None:
+        """记录一个观测值"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """记录 with 块的耗时（秒），块内抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """观测次数"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        with self._lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in states:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                samples.append(('_bucket', dict(labels, le=_format_value(bound)), cumulative))
+            samples.append(('_bucket', dict(labels, le='+Inf'), count))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+class MetricsRegistry:
+    """指标注册表
+
+    counter() / gauge() / histogram() 按名称取得或创建指标；
+    register_collector() 注册在导出时才计算样本的回调，适合池大小、缓存命中率这类已有统计。
+    """
+
+    def __init__(self):
+        """初始化空注册表"""
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Sequence[str], **kwargs) -> Any:
+        """按名称取得或创建指标
+
+        Raises:
+            ValueError: 同名指标已以不同类型或标签注册
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **kwargs)
+            elif type(metric) is not cls or metric.labels != tuple(labels):
+                raise ValueError(f"指标 {name} 已注册为 {metric.type}{list(metric.labels)}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        """取得或创建计数器"""
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        """取得或创建量"""
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """取得或创建直方图"""
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """注册导出时调用的采集回调
+
+        Args:
+            collector: 返回 (指标名, 类型, 说明, [(名称后缀, 标签, 值)]) 序列的函数
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        """采集所有指标，同名指标合并样本"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families: Dict[str, Family] = {}
+        for metric in metrics:
+            families[metric.name] = (metric.name, metric.type, metric.documentation, metric.samples())
+        for collector in collectors:
+            for name, metric_type, documentation, samples in collector():
+                if name in families:
+                    families[name][3].extend(samples)
+                else:
+                    families[name] = (name, metric_type, documentation, list(samples))
+        return [families[name] for name in sorted(families)]
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式导出"""
+        lines = []
+        for name, metric_type, documentation, samples in self.collect():
+            lines.append(f'# HELP {name} {_escape(documentation, quote=False)}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for suffix, labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                label_text = '{' + label_text + '}' if label_text else ''
+                lines.append(f'{name}{suffix}{label_text} {_format_value(value)}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def write(self, path: str) -> None:
+        """把导出文本原子地写入文件（先写同目录临时文件再替换），读取方不会看到写了一半的内容"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(self.render())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def serve(self, port: int = 9464, host: str = '127.0.0.1') -> 'MetricsServer':
+        """在后台线程启动 HTTP 端点
+
+        Args:
+            port: 端口，0 表示由系统分配
+            host: 监听地址，缺省只监听本机
+
+        Returns:
+            MetricsServer: 已启动的服务器
+        """
+        return MetricsServer(self, host, port)
+
+class MetricsServer:
+    """导出指标的 HTTP 服务器，GET /metrics 返回 render() 的结果"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9464):
+        """绑定端口并在守护线程中开始服务"""
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/metrics/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        """实际监听的端口"""
+        return self._server.server_address[1]
+
+    def close(self) -> None:
+        """停止服务并释放端口"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+def instrumentation_collector(instrumentation) -> Callable[[], List[Family]]:
+    """把 matching.instrumentation.Instrumentation 的快照转换为指标
+
+    各项累计耗时与调用次数导出为 gresy_match_stage_seconds_total / gresy_match_stage_calls_total，
+    计数导出为 gresy_match_events_total，另给出打分阶段缓存的命中率 gresy_cache_hit_ratio{cache="stages"}。
+    """
+    def collect() -> List[Family]:
+        snapshot = instrumentation.snapshot()
+        timings = snapshot['timings']
+        counters = snapshot['counters']
+        families = [
+            ('gresy_match_stage_seconds_total', 'counter', "匹配各阶段的累计耗时（秒）",
+             [('', {'stage': name}, entry['seconds']) for name, entry in timings.items()]),
+            ('gresy_match_stage_calls_total', 'counter', "匹配各阶段的调用次数",
+             [('', {'stage': name}, entry['calls']) for name, entry in timings.items()]),
+            ('gresy_match_events_total', 'counter', "匹配过程中的扫描、剪枝、缓存等计数",
+             [('', {'event': name}, value) for name, value in counters.items()]),
+        ]
+        lookups = counters.get('stages_cache_hits', 0) + counters.get('stages_cache_misses', 0)
+        if lookups:
+            families.append(('gresy_cache_hit_ratio', 'gauge', "缓存命中率",
+                             [('', {'cache': 'stages'}, counters.get('stages_cache_hits', 0) / lookups)]))
+        return families
+    return collect
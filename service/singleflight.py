@@ -0,0 +1,92 @@
+"""请求合并模块
+
+同一个键的计算正在进行时，后到的调用者等待并共享其结果，而不是重复计算
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class SingleFlight:
+    """单飞请求合并器
+
+    对同一个键，任意时刻最多只有一个计算在执行。计算结束后键立即释放，
+    之后的调用会重新计算，因此这里只合并并发请求，不做缓存。
+    """
+
+    def __init__(self):
+        """初始化请求合并器"""
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._calls = 0
+        self._executions = 0
+        self._shared = 0
+
+    def do(
+        self,
+        key: Hashable,
+        function: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Tuple[Any, bool]:
+        """执行或等待与键对应的计算
+
+        Args:
+            key: 合并键
+            function: 计算函数
+            *args: 计算函数的位置参数
+            timeout: 等待其他调用者计算结果的超时时间（秒），None 表示一直等待
+            **kwargs: 计算函数的关键字参数
+
+        Returns:
+            Tuple[Any, bool]: (计算结果, 是否共享了其他调用者的计算)
+
+        Raises:
+            concurrent.futures.TimeoutError: 等待超时
+            Exception: 计算函数抛出的异常会传递给所有等待者
+        """
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._executions += 1
+            else:
+                self._shared += 1
+
+        if not leader:
+            return future.result(timeout=timeout), True
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def in_flight(self) -> int:
+        """正在执行的计算数量"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def counters(self) -> Dict[str, int]:
+        """获取计数器
+
+        Returns:
+            Dict[str, int]: calls 为调用总数，executions 为实际计算次数，
+            shared 为共享结果、被节省下来的计算次数
+        """
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'executions': self._executions,
+                'shared': self._shared
+            }
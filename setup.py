@@ -10,5 +10,5 @@ setup(
         'numpy',
         'pandas'
     ],
-    python_requires='>=3.6'
+    python_requires='>=3.8'
 ) 
\ No newline at end of file
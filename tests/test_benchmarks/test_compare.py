@@ -0,0 +1,88 @@
+"""基准对比与回归门禁测试"""
+
+import json
+
+import pytest
+
+from benchmarks.compare import aggregate, compare, format_diff, interval, main
+
+def make_report(ops_per_sec, p50_ms, benchmark='match_users', size=1000, samples=None):
+    return {'meta': {}, 'results': [{
+        'benchmark': benchmark, 'size': size, 'ops': 10,
+        'ops_per_sec': ops_per_sec, 'mean_ms': 1000.0 / ops_per_sec,
+        'p50_ms': p50_ms, 'p95_ms': p50_ms * 2, 'p99_ms': p50_ms * 3,
+        'peak_memory_bytes': 1024, 'samples_ms': samples or []
+    }]}
+
+def rounds(values, p50_ms=1.0):
+    return aggregate([make_report(value, p50_ms) for value in values])
+
+def status_of(rows, metric):
+    return next(row['status'] for row in rows if row['metric'] == metric)
+
+def test_interval():
+    result = interval([10.0, 12.0, 14.0])
+    assert result['mean'] == pytest.approx(12.0)
+    assert result['low'] < 12.0 < result['high']
+    assert interval([5.0])['low'] == interval([5.0])['high'] == 5.0
+
+def test_regression_detected():
+    rows = compare(rounds([1000, 1010, 990]), rounds([700, 705, 695]), threshold=10)
+    assert status_of(rows, 'ops_per_sec') == 'regressed'
+    assert status_of(rows, 'p50_ms') == 'ok'
+
+def test_improvement_and_latency_direction():
+    rows = compare(rounds([1000, 1010, 990], p50_ms=2.0), rounds([1500, 1510, 1490], p50_ms=1.0))
+    assert status_of(rows, 'ops_per_sec') == 'improved'
+    assert status_of(rows, 'p50_ms') == 'improved'
+    rows = compare(rounds([1000, 1000], p50_ms=1.0), rounds([1000, 1000], p50_ms=2.0))
+    assert status_of(rows, 'p50_ms') == 'regressed'
+
+def test_difference_is_tested_not_interval_overlap():
+    # 各自的 95% 区间重叠，但差值的 Welch 检验显著
+    base, now = rounds([1000, 1040, 960]), rounds([880, 920, 840])
+    base_ops = base['benchmarks']['match_users@1000']['ops_per_sec']
+    now_ops = now['benchmarks']['match_users@1000']['ops_per_sec']
+    assert now_ops['high'] > base_ops['low']
+    assert status_of(compare(base, now, threshold=10), 'ops_per_sec') == 'regressed'
+
+def test_noisy_change_is_not_regression():
+    rows = compare(rounds([1000, 1400, 600]), rounds([800, 1200, 400]), threshold=10)
+    assert status_of(rows, 'ops_per_sec') == 'noise'
+
+def test_new_and_missing():
+    baseline = aggregate([make_report(1000, 1.0, benchmark='match_type')])
+    rows = compare(baseline, rounds([1000]), metrics=['ops_per_sec'])
+    assert {(row['benchmark'], row['status']) for row in rows} == {
+        ('match_users@1000', 'new'), ('match_type@1000', 'missing')}
+    assert 'match_type@1000' in format_diff(rows)
+
+def test_single_round_uses_samples():
+    report = make_report(1000, 1.0, samples=[0.9, 1.0, 1.1, 1.0])
+    metrics = aggregate([report])['benchmarks']['match_users@1000']
+    assert metrics['ops_per_sec']['low'] < 1000 < metrics['ops_per_sec']['high']
+
+def test_single_round_percentiles_are_bootstrapped():
+    samples = [1.0 + 0.01 * (i % 7) for i in range(50)] + [3.0]
+    metrics = aggregate([make_report(1000, 1.03, samples=samples)])['benchmarks']['match_users@1000']
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+        assert metrics[metric]['se'] > 0
+        assert metrics[metric]['low'] < metrics[metric]['high']
+
+def test_single_round_without_samples_is_unverified():
+    rows = compare(rounds([1000]), rounds([500], p50_ms=2.0), threshold=10)
+    assert status_of(rows, 'ops_per_sec') == 'unverified'
+    assert status_of(rows, 'p50_ms') == 'unverified'
+
+def test_main_exit_codes(tmp_path, capsys):
+    baseline = tmp_path / 'baseline.json'
+    current = tmp_path / 'current.json'
+    slower = tmp_path / 'slower.json'
+    samples = [0.95, 1.0, 1.05, 1.0, 0.98, 1.02]
+    current.write_text(json.dumps(make_report(1000, 1.0, samples=samples)), encoding='utf-8')
+    slower.write_text(json.dumps(make_report(500, 2.0, samples=[2 * value for value in samples])),
+                      encoding='utf-8')
+    assert main(['--current', str(current), '--save-baseline', str(baseline)]) == 0
+    assert main(['--current', str(current), '--baseline', str(baseline)]) == 0
+    assert main(['--current', str(slower), '--baseline', str(baseline), '--threshold', '20']) == 1
+    assert 'REGRESSED' in capsys.readouterr().out
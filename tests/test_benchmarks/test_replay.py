@@ -0,0 +1,85 @@
+"""请求回放压测测试"""
+
+import json
+import time
+import pytest
+from benchmarks.replay import (
+    CLOSED, OPEN, ReplayRunner, load_requests, synthesize_requests, system_target, write_requests
+)
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from service.admission import ServiceBusy
+
+def _write(path, lines):
+    path.write_text('\n'.join(json.dumps(line) for line in lines) + '\n', encoding='utf-8')
+    return str(path)
+
+def test_load_requests(tmp_path):
+    """测试读取请求: 缺省值、ISO 时间戳与错误行号"""
+    path = _write(tmp_path / 'requests.jsonl', [
+        {'user_id': 'a', 'timestamp': 10},
+        {'user_id': 'b', 'top_n': 3, 'timestamp': '1970-01-01T00:00:12Z', 'lane': 'bulk'},
+    ])
+    requests = load_requests(path)
+    assert requests[0] == {'user_id': 'a', 'top_n': 10, 'timestamp': 10.0, 'lane': 'interactive'}
+    assert requests[1]['timestamp'] == 12.0 and requests[1]['lane'] == 'bulk'
+
+    bad = _write(tmp_path / 'bad.jsonl', [{'user_id': 'a'}, {'top_n': 3}])
+    with pytest.raises(ValueError, match='第 2 行'):
+        load_requests(bad)
+
+def test_synthesize_round_trip(tmp_path):
+    """测试生成的请求可写出并读回，时间戳递增"""
+    records = synthesize_requests(['a', 'b', 'c'], 50, rate=100.0, seed=1)
+    path = str(tmp_path / 'requests.jsonl')
+    assert write_requests(path, records) == 50
+    requests = load_requests(path)
+    timestamps = [request['timestamp'] for request in requests]
+    assert timestamps == sorted(timestamps)
+    assert {request['user_id'] for request in requests} <= {'a', 'b', 'c'}
+    assert records == synthesize_requests(['a', 'b', 'c'], 50, rate=100.0, seed=1)
+
+def test_schedule():
+    """测试开环发出时间按 speed 缩放或按 rate 均匀分布"""
+    requests = [{'timestamp': t} for t in (100.0, 101.0, 103.0)]
+    assert ReplayRunner(lambda r, d: None, speed=2.0).schedule(requests) == [0.0, 0.5, 1.5]
+    assert ReplayRunner(lambda r, d: None, rate=4.0).schedule(requests) == [0.0, 0.25, 0.5]
+    with pytest.raises(ValueError):
+        ReplayRunner(lambda r, d: None).schedule([{'timestamp': None}])
+
+def test_open_loop_counts_queueing_as_latency():
+    """测试开环模式: 目标跟不上时延迟包含排队，超时按计划时刻计算"""
+    def slow(request, deadline):
+        time.sleep(0.02)
+
+    requests = [{'user_id': str(i), 'top_n': 1, 'timestamp': i * 0.001, 'lane': 'interactive'} for i in range(20)]
+    report = ReplayRunner(slow, OPEN, max_workers=1, timeout=0.1).run(requests)
+    assert report['completed'] == 20
+    assert report['latency_ms']['max'] > report['service_time_ms']['max'] * 2
+    assert report['timeouts'] > 0
+    assert report['offered_rate'] > 500
+
+def test_closed_loop_errors():
+    """测试闭环模式的错误分类"""
+    def flaky(request, deadline):
+        if request['user_id'] == 'missing':
+            raise KeyError(request['user_id'])
+        if request['user_id'] == 'busy':
+            raise ServiceBusy('interactive', 'queue_full')
+
+    requests = [{'user_id': user_id, 'top_n': 1, 'timestamp': None, 'lane': 'interactive'}
+                for user_id in ('ok', 'missing', 'busy', 'ok')]
+    report = ReplayRunner(flaky, CLOSED, concurrency=2).run(requests)
+    assert report['completed'] == 2
+    assert report['errors'] == {'busy_queue_full': 1, 'not_found': 1}
+    assert report['error_rate'] == 0.5
+
+def test_system_target():
+    """测试回放到匹配系统"""
+    pools_loader = LoaderManager().pools_loader
+    users = pools_loader.load_user_pool()
+    target = system_target(MatchingSystem(pools_loader.load_game_pool()), users)
+    requests = [{'user_id': user.user_id, 'top_n': 3, 'timestamp': None, 'lane': 'interactive'} for user in users]
+    report = ReplayRunner(target, CLOSED, concurrency=2).run(requests)
+    assert report['completed'] == len(users)
+    assert report['throughput'] > 0
@@ -0,0 +1,47 @@
+"""基准测试套件测试"""
+
+import json
+
+import pytest
+
+from benchmarks.suite import BENCHMARKS, BenchmarkSuite, main, summarize, time_operation
+
+def test_summarize():
+    summary = summarize([0.001] * 98 + [0.002, 0.010])
+    assert summary['ops'] == 100
+    assert summary['p50_ms'] == pytest.approx(1.0)
+    assert summary['p99_ms'] > summary['p95_ms'] >= summary['p50_ms']
+    assert summary['ops_per_sec'] == pytest.approx(100 / 0.11)
+    assert summarize([])['ops'] == 0
+
+def test_time_operation_bounds():
+    calls = []
+    assert len(time_operation(calls.append, min_time=0.0, max_ops=10, min_ops=4)) == 4
+    assert calls == [0, 1, 2, 3]
+    assert len(time_operation(lambda index: None, min_time=10.0, max_ops=5, min_ops=1)) == 5
+
+def test_run_reports_every_benchmark():
+    suite = BenchmarkSuite(sizes=[50, 80], min_time=0.0, max_ops=3, min_ops=2)
+    report = suite.run()
+    keys = [(result['benchmark'], result['size']) for result in report['results']]
+    assert ('matching_system_init', None) in keys
+    for name, scaled in BENCHMARKS.items():
+        if scaled:
+            assert (name, 50) in keys and (name, 80) in keys
+    for result in report['results']:
+        assert result['ops'] == 2
+        assert len(result['samples_ms']) == 2
+        assert result['ops_per_sec'] > 0
+        assert result['peak_memory_bytes'] >= 0
+    assert report['meta']['sizes'] == [50, 80]
+
+def test_unknown_benchmark():
+    with pytest.raises(ValueError):
+        BenchmarkSuite(benchmarks=['sort'])
+
+def test_main_writes_json(tmp_path):
+    output = tmp_path / 'results.json'
+    assert main(['--sizes', '30', '--benchmarks', 'match_users', 'load_pool',
+                 '--min-time', '0', '--max-ops', '2', '--output', str(output)]) == 0
+    report = json.loads(output.read_text(encoding='utf-8'))
+    assert [result['benchmark'] for result in report['results']] == ['match_users', 'load_pool']
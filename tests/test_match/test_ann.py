@@ -0,0 +1,115 @@
+"""近似最近邻索引测试模块"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.ann import FeatureEmbedding, IVFIndex, kmeans
+from models.user_profile import UserProfile
+
+class TestIVFIndex(unittest.TestCase):
+    """IVF 索引测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+        self.index = IVFIndex(self.system, self.users, n_lists=4, nprobe=1, seed=3)
+
+    def test_embedding_tracks_total_score(self):
+        """测试嵌入内积与精确总分高度相关"""
+        vectors = self.index.embedding.embed(self.users)
+        encoded = self.system.encoder.encode(self.users)
+        for target_row, target in enumerate(self.users):
+            exact = encoded.score(self.system.encoder.encode_query(target))['total_score']
+            approximate = vectors @ vectors[target_row]
+            self.assertGreater(np.corrcoef(exact, approximate)[0, 1], 0.8)
+
+    def test_batch_embedding_matches_single_users(self):
+        """测试按编码池批量计算的嵌入与逐个用户计算一致，重建的嵌入须给出编码器"""
+        embedding = self.index.embedding
+        vectors = embedding.embed(self.users)
+        for row, user in enumerate(self.users):
+            np.testing.assert_allclose(embedding.embed([user])[0], vectors[row], atol=1e-6)
+        np.testing.assert_allclose(
+            embedding.embed_encoded(self.system.encoder.encode(self.users)), vectors)
+
+        restored = FeatureEmbedding.from_state(*embedding.state())
+        with self.assertRaises(ValueError):
+            restored.embed(self.users)
+        np.testing.assert_allclose(restored.embed(self.users, self.system.encoder), vectors)
+
+    def test_probe_all_lists_is_exact(self):
+        """测试探查全部簇时与完整扫描一致"""
+        for target in self.users:
+            expected = self.system.find_best_matches(target, self.users, top_n=5)
+            matches = self.index.find_best_matches(target, top_n=5, nprobe=self.index.n_lists)
+            self.assertEqual([user.user_id for user, _ in matches], [user.user_id for user, _ in expected])
+        report = self.index.measure_recall(self.users, top_n=5, nprobe=self.index.n_lists)
+        self.assertEqual(report['recall'], 1.0)
+
+    def test_nprobe_limits_candidates(self):
+        """测试 nprobe 较小时只扫描部分用户，召回率报告在 [0,1] 内"""
+        report = self.index.measure_recall(self.users, top_n=3)
+        self.assertLess(report['pool_fraction'], 1.0)
+        self.assertGreaterEqual(report['recall'], report['min_recall'])
+        self.assertLessEqual(report['recall'], 1.0)
+
+    def test_add_and_remove(self):
+        """测试增删用户"""
+        target = self.users[0]
+        self.assertTrue(self.index.remove(target.user_id))
+        self.assertFalse(self.index.remove(target.user_id))
+        self.assertEqual(len(self.index), len(self.users) - 1)
+        for user in self.users[1:]:
+            candidates = self.index.candidates(user, nprobe=self.index.n_lists)
+            self.assertNotIn(target.user_id, [candidate.user_id for candidate in candidates])
+        self.index.add(target)
+        self.assertEqual(len(self.index), len(self.users))
+        self.assertIn(target.user_id, [user.user_id for user in self.index.users])
+
+    def test_churn_reuses_rows(self):
+        """测试反复增删时嵌入行被复用，行数上界保持不变"""
+        rng = np.random.default_rng(5)
+        live = {user.user_id: user for user in self.users}
+        bound = self.index.doc_bound
+        for step in range(300):
+            user = self.users[int(rng.integers(len(self.users)))]
+            removed = [user_id for user_id in list(live)[:2] if rng.random() < 0.8]
+            for user_id in removed:
+                del live[user_id]
+            upserted = [UserProfile(**dict(vars(user), user_id=f"{user.user_id}_{step}"))]
+            upserted = upserted[:len(removed)]
+            live.update((added.user_id, added) for added in upserted)
+            self.index.apply(upserted, removed)
+            self.assertEqual(self.index.doc_bound, bound)
+        self.assertEqual(len(self.index), len(live))
+        candidates = self.index.candidates(self.users[0], nprobe=self.index.n_lists)
+        self.assertEqual(sorted(user.user_id for user in candidates), sorted(live))
+
+    def test_save_and_load(self):
+        """测试保存后加载的索引给出相同结果"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.npz')
+            self.index.save(path)
+            loaded = IVFIndex.load(path, self.system)
+        self.assertEqual(loaded.n_lists, self.index.n_lists)
+        self.assertEqual(loaded.nprobe, self.index.nprobe)
+        for target in self.users:
+            self.assertEqual(
+                [user.user_id for user in loaded.candidates(target)],
+                [user.user_id for user in self.index.candidates(target)]
+            )
+
+    def test_kmeans_separates_clusters(self):
+        """测试 k-means 能分开明显分离的簇"""
+        rng = np.random.default_rng(0)
+        vectors = np.concatenate([rng.normal(0, 0.1, (50, 2)), rng.normal(10, 0.1, (50, 2))])
+        centroids = kmeans(vectors, 2, seed=0)
+        self.assertEqual(sorted(np.round(centroids[:, 0]).tolist()), [0.0, 10.0])
+
+if __name__ == '__main__':
+    unittest.main()
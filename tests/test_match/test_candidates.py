@@ -0,0 +1,127 @@
+"""两阶段匹配测试模块"""
+
+import unittest
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.candidates import CandidateIndex, TwoStageMatcher, DEFAULT_FAN_OUT
+from models.user_profile import UserProfile
+from pool.versioned_pool import VersionedPool
+
+class TestTwoStageMatcher(unittest.TestCase):
+    """两阶段匹配测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+        self.index = CandidateIndex(self.system, self.users)
+
+    def test_sources_respect_fan_out(self):
+        """测试每个来源的召回数量不超过配置，且只召回键为正的用户"""
+        target = self.users[0]
+        for source in DEFAULT_FAN_OUT:
+            keys = getattr(self.index, source)(target)
+            positions = self.index.retrieve(target, {source: 3})
+            self.assertLessEqual(len(positions), 3)
+            for position in positions:
+                self.assertGreater(keys[position], 0)
+                self.assertNotEqual(self.users[position], target)
+
+    def test_sources_rank_by_key(self):
+        """测试每个来源召回的用户键都不低于未召回的用户，目标用户按ID排除"""
+        for target in self.users[:10]:
+            copy = UserProfile(**vars(target))
+            for source in DEFAULT_FAN_OUT:
+                keys = getattr(self.index, source)(target)
+                for limit in (1, 3, 6):
+                    positions = set(self.index.retrieve(copy, {source: limit}).tolist())
+                    others = [position for position, user in enumerate(self.users)
+                              if user.user_id != target.user_id and keys[position] > 0]
+                    self.assertEqual(len(positions), min(limit, len(others)))
+                    rest = [keys[position] for position in others if position not in positions]
+                    if positions and rest:
+                        self.assertGreaterEqual(min(keys[position] for position in positions), max(rest))
+
+    def test_server_source_prefers_same_server(self):
+        """测试服务器来源优先召回同服务器用户"""
+        target = self.users[0]
+        same_server = [user for user in self.users[1:] if user.play_region == target.play_region]
+        positions = self.index.retrieve(target, {'server_group': len(same_server)})
+        self.assertEqual(
+            sorted(self.users[position].user_id for position in positions),
+            sorted(user.user_id for user in same_server)
+        )
+
+    def test_unknown_source(self):
+        """测试未知的召回来源"""
+        with self.assertRaises(ValueError):
+            self.index.retrieve(self.users[0], {'zodiac': 10})
+
+    def test_full_fan_out_matches_exhaustive(self):
+        """测试召回预算覆盖全池时与完整扫描一致，召回率为1"""
+        matcher = TwoStageMatcher(self.system, self.users)
+        for target in self.users:
+            candidates = matcher.index.retrieve(target, matcher.fan_out)
+            retrievable = [
+                user for user in self.users
+                if user != target and any(
+                    getattr(self.index, source)(target)[self.users.index(user)] > 0
+                    for source in DEFAULT_FAN_OUT)
+            ]
+            self.assertEqual(len(candidates), len(retrievable))
+        report = matcher.measure_recall(self.users, top_n=3)
+        self.assertEqual(report['recall'], 1.0)
+        self.assertGreater(report['candidates'], 0)
+
+    def test_small_budget_reports_recall(self):
+        """测试小预算时召回率报告在 [0,1] 内"""
+        matcher = TwoStageMatcher(self.system, self.users, {'server_group': 2, 'shared_games': 2})
+        report = matcher.measure_recall(self.users, top_n=5)
+        self.assertLessEqual(report['candidates'], 4)
+        self.assertGreaterEqual(report['recall'], report['min_recall'])
+        self.assertLessEqual(report['recall'], 1.0)
+
+    def test_incremental_updates_match_rebuild(self):
+        """测试增量增删改后召回结果与重新构建的索引一致，空出的位置被复用"""
+        index = CandidateIndex(self.system, self.users)
+        removed = self.users[::3]
+        changed = [UserProfile(**dict(vars(user), play_region=self.users[0].play_region, games=["原神"]))
+                   for user in self.users[1::3]]
+        index.apply(changed, [user.user_id for user in removed])
+        added = [UserProfile(**dict(vars(user), user_id=user.user_id + "_new")) for user in removed]
+        index.apply(added, ())
+        self.assertEqual(index.size, len(self.users))
+
+        rebuilt = CandidateIndex(self.system, index.users)
+        for target in self.users[:10]:
+            for source in DEFAULT_FAN_OUT:
+                fan_out = {source: len(self.users)}
+                ids = lambda idx: sorted(user.user_id for user in idx.users_at(idx.retrieve(target, fan_out)))
+                self.assertEqual(ids(index), ids(rebuilt))
+
+    def test_shared_games_key_is_preference_score(self):
+        """测试共同游戏来源的召回键与 match_preference 一致"""
+        matcher = self.system.game_matcher
+        for target in self.users[:10]:
+            keys = self.index.shared_games(target)
+            for position, user in enumerate(self.users):
+                self.assertAlmostEqual(keys[position], matcher.match_preference(target, user), places=12)
+
+    def test_attached_index_follows_pool(self):
+        """测试挂接到多版本用户池的索引随提交更新共同游戏召回"""
+        pool = VersionedPool(self.users)
+        matcher = TwoStageMatcher(self.system, pool.snapshot())
+        pool.attach(matcher.index)
+        target, other = self.users[0], self.users[1]
+        with pool.writer() as writer:
+            writer.patch(other.user_id, games=list(target.games))
+            writer.remove(self.users[2].user_id)
+        positions = matcher.index.retrieve(target, {'shared_games': 1})
+        self.assertEqual([user.user_id for user in matcher.index.users_at(positions)], [other.user_id])
+        self.assertEqual(
+            sorted(user.user_id for user in matcher.users),
+            sorted(user.user_id for user in pool.snapshot()))
+
+if __name__ == '__main__':
+    unittest.main()
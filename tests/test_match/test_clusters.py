@@ -0,0 +1,96 @@
+"""聚类剪枝匹配测试模块"""
+
+import unittest
+import numpy as np
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.clusters import ClusterIndex, EXACT, FAST
+from pool.generator import PoolGenerator
+
+class TestClusterIndex(unittest.TestCase):
+    """聚类剪枝匹配测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+        self.index = ClusterIndex(self.system, self.users, k=4, samples=3, sample_size=10)
+
+    def test_partition(self):
+        """测试每个用户恰好属于一个簇，中心点属于自己的簇"""
+        positions = np.sort(np.concatenate(self.index.members))
+        self.assertEqual(positions.tolist(), list(range(len(self.users))))
+        for medoid, members in zip(self.index.medoids, self.index.members):
+            self.assertIn(medoid, members)
+
+    def test_assignment_is_best_medoid(self):
+        """测试每个用户分到总分最高的中心点，cost 与逐对打分一致"""
+        cost = 0.0
+        for c, members in enumerate(self.index.members):
+            for position in members:
+                user = self.users[position]
+                scores = [self.system.match_users(self.users[m], user)['total_score'] for m in self.index.medoids]
+                self.assertAlmostEqual(scores[c], max(scores), places=9)
+                cost += 1.0 - scores[c]
+        self.assertAlmostEqual(self.index.cost, cost, places=6)
+
+    def test_bounds_are_upper_bounds(self):
+        """测试簇上界不低于簇内任意用户的精确总分"""
+        for target in self.users:
+            query = self.system.encoder.encode_query(target)
+            bounds = self.index.bounds(query)
+            for c, members in enumerate(self.index.members):
+                for position in members:
+                    total = self.system.match_users(target, self.users[position])['total_score']
+                    self.assertLessEqual(total, bounds[c])
+            bounds = self.index.cell_bounds(query)
+            for c, cell in enumerate(self.index.cells):
+                for position in cell:
+                    total = self.system.match_users(target, self.users[position])['total_score']
+                    self.assertLessEqual(total, bounds[c])
+
+    def test_exact_mode_matches_exhaustive(self):
+        """测试精确模式与完整扫描一致（含同分顺序）"""
+        for k in (1, 3, 6):
+            index = ClusterIndex(self.system, self.users, k=k)
+            for target in self.users:
+                for top_n in (1, 5):
+                    expected = self.system.find_best_matches(target, self.users, top_n)
+                    matches = index.find_best_matches(target, top_n, mode=EXACT)
+                    self.assertEqual(
+                        [(user.user_id, scores) for user, scores in matches],
+                        [(user.user_id, scores) for user, scores in expected]
+                    )
+
+    def test_exact_mode_skips_cells(self):
+        """测试生成的用户池上精确模式跳过大部分用户且结果与完整扫描一致"""
+        users = list(PoolGenerator(seed=1).users(2000))
+        index = ClusterIndex(self.system, users, k=20)
+        self.assertTrue(index.split_columns)
+        for target in users[:5]:
+            expected = self.system.find_best_matches(target, users, 10)
+            matches = index.find_best_matches(target, 10, mode=EXACT)
+            self.assertLess(matches.pool_size, len(users) // 2)
+            self.assertEqual(
+                [(user.user_id, scores) for user, scores in matches],
+                [(user.user_id, scores) for user, scores in expected]
+            )
+
+    def test_fast_mode_scans_top_clusters(self):
+        """测试快速模式只扫描指定数量的簇，扫描全部簇时召回率为1"""
+        report = self.index.measure(self.users, top_n=3, mode=FAST, clusters=1)
+        self.assertLess(report['pool_fraction'], 1.0)
+        self.assertLessEqual(report['min_recall'], report['recall'])
+        report = self.index.measure(self.users, top_n=3, mode=FAST, clusters=len(self.index))
+        self.assertEqual(report['recall'], 1.0)
+
+    def test_invalid_arguments(self):
+        """测试非法参数"""
+        with self.assertRaises(ValueError):
+            ClusterIndex(self.system, self.users, k=0)
+        with self.assertRaises(ValueError):
+            self.index.find_best_matches(self.users[0], mode='approximate')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""差分等价测试模块的测试"""
+
+import unittest
+from loaders import LoaderManager
+from matching import differential
+from matching.differential import CaseGenerator, compare, run
+from matching.matching_system import MatchingSystem
+
+class TestDifferential(unittest.TestCase):
+    """差分等价测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        self.system = MatchingSystem(LoaderManager().pools_loader.load_game_pool())
+
+    def test_generator_deterministic(self):
+        """测试同一种子生成相同的用例，且覆盖表外取值与并列用户"""
+        cases = [CaseGenerator(seed=3).case() for _ in range(2)]
+        self.assertEqual(cases[0], cases[1])
+
+        generator = CaseGenerator(seed=3)
+        users = [user for _ in range(30) for user in generator.case()['users']]
+        self.assertTrue(any(user['游玩固定时间'] == '未知时段' for user in users))
+        self.assertTrue(any(user['游戏'] == [] for user in users))
+        fields = [tuple((k, str(v)) for k, v in user.items() if k != 'id') for user in users]
+        self.assertLess(len(set(fields)), len(fields))
+
+    def test_engines_agree(self):
+        """测试各快速实现在随机用例上与参照实现一致"""
+        report = run(self.system, runs=40, seed=1, max_size=20)
+        self.assertEqual(report['failures'], [])
+        self.assertEqual(report['cases'] + report['skipped'], 40)
+
+    def test_shrink_broken_engine(self):
+        """测试故意出错的实现被发现并收缩为最小用例"""
+        def broken(system, target, users, top_n):
+            # 把首个游戏为空的候选排到最前
+            ranked = [(user.user_id, system.match_users(target, user)['total_score'])
+                      for user in users if user != target]
+            ranked.sort(key=lambda item: item[1], reverse=True)
+            empty = [item for item in ranked
+                     if not next(u for u in users if u.user_id == item[0]).games]
+            if empty:
+                ranked.remove(empty[0])
+                ranked.insert(0, empty[0])
+            return ranked[:top_n]
+
+        differential.RANKING_ENGINES['broken'] = broken
+        try:
+            report = run(self.system, runs=200, seed=2, engines=('broken',))
+            self.assertEqual(len(report['failures']), 1)
+            failure = report['failures'][0]
+            self.assertEqual(failure['kind'], 'ranking')
+            shrunk = failure['shrunk']
+            self.assertLess(len(shrunk['users']), len(failure['case']['users']))
+            self.assertLessEqual(len(shrunk['users']), 3)
+            self.assertTrue(compare(self.system, shrunk, ('broken',)))
+            self.assertIn([], [user['游戏'] for user in shrunk['users']])
+        finally:
+            del differential.RANKING_ENGINES['broken']
+
+if __name__ == '__main__':
+    unittest.main()
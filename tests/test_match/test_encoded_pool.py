@@ -0,0 +1,80 @@
+"""编码池测试模块
+
+测试编码池的向量化打分与 MatchingSystem.match_users 的一致性
+"""
+
+import unittest
+import numpy as np
+from models.user_profile import UserProfile
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.encoded_pool import DIMENSIONS
+
+class TestEncodedPool(unittest.TestCase):
+    """编码池测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.games = pools_loader.load_game_pool()
+        self.system = MatchingSystem(self.games)
+        self.pool = self.system.encode_pool(self.users)
+
+    def _make_user(self, user_id: str, **overrides) -> UserProfile:
+        """基于第一个用户构造测试用户"""
+        attrs = dict(vars(self.users[0]))
+        attrs.update(user_id=user_id, **overrides)
+        return UserProfile(**attrs)
+
+    def test_scores_match_reference(self):
+        """测试逐维分数与参考实现一致"""
+        for row, target in enumerate(self.users):
+            scores = self.pool.score(self.pool.query(row))
+            for index, user in enumerate(self.users):
+                expected = self.system.match_users(target, user)
+                for dimension in DIMENSIONS + ('total_score',):
+                    self.assertAlmostEqual(scores[dimension][index], expected[dimension], places=12)
+
+    def test_top_k_matches_find_best_matches(self):
+        """测试 top_k 与 find_best_matches 的排序一致"""
+        for row, target in enumerate(self.users):
+            expected = self.system.find_best_matches(target, self.users, top_n=5)
+            result = self.pool.top_k(self.pool.query(row), 5)
+            self.assertEqual(
+                [self.users[index].user_id for index, _ in result],
+                [user.user_id for user, _ in expected]
+            )
+
+    def test_row_of(self):
+        """测试按用户ID查找行号"""
+        for row, user in enumerate(self.users):
+            self.assertEqual(self.pool.row_of(user.user_id), row)
+        with self.assertRaises(KeyError):
+            self.pool.row_of("no_such_user")
+
+    def test_query_with_unseen_values(self):
+        """测试查询用户带有未见过的取值时词表自动扩展"""
+        stranger = self._make_user(
+            "stranger",
+            play_time="深夜",
+            game_style="佛系",
+            games=["王者荣耀", "不存在的游戏"]
+        )
+        query = self.system.encoder.encode_query(stranger)
+        scores = self.pool.score(query)
+        for index, user in enumerate(self.users):
+            expected = self.system.match_users(stranger, user)
+            self.assertEqual(scores['time'][index], 0.0)
+            self.assertAlmostEqual(scores['total_score'][index], expected['total_score'], places=12)
+
+    def test_empty_games(self):
+        """测试没有游戏的用户"""
+        empty = self._make_user("empty", games=[])
+        pool = self.system.encode_pool(self.users + [empty])
+        scores = pool.score(pool.query(len(self.users)))
+        self.assertTrue(np.all(scores['game_preference'] == 0.0))
+        self.assertTrue(np.all(scores['game_type'] == 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
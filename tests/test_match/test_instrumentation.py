@@ -0,0 +1,117 @@
+"""匹配计时与计数测试模块"""
+
+import threading
+import unittest
+from loaders import LoaderManager
+from matching.encoded_pool import DIMENSIONS
+from matching.instrumentation import Instrumentation
+from matching.matching_system import MatchingSystem
+
+class TestInstrumentation(unittest.TestCase):
+    """匹配计时与计数测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+
+    def test_disabled_by_default(self):
+        """测试缺省不挂接计数器"""
+        self.assertIsNone(self.system.instrumentation)
+
+    def test_results_unchanged(self):
+        """测试启用后 match_users 与 find_best_matches 的结果不变"""
+        target = self.users[0]
+        expected_pair = [self.system.match_users(target, user) for user in self.users]
+        expected = {
+            prune: self.system.find_best_matches(target, self.users, top_n=5, prune=prune)
+            for prune in (True, False)
+        }
+        self.system.instrumentation = Instrumentation()
+        self.assertEqual([self.system.match_users(target, user) for user in self.users], expected_pair)
+        for prune, results in expected.items():
+            matches = self.system.find_best_matches(target, self.users, top_n=5, prune=prune)
+            self.assertEqual(list(matches), list(results))
+            self.assertEqual(matches.pruned, results.pruned)
+
+    def test_match_users_timings(self):
+        """测试 match_users 按维度记录耗时与调用次数"""
+        instrumentation = self.system.instrumentation = Instrumentation()
+        for user in self.users:
+            self.system.match_users(self.users[0], user)
+        timings = instrumentation.snapshot()['timings']
+        for name in DIMENSIONS + ('aggregate', 'match_users'):
+            self.assertEqual(timings[name]['calls'], len(self.users))
+            self.assertGreaterEqual(timings[name]['seconds'], 0.0)
+        self.assertGreaterEqual(timings['match_users']['seconds'], timings['game_type']['seconds'])
+
+    def test_find_best_matches_counters(self):
+        """测试查找记录扫描、剪枝与缓存命中计数"""
+        instrumentation = self.system.instrumentation = Instrumentation()
+        total_pruned = 0
+        for target in self.users:
+            total_pruned += self.system.find_best_matches(target, self.users, top_n=2).pruned
+        snapshot = instrumentation.snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['queries'], len(self.users))
+        self.assertEqual(counters['candidates_scanned'], len(self.users) * (len(self.users) - 1))
+        self.assertEqual(counters['candidates_pruned'], total_pruned)
+        self.assertEqual(counters['stages_cache_misses'], 1)
+        self.assertEqual(counters['stages_cache_hits'], len(self.users) - 1)
+        self.assertEqual(snapshot['timings']['find_best_matches']['calls'], len(self.users))
+        scored = snapshot['timings']['style']['calls']
+        self.assertEqual(scored, counters['candidates_scanned'])
+        self.assertLessEqual(snapshot['timings']['game_type']['calls'], scored - total_pruned)
+
+    def test_weight_change_invalidates_stage_cache(self):
+        """测试权重变化后重新生成打分阶段"""
+        instrumentation = self.system.instrumentation = Instrumentation()
+        self.system.find_best_matches(self.users[0], self.users, top_n=2)
+        self.system.dimension_weights = dict(self.system.dimension_weights, mbti=0.0)
+        self.system.find_best_matches(self.users[0], self.users, top_n=2)
+        self.assertEqual(instrumentation.snapshot()['counters']['stages_cache_misses'], 2)
+
+    def test_snapshot_merges_threads_and_reset(self):
+        """测试多线程计数汇总与清零"""
+        instrumentation = Instrumentation()
+
+        def work():
+            for _ in range(1000):
+                instrumentation.count('events')
+                instrumentation.add_time('work', 0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = instrumentation.snapshot()
+        self.assertEqual(snapshot['counters']['events'], 4000)
+        self.assertEqual(snapshot['timings']['work']['calls'], 4000)
+        self.assertAlmostEqual(snapshot['timings']['work']['seconds'], 4.0)
+        instrumentation.reset()
+        self.assertEqual(instrumentation.snapshot(), {'timings': {}, 'counters': {}})
+
+    def test_finished_threads_fold_into_total(self):
+        """测试线程结束后其累加表并入合计，不再单独保留"""
+        instrumentation = Instrumentation()
+
+        def work():
+            instrumentation.count('calls')
+            instrumentation.add_time('step', 0.5)
+        for _ in range(20):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        instrumentation.count('calls')
+        self.assertLessEqual(len(instrumentation._tables), 1)
+        snapshot = instrumentation.snapshot()
+        self.assertEqual(snapshot['counters']['calls'], 21)
+        self.assertEqual(snapshot['timings']['step']['calls'], 20)
+        self.assertAlmostEqual(snapshot['timings']['step']['seconds'], 10.0)
+        instrumentation.reset()
+        self.assertEqual(instrumentation.snapshot()['counters'], {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""游戏倒排索引测试模块"""
+
+import random
+import unittest
+from loaders import LoaderManager
+from matching.game_matcher import GameMatcher
+from matching.inverted_index import GameIndex
+
+class TestGameIndex(unittest.TestCase):
+    """游戏倒排索引测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.game_matcher = GameMatcher(pools_loader.load_game_pool())
+        self.index = GameIndex(self.users)
+
+    def _players(self, game):
+        """逐个用户扫描得到的玩家ID（参考实现）"""
+        return sorted(user.user_id for user in self.users if game in user.games)
+
+    def test_postings_and_counts(self):
+        """测试倒排表与逐个扫描一致"""
+        games = {game for user in self.users for game in user.games}
+        self.assertEqual(set(self.index.counts()), games)
+        for game in games:
+            docs = self.index.postings(game)
+            self.assertEqual(list(docs), sorted(docs))
+            self.assertEqual(sorted(self.index.keys_of(docs)), self._players(game))
+            self.assertEqual(self.index.count(game), len(self._players(game)))
+        self.assertEqual(self.index.count('不存在的游戏'), 0)
+
+    def test_union_and_intersection(self):
+        """测试并集与交集"""
+        games = sorted(self.index.counts())
+        for first, second in zip(games, games[1:]):
+            union = set(self._players(first)) | set(self._players(second))
+            both = set(self._players(first)) & set(self._players(second))
+            self.assertEqual(set(self.index.keys_of(self.index.union([first, second]))), union)
+            self.assertEqual(set(self.index.keys_of(self.index.intersection([first, second]))), both)
+        self.assertEqual(len(self.index.intersection([games[0], '不存在的游戏'])), 0)
+
+    def test_preference_scores_match_game_matcher(self):
+        """测试批量 Jaccard 相似度与 match_preference 一致"""
+        by_id = {user.user_id: user for user in self.users}
+        for target in self.users:
+            docs, scores = self.index.preference_scores(target.games)
+            served = dict(zip(self.index.keys_of(docs), scores))
+            for user in self.users:
+                expected = self.game_matcher.match_preference(target, by_id[user.user_id])
+                self.assertAlmostEqual(served.get(user.user_id, 0.0), expected)
+
+    def test_incremental_updates(self):
+        """测试增量更新后与重新构建的索引一致"""
+        user = self.users[0]
+        self.index.put(user.user_id, ['新游戏'])
+        self.assertEqual(self.index.keys_of(self.index.postings('新游戏')), [user.user_id])
+        for game in set(user.games) - {'新游戏'}:
+            self.assertNotIn(user.user_id, self.index.keys_of(self.index.postings(game)))
+        self.assertTrue(self.index.remove(user.user_id))
+        self.assertFalse(self.index.remove(user.user_id))
+        self.assertEqual(self.index.count('新游戏'), 0)
+        self.assertNotIn('新游戏', self.index.counts())
+        self.assertEqual(self.index.counts(), GameIndex(self.users[1:]).counts())
+
+    def test_popular_games_are_compressed(self):
+        """测试热门游戏转为位图存储，冷门游戏变冷后转回数组，结果不变"""
+        rng = random.Random(7)
+        index = GameIndex()
+        expected = {}
+        for key in range(5000):
+            games = ['王者荣耀'] if rng.random() < 0.5 else []
+            games.append(f'冷门游戏{rng.randrange(500)}')
+            index.put(key, games)
+            expected[key] = set(games)
+        self.assertIn('王者荣耀', index.compressed_games())
+        self.assertNotIn('冷门游戏0', index.compressed_games())
+        players = sorted(key for key, games in expected.items() if '王者荣耀' in games)
+        self.assertEqual(index.keys_of(index.postings('王者荣耀')), players)
+        self.assertLess(index.nbytes(), 4 * sum(len(games) for games in expected.values()))
+
+        for key in players[:-10]:
+            index.remove(key)
+        self.assertNotIn('王者荣耀', index.compressed_games())
+        self.assertEqual(index.keys_of(index.postings('王者荣耀')), players[-10:])
+
+    def test_churn_reuses_doc_ids(self):
+        """测试反复增删时文档号被复用，文档号上界不随累计用户数增长，查询结果不变"""
+        rng = random.Random(3)
+        index = GameIndex()
+        live = {}
+        for step in range(20000):
+            key = f'u{step}'
+            games = ['王者荣耀'] if rng.random() < 0.5 else []
+            games.append(f'冷门游戏{rng.randrange(50)}')
+            index.put(key, games)
+            live[key] = set(games)
+            if len(live) > 500:
+                gone = rng.choice(sorted(live))
+                index.remove(gone)
+                del live[gone]
+        self.assertLessEqual(index.doc_bound, 501)
+        for game in ('王者荣耀', '冷门游戏7'):
+            self.assertEqual(
+                sorted(index.keys_of(index.postings(game))),
+                sorted(key for key, games in live.items() if game in games)
+            )
+        self.assertIn('王者荣耀', index.compressed_games())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,11 +3,14 @@
 测试匹配系统的各个功能
 """
 
+import copy
+import time
 import unittest
 from typing import List
 from models.user_profile import UserProfile
 from models.game_profile import GameProfile
 from matching.matching_system import MatchingSystem
+from pool import PoolSnapshot, PresenceIndex
 
 class TestMatchingSystem(unittest.TestCase):
     """匹配系统测试类"""
@@ -193,6 +196,133 @@ class TestMatchingSystem(unittest.TestCase):
         )
         print("分数正确降序排序 ✓")
         
+    def _make_pool(self, size: int) -> List[UserProfile]:
+        """复制测试用户构造较大的用户池"""
+        pool = []
+        for i in range(size):
+            template = [self.user2, self.user3][i % 2]
+            attrs = dict(vars(template))
+            attrs['user_id'] = f"{template.user_id}_{i}"
+            pool.append(UserProfile(**attrs))
+        return pool
+        
+    def test_find_best_matches_with_generous_deadline(self):
+        """测试截止时间充裕时与不限时结果一致"""
+        print("\n=== 测试充裕的截止时间 ===")
+        user_pool = [self.user1] + self._make_pool(40)
+        expected = self.matching_system.find_best_matches(self.user1, user_pool, top_n=10)
+        matches = self.matching_system.find_best_matches(
+            self.user1,
+            user_pool,
+            top_n=10,
+            deadline=time.monotonic() + 60,
+            chunk_size=7
+        )
+        
+        self.assertEqual(
+            [user.user_id for user, _ in matches],
+            [user.user_id for user, _ in expected]
+        )
+        self.assertTrue(matches.complete)
+        self.assertFalse(matches.deadline_hit)
+        self.assertEqual(matches.coverage, 1.0)
+        print(f"覆盖率 {matches.coverage:.0%}，结果与完整扫描一致 ✓")
+        
+    def test_find_best_matches_with_expired_deadline(self):
+        """测试截止时间已过时只返回优先块中的最佳结果"""
+        print("\n=== 测试已过的截止时间 ===")
+        # 用户池中同服务器(国服)的用户排在后面
+        user_pool = list(reversed(self._make_pool(40)))
+        matches = self.matching_system.find_best_matches(
+            self.user1,
+            user_pool,
+            top_n=5,
+            deadline=time.monotonic() - 1,
+            chunk_size=10
+        )
+        
+        self.assertTrue(matches.deadline_hit)
+        self.assertFalse(matches.complete)
+        self.assertEqual(matches.scanned, 10)
+        self.assertAlmostEqual(matches.coverage, 0.25)
+        self.assertEqual(len(matches), 5)
+        for user, _ in matches:
+            self.assertEqual(user.play_region, self.user1.play_region)
+        print(f"覆盖率 {matches.coverage:.0%}，优先扫描同服务器用户 ✓")
+        
+    def test_find_best_matches_pruning_is_exact(self):
+        """测试分支限界剪枝与完整扫描结果完全相同（含同分顺序）"""
+        print("\n=== 测试分支限界剪枝 ===")
+        user_pool = [self.user1, self.user3] + self._make_pool(60)
+        for target in (self.user1, self.user2, user_pool[5]):
+            for top_n in (0, 1, 3, 10, 100):
+                expected = self.matching_system.find_best_matches(target, user_pool, top_n, prune=False)
+                matches = self.matching_system.find_best_matches(target, user_pool, top_n)
+                self.assertEqual(
+                    [(user.user_id, scores) for user, scores in matches],
+                    [(user.user_id, scores) for user, scores in expected]
+                )
+                self.assertEqual(expected.pruned, 0)
+        
+        matches = self.matching_system.find_best_matches(self.user1, user_pool, top_n=1)
+        self.assertGreater(matches.pruned_fraction, 0)
+        print(f"top 1 剪枝比例 {matches.pruned_fraction:.0%}，结果与完整扫描一致 ✓")
+        
+    def test_pruning_bounds_follow_loaded_tables(self):
+        """测试配置表中的分数超出 [0,1] 时剪枝上界随之放宽，结果仍与完整扫描一致"""
+        print("\n=== 测试剪枝上界来自配置表 ===")
+        mbti = copy.deepcopy(self.matching_system.mbti_matcher)
+        for item in mbti.preference_data['mbti_types']:
+            for key, score in item['偏好mbti'].items():
+                item['偏好mbti'][key] = score * 30
+        self.matching_system.mbti_matcher = mbti
+        self.matching_system.numeric_matcher.time_similarity = {
+            period: {other: value * 3 for other, value in row.items()}
+            for period, row in self.matching_system.numeric_matcher.time_similarity.items()
+        }
+        self.matching_system._stages_cache = None
+        user_pool = [self.user1, self.user3] + self._make_pool(60)
+        weights = self.matching_system.dimension_weights
+        bound = self.matching_system._score_stages()[0][3]
+        for user in user_pool:
+            scores = self.matching_system.match_users(self.user1, user)
+            self.assertLessEqual(sum(scores[name] * weights[name] for name in weights), bound)
+        
+        for target in (self.user1, self.user2, user_pool[5]):
+            for top_n in (1, 3, 10):
+                expected = self.matching_system.find_best_matches(target, user_pool, top_n, prune=False)
+                matches = self.matching_system.find_best_matches(target, user_pool, top_n)
+                self.assertEqual(
+                    [(user.user_id, scores) for user, scores in matches],
+                    [(user.user_id, scores) for user, scores in expected]
+                )
+        print("放大 MBTI 与时间分数后剪枝结果与完整扫描一致 ✓")
+        
+    def test_find_best_matches_online_only(self):
+        """测试只匹配在线用户: 列表与快照两种用户池结果一致"""
+        print("\n=== 测试只匹配在线用户 ===")
+        user_pool = [self.user1] + self._make_pool(20)
+        presence = PresenceIndex(ttl=10, clock=lambda: 15.0)
+        presence.heartbeat(user_pool[1].user_id, now=0.0)
+        for user in user_pool[::3]:
+            presence.heartbeat(user.user_id, now=10.0)
+        self.matching_system.presence = presence
+        
+        online = {user.user_id for user in user_pool[::3]}
+        expected = self.matching_system.find_best_matches(
+            self.user1, [user for user in user_pool if user.user_id in online], top_n=5)
+        from_list = self.matching_system.find_best_matches(
+            self.user1, user_pool, top_n=5, online_only=True)
+        snapshot = PoolSnapshot.build(0, user_pool, chunk_size=8)
+        from_snapshot = self.matching_system.find_best_matches(
+            self.user1, snapshot, top_n=5, online_only=True)
+        
+        expected_ids = [user.user_id for user, _ in expected]
+        self.assertEqual([user.user_id for user, _ in from_list], expected_ids)
+        self.assertEqual([user.user_id for user, _ in from_snapshot], expected_ids)
+        self.assertEqual(from_list.pool_size, len(online) - 1)
+        print(f"在线 {len(online)} 人，结果与预先过滤一致 ✓")
+        
     def test_get_match_explanation(self):
         """测试匹配解释生成"""
         print("\n=== 测试匹配解释生成 ===")
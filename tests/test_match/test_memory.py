@@ -0,0 +1,68 @@
+"""内存统计测试模块"""
+
+import sys
+import tracemalloc
+import unittest
+import numpy as np
+from loaders import LoaderManager
+from matching.inverted_index import GameIndex
+from matching.matching_system import MatchingSystem
+from matching.memory import deep_sizeof, format_memory_report, memory_report
+from pool.versioned_pool import VersionedPool
+
+class TestMemoryReport(unittest.TestCase):
+    """内存统计测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+
+    def test_deep_sizeof(self):
+        """测试递归统计容器、NumPy 缓冲区与共享对象"""
+        array = np.zeros(1000, dtype=np.float64)
+        self.assertGreaterEqual(deep_sizeof(array), array.nbytes)
+        self.assertGreaterEqual(deep_sizeof(array[10:20]), array.nbytes)
+        shared = 'x' * 1000
+        self.assertLess(deep_sizeof([shared, shared]), 2 * sys.getsizeof(shared))
+        seen = set()
+        deep_sizeof(shared, seen)
+        self.assertEqual(deep_sizeof([shared], seen), sys.getsizeof([shared]))
+
+    def test_components(self):
+        """测试各组件的统计与每用户字节数"""
+        self.system.find_best_matches(self.users[0], self.users, top_n=3)
+        report = memory_report(self.system, self.users, indexes={'games': GameIndex(self.users)})
+        components = report['components']
+        self.assertEqual(list(components), ['games', 'pool', 'similarity_tables', 'caches', 'indexes'])
+        self.assertEqual(report['users'], len(self.users))
+        self.assertEqual(report['total_bytes'], sum(c['bytes'] for c in components.values()))
+        self.assertGreater(components['pool']['bytes'], 0)
+        self.assertGreater(components['similarity_tables']['parts']['mbti_matcher'], 0)
+        self.assertGreater(components['caches']['parts']['stages_cache'], 0)
+        self.assertGreater(components['indexes']['parts']['games'], 0)
+        self.assertAlmostEqual(report['bytes_per_user']['pool'], components['pool']['bytes'] / len(self.users))
+        self.assertIsNone(report['traced'])
+        self.assertIn('similarity_tables', format_memory_report(report))
+
+    def test_shared_users_counted_once(self):
+        """测试索引引用的用户档案不重复计入"""
+        alone = memory_report(self.system, indexes={'games': GameIndex(self.users)})
+        with_pool = memory_report(self.system, self.users, indexes={'games': GameIndex(self.users)})
+        self.assertLess(with_pool['components']['indexes']['bytes'], alone['components']['indexes']['bytes'])
+
+    def test_versioned_pool_and_tracemalloc(self):
+        """测试多版本用户池与 tracemalloc 汇总"""
+        pool = VersionedPool(self.users, self.system.game_matcher.games)
+        tracemalloc.start()
+        try:
+            report = memory_report(self.system, pool)
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(report['users'], len(self.users))
+        self.assertIsNotNone(report['traced'])
+        self.assertGreaterEqual(report['traced']['peak_bytes'], report['traced']['current_bytes'])
+
+if __name__ == '__main__':
+    unittest.main()
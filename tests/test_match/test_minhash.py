@@ -0,0 +1,97 @@
+"""MinHash / LSH 测试模块"""
+
+import random
+import unittest
+from loaders import LoaderManager
+from matching.game_matcher import GameMatcher
+from matching.minhash import MinHashLSH
+
+class TestMinHashLSH(unittest.TestCase):
+    """MinHash / LSH 测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.game_matcher = GameMatcher(pools_loader.load_game_pool())
+        self.index = MinHashLSH(num_perm=256, bands=128)
+        for user in self.users:
+            self.index.add_user(user)
+
+    def test_invalid_configuration(self):
+        """测试签名长度不能被分段数整除"""
+        with self.assertRaises(ValueError):
+            MinHashLSH(num_perm=100, bands=32)
+
+    def test_signature_estimates_jaccard(self):
+        """测试签名估计值接近精确 Jaccard，相同集合估计为1"""
+        for target in self.users:
+            signature = self.index.signature(target.games)
+            self.assertEqual(self.index.estimate(signature, self.index.signature(reversed(target.games))), 1.0)
+            for user in self.users:
+                exact = self.game_matcher.match_preference(target, user)
+                estimate = self.index.estimate(signature, self.index.signature(user.games))
+                self.assertLess(abs(estimate - exact), 0.2)
+
+    def test_query_full_recall_on_sample_pool(self):
+        """测试分段足够细时样例池的召回率为1"""
+        report = self.index.measure_recall(self.users, threshold=0.2)
+        self.assertEqual(report['candidate_recall'], 1.0)
+        self.assertGreater(report['recall'], 0.8)
+        self.assertGreater(report['precision'], 0.8)
+
+    def test_query_sorted_and_updates(self):
+        """测试查询结果按相似度排序，更新与删除后桶同步"""
+        target = self.users[0]
+        results = self.index.query(target.games, threshold=0.0)
+        self.assertEqual(results[0], (target.user_id, 1.0))
+        self.assertEqual([score for _, score in results], sorted((score for _, score in results), reverse=True))
+
+        self.index.put(target.user_id, ['新游戏'])
+        self.assertEqual(self.index.query(['新游戏'], threshold=0.5), [(target.user_id, 1.0)])
+        self.assertTrue(self.index.remove(target.user_id))
+        self.assertEqual(self.index.query(['新游戏'], threshold=0.5), [])
+        self.index.put('无游戏用户', [])
+        self.assertEqual(self.index.query([], threshold=0.0), [])
+
+    def test_churn_reuses_signature_rows(self):
+        """测试反复更新与增删时签名行被复用，查询结果只含现存用户"""
+        index = MinHashLSH()
+        rng = random.Random(11)
+        live = {}
+        for step in range(3000):
+            key = f'u{rng.randrange(200)}'
+            if key in live and rng.random() < 0.3:
+                index.remove(key)
+                del live[key]
+            else:
+                live[key] = [f'游戏{rng.randrange(20)}' for _ in range(3)]
+                index.put(key, live[key])
+        self.assertLessEqual(index.doc_bound, 200)
+        self.assertEqual(len(index), len(live))
+        for key, games in list(live.items())[:20]:
+            results = dict(index.query(games, threshold=0.0))
+            self.assertEqual(results[key], 1.0)
+            self.assertLessEqual(set(results), set(live))
+
+    def test_recall_on_larger_pool(self):
+        """测试较大合成池上的召回率报告"""
+        rng = random.Random(5)
+        games = [f'游戏{i}' for i in range(100)]
+        index = MinHashLSH(num_perm=128, bands=32)
+
+        class User:
+            def __init__(self, user_id, games):
+                self.user_id = user_id
+                self.games = games
+
+        users = [User(i, rng.sample(games, 4)) for i in range(2000)]
+        users += [User(2000 + i, list(user.games) + [rng.choice(games)]) for i, user in enumerate(users[:500])]
+        for user in users:
+            index.add_user(user)
+        report = index.measure_recall(users, threshold=0.6, targets=users[:100])
+        self.assertGreater(report['candidate_recall'], 0.9)
+        self.assertLess(report['pool_fraction'], 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""硬约束预过滤测试模块
+
+测试位图过滤与逐个用户判断的结果一致
+"""
+
+import copy
+import itertools
+import unittest
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.prefilter import HardConstraints, prefilter
+from pool import PoolSnapshot, PresenceIndex, VersionedPool
+
+class TestPrefilter(unittest.TestCase):
+    """硬约束预过滤测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+
+    def _satisfies(self, target, user, constraints):
+        """逐个用户判断是否满足约束（参考实现）"""
+        if constraints.server_group and self.system.base_matcher.match_server(target, user) <= 0.3:
+            return False
+        if constraints.online and user.online_status != '在线':
+            return False
+        if constraints.gender and not (
+                user.gender in target.gender_preference and target.gender in user.gender_preference):
+            return False
+        if constraints.experience_gap is not None:
+            levels = self.system.numeric_matcher.experience_levels
+            if target.game_experience not in levels or user.game_experience not in levels:
+                return False
+            if abs(levels[target.game_experience] - levels[user.game_experience]) > constraints.experience_gap:
+                return False
+        return True
+
+    def _all_constraints(self):
+        """枚举约束组合"""
+        for server_group, online, gender, gap in itertools.product(
+                (False, True), (False, True), (False, True), (None, 0, 1)):
+            yield HardConstraints(server_group, online, gender, gap)
+
+    def test_bitmaps_match_reference(self):
+        """测试列表用户池的过滤结果与逐个判断一致"""
+        for constraints in self._all_constraints():
+            for target in self.users:
+                expected = [user for user in self.users if self._satisfies(target, user, constraints)]
+                self.assertEqual(prefilter(self.system, target, self.users, constraints), expected)
+
+    def test_snapshot_matches_list(self):
+        """测试带编码器的快照按块过滤，与列表结果一致"""
+        snapshot = PoolSnapshot.build(0, self.users, chunk_size=4, encoder=self.system.encoder)
+        for constraints in self._all_constraints():
+            for target in self.users:
+                self.assertEqual(
+                    prefilter(self.system, target, snapshot, constraints),
+                    prefilter(self.system, target, self.users, constraints)
+                )
+
+    def test_snapshot_encoded_once_per_version(self):
+        """测试不带编码器的快照只在首次查询时编码，同一版本的后续查询不再编码"""
+        pool = VersionedPool(self.users, chunk_size=4)
+        pool.remove_user(self.users[2].user_id)
+        snapshot = pool.snapshot()
+        remaining = [user for user in self.users if user is not self.users[2]]
+        constraints = HardConstraints(server_group=True, gender=True)
+        encoder = self.system.encoder
+        encode = encoder.encode
+        calls = []
+        encoder.encode = lambda users: calls.append(len(users)) or encode(users)
+        try:
+            first = prefilter(self.system, self.users[0], snapshot, constraints)
+            encoded = len(calls)
+            second = prefilter(self.system, self.users[1], snapshot, constraints)
+            self.assertGreater(encoded, 0)
+            self.assertEqual(len(calls), encoded)
+        finally:
+            del encoder.encode
+        self.assertEqual(first, prefilter(self.system, self.users[0], remaining, constraints))
+        self.assertEqual(second, prefilter(self.system, self.users[1], remaining, constraints))
+
+    def test_list_encoded_once(self):
+        """测试同一列表反复查询时复用编码池，换入新的用户档案后重新编码"""
+        constraints = HardConstraints(server_group=True, gender=True)
+        encoder = self.system.encoder
+        encode = encoder.encode
+        calls = []
+        encoder.encode = lambda users: calls.append(len(users)) or encode(users)
+        try:
+            for target in self.users[:3]:
+                prefilter(self.system, target, self.users, constraints)
+            self.assertEqual(len(calls), 1)
+            changed = list(self.users)
+            changed[0] = copy.copy(changed[0])
+            prefilter(self.system, self.users[0], changed, constraints)
+            self.assertEqual(len(calls), 2)
+        finally:
+            del encoder.encode
+
+    def test_find_best_matches_with_constraints(self):
+        """测试带约束的查找等于先过滤再查找"""
+        constraints = HardConstraints(server_group=True, gender=True)
+        for target in self.users:
+            allowed = [user for user in self.users if self._satisfies(target, user, constraints)]
+            expected = self.system.find_best_matches(target, allowed, top_n=5)
+            matches = self.system.find_best_matches(target, self.users, top_n=5, constraints=constraints)
+            self.assertEqual([user.user_id for user, _ in matches], [user.user_id for user, _ in expected])
+            self.assertEqual(matches.prefiltered, len(self.users) - len(allowed))
+
+    def test_online_uses_presence_index(self):
+        """测试挂接在线状态索引后按索引判断在线"""
+        presence = PresenceIndex(ttl=10, clock=lambda: 0.0)
+        online = [user.user_id for user in self.users[1::2]]
+        for user_id in online:
+            presence.heartbeat(user_id)
+        self.system.presence = presence
+        target = self.users[0]
+        snapshot = PoolSnapshot.build(0, self.users, chunk_size=4, encoder=self.system.encoder)
+        for pool in (self.users, snapshot):
+            users = prefilter(self.system, target, pool, HardConstraints(online=True))
+            self.assertEqual([user.user_id for user in users], online)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""共享编码池测试模块
+
+测试共享内存编码池的创建、跨进程附加与删除
+"""
+
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import unittest
+import numpy as np
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from matching.shared_pool import SharedEncodedPool, SharedPoolDescriptor
+
+def _worker_top_k(descriptor: dict, user_id: str, k: int) -> list:
+    """工作进程: 附加共享编码池并计算 top-k"""
+    shared = SharedEncodedPool.attach(descriptor)
+    pool = shared.pool
+    result = [(str(pool.user_ids[row]), score) for row, score in pool.top_k(pool.query(pool.row_of(user_id)), k)]
+    del pool
+    shared.close()
+    return result
+
+class TestSharedPool(unittest.TestCase):
+    """共享编码池测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+        self.pool = self.system.encode_pool(self.users)
+
+    def test_attach_is_zero_copy(self):
+        """测试附加后的数组直接引用共享内存"""
+        with SharedEncodedPool.create(self.pool) as owner:
+            reader = SharedEncodedPool.attach(owner.descriptor.to_dict())
+            columns = reader.pool.columns['server']
+            np.testing.assert_array_equal(columns, self.pool.columns['server'])
+            self.assertFalse(columns.flags.writeable)
+            self.assertFalse(columns.flags.owndata)
+            del columns
+            reader.close()
+
+    def test_descriptor_round_trip(self):
+        """测试描述符序列化"""
+        with SharedEncodedPool.create(self.pool) as owner:
+            descriptor = SharedPoolDescriptor.from_dict(owner.descriptor.to_dict())
+            self.assertEqual(descriptor.layout, owner.descriptor.layout)
+            self.assertEqual(descriptor.segment_name, owner.descriptor.segment_name)
+
+    def test_worker_process_results(self):
+        """测试工作进程附加后的结果与本进程一致"""
+        target = self.users[0]
+        expected = [
+            (self.users[row].user_id, score)
+            for row, score in self.pool.top_k(self.pool.query(0), 5)
+        ]
+        with SharedEncodedPool.create(self.pool) as owner:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(2) as workers:
+                results = workers.starmap(
+                    _worker_top_k,
+                    [(owner.descriptor.to_dict(), target.user_id, 5)] * 2
+                )
+        for result in results:
+            self.assertEqual(result, expected)
+
+    def test_unrelated_process_exit_keeps_segment(self):
+        """测试无关进程附加并退出后共享内存段仍然存在"""
+        script = (
+            "import json, sys\n"
+            "from matching.shared_pool import SharedEncodedPool\n"
+            "shared = SharedEncodedPool.attach(json.loads(sys.argv[1]))\n"
+            "print(len(shared.pool.user_ids))\n"
+            "shared.close()\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        with SharedEncodedPool.create(self.pool) as owner:
+            completed = subprocess.run(
+                [sys.executable, '-c', script, json.dumps(owner.descriptor.to_dict())],
+                cwd=root, capture_output=True, text=True, timeout=60)
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            self.assertEqual(completed.stdout.strip(), str(len(self.users)))
+            self.assertNotIn('Traceback', completed.stderr)
+            reader = SharedEncodedPool.attach(owner.descriptor)
+            reader.close()
+
+    def test_unlink(self):
+        """测试删除后无法再附加"""
+        owner = SharedEncodedPool.create(self.pool)
+        descriptor = owner.descriptor
+        owner.unlink()
+        with self.assertRaises(FileNotFoundError):
+            SharedEncodedPool.attach(descriptor)
+        with self.assertRaises(ValueError):
+            owner.pool
+
+    def test_reader_cannot_unlink(self):
+        """测试只有创建者可以删除"""
+        with SharedEncodedPool.create(self.pool) as owner:
+            reader = SharedEncodedPool.attach(owner.descriptor)
+            with self.assertRaises(PermissionError):
+                reader.unlink()
+            reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
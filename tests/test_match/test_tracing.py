@@ -0,0 +1,190 @@
+"""查询追踪测试模块"""
+
+import gc
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from loaders import LoaderManager
+from matching.encoded_pool import DIMENSIONS
+from matching.instrumentation import Instrumentation
+from matching.matching_system import MatchingSystem
+from matching.tracing import QueryTracer
+
+class TestQueryTracer(unittest.TestCase):
+    """查询追踪测试类"""
+
+    def setUp(self):
+        """测试初始化"""
+        pools_loader = LoaderManager().pools_loader
+        self.users = pools_loader.load_user_pool()
+        self.system = MatchingSystem(pools_loader.load_game_pool())
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'trace.jsonl')
+
+    def tearDown(self):
+        """清理追踪文件"""
+        shutil.rmtree(self.directory)
+
+    def _records(self):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_results_unchanged(self):
+        """测试追踪不改变匹配结果"""
+        target = self.users[0]
+        expected = {
+            prune: list(self.system.find_best_matches(target, self.users, top_n=5, prune=prune))
+            for prune in (True, False)
+        }
+        with QueryTracer(self.path) as tracer:
+            self.system.tracer = tracer
+            for prune, results in expected.items():
+                self.assertEqual(list(self.system.find_best_matches(target, self.users, top_n=5, prune=prune)),
+                                 results)
+
+    def test_record_fields(self):
+        """测试追踪记录的字段"""
+        with QueryTracer(self.path) as tracer:
+            self.system.tracer = tracer
+            results = self.system.find_best_matches(self.users[0], self.users, top_n=3)
+            self.system.find_best_matches(self.users[0], self.users, top_n=3, prune=False)
+        first, second = self._records()
+        self.assertEqual(first['target_id'], self.users[0].user_id)
+        self.assertEqual(first['pool_size'], len(self.users))
+        self.assertEqual(first['candidates'], len(self.users) - 1)
+        self.assertEqual(first['scored'], results.scanned - results.pruned)
+        self.assertEqual(first['results'], 3)
+        self.assertEqual(set(first['stages_ms']), {'filter', 'score', 'topk', 'breakdown'})
+        self.assertTrue(set(first['stages_ms']['breakdown']) <= set(DIMENSIONS) | {'aggregate'})
+        self.assertLessEqual(sum(first['stages_ms'][stage] for stage in ('filter', 'score', 'topk')),
+                             first['duration_ms'] + 1e-6)
+        self.assertIn(first['cache'], ('hit', 'miss'))
+        self.assertEqual(first['deadline'], {'set': False, 'hit': False, 'remaining_ms': None})
+        self.assertIsNone(second['cache'])
+        self.assertEqual(set(second['stages_ms']['breakdown']), set(DIMENSIONS) | {'aggregate'})
+
+    def test_deadline_and_instrumentation(self):
+        """测试限时查询的截止状态，以及同时挂接计数器时计时照常累加"""
+        instrumentation = self.system.instrumentation = Instrumentation()
+        with QueryTracer(self.path) as tracer:
+            self.system.tracer = tracer
+            self.system.find_best_matches(self.users[0], self.users, top_n=3, deadline=time.monotonic() + 10)
+        record, = self._records()
+        self.assertTrue(record['deadline']['set'])
+        self.assertFalse(record['deadline']['hit'])
+        self.assertGreater(record['deadline']['remaining_ms'], 0)
+        snapshot = instrumentation.snapshot()
+        self.assertEqual(snapshot['counters']['queries'], 1)
+        self.assertIn('game_type', snapshot['timings'])
+
+    def test_sampling_and_slow_filter(self):
+        """测试抽样比例为0与慢查询阈值时不输出记录"""
+        with QueryTracer(self.path, sample_rate=0.0) as tracer:
+            self.system.tracer = tracer
+            self.system.find_best_matches(self.users[0], self.users, top_n=3)
+        with QueryTracer(self.path, slow_ms=60000) as tracer:
+            self.system.tracer = tracer
+            self.system.find_best_matches(self.users[0], self.users, top_n=3)
+        self.assertEqual(self._records(), [])
+
+    def test_full_queue_drops(self):
+        """测试队列满时丢弃记录而不阻塞"""
+        tracer = QueryTracer(self.path, queue_size=1)
+        tracer._listener.stop()
+        try:
+            self.system.tracer = tracer
+            for _ in range(3):
+                self.system.find_best_matches(self.users[0], self.users, top_n=3)
+            self.assertEqual(tracer.dropped, 2)
+        finally:
+            tracer._listener.start()
+            tracer.close()
+        self.assertEqual(len(self._records()), 1)
+
+    def test_close_with_full_queue(self):
+        """测试队列满时 close() 等待写出而不抛出 queue.Full，并关闭文件"""
+        tracer = QueryTracer(self.path, queue_size=1)
+        release = threading.Event()
+        emit = tracer._file_handler.emit
+
+        def blocked_emit(record):
+            release.wait(5)
+            emit(record)
+
+        tracer._file_handler.emit = blocked_emit
+        self.system.tracer = tracer
+        for _ in range(3):
+            self.system.find_best_matches(self.users[0], self.users, top_n=3)
+            time.sleep(0.05)
+        self.assertTrue(tracer._handler.queue.full())
+        errors = []
+
+        def close():
+            try:
+                tracer.close()
+            except Exception as error:
+                errors.append(error)
+
+        closer = threading.Thread(target=close)
+        closer.start()
+        time.sleep(0.05)
+        release.set()
+        closer.join(5)
+        self.assertFalse(closer.is_alive())
+        self.assertEqual(errors, [])
+        self.assertIsNone(tracer._file_handler.stream)
+        self.assertEqual(len(self._records()), 2)
+
+    def test_flush_does_not_restart_listener(self):
+        """测试 flush() 只等待队列写出，可与 close() 并发调用"""
+        tracer = QueryTracer(self.path)
+        thread = tracer._listener._thread
+        self.system.tracer = tracer
+        self.system.find_best_matches(self.users[0], self.users, top_n=3)
+        tracer.flush()
+        self.assertEqual(len(self._records()), 1)
+        self.assertIs(tracer._listener._thread, thread)
+
+        flushers = [threading.Thread(target=tracer.flush) for _ in range(4)]
+        for flusher in flushers:
+            flusher.start()
+        tracer.close()
+        for flusher in flushers:
+            flusher.join(5)
+            self.assertFalse(flusher.is_alive())
+        self.assertIsNone(tracer._listener._thread)
+        tracer.flush()
+
+    def test_rotation(self):
+        """测试文件超过大小上限后轮转"""
+        with QueryTracer(self.path, max_bytes=2000, backup_count=2) as tracer:
+            self.system.tracer = tracer
+            for user in self.users[:10]:
+                self.system.find_best_matches(user, self.users, top_n=3)
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        for record in self._records():
+            self.assertIn('target_id', record)
+
+    def test_logger_not_registered_globally(self):
+        """测试追踪器的 Logger 不注册到全局管理器，关闭后随追踪器回收"""
+        registered = set(logging.Logger.manager.loggerDict)
+        tracer = QueryTracer(self.path)
+        self.system.tracer = tracer
+        self.system.find_best_matches(self.users[0], self.users, top_n=3)
+        tracer.close()
+        self.system.tracer = None
+        self.assertEqual(set(logging.Logger.manager.loggerDict), registered)
+        self.assertEqual(len(self._records()), 1)
+        logger = weakref.ref(tracer._logger)
+        del tracer
+        gc.collect()
+        self.assertIsNone(logger())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""事件流消费测试"""
+
+import json
+import threading
+import pytest
+from pool.versioned_pool import VersionedPool
+from pool.event_stream import EventConsumer
+from pool.presence import PresenceIndex
+
+def user_event(user_id, **overrides):
+    """创建 upsert 事件"""
+    user = {
+        'id': user_id,
+        '游戏': ['英雄联盟'],
+        '性别': '男',
+        '性别倾向': ['女'],
+        '游玩服务器': '国服',
+        '在线状态': '在线',
+        '游玩固定时间': '晚上',
+        'MBTI': 'INTJ',
+        '星座': '天蝎座',
+        '游戏风格': '竞技',
+        '游戏经验': '高级'
+    }
+    user.update(overrides)
+    return {'op': 'upsert', 'user': user}
+
+def write_events(path, events, mode='a'):
+    """以 JSON Lines 格式追加事件"""
+    with open(path, mode, encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+@pytest.fixture
+def log_path(tmp_path):
+    """事件日志路径"""
+    return str(tmp_path / 'events.jsonl')
+
+def test_apply_events(log_path):
+    """测试三种事件按顺序应用，无效行被跳过"""
+    write_events(log_path, [
+        user_event('a'),
+        user_event('b', 游玩服务器='日服'),
+        {'op': 'presence', 'user_id': 'a', 'status': '离线', 'ts': 1.0},
+        {'op': 'delete', 'user_id': 'b'},
+        {'op': 'delete', 'user_id': 'missing'},
+        {'op': 'rename', 'user_id': 'a'}
+    ])
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write('not json\n\n')
+
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path, batch_size=4) as consumer:
+        stats = consumer.run()
+
+    snapshot = pool.snapshot()
+    assert [user.user_id for user in snapshot] == ['a']
+    assert snapshot.get('a').online_status == '离线'
+    assert stats['events'] == 7
+    assert stats['batches'] == 2
+    assert stats['errors'] == 2
+    assert stats['missing'] == 1
+    assert stats['lag_bytes'] == 0
+    assert stats['lag_seconds'] > 0
+
+def test_joined_events_line_is_rejected(log_path):
+    """测试一行中以逗号相连的两个事件计为一个无效行，不会被整批解析拆成两个事件"""
+    write_events(log_path, [user_event('a'), user_event('b')])
+    joined = ','.join(json.dumps(event, ensure_ascii=False) for event in [
+        {'op': 'delete', 'user_id': 'a'},
+        user_event('c')
+    ])
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(joined + '\n')
+    write_events(log_path, [{'op': 'presence', 'user_id': 'b', 'status': '离线'}])
+
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path) as consumer:
+        stats = consumer.run()
+
+    snapshot = pool.snapshot()
+    assert [user.user_id for user in snapshot] == ['a', 'b']
+    assert snapshot.get('b').online_status == '离线'
+    assert stats['events'] == 4
+    assert stats['errors'] == 1
+
+def test_split_object_lines_are_rejected(log_path):
+    """测试各自无法解析、拼接后却能组成对象的相邻两行都计为无效行"""
+    write_events(log_path, [user_event('lily'), user_event('alex')])
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "delete", "user_id": "lily"\n')
+        f.write('"x": 1}, {"op": "delete", "user_id": "alex"}\n')
+
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path) as consumer:
+        stats = consumer.run()
+
+    assert [user.user_id for user in pool.snapshot()] == ['lily', 'alex']
+    assert stats['errors'] == 2
+
+def test_presence_events_update_index(log_path):
+    """测试 presence 事件同时更新在线状态索引，不存在的用户不登记"""
+    write_events(log_path, [
+        user_event('a'),
+        user_event('b'),
+        {'op': 'presence', 'user_id': 'a', 'status': '在线'},
+        {'op': 'presence', 'user_id': 'b', 'status': '在线'},
+        {'op': 'presence', 'user_id': 'b', 'status': '离线'},
+        {'op': 'presence', 'user_id': 'ghost', 'status': '在线'}
+    ])
+    presence = PresenceIndex(ttl=10, clock=lambda: 0.0)
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path, presence=presence) as consumer:
+        stats = consumer.run()
+
+    assert presence.online_ids() == ['a']
+    assert pool.snapshot().get('b').online_status == '离线'
+    assert stats['missing'] == 1
+
+def test_checkpoint_resume(log_path, tmp_path):
+    """测试从检查点继续消费，不重复应用已消费的事件"""
+    checkpoint = str(tmp_path / 'events.checkpoint')
+    write_events(log_path, [user_event('a'), user_event('b')])
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path, checkpoint_path=checkpoint) as consumer:
+        consumer.run()
+    version = pool.version
+
+    write_events(log_path, [{'op': 'delete', 'user_id': 'a'}])
+    with EventConsumer(pool, log_path, checkpoint_path=checkpoint) as consumer:
+        assert consumer.lag()['lag_bytes'] > 0
+        stats = consumer.run()
+
+    assert pool.version == version + 1
+    assert [user.user_id for user in pool.snapshot()] == ['b']
+    assert stats['events'] == 3
+
+def test_partial_line_waits(log_path):
+    """测试尚未写完的行等写完后才应用"""
+    line = json.dumps(user_event('a'), ensure_ascii=False)
+    with open(log_path, 'w', encoding='utf-8') as f:
+        f.write(line[:20])
+    pool = VersionedPool()
+    with EventConsumer(pool, log_path) as consumer:
+        assert consumer.poll() == 0
+        assert consumer.offset == 0
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(line[20:] + '\n')
+        assert consumer.poll() == 1
+        assert 'a' in pool.snapshot()
+
+def test_follow_until_stopped(log_path):
+    """测试 follow 模式持续消费新事件，收到停止信号后返回"""
+    write_events(log_path, [], mode='w')
+    pool = VersionedPool()
+    stop = threading.Event()
+    with EventConsumer(pool, log_path) as consumer:
+        worker = threading.Thread(target=consumer.run, kwargs={
+            'follow': True, 'poll_interval': 0.01, 'stop': stop})
+        worker.start()
+        write_events(log_path, [user_event('a')])
+        for _ in range(500):
+            if 'a' in pool.snapshot():
+                break
+            stop.wait(0.01)
+        stop.set()
+        worker.join(timeout=5)
+    assert not worker.is_alive()
+    assert 'a' in pool.snapshot()
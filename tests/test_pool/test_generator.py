@@ -0,0 +1,79 @@
+"""合成用户池生成测试"""
+
+import json
+
+import pytest
+
+from loaders import LoaderManager
+from pool.generator import BATCH_SIZE, PoolGenerator, load_vocabularies
+
+@pytest.fixture(scope='module')
+def vocabularies():
+    return load_vocabularies(LoaderManager())
+
+def test_vocabularies_come_from_data_input(vocabularies):
+    assert vocabularies['play_region'] == ['国服', '亚服', '美服', '欧服']
+    assert vocabularies['game_experience'] == ['初级', '中级', '高级', '高超']
+    assert '王者荣耀' in vocabularies['games']
+    assert len(vocabularies['mbti']) == 16
+    assert len(vocabularies['zodiac']) == 12
+
+def test_deterministic_and_resumable(vocabularies):
+    generator = PoolGenerator(seed=5, vocabularies=vocabularies)
+    first = list(generator.records(BATCH_SIZE + 10))
+    assert first == list(PoolGenerator(seed=5, vocabularies=vocabularies).records(BATCH_SIZE + 10))
+    assert list(generator.records(20, start=BATCH_SIZE - 10)) == first[BATCH_SIZE - 10:BATCH_SIZE + 10]
+    assert first != list(PoolGenerator(seed=6, vocabularies=vocabularies).records(BATCH_SIZE + 10))
+    assert len({record['id'] for record in first}) == len(first)
+
+def test_records_respect_vocabularies_and_config(vocabularies):
+    generator = PoolGenerator(
+        seed=1, vocabularies=vocabularies,
+        distributions={'play_region': {'国服': 3, '美服': 1}, 'online_status': {'在线': 1}},
+        library_sizes={2: 1, 100: 1}
+    )
+    users = list(generator.users(2000))
+    assert {user.play_region for user in users} == {'国服', '美服'}
+    assert {user.online_status for user in users} == {'在线'}
+    assert {len(user.games) for user in users} == {2, len(vocabularies['games'])}
+    for user in users:
+        assert len(set(user.games)) == len(user.games)
+        assert sorted(user.gender_preference) == sorted(vocabularies['gender'])
+        assert user.mbti in vocabularies['mbti']
+        assert user.play_time in vocabularies['play_time']
+    china = sum(user.play_region == '国服' for user in users) / len(users)
+    assert 0.7 < china < 0.8
+
+def test_game_skew(vocabularies):
+    counts = {}
+    for record in PoolGenerator(seed=2, vocabularies=vocabularies, game_skew=1.5).records(3000):
+        for game in record['游戏']:
+            counts[game] = counts.get(game, 0) + 1
+    assert max(counts, key=counts.get) == vocabularies['games'][0]
+
+def test_invalid_config(vocabularies):
+    with pytest.raises(ValueError):
+        PoolGenerator(vocabularies=vocabularies, distributions={'play_region': {'火星服': 1}})
+    with pytest.raises(ValueError):
+        PoolGenerator(vocabularies=vocabularies, distributions={'height': {'高': 1}})
+    with pytest.raises(ValueError):
+        PoolGenerator(vocabularies=vocabularies, library_sizes={1: 0})
+    with pytest.raises(ValueError):
+        PoolGenerator(vocabularies=vocabularies).write('users.csv', 1)
+
+def test_write_json_and_jsonl(tmp_path, vocabularies):
+    generator = PoolGenerator(seed=3, vocabularies=vocabularies)
+    expected = list(generator.records(25))
+    assert generator.write(str(tmp_path / 'users.json'), 25) == 25
+    with open(tmp_path / 'users.json', encoding='utf-8') as file:
+        assert json.load(file) == {'users': expected}
+    assert generator.write(str(tmp_path / 'users.jsonl'), 25) == 25
+    with open(tmp_path / 'users.jsonl', encoding='utf-8') as file:
+        assert [json.loads(line) for line in file] == expected
+
+def test_write_parquet(tmp_path, vocabularies):
+    pq = pytest.importorskip('pyarrow.parquet')
+    generator = PoolGenerator(seed=3, vocabularies=vocabularies)
+    assert generator.write(str(tmp_path / 'users.parquet'), 25) == 25
+    rows = pq.read_table(tmp_path / 'users.parquet').to_pylist()
+    assert [row['id'] for row in rows] == [record['id'] for record in generator.records(25)]
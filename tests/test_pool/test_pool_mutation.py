@@ -0,0 +1,170 @@
+"""用户池增量更新测试
+
+测试增删改后各块编码池与参考实现一致、二级索引与墓碑压缩
+"""
+
+import pytest
+from models.user_profile import UserProfile
+from models.game_profile import GameProfile
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from pool.versioned_pool import VersionedPool
+
+@pytest.fixture
+def system_and_users():
+    """加载真实数据并创建匹配系统"""
+    pools_loader = LoaderManager().pools_loader
+    users = pools_loader.load_user_pool()
+    return MatchingSystem(pools_loader.load_game_pool()), users
+
+@pytest.fixture
+def pool(system_and_users):
+    """创建带编码器、每块4个槽位的多版本用户池"""
+    system, users = system_and_users
+    return VersionedPool(users, system.game_matcher.games, chunk_size=4, encoder=system.encoder)
+
+def clone(user: UserProfile, user_id: str, **overrides) -> UserProfile:
+    """基于已有用户构造新用户"""
+    attrs = dict(vars(user))
+    attrs.update(user_id=user_id, **overrides)
+    return UserProfile(**attrs)
+
+def assert_encoded_matches(system, snapshot):
+    """断言每块编码池的存活行与 match_users 一致"""
+    target = next(iter(snapshot))
+    query = snapshot.encoder.encode_query(target)
+    for base, encoded, live_rows in snapshot.encoded_chunks():
+        scores = encoded.score(query, live_rows)
+        for index, row in enumerate(live_rows):
+            user = snapshot.slot(base + int(row))
+            assert encoded.user_ids[row] == user.user_id
+            expected = system.match_users(target, user)
+            assert scores['total_score'][index] == pytest.approx(expected['total_score'], abs=1e-12)
+
+def test_add_update_remove_keep_encoding(system_and_users, pool):
+    """测试增删改后编码池与参考实现一致"""
+    system, users = system_and_users
+    old = pool.snapshot()
+    pool.add_user(clone(users[0], "new_user", play_time="早上", mbti="INTJ"))
+    pool.update_user(clone(users[1], users[1].user_id, games=[]))
+    pool.remove_user(users[2].user_id)
+    snapshot = pool.snapshot()
+
+    assert snapshot.version == old.version + 3
+    assert "new_user" in snapshot and users[2].user_id not in snapshot
+    assert snapshot.get(users[1].user_id).games == []
+    assert_encoded_matches(system, snapshot)
+    assert_encoded_matches(system, old)
+
+def test_add_unseen_values_extends_vocabulary(system_and_users, pool):
+    """测试新增用户带来未见过的取值"""
+    system, users = system_and_users
+    pool.update_user(clone(users[0], users[0].user_id, mbti="INTJ"))
+    old = pool.snapshot()
+    vocabularies = [{name: list(values) for name, values in chunk.encoded.vocabularies.items()}
+                    for chunk in old.chunks]
+    pool.add_user(clone(users[0], "stranger", play_region="火星服", zodiac="蛇夫座"))
+    pool.update_user(clone(users[1], users[1].user_id, play_region="木星服"))
+    assert_encoded_matches(system, pool.snapshot())
+    # 旧快照各块的取值表不随编码器增长
+    assert [chunk.encoded.vocabularies for chunk in old.chunks] == vocabularies
+    assert "木星服" in pool.snapshot().chunks[0].encoded.vocabularies['server']
+
+def test_size_is_maintained_incrementally(system_and_users, pool):
+    """测试提交增量维护的存活用户数与逐块统计一致"""
+    system, users = system_and_users
+    with pool.writer() as writer:
+        writer.put(clone(users[0], "a"))
+        writer.remove(users[3].user_id)
+        writer.remove(users[4].user_id)
+        writer.put(clone(users[5], users[5].user_id, mbti="INTJ"))
+    snapshot = pool.snapshot()
+    assert len(snapshot) == sum(chunk.live for chunk in snapshot.chunks) == len(users) - 1
+    assert len(list(snapshot)) == len(snapshot)
+
+def test_mutation_errors(system_and_users, pool):
+    """测试重复新增与更新、删除不存在的用户"""
+    system, users = system_and_users
+    with pytest.raises(ValueError):
+        pool.add_user(users[0])
+    with pytest.raises(KeyError):
+        pool.update_user(clone(users[0], "missing"))
+    with pytest.raises(KeyError):
+        pool.remove_user("missing")
+    assert pool.version == 0
+
+def test_slots_where(system_and_users, pool):
+    """测试二级索引查询与逐个过滤一致"""
+    system, users = system_and_users
+    pool.remove_user(users[0].user_id)
+    snapshot = pool.snapshot()
+    server = users[1].play_region
+    expected = [
+        position for position in range(snapshot.slot_count)
+        if snapshot.slot(position) is not None and snapshot.slot(position).play_region == server
+    ]
+    assert snapshot.slots_where('server', server).tolist() == expected
+    assert len(snapshot.slots_where('server', "不存在的服务器")) == 0
+
+def test_slots_where_follows_commits(system_and_users):
+    """测试二级索引随增删改增量维护，与逐个过滤一致"""
+    system, users = system_and_users
+    pool = VersionedPool(users, chunk_size=4, compact_ratio=1.0)
+    servers = sorted({user.play_region for user in users})
+    for step, user in enumerate(users):
+        with pool.writer() as writer:
+            if step % 3 == 0:
+                writer.remove(user.user_id)
+            else:
+                writer.patch(user.user_id, play_region=servers[step % len(servers)])
+            writer.put(clone(user, f"new{step}", play_region=servers[-1]))
+        snapshot = pool.snapshot()
+        for server in servers:
+            expected = [
+                position for position in range(snapshot.slot_count)
+                if snapshot.slot(position) is not None and snapshot.slot(position).play_region == server
+            ]
+            assert snapshot.slots_where('server', server).tolist() == expected
+    with pytest.raises(KeyError):
+        snapshot.slots_where('unknown', 1)
+
+def test_compaction(system_and_users):
+    """测试墓碑过多时自动压缩，旧快照不受影响"""
+    system, users = system_and_users
+    pool = VersionedPool(users, chunk_size=4, encoder=system.encoder, compact_ratio=0.25)
+    removed = users[:len(users) // 2]
+    snapshots = []
+    for user in removed:
+        pool.remove_user(user.user_id)
+        snapshots.append(pool.snapshot())
+
+    assert any(snapshot.tombstones > 0 for snapshot in snapshots)
+    final = pool.snapshot()
+    assert final.tombstones < len(removed)
+    assert [user.user_id for user in final] == [user.user_id for user in users[len(removed):]]
+    for user in users[len(removed):]:
+        assert final.slot(final.index.get(user.user_id)) is user
+    assert_encoded_matches(system, final)
+    assert snapshots[0].get(users[1].user_id) is users[1]
+
+    pool.compact()
+    assert pool.snapshot().tombstones == 0
+
+def test_game_pool_swap_is_versioned(system_and_users, pool):
+    """测试替换游戏档案后新快照按新游戏档案打分，旧快照不受影响"""
+    system, users = system_and_users
+    old = pool.snapshot()
+    games = [GameProfile(game.name, ['改版类型'], game.platforms, game.tags) for game in system.game_matcher.games]
+    with pool.writer() as writer:
+        writer.set_games(games)
+    new = pool.snapshot()
+
+    target = next(user for user in users if user.games)
+    reference = MatchingSystem(games)
+    for snapshot, expected_system in ((old, system), (new, reference)):
+        expected = {user.user_id: scores['total_score']
+                    for user, scores in expected_system.find_best_matches(target, users, len(users), prune=False)}
+        results = system.find_best_matches(target, snapshot, len(users))
+        assert {user.user_id: scores['total_score'] for user, scores in results} == pytest.approx(expected)
+        assert_encoded_matches(expected_system, snapshot)
+    assert any(scores['game_type'] == 1.0 for _, scores in system.find_best_matches(target, new, len(users)))
@@ -0,0 +1,101 @@
+"""在线状态索引测试"""
+
+from pool.presence import PresenceIndex
+
+class FakeClock:
+    """可手动推进的时钟"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_heartbeat_and_expiry():
+    """测试心跳顺延过期时间，超时后离线"""
+    clock = FakeClock()
+    presence = PresenceIndex(ttl=10, clock=clock)
+    presence.heartbeat("a")
+    clock.now = 5
+    presence.heartbeat("b")
+    presence.heartbeat("a")
+    assert presence.online_ids() == ["a", "b"]
+
+    clock.now = 14
+    assert presence.is_online("a") and presence.is_online("b")
+    clock.now = 15
+    assert presence.expire() == 2
+    assert presence.online_ids() == []
+    assert not presence.is_online("a")
+    assert len(presence) == 0
+
+def test_partial_expiry_and_leave():
+    """测试只清理已过期的会话，主动下线立即生效"""
+    clock = FakeClock()
+    presence = PresenceIndex(ttl=10, clock=clock)
+    for i in range(5):
+        clock.now = i
+        presence.heartbeat(f"u{i}")
+    assert presence.leave("u4")
+    assert not presence.leave("u4")
+
+    clock.now = 12
+    assert presence.expire() == 3
+    assert presence.online_ids() == ["u3"]
+    bitmap = presence.bitmap()
+    assert [presence.user_id_of(bit) for bit in bitmap.nonzero()[0]] == ["u3"]
+    assert not bitmap.flags.writeable
+
+def test_bitmap_grows_and_mass_expiry():
+    """测试位图扩容与大批会话过期"""
+    clock = FakeClock()
+    presence = PresenceIndex(ttl=1, clock=clock)
+    for i in range(5000):
+        presence.heartbeat(f"u{i}", now=i * 1e-4)
+    assert len(presence.online_ids()) == 5000
+    assert presence.expire(now=1.24995) == 2500
+    assert len(presence.bitmap(now=1.24995).nonzero()[0]) == 2500
+    assert presence.expire(now=10) == 2500
+    presence.heartbeat("u1", now=10)
+    assert presence.online_ids(now=10) == ["u1"]
+
+def test_out_of_order_heartbeat_keeps_exact_expiry():
+    """测试乱序到达的心跳按各自的时间过期，不会延长其他用户的会话，也不会缩短自己的会话"""
+    presence = PresenceIndex(ttl=10)
+    presence.heartbeat("a", now=1000)
+    presence.heartbeat("b", now=10)
+    presence.heartbeat("c", now=0)
+    presence.heartbeat("c", now=5)
+    presence.heartbeat("c", now=3)
+    assert presence.is_online("b", now=19)
+    assert not presence.is_online("b", now=20)
+    assert presence.expire(now=15) == 1
+    assert presence.online_ids(now=15) == ["a", "b"]
+    assert presence.expire(now=20) == 1
+    assert presence.online_ids(now=20) == ["a"]
+    assert presence.expire(now=1010) == 1
+    assert len(presence) == 0
+
+def test_heap_stays_bounded():
+    """测试反复心跳作废的堆条目会被回收"""
+    presence = PresenceIndex(ttl=10)
+    for step in range(2000):
+        presence.heartbeat(f"u{step % 10}", now=step)
+    assert len(presence._heap) <= 2 * len(presence) + 64
+    assert presence.expire(now=2005) == 6
+
+def test_slots_are_reused_after_sessions_end():
+    """测试会话结束后位图槽位被复用，位图不随见过的用户数增长"""
+    clock = FakeClock()
+    presence = PresenceIndex(ttl=1, clock=clock)
+    for round_number in range(10):
+        clock.now = round_number * 2
+        for i in range(100):
+            presence.heartbeat(f"r{round_number}u{i}")
+        if round_number % 2:
+            presence.leave(f"r{round_number}u0")
+    clock.now = 18.5
+    assert len(presence.bitmap()) == 100
+    online = presence.online_ids()
+    assert sorted(online) == sorted(f"r9u{i}" for i in range(1, 100))
+    assert [presence.user_id_of(bit) for bit in presence.bitmap().nonzero()[0]] == online
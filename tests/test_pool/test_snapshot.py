@@ -0,0 +1,81 @@
+"""用户池快照测试"""
+
+import pytest
+from models.user_profile import UserProfile
+from pool.snapshot import PersistentVector, PoolSnapshot, ShardedIndex
+
+def make_user(user_id, **overrides):
+    """创建测试用户"""
+    attrs = dict(
+        user_id=user_id,
+        gender="男",
+        gender_preference=["女"],
+        play_region="国服",
+        play_time="晚上",
+        mbti="INTJ",
+        zodiac="天蝎座",
+        game_experience="高级",
+        online_status="在线",
+        game_style="竞技",
+        games=["英雄联盟"]
+    )
+    attrs.update(overrides)
+    return UserProfile(**attrs)
+
+def test_build_and_lookup():
+    """测试构建快照与按ID查找"""
+    users = [make_user(f"u{i}") for i in range(10)]
+    snapshot = PoolSnapshot.build(0, users, chunk_size=4)
+    assert len(snapshot) == 10
+    assert len(snapshot.chunks) == 3
+    assert [user.user_id for user in snapshot] == [f"u{i}" for i in range(10)]
+    assert snapshot[7].user_id == "u7"
+    assert snapshot[-1].user_id == "u9"
+    assert snapshot.get("u5") is users[5]
+    assert snapshot.get("missing") is None
+    assert "u3" in snapshot
+    with pytest.raises(IndexError):
+        snapshot[10]
+
+def test_duplicate_ids_keep_last():
+    """测试重复ID以最后一个为准"""
+    first, second = make_user("dup"), make_user("dup", play_time="早上")
+    snapshot = PoolSnapshot.build(0, [first, make_user("other"), second])
+    assert len(snapshot) == 2
+    assert snapshot.get("dup") is second
+
+def test_sharded_index_copies_only_touched_shards():
+    """测试索引更新只复制被修改的分片"""
+    index = ShardedIndex().updated({f"k{i}": i for i in range(5000)})
+    assert len(index.shards) > 1
+    updated = index.updated({"k1": 100, "k2": None})
+    assert updated.get("k1") == 100
+    assert updated.get("k2") is None
+    assert index.get("k1") == 1
+    assert len(updated) == len(index) - 1
+    shared = sum(a is b for a, b in zip(index.shards, updated.shards))
+    assert shared >= len(index.shards) - 2
+
+def test_persistent_vector_matches_list():
+    """测试持久化向量的读写与列表一致，旧版本不变"""
+    items = list(range(2000))
+    vector = PersistentVector(items)
+    assert list(vector) == items and vector[-1] == 1999
+    updated = vector.updated({5: 'a', 1500: 'b', 2000: 'c', 2001: 'd'})
+    expected = items[:5] + ['a'] + items[6:1500] + ['b'] + items[1501:] + ['c', 'd']
+    assert list(updated) == expected and len(updated) == 2002
+    assert list(vector) == items
+    # 超出末尾写入时跳过的位置为 None，items() 不产出
+    sparse = PersistentVector().updated({40: 'x', 3: 'y'})
+    assert len(sparse) == 41 and sparse[10] is None
+    assert list(sparse.items()) == [(3, 'y'), (40, 'x')]
+    with pytest.raises(IndexError):
+        updated[2002]
+
+def test_persistent_vector_copies_only_path():
+    """测试单个修改只复制一条到根的路径"""
+    vector = PersistentVector(range(32 ** 3))
+    updated = vector.updated({1000: -1})
+    leaves = lambda v: [leaf for middle in v._root for leaf in middle]
+    shared = sum(a is b for a, b in zip(leaves(vector), leaves(updated)))
+    assert shared == len(leaves(vector)) - 1
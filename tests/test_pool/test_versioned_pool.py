@@ -0,0 +1,122 @@
+"""多版本用户池测试"""
+
+import threading
+import time
+import pytest
+from matching.inverted_index import GameIndex
+from matching.minhash import MinHashLSH
+from pool.versioned_pool import VersionedPool
+from test_snapshot import make_user
+
+@pytest.fixture
+def pool():
+    """创建每块4个槽位的多版本用户池"""
+    return VersionedPool([make_user(f"u{i}") for i in range(10)], chunk_size=4)
+
+def test_writer_publishes_new_version(pool):
+    """测试提交后发布新版本，旧快照不变"""
+    old = pool.snapshot()
+    with pool.writer() as writer:
+        writer.put(make_user("u1", play_time="早上"))
+        writer.put(make_user("new"))
+        assert writer.remove("u9")
+        assert not writer.remove("missing")
+    new = pool.snapshot()
+
+    assert new.version == old.version + 1
+    assert new.get("u1").play_time == "早上"
+    assert new.get("new") is not None
+    assert new.get("u9") is None
+    assert len(new) == 10
+
+    assert old.get("u1").play_time == "晚上"
+    assert old.get("new") is None
+    assert old.get("u9") is not None
+
+def test_copy_on_write_chunks(pool):
+    """测试只复制被修改的块"""
+    old = pool.snapshot()
+    with pool.writer() as writer:
+        writer.put(make_user("u5", play_time="早上"))
+    new = pool.snapshot()
+    assert new.shares_chunks_with(old) == [True, False, True]
+
+def test_abort_on_exception(pool):
+    """测试事务异常时放弃修改并释放写锁"""
+    with pytest.raises(RuntimeError):
+        with pool.writer() as writer:
+            writer.put(make_user("ghost"))
+            raise RuntimeError("abort")
+    assert pool.snapshot().get("ghost") is None
+    assert pool.version == 0
+    with pool.writer() as writer:
+        writer.put(make_user("ghost"))
+    assert pool.snapshot().get("ghost") is not None
+
+def test_remove_then_put_same_transaction(pool):
+    """测试同一事务内删除后重新加入"""
+    with pool.writer() as writer:
+        writer.remove("u0")
+        writer.put(make_user("u0", play_time="中午"))
+        assert writer.get("u0").play_time == "中午"
+    snapshot = pool.snapshot()
+    assert snapshot.get("u0").play_time == "中午"
+    assert len(snapshot) == 10
+
+def test_reader_and_writer_do_not_block_each_other(pool):
+    """测试长时间读取与写入互不阻塞"""
+    reader_started = threading.Event()
+    writer_done = threading.Event()
+    seen = []
+
+    def long_scan():
+        snapshot = pool.snapshot()
+        reader_started.set()
+        for user in snapshot:
+            # 写者在扫描过程中提交，扫描看到的仍是固定版本
+            writer_done.wait(timeout=5)
+            seen.append(user.user_id)
+
+    reader = threading.Thread(target=long_scan)
+    reader.start()
+    reader_started.wait(timeout=5)
+    started = time.monotonic()
+    with pool.writer() as writer:
+        writer.remove("u3")
+        writer.put(make_user("late"))
+    assert time.monotonic() - started < 1.0
+    writer_done.set()
+    reader.join()
+
+    assert seen == [f"u{i}" for i in range(10)]
+    assert "late" in pool.snapshot()
+
+def test_attached_indexes_follow_commits(pool):
+    """测试挂接的索引随提交、整体替换增量更新，落后的索引挂接时补齐"""
+    rare = ["原神", "星露谷物语"]
+    games = GameIndex(pool.snapshot())
+    stale = pool.snapshot()
+    pool.add_user(make_user("early", games=rare))
+    lsh = MinHashLSH()
+    for user in stale:
+        lsh.add_user(user)
+    pool.attach(games, stale)
+    pool.attach(lsh, stale)
+    assert "early" in games
+    assert [key for key, _ in lsh.query(rare, 1.0)] == ["early"]
+
+    with pool.writer() as writer:
+        writer.put(make_user("new", games=rare))
+        writer.patch("u1", games=["原神"])
+        writer.remove("u2")
+        writer.remove("early")
+    assert "u2" not in games and "early" not in games
+    assert games.games_of("u1") == {"原神"}
+    assert [key for key, _ in lsh.query(rare, 1.0)] == ["new"]
+
+    pool.replace([make_user("only", games=rare)])
+    assert len(games) == 1 and games.postings("原神").tolist() == [games.doc_of("only")]
+    pool.detach(games)
+    pool.add_user(make_user("later", games=rare))
+    assert "later" not in games
+    assert sorted(key for key, _ in lsh.query(rare, 1.0)) == ["later", "only"]
@@ -0,0 +1,70 @@
+"""剖析模块测试"""
+
+import io
+import pstats
+import time
+import pytest
+from utils.profiling import Profiler, ProfileSession
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+def _outer():
+    return _busy(0.05)
+
+def test_cprofile_top_and_files(tmp_path):
+    """测试 cProfile 模式的最热函数、pstats 与折叠栈文件"""
+    with Profiler('cprofile') as profiler:
+        _outer()
+    names = [row['function'] for row in profiler.top(5)]
+    assert any('(_busy)' in name for name in names)
+    assert all(row['calls'] is not None for row in profiler.top(5))
+
+    paths = profiler.save(str(tmp_path / 'run'))
+    assert pstats.Stats(paths['pstats']).total_calls > 0
+    lines = open(paths['collapsed'], encoding='utf-8').read().splitlines()
+    busy = [line for line in lines if line.rsplit(' ', 1)[0].endswith('(_busy)')]
+    assert busy and all('(_outer);' in line for line in busy)
+
+    # 分摊到各路径的自身耗时之和约等于总自身耗时
+    total = sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+    expected = sum(entry[2] for entry in profiler.stats().stats.values()) * 1e6
+    assert total == pytest.approx(expected, rel=0.05, abs=50)
+
+def test_sampling_records_stacks(tmp_path):
+    """测试采样模式记录真实调用栈"""
+    with Profiler('sampling', interval=0.001) as profiler:
+        _outer()
+    assert profiler.samples > 0
+    assert profiler.top(1)[0]['function'].endswith('(_busy)')
+    assert profiler.top(1)[0]['calls'] is None
+    assert any(stack.endswith('(_outer);' + stack.rsplit(';', 1)[1]) for stack in profiler.collapsed())
+    paths = profiler.save(str(tmp_path / 'run'))
+    assert set(paths) == {'collapsed'}
+    with pytest.raises(ValueError):
+        profiler.stats()
+
+def test_session_scopes(tmp_path):
+    """测试会话范围与查询范围只剖析对应的代码块"""
+    stream = io.StringIO()
+    session = ProfileSession(scope='query', directory=str(tmp_path), stream=stream)
+    with session.session():
+        _busy(0.001)
+    assert session.outputs == []
+    for index in range(2):
+        with session.query(f'query-{index}/x'):
+            _busy(0.001)
+    assert len(session.outputs) == 2
+    assert (tmp_path / 'query-0_x.pstats').exists()
+    assert stream.getvalue().count('[profile]') == 2
+
+def test_invalid_mode():
+    """测试未知的剖析模式与范围"""
+    with pytest.raises(ValueError):
+        Profiler('perf')
+    with pytest.raises(ValueError):
+        ProfileSession(scope='request')
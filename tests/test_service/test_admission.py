@@ -0,0 +1,129 @@
+"""准入控制测试"""
+
+import threading
+import time
+import pytest
+from service.admission import AdmissionController, ServiceBusy
+
+def _percentile(values, fraction):
+    """计算分位数（最近秩法）"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def test_fast_path_and_metrics():
+    """测试空闲时直接受理"""
+    controller = AdmissionController(max_concurrency=2)
+    with controller.slot('interactive'):
+        metrics = controller.metrics()
+        assert metrics['in_flight'] == 1
+        assert metrics['lanes']['interactive']['in_flight'] == 1
+    lane = controller.metrics()['lanes']['interactive']
+    assert lane['admitted'] == 1
+    assert lane['completed'] == 1
+    assert lane['shed'] == 0
+
+def test_unknown_lane():
+    """测试未知通道"""
+    with pytest.raises(ValueError):
+        AdmissionController().acquire('vip')
+
+def test_queue_full_is_shed_immediately():
+    """测试队列满时立即拒绝"""
+    controller = AdmissionController(max_concurrency=1, queue_limits={'interactive': 0})
+    controller.acquire('interactive')
+    started = time.monotonic()
+    with pytest.raises(ServiceBusy) as error:
+        controller.acquire('interactive')
+    assert error.value.reason == 'queue_full'
+    assert time.monotonic() - started < 0.05
+    controller.release('interactive')
+    assert controller.metrics()['lanes']['interactive']['shed_queue_full'] == 1
+
+def test_queue_timeout():
+    """测试排队超时后拒绝"""
+    controller = AdmissionController(max_concurrency=1, max_queue_wait={'interactive': 0.05})
+    controller.acquire('interactive')
+    with pytest.raises(ServiceBusy) as error:
+        controller.acquire('interactive')
+    assert error.value.reason == 'queue_timeout'
+    controller.release('interactive')
+    lane = controller.metrics()['lanes']['interactive']
+    assert lane['shed_queue_timeout'] == 1
+    assert lane['queue_depth'] == 0
+
+def test_bulk_cannot_take_all_slots():
+    """测试批量通道无法占满全部执行槽"""
+    controller = AdmissionController(max_concurrency=2, max_queue_wait={'bulk': 0.01})
+    controller.acquire('bulk')
+    with pytest.raises(ServiceBusy):
+        controller.acquire('bulk')
+    controller.acquire('interactive')
+    controller.release('interactive')
+    controller.release('bulk')
+
+def test_interactive_served_before_bulk():
+    """测试空出的执行槽优先分配给交互通道"""
+    controller = AdmissionController(
+        max_concurrency=1,
+        lane_concurrency={'bulk': 1},
+        max_queue_wait={'interactive': 5.0, 'bulk': 5.0}
+    )
+    controller.acquire('interactive')
+    order = []
+
+    def request(lane):
+        with controller.slot(lane):
+            order.append(lane)
+
+    bulk = threading.Thread(target=request, args=('bulk',))
+    bulk.start()
+    while controller.metrics()['lanes']['bulk']['queue_depth'] < 1:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=request, args=('interactive',))
+    interactive.start()
+    while controller.metrics()['lanes']['interactive']['queue_depth'] < 1:
+        time.sleep(0.001)
+    controller.release('interactive')
+    bulk.join()
+    interactive.join()
+    assert order == ['interactive', 'bulk']
+
+def test_overload_keeps_p99_bounded():
+    """负载测试: 提供负载远超容量时，被受理请求的 p99 延迟仍然有界"""
+    service_time = 0.005
+    max_wait = 0.03
+    controller = AdmissionController(
+        max_concurrency=2,
+        queue_limits={'interactive': 8},
+        max_queue_wait={'interactive': max_wait}
+    )
+    latencies = []
+    shed = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(20):
+            started = time.monotonic()
+            try:
+                with controller.slot('interactive'):
+                    time.sleep(service_time)
+            except ServiceBusy:
+                with lock:
+                    shed.append(1)
+                continue
+            with lock:
+                latencies.append(time.monotonic() - started)
+
+    # 16 个闭环客户端，容量仅为 2 个并发
+    clients = [threading.Thread(target=client) for _ in range(16)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    metrics = controller.metrics()['lanes']['interactive']
+    assert shed, "过载时应当有请求被削减"
+    assert metrics['shed'] == len(shed)
+    assert metrics['wait_seconds_max'] <= max_wait + 0.05
+    # 排队时间被 max_wait 约束，再加服务时间和调度抖动
+    assert _percentile(latencies, 0.99) < max_wait + service_time + 0.1
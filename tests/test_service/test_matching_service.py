@@ -0,0 +1,90 @@
+"""匹配服务测试"""
+
+import threading
+import time
+import pytest
+from loaders import LoaderManager
+from matching.matching_system import MatchingSystem
+from service.matching_service import MatchingService
+from service.admission import AdmissionController
+
+@pytest.fixture
+def service():
+    """创建基于默认数据的匹配服务"""
+    pools_loader = LoaderManager().pools_loader
+    system = MatchingSystem(pools_loader.load_game_pool())
+    return MatchingService(system, pools_loader.load_user_pool())
+
+def test_find_matches_same_as_system(service):
+    """测试服务结果与匹配系统一致"""
+    users = service.pool.snapshot()
+    expected = service.system.find_best_matches(users[0], users, top_n=3)
+    result = service.find_matches(users[0].user_id, top_n=3)
+    assert [user.user_id for user, _ in result] == [user.user_id for user, _ in expected]
+
+def test_unknown_user(service):
+    """测试查询不存在的用户"""
+    with pytest.raises(KeyError):
+        service.find_matches("no_such_user")
+
+def test_concurrent_queries_are_coalesced(service, monkeypatch):
+    """测试并发的相同查询被合并"""
+    gate = threading.Event()
+    original = service.system.find_best_matches
+
+    def gated(*args, **kwargs):
+        gate.wait(timeout=5)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(service.system, 'find_best_matches', gated)
+    user_id = service.pool.snapshot()[0].user_id
+    threads = [threading.Thread(target=service.find_matches, args=(user_id, 5)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    while service.stats()['singleflight_calls'] < 6:
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    stats = service.stats()
+    assert stats['singleflight_executions'] == 1
+    assert stats['singleflight_shared'] == 5
+
+def test_interactive_does_not_join_queued_bulk(service):
+    """测试交互查询不合并到正在批量通道排队的同一查询"""
+    service.admission = AdmissionController(
+        max_concurrency=2, lane_concurrency={'bulk': 1}, max_queue_wait={'bulk': 5.0})
+    user_id = service.pool.snapshot()[0].user_id
+    service.admission.acquire('bulk')
+    bulk = threading.Thread(target=service.find_matches, args=(user_id, 5, 'bulk'))
+    bulk.start()
+    try:
+        while service.admission.metrics()['lanes']['bulk']['queue_depth'] < 1:
+            time.sleep(0.01)
+        start = time.monotonic()
+        result = service.find_matches(user_id, 5, 'interactive')
+        assert time.monotonic() - start < 1.0
+        assert len(result) == 5
+        assert service.stats()['singleflight_shared'] == 0
+    finally:
+        service.admission.release('bulk')
+        bulk.join()
+    lanes = service.stats()['admission']['lanes']
+    assert lanes['interactive']['admitted'] == 1
+    assert lanes['bulk']['admitted'] == 2
+
+def test_replace_pool_bumps_version(service):
+    """测试替换用户池后版本号递增"""
+    users = service.pool.snapshot()
+    assert service.stats()['pool_version'] == 0
+    assert service.replace_pool(users.users()[:5]) == 1
+    assert service.stats()['pool_size'] == 5
+
+def test_admission_metrics_exposed(service):
+    """测试配置准入控制后统计中包含其指标"""
+    service.admission = AdmissionController(max_concurrency=1)
+    service.find_matches(service.pool.snapshot()[0].user_id, top_n=3, lane='bulk')
+    lanes = service.stats()['admission']['lanes']
+    assert lanes['bulk']['admitted'] == 1
+    assert lanes['interactive']['admitted'] == 0
@@ -0,0 +1,110 @@
+"""指标模块测试"""
+
+import os
+import urllib.error
+import urllib.request
+import pytest
+from loaders import LoaderManager
+from matching.instrumentation import Instrumentation
+from matching.matching_system import MatchingSystem
+from service.matching_service import MatchingService
+from service.metrics import MetricsRegistry, _Metric
+
+def _lines(registry):
+    return registry.render().splitlines()
+
+def test_counter_and_gauge_render():
+    """测试计数器与量的文本格式"""
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', "任务数", ('kind',)).inc(kind='a')
+    registry.counter('jobs_total', "任务数", ('kind',)).inc(2, kind='a')
+    gauge = registry.gauge('depth', "深度")
+    gauge.set(5)
+    gauge.dec(2)
+    lines = _lines(registry)
+    assert '# TYPE jobs_total counter' in lines
+    assert 'jobs_total{kind="a"} 3' in lines
+    assert '# TYPE depth gauge' in lines
+    assert 'depth 3' in lines
+
+def test_histogram_buckets_are_cumulative():
+    """测试直方图分桶累计、总和与次数"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', "延迟", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value)
+    lines = _lines(registry)
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum 4.05' in lines
+    assert 'latency_seconds_count 4' in lines
+
+def test_label_values_are_escaped():
+    """测试标签值中的引号、反斜杠与换行被转义"""
+    registry = MetricsRegistry()
+    registry.counter('events_total', "事件\n数", ('name',)).inc(name='a"b\\c\nd')
+    lines = _lines(registry)
+    assert '# HELP events_total 事件\\n数' in lines
+    assert 'events_total{name="a\\"b\\\\c\\nd"} 1' in lines
+
+def test_invalid_registration():
+    """测试不合法的指标名、标签与重复注册"""
+    registry = MetricsRegistry()
+    with pytest.raises(ValueError):
+        registry.counter('bad-name', "")
+    with pytest.raises(ValueError):
+        registry.histogram('h', "", ('le',))
+    registry.counter('x_total', "")
+    with pytest.raises(ValueError):
+        registry.gauge('x_total', "")
+    with pytest.raises(ValueError):
+        registry.counter('x_total', "").inc(-1)
+    with pytest.raises(ValueError):
+        registry.counter('x_total', "").inc(kind='a')
+    with pytest.raises(TypeError):
+        _Metric('y_total', "")
+
+def test_write_and_serve(tmp_path):
+    """测试写文件与 HTTP 端点导出相同的内容"""
+    registry = MetricsRegistry()
+    registry.counter('hits_total', "命中数").inc()
+    path = tmp_path / 'gresy.prom'
+    registry.write(str(path))
+    assert path.read_text(encoding='utf-8') == registry.render()
+    assert os.listdir(tmp_path) == ['gresy.prom']
+
+    server = registry.serve(port=0)
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode('utf-8') == registry.render()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other', timeout=5)
+    finally:
+        server.close()
+
+def test_matching_service_metrics():
+    """测试匹配服务导出查询、池大小、替换次数与匹配计时"""
+    pools_loader = LoaderManager().pools_loader
+    system = MatchingSystem(pools_loader.load_game_pool())
+    system.instrumentation = Instrumentation()
+    registry = MetricsRegistry()
+    service = MatchingService(system, pools_loader.load_user_pool(), metrics=registry)
+    users = service.pool.snapshot()
+    service.find_matches(users[0].user_id, top_n=3)
+    service.find_matches(users[0].user_id, top_n=3)
+    with pytest.raises(KeyError):
+        service.find_matches('no_such_user')
+    service.replace_pool(users.users()[:5])
+
+    lines = _lines(registry)
+    assert 'gresy_queries_total{lane="interactive",outcome="ok"} 2' in lines
+    assert 'gresy_queries_total{lane="interactive",outcome="not_found"} 1' in lines
+    assert 'gresy_query_duration_seconds_count{lane="interactive"} 3' in lines
+    assert 'gresy_pool_size 5' in lines
+    assert 'gresy_pool_version 1' in lines
+    assert 'gresy_pool_reloads_total 1' in lines
+    assert 'gresy_singleflight_calls_total{result="executed"} 2' in lines
+    assert 'gresy_match_events_total{event="queries"} 2' in lines
+    assert 'gresy_cache_hit_ratio{cache="stages"} 0.5' in lines
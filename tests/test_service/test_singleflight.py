@@ -0,0 +1,70 @@
+"""请求合并测试"""
+
+import threading
+import time
+import pytest
+from service.singleflight import SingleFlight
+
+def _run_concurrently(count, function):
+    """在 count 个线程中同时调用 function，返回各线程结果"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        results[index] = function()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_calls_share_one_execution():
+    """测试并发的相同请求只计算一次"""
+    flight = SingleFlight()
+    executions = []
+    started = threading.Event()
+
+    def slow():
+        executions.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 42
+
+    results = _run_concurrently(8, lambda: flight.do('key', slow))
+    assert [value for value, _ in results] == [42] * 8
+    assert len(executions) == 1
+    assert sum(shared for _, shared in results) == 7
+    assert flight.counters() == {'calls': 8, 'executions': 1, 'shared': 7}
+    assert flight.in_flight() == 0
+
+def test_sequential_calls_recompute():
+    """测试计算结束后不再合并"""
+    flight = SingleFlight()
+    assert flight.do('key', lambda: 1) == (1, False)
+    assert flight.do('key', lambda: 2) == (2, False)
+    assert flight.counters()['executions'] == 2
+
+def test_different_keys_do_not_merge():
+    """测试不同的键分别计算"""
+    flight = SingleFlight()
+    results = _run_concurrently(4, lambda: flight.do(threading.get_ident(), time.sleep, 0.05))
+    assert not any(shared for _, shared in results)
+
+def test_exception_propagates_to_waiters():
+    """测试计算异常传递给所有等待者"""
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    def call():
+        with pytest.raises(RuntimeError):
+            flight.do('key', failing)
+        return True
+
+    assert all(_run_concurrently(4, call))
+    assert flight.in_flight() == 0
@@ -0,0 +1,335 @@
+"""剖析模块
+
+为命令行入口提供 --profile 开关: 在 cProfile 或采样线程下运行整个会话或单次查询，
+写出 pstats 文件（仅 cProfile）与火焰图工具可读的折叠栈文件，并打印最热的 20 个函数::
+
+    python main.py --profile --profile-scope query
+    python -m benchmarks.suite --sizes 10000 --profile sampling
+
+折叠栈每行为 "根;...;叶 数值"，可直接交给 flamegraph.pl、speedscope 等渲染。
+cProfile 只记录调用边，折叠栈按各调用方的累计耗时比例把函数自身耗时分摊到调用路径上
+（数值单位为微秒）；采样模式记录真实调用栈（数值为样本数）
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+MODES = ('cprofile', 'sampling')
+SCOPES = ('session', 'query')
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 20
+
+# 由 cProfile 调用边推导折叠栈时的路径深度上限、最小分摊比例与每个函数保留的路径数
+_MAX_DEPTH = 64
+_MIN_FRACTION = 1e-4
+_MAX_PATHS = 256
+
+Function = Tuple[str, int, str]
+
+def _label(function: Function) -> str:
+    """函数的显示名: 文件名:行号(函数名)；内置函数只有函数名"""
+    filename, line, name = function
+    if filename == '~' and line == 0:
+        return name
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+def _frame_label(label: str) -> str:
+    """折叠栈中的帧名，去掉分号与换行"""
+    return re.sub(r'[;\n]', '_', label)
+
+class Profiler:
+    """cProfile 或采样剖析器
+
+    采样模式由后台线程按 interval 读取被剖析线程的调用栈，开销与被剖析代码的调用次数无关，
+    但只能给出近似的耗时，没有调用次数。
+    """
+
+    def __init__(self, mode: str = 'cprofile', interval: float = DEFAULT_INTERVAL):
+        """初始化剖析器
+
+        Args:
+            mode: 'cprofile' 或 'sampling'
+            interval: 采样间隔（秒）
+
+        Raises:
+            ValueError: 未知的模式
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}，可选 {', '.join(MODES)}")
+        self.mode = mode
+        self.interval = interval
+        self.elapsed = 0.0
+        self._profile: Optional[cProfile.Profile] = None
+        self._samples: Dict[Tuple[str, ...], float] = {}
+        self._sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start = 0.0
+
+    def start(self) -> None:
+        """开始剖析当前线程"""
+        self._start = time.perf_counter()
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """结束剖析"""
+        if self.mode == 'cprofile':
+            self._profile.disable()
+        else:
+            self._stop.set()
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self._start
+
+    def __enter__(self) -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _sample(self, ident: int) -> None:
+        """采样线程: 按间隔记录被剖析线程的调用栈，按实际间隔加权"""
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_label((code.co_filename, code.co_firstlineno, code.co_name)))
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self._samples[key] = self._samples.get(key, 0.0) + (now - previous)
+            self._sample_count += 1
+            previous = now
+
+    @property
+    def samples(self) -> int:
+        """采样次数（cProfile 模式为 0）"""
+        return self._sample_count
+
+    def stats(self) -> pstats.Stats:
+        """cProfile 的统计
+
+        Raises:
+            ValueError: 采样模式没有 pstats 统计
+        """
+        if self._profile is None:
+            raise ValueError("采样模式没有 pstats 统计")
+        return pstats.Stats(self._profile)
+
+    def top(self, n: int = DEFAULT_TOP) -> List[Dict[str, Any]]:
+        """自身耗时最高的 n 个函数
+
+        Returns:
+            List[Dict[str, Any]]: function、calls（采样模式为 None）、self_seconds、cumulative_seconds
+        """
+        if self.mode == 'cprofile':
+            rows = [
+                {'function': _label(function), 'calls': nc, 'self_seconds': tt, 'cumulative_seconds': ct}
+                for function, (cc, nc, tt, ct, callers) in self.stats().stats.items()
+            ]
+        else:
+            own: Dict[str, float] = {}
+            cumulative: Dict[str, float] = {}
+            for stack, seconds in self._samples.items():
+                own[stack[-1]] = own.get(stack[-1], 0.0) + seconds
+                for label in set(stack):
+                    cumulative[label] = cumulative.get(label, 0.0) + seconds
+            rows = [
+                {'function': label, 'calls': None, 'self_seconds': own.get(label, 0.0),
+                 'cumulative_seconds': seconds}
+                for label, seconds in cumulative.items()
+            ]
+        rows.sort(key=lambda row: (row['self_seconds'], row['cumulative_seconds']), reverse=True)
+        return rows[:n]
+
+    def collapsed(self) -> Dict[str, int]:
+        """折叠栈: "根;...;叶" -> 数值（cProfile 为微秒，采样为样本数）"""
+        if self.mode == 'sampling':
+            result: Dict[str, int] = {}
+            for stack, seconds in self._samples.items():
+                key = ';'.join(_frame_label(label) for label in stack)
+                result[key] = result.get(key, 0) + max(1, round(seconds / self.interval))
+            return result
+        return _collapse_stats(self.stats().stats)
+
+    def save(self, prefix: str) -> Dict[str, str]:
+        """写出剖析结果
+
+        Args:
+            prefix: 路径前缀，写出 prefix.pstats（仅 cProfile）与 prefix.collapsed
+
+        Returns:
+            Dict[str, str]: 类型 -> 路径
+        """
+        directory = os.path.dirname(os.path.abspath(prefix))
+        os.makedirs(directory, exist_ok=True)
+        paths = {}
+        if self.mode == 'cprofile':
+            paths['pstats'] = prefix + '.pstats'
+            self._profile.dump_stats(paths['pstats'])
+        paths['collapsed'] = prefix + '.collapsed'
+        with open(paths['collapsed'], 'w', encoding='utf-8') as file:
+            for stack, value in sorted(self.collapsed().items()):
+                if value > 0:
+                    file.write(f'{stack} {value}\n')
+        return paths
+
+def _collapse_stats(stats: Dict[Function, tuple]) -> Dict[str, int]:
+    """由 cProfile 的调用边推导折叠栈
+
+    函数的每条调用路径按调用方在该函数上的累计耗时比例分得一份自身耗时；
+    递归调用（调用方已在路径上）不再向上展开，比例过小的路径丢弃。
+    """
+    memo: Dict[Function, List[Tuple[Tuple[Function, ...], float]]] = {}
+    in_progress = set()
+
+    def paths(function: Function, depth: int) -> List[Tuple[Tuple[Function, ...], float]]:
+        if function in memo:
+            return memo[function]
+        callers = stats[function][4] if function in stats else {}
+        if not callers or depth >= _MAX_DEPTH:
+            return [((function,), 1.0)]
+        in_progress.add(function)
+        edges = [(caller, edge[3] if len(edge) > 3 else 0.0) for caller, edge in callers.items()
+                 if caller not in in_progress and caller in stats]
+        total = sum(weight for _, weight in edges)
+        if total <= 0:
+            edges = [(caller, 1.0) for caller, _ in edges]
+            total = float(len(edges))
+        result = []
+        for caller, weight in edges:
+            share = weight / total
+            for stack, fraction in paths(caller, depth + 1):
+                if fraction * share >= _MIN_FRACTION:
+                    result.append((stack + (function,), fraction * share))
+        in_progress.discard(function)
+        result.sort(key=lambda item: item[1], reverse=True)
+        result = result[:_MAX_PATHS] or [((function,), 1.0)]
+        memo[function] = result
+        return result
+
+    collapsed: Dict[str, int] = {}
+    for function, (cc, nc, tt, ct, callers) in stats.items():
+        if tt <= 0:
+            continue
+        for stack, fraction in paths(function, 0):
+            key = ';'.join(_frame_label(_label(frame)) for frame in stack)
+            collapsed[key] = collapsed.get(key, 0) + round(tt * fraction * 1e6)
+    return collapsed
+
+def format_top(rows: List[Dict[str, Any]]) -> str:
+    """把 top() 的结果格式化为文本表"""
+    lines = [f"{'self(s)':>10}{'cum(s)':>10}{'calls':>10}  function"]
+    for row in rows:
+        calls = str(row['calls']) if row['calls'] is not None else '-'
+        lines.append(f"{row['self_seconds']:>10.4f}{row['cumulative_seconds']:>10.4f}{calls:>10}  {row['function']}")
+    return '\n'.join(lines)
+
+class ProfileSession:
+    """按命令行配置剖析整个会话或单次查询
+
+    scope 为 session 时 session() 剖析其中的代码、query() 不做任何事；scope 为 query 时相反，
+    每次查询单独写出一组文件，便于隔离某一次慢查询。
+    """
+
+    def __init__(
+        self,
+        mode: str = 'cprofile',
+        scope: str = 'session',
+        directory: str = 'profiles',
+        interval: float = DEFAULT_INTERVAL,
+        top: int = DEFAULT_TOP,
+        stream: Optional[TextIO] = None
+    ):
+        """初始化剖析会话
+
+        Args:
+            mode: 'cprofile' 或 'sampling'
+            scope: 'session' 或 'query'
+            directory: 输出目录
+            interval: 采样间隔（秒）
+            top: 结束时打印的函数数
+            stream: 打印目标，缺省为标准错误
+
+        Raises:
+            ValueError: 未知的模式或范围
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}，可选 {', '.join(MODES)}")
+        if scope not in SCOPES:
+            raise ValueError(f"未知的剖析范围: {scope}，可选 {', '.join(SCOPES)}")
+        self.mode = mode
+        self.scope = scope
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        self.stream = stream
+        self.outputs: List[Dict[str, str]] = []
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> Optional['ProfileSession']:
+        """由 add_arguments() 添加的参数创建，未指定 --profile 时返回 None"""
+        if not args.profile:
+            return None
+        return cls(args.profile, getattr(args, 'profile_scope', 'session'), args.profile_dir,
+                   args.profile_interval)
+
+    @contextmanager
+    def _run(self, name: str) -> Iterator[Profiler]:
+        """剖析 with 块，结束时写出文件并打印最热的函数"""
+        profiler = Profiler(self.mode, self.interval)
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            prefix = os.path.join(self.directory, re.sub(r'[^\w.-]', '_', name))
+            paths = profiler.save(prefix)
+            self.outputs.append(paths)
+            stream = self.stream or sys.stderr
+            print(f"\n[profile] {name}: {profiler.elapsed:.3f}s -> {', '.join(paths.values())}", file=stream)
+            print(format_top(profiler.top(self.top)), file=stream)
+
+    def session(self, name: str = 'session'):
+        """剖析整个会话（scope 为 session 时）"""
+        return self._run(name) if self.scope == 'session' else nullcontext()
+
+    def query(self, name: str):
+        """剖析单次查询（scope 为 query 时）"""
+        return self._run(name) if self.scope == 'query' else nullcontext()
+
+def add_arguments(parser: argparse.ArgumentParser, scopes: bool = True) -> None:
+    """为命令行入口添加剖析参数
+
+    Args:
+        parser: 参数解析器
+        scopes: 是否提供 --profile-scope（入口没有查询粒度时只支持整个会话）
+    """
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=MODES,
+                        help="在 cProfile（缺省）或采样剖析器下运行")
+    if scopes:
+        parser.add_argument('--profile-scope', choices=SCOPES, default='session',
+                            help="剖析整个会话，或每次查询单独剖析")
+    parser.add_argument('--profile-dir', default='profiles', help="剖析结果输出目录")
+    parser.add_argument('--profile-interval', type=float, default=DEFAULT_INTERVAL,
+                        help="采样模式的采样间隔（秒）")